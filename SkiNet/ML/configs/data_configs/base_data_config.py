@@ -72,6 +72,19 @@ class BaseDataConfig(BaseModel):
                     "split_train_size / split_val_size / split_test_size are ignored in this case.",
     )
 
+    shard_dir: str | None = Field(
+        default=None,
+        description="Directory of packed tar shards written by 'python -m SkiNet.ML.datasets.sharded_dataset', "
+                    "relative to the data root. When set, samples are read from the shards instead of "
+                    "individual image and mask files.",
+    )
+    use_resized_variants: bool = Field(
+        default=True,
+        description="Read images and masks from the smallest pre-resized variant recorded in the metadata CSV "
+                    "(see 'python -m SkiNet.ML.datasets.preprocessing.resize_variants') that still fits "
+                    "TRANSFORM_CONFIG.crop. Without recorded variants, or if False, the original files are read.",
+    )
+
     METADATA_CSV_NAME: ClassVar[str]
     REQUIRED_COLUMNS: ClassVar[frozenset[str]] = frozenset()
     DATASET_KEY: ClassVar[Optional[DatasetKey]] = None
@@ -1,4 +1,5 @@
 import os
+import platform
 from typing import Literal
 from pydantic import BaseModel, ConfigDict, Field, model_validator
 import logging
@@ -100,6 +101,17 @@ class LitLoggerConfig(BaseModel):
         return self
 
 
+def cpu_supports_bf16() -> bool:
+    """
+    Whether the CPU executes bfloat16 natively: x86 with AVX512-BF16 or AMX, or aarch64 with the BF16 extension.
+    CPUs without it emulate bfloat16 and run mixed precision slower than float32.
+    """
+    import torch
+    if torch.cpu._is_avx512_bf16_supported() or torch.cpu._is_amx_tile_supported():
+        return True
+    return platform.machine().lower() in ("aarch64", "arm64") and bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+
+
 PrecisionType = Literal[
     "16-mixed",
     "bf16-mixed",
@@ -147,7 +159,61 @@ class TrainConfig(BaseModel):
         default=None, ge=1,
         description="Batches pre-loaded per worker. Ignored (forced None) when num_workers=0.",
     )
+    shuffle_mode: Literal["random", "chunked"] = Field(
+        default="random",
+        description="Shuffling of the training set. 'random' permutes all samples. 'chunked' permutes chunks of "
+                    "shuffle_chunk_size consecutive samples and shuffles within a buffer of shuffle_buffer_chunks "
+                    "chunks, so reads are near-sequential; use it with cache_in_ram=False on HDDs or blob mounts.",
+    )
+    shuffle_chunk_size: int = Field(default=64, ge=1, description="Consecutive samples per chunk for shuffle_mode='chunked'.")
+    shuffle_buffer_chunks: int = Field(
+        default=8, ge=1, description="Chunks shuffled together for shuffle_mode='chunked'; larger mixes better.")
     cache_in_ram: bool = Field(default=True, description="Pre-load all images into RAM at startup.")
+    cache_backend: Literal["dict", "shared_memory", "memmap"] = Field(
+        default="dict",
+        description="RAM cache storage when cache_in_ram=True. 'dict' keeps one Sample object per image; "
+                    "'shared_memory' and 'memmap' pack all images and masks into one contiguous uint8 arena "
+                    "read zero-copy by DataLoader workers, so memory does not grow with num_workers.",
+    )
+    cache_dir: str | None = Field(
+        default=None,
+        description="Directory for the arena file of cache_backend='memmap'. When None, the system temp dir is used.",
+    )
+    cache_warmup: Literal["threads", "processes"] = Field(
+        default="threads",
+        description="How cache_in_ram fills the RAM caches at startup. 'threads' loads each split in turn with up to 8 "
+                    "threads; 'processes' decodes the train, val and test splits concurrently with a process pool "
+                    "of cache_warmup_workers processes into shared memory and logs MB/s and images/s.",
+    )
+    cache_warmup_workers: int | None = Field(
+        default=None, ge=1, description="Processes for cache_warmup='processes'. When None, os.cpu_count() is used.")
+    cache_budget_mb: float | None = Field(
+        default=None, gt=0,
+        description="When set with cache_in_ram=True, the RAM cache is filled lazily on first access instead of at "
+                    "startup and evicts least-recently-used samples to stay within this budget per split. The budget "
+                    "is divided among the split's DataLoader workers, each holding its own cache; cache_backend is "
+                    "ignored. Hit rate and resident MB are logged with the system metrics.",
+    )
+    decoded_cache_dir: str | None = Field(
+        default=None,
+        description="Directory of a persistent on-disk cache of decoded images and masks. When set, later runs "
+                    "memory-map the decoded arrays instead of decoding JPEG/PNG/BMP files again. Entries are "
+                    "invalidated when a source file's size or mtime changes. Pre-warm with "
+                    "'python -m SkiNet.ML.datasets.decoded_cache --config <yaml>'.",
+    )
+    precompute_eval_transforms: Literal["float16", "uint8"] | None = Field(
+        default=None,
+        description="When set with cache_in_ram=True, the val and test datasets run their deterministic crop and "
+                    "normalisation once at startup and cache the result, so validation epochs are pure memory "
+                    "reads. 'float16' stores normalised images at half precision; 'uint8' stores them quantised "
+                    "with a per-image, per-channel scale (4x smaller than float32). Random crop types are drawn once.",
+    )
+    fast_collate: bool = Field(
+        default=False,
+        description="Collate images and masks straight into preallocated batch tensors (shared memory in workers, "
+                    "pinned with pin_memory and num_workers=0) and pass sample indices instead of per-sample specs "
+                    "dicts. Resolve specs with dataset.resolve_specs(batch['index']) where needed.",
+    )
     use_torch_compile: bool = Field(default=False, description="Wrap the model with torch.compile.")
     torch_compile_backend: str = Field(
         default="inductor",
@@ -179,9 +245,27 @@ class TrainConfig(BaseModel):
     precision: PrecisionType | None = Field(
         default=None,
         description="Training precision. When None, auto-set to '16-mixed' on GPU/MPS and "
-                    "'32-true' on CPU.",
+                    "'32-true' on CPU ('bf16-mixed' with cpu_bf16=True on CPUs with native bfloat16).",
+    )
+    cpu_bf16: bool = Field(
+        default=False,
+        description="When precision is None on CPU, use 'bf16-mixed' (bfloat16 autocast) if the CPU executes "
+                    "bfloat16 natively (AVX512-BF16, AMX or aarch64 BF16); otherwise precision stays '32-true'.",
+    )
+    channels_last: bool = Field(
+        default=False,
+        description="Convert the model and every batch of images to torch.channels_last (NHWC) memory format, "
+                    "which lets oneDNN on CPU and cuDNN on GPU run convolutions without layout reorders.",
     )
     log_every_n_steps: int = Field(default=1, ge=1, description="Logging frequency in steps.")
+    metric_sync: Literal["step", "interval", "epoch"] = Field(
+        default="step",
+        description="When the step-level train_loss_step is all-reduced across DDP ranks: 'step' on every step; "
+                    "'interval' every metric_sync_interval steps, logging the mean over the window; 'epoch' never, "
+                    "each rank logs its local value. Epoch metrics are synced once at epoch end in every mode.",
+    )
+    metric_sync_interval: int = Field(
+        default=50, ge=1, description="Steps per all-reduce of train_loss_step when metric_sync='interval'.")
     check_val_every_n_epoch: int = Field(default=1, ge=1, description="Validation frequency in epochs.")
     num_sanity_val_steps: int = Field(default=0, ge=0, description="Sanity validation steps before training.")
 
@@ -264,6 +348,11 @@ class TrainConfig(BaseModel):
             "cpu": "32-true",
         }
         resolved = precision_map.get(accelerator)
+        if accelerator == "cpu" and self.cpu_bf16:
+            if cpu_supports_bf16():
+                resolved = "bf16-mixed"
+            else:
+                logger.warning("cpu_bf16=True but the CPU has no native bfloat16 support; keeping '32-true'.")
         if resolved:
             object.__setattr__(self, "precision", resolved)
             logger.info("precision auto-set to '%s' for accelerator='%s'", resolved, self.accelerator)
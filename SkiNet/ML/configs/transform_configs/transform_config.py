@@ -6,7 +6,7 @@ from SkiNet.ML.configs.transform_configs.augment_config import (
     SpatialAugmentConfig,
 )
 from SkiNet.ML.configs.transform_configs.crop_config import CropConfig
-from pydantic import Field
+from pydantic import Field, model_validator
 
 
 class TransformConfig(BaseTransformConfig):
@@ -59,3 +59,24 @@ class TransformConfig(BaseTransformConfig):
             "Required when normalization_mode='standard'. Compute with compute_dataset_stats.py."
         ),
     )
+    augmentation_backend: Literal["albumentations", "batched"] = Field(
+        default="albumentations",
+        description=(
+            "'albumentations' runs the per-sample Albumentations pipeline in the DataLoader workers. "
+            "'batched' only collates the decoded uint8 samples in the workers and applies crop, spatial "
+            "and photometric augmentation and normalisation batch-wise as tensor ops in the LightningModel, "
+            "on the training device (GPU, or CPU if none is present). Perspective and elastic transforms "
+            "are not supported by 'batched'."
+        ),
+    )
+
+    @model_validator(mode="after")
+    def validate_batched_augmentations(self) -> "TransformConfig":
+        if self.augmentation_backend == "batched":
+            unsupported = [name for name, enabled in (("perspective", self.spatial_augmentation.perspective_apply),
+                                                      ("elastic", self.spatial_augmentation.elastic_apply))
+                           if enabled]
+            if unsupported:
+                raise ValueError(f"augmentation_backend='batched' does not support {unsupported} transforms. "
+                                 "Disable them or use augmentation_backend='albumentations'.")
+        return self
@@ -1,9 +1,12 @@
 from dataclasses import dataclass
+from functools import partial
 import logging
+from typing import Any, Callable
 from SkiNet.ML.configs.train_configs.train_config import TrainConfig
 from SkiNet.ML.utils.typing_utils import TDataset_co
 from SkiNet.ML.configs.experiment_config import ExperimentConfig
-from SkiNet.ML.dataloaders.dataloaders import RepeatDataLoader
+from SkiNet.ML.dataloaders.dataloaders import RepeatDataLoader, collate_into_buffers, collate_padded_preserving_specs
+from SkiNet.ML.dataloaders.samplers import ChunkShuffleSampler
 from SkiNet.ML.datasets.dataset_factory import DatasetSplit, create_segmentation_datasets_from_config
 from SkiNet.ML.datasets.segmentation_dataset import SegmentationDataset
 
@@ -20,28 +23,39 @@ class DataLoaders:
     test: RepeatDataLoader
 
 
-def create_dataloaders_from_datasets(datasets: DatasetSplit[TDataset_co], train_cfg: TrainConfig) -> DataLoaders:
+def create_dataloaders_from_datasets(datasets: DatasetSplit[TDataset_co],
+                                     train_cfg: TrainConfig,
+                                     collate_fn: Callable[[list[Any]], Any] | None = None) -> DataLoaders:
     """
     Generic builder — works for any dataset triple.
 
     :param datasets: DatasetSplit containing the train/val/test datasets to load from.
     :param train_cfg: TrainConfig containing dataloader parameters like batch size and num_workers.
+    :param collate_fn: Optional collate function; defaults to the RepeatDataLoader default (collate_preserving_specs).
     :return: DataLoaders containing the train/val/test dataloaders built from the provided datasets and config.
     """
     num_workers = train_cfg.num_workers or 0
     prefetch = train_cfg.prefetch_factor if num_workers > 0 else None
-    return DataLoaders(train=RepeatDataLoader(datasets.train, shuffle=True, batch_size=train_cfg.batch_size,
+    extra_kwargs: dict[str, Any] = {"collate_fn": collate_fn} if collate_fn is not None else {}
+    train_kwargs: dict[str, Any] = {"shuffle": True}
+    if train_cfg.shuffle_mode == "chunked":
+        train_kwargs = {"shuffle": False,
+                        "sampler": ChunkShuffleSampler(datasets.train,
+                                                       chunk_size=train_cfg.shuffle_chunk_size,
+                                                       buffer_chunks=train_cfg.shuffle_buffer_chunks,
+                                                       seed=train_cfg.seed)}
+    return DataLoaders(train=RepeatDataLoader(datasets.train, batch_size=train_cfg.batch_size,
                                               num_workers=num_workers, drop_last=False,
                                               pin_memory=train_cfg.pin_memory,
-                                              prefetch_factor=prefetch),
+                                              prefetch_factor=prefetch, **train_kwargs, **extra_kwargs),
                        val=RepeatDataLoader(datasets.val, shuffle=False, batch_size=train_cfg.batch_size,
                                             num_workers=num_workers, drop_last=False,
                                             pin_memory=train_cfg.pin_memory,
-                                            prefetch_factor=prefetch),
+                                            prefetch_factor=prefetch, **extra_kwargs),
                        test=RepeatDataLoader(datasets.test, shuffle=False, batch_size=train_cfg.batch_size,
                                              num_workers=num_workers, drop_last=False,
                                              pin_memory=train_cfg.pin_memory,
-                                             prefetch_factor=prefetch))
+                                             prefetch_factor=prefetch, **extra_kwargs))
 
 
 def create_segmentation_dataloaders(main_config: ExperimentConfig) -> DataLoaders:
@@ -52,7 +66,14 @@ def create_segmentation_dataloaders(main_config: ExperimentConfig) -> DataLoader
     :return Dataloaders class whose fields are train, val and test dataloaders
     """
     segm_datasets: DatasetSplit[SegmentationDataset] = create_segmentation_datasets_from_config(main_config)
-    loaders = create_dataloaders_from_datasets(segm_datasets, main_config.trainconfig)
+    train_cfg = main_config.trainconfig
+    collate_fn: Callable[[list[Any]], Any] | None = None
+    if main_config.transformconfig.augmentation_backend == "batched":
+        # batched augmentation crops on the device, so workers pad samples of different sizes instead
+        collate_fn = collate_padded_preserving_specs
+    elif train_cfg.fast_collate:
+        collate_fn = partial(collate_into_buffers, pin_memory=bool(train_cfg.pin_memory))
+    loaders = create_dataloaders_from_datasets(segm_datasets, train_cfg, collate_fn=collate_fn)
     logger.info("Train dataset length: %d, batches per epoch: %d",
                 len(segm_datasets.train), len(loaders.train))
     return loaders
@@ -3,7 +3,7 @@ import torch
 import numpy as np
 import random
 
-from torch.utils.data import DataLoader, Dataset
+from torch.utils.data import DataLoader, Dataset, get_worker_info
 from torch.utils.data._utils.collate import default_collate
 
 
@@ -45,6 +45,81 @@ def collate_preserving_specs(batch: list[Any]) -> Any:
     return default_collate(batch)
 
 
+def _batch_buffer(first: torch.Tensor, batch_size: int, pin_memory: bool) -> torch.Tensor:
+    """
+    Allocate the output tensor of a batch of tensors shaped like ``first``.
+
+    In a DataLoader worker the buffer is allocated in shared memory, as in ``default_collate``, so that
+    sending the batch to the main process does not copy it again. In the main process it is allocated in
+    pinned memory if requested, so that the DataLoader's pin-memory step is a no-op.
+    """
+    shape = (batch_size, *first.shape)
+    if get_worker_info() is not None:
+        storage = first._typed_storage()._new_shared(batch_size * first.numel(), device=first.device)
+        return first.new(storage).resize_(shape)
+    return torch.empty(shape, dtype=first.dtype, pin_memory=pin_memory and torch.cuda.is_available())
+
+
+def collate_into_buffers(batch: list[dict[str, Any]], pin_memory: bool = False) -> dict[str, Any]:
+    """
+    Fast collate of equally sized segmentation samples.
+
+    Images and masks are copied straight into one preallocated batch tensor each
+    (see :func:`_batch_buffer`) instead of going through the recursive ``default_collate``.
+    Items returned by a dataset created with ``return_specs=False`` carry an ``index`` instead of
+    their ``specs`` dict; the indices are collated into one int64 tensor, so no per-sample
+    Python objects cross the worker queue. Resolve them with ``dataset.resolve_specs(batch["index"])``
+    where the specs are needed. Items that still carry ``specs`` keep them as a list.
+
+    :param batch: Items with CHW ``image`` and ``mask`` tensors of the same shape across the batch,
+        plus ``index`` and/or ``specs``.
+    :param pin_memory: Allocate the batch in pinned memory when collating in the main process
+        (``num_workers=0``) and CUDA is available.
+    :return: Dict with ``image`` [B, C, H, W], ``mask`` [B, 1, H, W] and ``index`` [B] and/or ``specs``.
+    """
+    first = batch[0]
+    collated: dict[str, Any] = {}
+    for key in ("image", "mask"):
+        out = _batch_buffer(first[key], len(batch), pin_memory)
+        torch.stack([item[key] for item in batch], out=out)
+        collated[key] = out
+    if "index" in first:
+        collated["index"] = torch.tensor([item["index"] for item in batch], dtype=torch.long)
+    if "specs" in first:
+        collated["specs"] = [item["specs"] for item in batch]
+    return collated
+
+
+def collate_padded_preserving_specs(batch: list[dict[str, Any]]) -> dict[str, Any]:
+    """
+    Collate CHW uint8 samples of different sizes by zero-padding them to the largest sample.
+
+    Used with ``augmentation_backend="batched"``, where workers return decoded samples unchanged.
+    The original size of every sample is kept in ``image_size`` so that the batched augmentation
+    only samples crops from the unpadded region; ``specs`` is preserved as a list as in
+    :func:`collate_preserving_specs`, and ``index`` is collated as in :func:`collate_into_buffers`.
+
+    :param batch: Items with ``image`` [C, H_i, W_i], ``mask`` [1, H_i, W_i] and ``specs`` and/or ``index``.
+    :return: Dict with ``image`` [B, C, H, W], ``mask`` [B, 1, H, W], ``image_size`` [B, 2]
+        (int64 height, width per sample) and ``specs`` and/or ``index``.
+    """
+    sizes = torch.tensor([item["image"].shape[-2:] for item in batch], dtype=torch.long)
+    max_h, max_w = (int(v) for v in sizes.max(dim=0).values)
+    collated: dict[str, Any] = {"image_size": sizes}
+    if "index" in batch[0]:
+        collated["index"] = torch.tensor([item["index"] for item in batch], dtype=torch.long)
+    if "specs" in batch[0]:
+        collated["specs"] = [item["specs"] for item in batch]
+    for key in ("image", "mask"):
+        first = batch[0][key]
+        out = first.new_zeros((len(batch), first.shape[0], max_h, max_w))
+        for i, item in enumerate(batch):
+            _, h, w = item[key].shape
+            out[i, :, :h, :w] = item[key]
+        collated[key] = out
+    return collated
+
+
 class RepeatDataLoader(DataLoader):
     """
     DataLoader with persistent workers to avoid respawning processes each epoch.
@@ -0,0 +1,106 @@
+"""
+Samplers trading a little randomness for sequential reads.
+
+With ``cache_in_ram=False`` every training item is read from storage. Fully random access
+(``shuffle=True``) turns each batch into scattered small reads, which is slow on HDDs and on
+blob-mounted storage where every read has a high latency, while consecutive dataset indices
+are stored close together (files in ``sample_id`` order, or packed shards).
+"""
+from collections.abc import Iterable, Iterator, Sized
+from typing import Protocol
+
+import torch
+from torch.utils.data import Sampler
+
+
+class SupportsPrefetchOrder(Protocol):
+    def set_prefetch_order(self, indices: Iterable[int]) -> None:
+        ...
+
+
+class ChunkShuffleSampler(Sampler[int]):
+    """
+    Shuffle the order of contiguous chunks of indices, then shuffle within a buffer of chunks.
+
+    The dataset indices are split into chunks of ``chunk_size`` consecutive indices. Every epoch the
+    chunk order is permuted, and the chunks are consumed ``buffer_chunks`` at a time: the indices of
+    the buffered chunks are shuffled together and yielded. A batch thus touches at most
+    ``buffer_chunks`` contiguous regions of storage instead of ``batch_size`` random ones, while each
+    batch still mixes samples from ``buffer_chunks`` random places in the dataset.
+
+    ``buffer_chunks=1`` gives the most sequential reads; a buffer covering the whole dataset
+    is equivalent to a full random shuffle.
+    """
+
+    def __init__(self,
+                 data_source: Sized,
+                 chunk_size: int = 64,
+                 buffer_chunks: int = 8,
+                 seed: int = 0) -> None:
+        """
+        :param data_source: Dataset to sample from; only its length is used.
+        :param chunk_size: Number of consecutive indices per chunk.
+        :param buffer_chunks: Number of chunks whose indices are shuffled together.
+        :param seed: Base seed; the permutation of epoch ``e`` is drawn with seed ``seed + e``.
+        """
+        if chunk_size < 1 or buffer_chunks < 1:
+            raise ValueError(f"chunk_size and buffer_chunks must be positive, got {chunk_size} and {buffer_chunks}.")
+        self.num_samples = len(data_source)
+        self.chunk_size = chunk_size
+        self.buffer_chunks = buffer_chunks
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        """
+        Set the epoch that seeds the next permutation. Lightning calls this before every epoch,
+        as for ``DistributedSampler``; without it the epoch advances after each full iteration.
+        """
+        self.epoch = epoch
+
+    def __iter__(self) -> Iterator[int]:
+        generator = torch.Generator()
+        generator.manual_seed(self.seed + self.epoch)
+        self.epoch += 1
+
+        n_chunks = -(-self.num_samples // self.chunk_size)
+        chunk_order = torch.randperm(n_chunks, generator=generator)
+        for start in range(0, n_chunks, self.buffer_chunks):
+            starts = chunk_order[start:start + self.buffer_chunks] * self.chunk_size
+            indices = (starts[:, None] + torch.arange(self.chunk_size)).reshape(-1)
+            indices = indices[indices < self.num_samples]
+            yield from indices[torch.randperm(len(indices), generator=generator)].tolist()
+
+    def __len__(self) -> int:
+        return self.num_samples
+
+
+class PrefetchOrderSampler(Sampler[int]):
+    """
+    Wrap a sampler and announce each epoch's index order to the dataset before yielding it.
+
+    Datasets reading from remote storage use the order to keep reads in flight ahead of the
+    training loop (see :class:`~SkiNet.ML.datasets.remote_prefetch.RemoteFilePrefetcher`). The
+    announcement reaches the dataset in the process iterating the sampler, i.e. it takes effect
+    with ``num_workers=0``; worker processes prefetch per batch instead.
+    """
+
+    def __init__(self, sampler: Sampler[int], dataset: SupportsPrefetchOrder) -> None:
+        """
+        :param sampler: Sampler defining the order, e.g. a RandomSampler or ChunkShuffleSampler.
+        :param dataset: Dataset receiving the order through ``set_prefetch_order``.
+        """
+        self.sampler = sampler
+        self.dataset = dataset
+
+    def set_epoch(self, epoch: int) -> None:
+        if hasattr(self.sampler, "set_epoch"):
+            self.sampler.set_epoch(epoch)
+
+    def __iter__(self) -> Iterator[int]:
+        order = list(self.sampler)
+        self.dataset.set_prefetch_order(order)
+        return iter(order)
+
+    def __len__(self) -> int:
+        return len(self.sampler)  # type: ignore[arg-type]
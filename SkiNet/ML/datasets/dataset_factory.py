@@ -1,13 +1,17 @@
 import logging
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
+from pathlib import Path
 from typing import Generic, cast
 
 from pandas import DataFrame
 
 from SkiNet.ML.configs.data_configs.base_data_config import BaseDataConfig
 from SkiNet.Utils.experiment_keys import ExperimentType
-from SkiNet.ML.datasets.segmentation_dataset import BaseDataset, SegmentationDataset
+from SkiNet.ML.datasets.segmentation_dataset import BaseDataset, SegmentationDataset, warm_up_caches
+from SkiNet.ML.datasets.preprocessing.resize_variants import required_min_side
+from SkiNet.ML.datasets.sharded_dataset import ShardedSegmentationDataset
+from SkiNet.ML.transformations.transform_adapters import SampleTransformAdapter
 from SkiNet.ML.transformations.transform_data import get_transform_from_config
 from SkiNet.ML.utils.model_utils import MLWorkflowState
 from SkiNet.Utils.data.split_data import DataFrameSplits, split_segmentation_metadata
@@ -82,6 +86,9 @@ class DatasetFactory(ABC, Generic[TDataset_co]):
 class SegmentationDatasetFactory(DatasetFactory[SegmentationDataset]):
     """
     Factory that creates ``SegmentationDataset`` objects for each workflow split.
+    If ``shard_dir`` is set in the data config, ``ShardedSegmentationDataset`` objects reading
+    from packed shards are created instead. Otherwise images are read from the smallest pre-resized
+    variant that fits the configured crop, if any are recorded in the metadata.
     Use ``create_segmentation_datasets_from_config`` for the typed public entry point.
     """
 
@@ -104,21 +111,61 @@ class SegmentationDatasetFactory(DatasetFactory[SegmentationDataset]):
             splits = split_segmentation_metadata(df=metadata_df, split_config=split_config)
         transformations = get_transform_from_config(config)
         cache_in_ram = config.trainconfig.cache_in_ram
-        train_dataset = SegmentationDataset(config.dataconfig.data_root,
-                                            splits.train,
-                                            transformations.train,
-                                            MLWorkflowState.TRAIN,
-                                            cache_in_ram=cache_in_ram)
-        val_dataset = SegmentationDataset(config.dataconfig.data_root,
-                                          splits.val,
-                                          transformations.val,
-                                          MLWorkflowState.VAL,
-                                          cache_in_ram=cache_in_ram)
-        test_dataset = SegmentationDataset(config.dataconfig.data_root,
-                                           splits.test,
-                                           transformations.test,
-                                           MLWorkflowState.TEST,
-                                           cache_in_ram=cache_in_ram)
+        cache_backend = config.trainconfig.cache_backend
+        cache_dir = Path(config.trainconfig.cache_dir) if config.trainconfig.cache_dir is not None else None
+        decoded_cache_dir = (Path(config.trainconfig.decoded_cache_dir)
+                             if config.trainconfig.decoded_cache_dir is not None else None)
+        shard_dir = data_config.shard_dir
+        precompute_eval = config.trainconfig.precompute_eval_transforms
+        return_specs = not config.trainconfig.fast_collate
+        cache_budget_bytes: int | None = None
+        if config.trainconfig.cache_budget_mb is not None:
+            # every DataLoader worker holds its own LRU cache
+            processes = max(1, config.trainconfig.num_workers or 0)
+            cache_budget_bytes = int(config.trainconfig.cache_budget_mb * 1024**2 / processes)
+        # process warm-up builds the caches of all splits together after the datasets exist
+        warm_up_in_processes = cache_in_ram and config.trainconfig.cache_warmup == "processes"
+        cache_at_init = cache_in_ram and not warm_up_in_processes
+        min_image_side = required_min_side(config.transformconfig.crop) if data_config.use_resized_variants else None
+        if precompute_eval is not None and config.transformconfig.augmentation_backend == "batched":
+            logger.warning("precompute_eval_transforms is ignored with augmentation_backend='batched'.")
+            precompute_eval = None
+
+        def create_dataset(dataframe: DataFrame, transform: SampleTransformAdapter, mode: MLWorkflowState) -> SegmentationDataset:
+            precompute_transform = precompute_eval if mode != MLWorkflowState.TRAIN else None
+            if shard_dir is not None:
+                return ShardedSegmentationDataset(config.dataconfig.data_root,
+                                                  dataframe,
+                                                  transform,
+                                                  mode,
+                                                  shard_dir=Path(shard_dir),
+                                                  cache_in_ram=cache_at_init,
+                                                  cache_backend=cache_backend,
+                                                  cache_dir=cache_dir,
+                                                  precompute_transform=precompute_transform,
+                                                  return_specs=return_specs,
+                                                  cache_budget_bytes=cache_budget_bytes)
+            return SegmentationDataset(config.dataconfig.data_root,
+                                       dataframe,
+                                       transform,
+                                       mode,
+                                       cache_in_ram=cache_at_init,
+                                       cache_backend=cache_backend,
+                                       cache_dir=cache_dir,
+                                       decoded_cache_dir=decoded_cache_dir,
+                                       precompute_transform=precompute_transform,
+                                       return_specs=return_specs,
+                                       cache_budget_bytes=cache_budget_bytes,
+                                       min_image_side=min_image_side)
+
+        if shard_dir is not None and decoded_cache_dir is not None:
+            logger.warning("decoded_cache_dir is ignored when reading samples from shards in '%s'.", shard_dir)
+        train_dataset = create_dataset(splits.train, transformations.train, MLWorkflowState.TRAIN)
+        val_dataset = create_dataset(splits.val, transformations.val, MLWorkflowState.VAL)
+        test_dataset = create_dataset(splits.test, transformations.test, MLWorkflowState.TEST)
+        if warm_up_in_processes:
+            warm_up_caches([train_dataset, val_dataset, test_dataset], cache_backend, cache_dir,
+                           max_workers=config.trainconfig.cache_warmup_workers)
 
         # log basic info for observability
         try:
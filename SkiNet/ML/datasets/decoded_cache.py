@@ -0,0 +1,166 @@
+"""
+Persistent on-disk cache of decoded images and masks.
+
+Every run otherwise re-decodes every JPEG/PNG/BMP at startup through
+:func:`~SkiNet.ML.datasets.sample_specs.load_data_item`. The cache stores each decoded
+CHW uint8 array as a ``.npy`` file; later runs memory-map the array and skip decoding.
+
+Entries are keyed by the resolved data root, the item's relative path and the source
+file's size and mtime, so replacing or touching a source file invalidates its entry.
+The store is versioned: bumping ``CACHE_VERSION`` (e.g. after a change of the decoder)
+makes all previous entries unreachable.
+
+Pre-warm the cache for all samples of a configured dataset with:
+    python -m SkiNet.ML.datasets.decoded_cache --config main_config.yaml --cache-dir /path/to/cache
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import logging
+import os
+import tempfile
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from SkiNet.ML.datasets.sample_specs import SampleSpecs, load_data_item
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 1
+"""Version of the on-disk layout and decoder; entries of other versions are never read."""
+
+
+class DecodedTensorCache:
+    """
+    Versioned on-disk store of decoded CHW uint8 arrays, read back via memory mapping.
+
+    Layout: ``<cache_dir>/v<CACHE_VERSION>/<path_key[:2]>/<path_key>-<stat_key>.npy`` where
+    ``path_key`` hashes (data_root, relative path) and ``stat_key`` hashes the source
+    file's (size, mtime). Writing a new entry removes stale entries of the same item.
+
+    The cache is safe to share between concurrent runs and DataLoader workers: entries are
+    written to a temporary file and atomically renamed into place.
+    """
+
+    def __init__(self, cache_dir: Path) -> None:
+        """
+        :param cache_dir: Root directory of the cache; created if it does not exist.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.version_dir = self.cache_dir / f"v{CACHE_VERSION}"
+        self.version_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def _hash(*parts: str) -> str:
+        return hashlib.sha1("\x00".join(parts).encode()).hexdigest()
+
+    def entry_path(self, item_rel_path: str, data_root: Path) -> Path:
+        """
+        Location of the cache entry for the current state of a source file.
+
+        :param item_rel_path: Path to the data item relative to data root
+        :param data_root: Root directory location of the source file
+        :return: Path of the ``.npy`` entry; it may not exist yet.
+        :raises FileNotFoundError: If the source file does not exist.
+        """
+        full_path = data_root / item_rel_path
+        stat = full_path.stat()
+        path_key = self._hash(str(data_root.resolve()), str(item_rel_path))
+        stat_key = self._hash(str(stat.st_size), str(stat.st_mtime_ns))[:16]
+        return self.version_dir / path_key[:2] / f"{path_key}-{stat_key}.npy"
+
+    def load(self, item_rel_path: str, data_root: Path) -> torch.Tensor:
+        """
+        Load a decoded data item from the cache, decoding and storing it on a miss.
+
+        :param item_rel_path: Path to the data item relative to data root
+        :param data_root: Root directory location, it is assumed to be a local path.
+        :return: A memory-mapped torch.Tensor of shape (C, H, W) and dtype torch.uint8.
+            The mapping is copy-on-write, so in-place modifications never reach the cache file.
+        """
+        if not data_root.exists():
+            raise FileNotFoundError(f"Data root does not exist: '{data_root}'")
+        full_path = data_root / item_rel_path
+        if not full_path.exists():
+            raise FileNotFoundError(f"Data item not found: '{full_path}'")
+
+        entry = self.entry_path(item_rel_path, data_root)
+        if entry.exists():
+            try:
+                return torch.from_numpy(np.load(entry, mmap_mode="c"))
+            except (ValueError, OSError):
+                logger.warning("Corrupt decoded-cache entry '%s', decoding '%s' again.", entry, full_path)
+
+        image = load_data_item(item_rel_path, data_root=data_root)
+        self._store(entry, image.numpy())
+        return image
+
+    def _store(self, entry: Path, array: np.ndarray) -> None:
+        """Atomically write ``array`` to ``entry`` and remove stale entries of the same source item."""
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=entry.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp_path, entry)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        path_key = entry.name.split("-")[0]
+        for stale in entry.parent.glob(f"{path_key}-*.npy"):
+            if stale != entry:
+                stale.unlink(missing_ok=True)
+
+    def warm(self,
+             sample_specs: Mapping[str, SampleSpecs],
+             data_root: Path,
+             max_workers: int | None = None) -> int:
+        """
+        Decode and store every image and mask of the given samples that is not cached yet.
+
+        :param sample_specs: Mapping of sample_id to its SampleSpecs.
+        :param data_root: Root directory where images and masks are stored.
+        :param max_workers: Number of decoding threads; defaults to os.cpu_count().
+        :return: Number of data items that had to be decoded.
+        """
+        rel_paths = [p for specs in sample_specs.values() for p in (specs.image_path, specs.mask_path)]
+        missing = [p for p in rel_paths if not self.entry_path(p, data_root).exists()]
+        logger.info("Decoded cache: %d of %d items missing in '%s'.", len(missing), len(rel_paths), self.version_dir)
+        with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+            for done, _ in enumerate(executor.map(lambda p: self.load(p, data_root), missing), start=1):
+                if done % 500 == 0 or done == len(missing):
+                    logger.info("  %d / %d", done, len(missing))
+        return len(missing)
+
+
+def main() -> None:
+    from SkiNet.ML.configs.load_config_from_yaml import load_config_from_yaml
+    from SkiNet.ML.datasets.sample_specs import create_valid_samplespecs
+
+    logging.basicConfig(level=logging.INFO)
+    ap = argparse.ArgumentParser(description="Pre-warm the on-disk decoded-tensor cache for a configured dataset.")
+    ap.add_argument("--config", type=Path, default=Path("main_config.yaml"),
+                    help="Path to experiment YAML config (default: main_config.yaml)")
+    ap.add_argument("--cache-dir", type=Path, default=None,
+                    help="Cache directory (default: TRAIN_CONFIG.decoded_cache_dir from the config)")
+    ap.add_argument("--workers", type=int, default=None, help="Number of decoding threads (default: all cores)")
+    args = ap.parse_args()
+
+    config = load_config_from_yaml(args.config)
+    cache_dir = args.cache_dir or config.trainconfig.decoded_cache_dir
+    if cache_dir is None:
+        ap.error("Provide --cache-dir or set TRAIN_CONFIG.decoded_cache_dir in the config")
+
+    sample_specs = create_valid_samplespecs(config.dataconfig.metadata)
+    n_decoded = DecodedTensorCache(Path(cache_dir)).warm(sample_specs, config.dataconfig.data_root, max_workers=args.workers)
+    print(f"Decoded {n_decoded} items into '{cache_dir}'.")
+
+
+if __name__ == "__main__":
+    main()
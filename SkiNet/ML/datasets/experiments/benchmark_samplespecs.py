@@ -0,0 +1,97 @@
+"""
+Scaling benchmark of :func:`~SkiNet.ML.datasets.sample_specs.create_valid_samplespecs`.
+
+Builds synthetic metadata in the layout of the ISIC metadata CSVs (one image row and one mask
+row per sample plus a few metadata columns, with a small share of incomplete, duplicated and
+mismatching samples) and times the conversion at 2k, 25k and 250k samples. The runtime should
+grow linearly with the number of samples; a super-linear jump indicates a regression to
+per-sample pandas work.
+
+Run with:
+    python -m SkiNet.ML.datasets.experiments.benchmark_samplespecs [--sizes 2000 25000 250000] [--repeats 3]
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from SkiNet.ML.datasets.sample_specs import create_valid_samplespecs
+from SkiNet.Utils.csv_headers import DATAPATH_HEADER, DATATYPE_HEADER, DATATYPE_IMAGE, DATATYPE_MASK, SAMPLEID_HEADER
+
+DEFAULT_SIZES = [2_000, 25_000, 250_000]
+
+
+def make_metadata(n_samples: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Synthetic metadata with an image and a mask row per sample.
+
+    About 1% of the samples lack their mask, 1% have a duplicate image row and 1% have
+    a metadata mismatch between image and mask, so that every warning path is exercised.
+
+    :param n_samples: Number of samples.
+    :param seed: Seed of the random metadata.
+    :return: Metadata DataFrame in shuffled row order.
+    """
+    rng = np.random.default_rng(seed)
+    sample_ids = np.array([f"ISIC_{i:07d}" for i in range(n_samples)])
+    diagnosis = rng.choice(["melanoma", "nevus", "seborrheic_keratosis"], size=n_samples)
+    age = rng.integers(5, 90, size=n_samples).astype(float)
+    age[rng.random(n_samples) < 0.05] = np.nan
+    sex = rng.choice(["male", "female"], size=n_samples)
+
+    images = pd.DataFrame({SAMPLEID_HEADER: sample_ids,
+                           DATATYPE_HEADER: DATATYPE_IMAGE,
+                           DATAPATH_HEADER: [f"images/{sid}.jpg" for sid in sample_ids],
+                           "diagnosis": diagnosis, "age": age, "sex": sex})
+    masks = images.assign(**{DATATYPE_HEADER: DATATYPE_MASK,
+                             DATAPATH_HEADER: [f"masks/{sid}_segmentation.png" for sid in sample_ids]})
+
+    masks = masks[rng.random(n_samples) >= 0.01]
+    mismatch = rng.random(len(masks)) < 0.01
+    masks.loc[mismatch, "sex"] = "unknown"
+    duplicates = images[rng.random(n_samples) < 0.01].assign(**{DATAPATH_HEADER: "images/duplicate.jpg"})
+
+    df = pd.concat([images, masks, duplicates], ignore_index=True)
+    return df.sample(frac=1.0, random_state=seed).reset_index(drop=True)
+
+
+def benchmark(sizes: list[int], repeats: int) -> pd.DataFrame:
+    """
+    Time create_valid_samplespecs for each metadata size.
+
+    :param sizes: Numbers of samples to benchmark.
+    :param repeats: Timed runs per size; the best run is reported.
+    :return: DataFrame with columns samples, rows, valid, best_s, us_per_sample.
+    """
+    results = []
+    for n in sizes:
+        df = make_metadata(n)
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            specs = create_valid_samplespecs(df)
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        results.append({"samples": n, "rows": len(df), "valid": len(specs),
+                        "best_s": best, "us_per_sample": best / n * 1e6})
+    return pd.DataFrame(results)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark create_valid_samplespecs at several metadata sizes.")
+    ap.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                    help="Numbers of samples (default: 2000 25000 250000)")
+    ap.add_argument("--repeats", type=int, default=3, help="Timed runs per size, best is reported (default: 3)")
+    args = ap.parse_args()
+
+    # the synthetic metadata triggers thousands of per-sample warnings by design
+    logging.getLogger("SkiNet.ML.datasets.sample_specs").setLevel(logging.ERROR)
+    print(benchmark(args.sizes, args.repeats).to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+
+
+if __name__ == "__main__":
+    main()
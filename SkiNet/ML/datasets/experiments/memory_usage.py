@@ -7,20 +7,51 @@ import torch
 from torch.utils.data import Dataset
 
 
+def process_tree_memory() -> tuple[float, float]:
+    """
+    Memory of the current process and all its children (e.g. DataLoader workers), in GB.
+
+    RSS counts shared pages once per process, so it over-reports memory that workers share
+    with the main process. PSS divides shared pages between the processes sharing them,
+    so its sum is the actual memory footprint: with a dict-of-Samples RAM cache it grows with
+    num_workers as copy-on-write pages get duplicated, with a packed arena cache it stays flat.
+    PSS is only available on Linux; elsewhere it is reported as RSS.
+
+    :return: (summed RSS, summed PSS) over the process tree in GB
+    """
+    main = psutil.Process()
+    rss = pss = 0.0
+    for proc in [main] + main.children(recursive=True):
+        try:
+            info = proc.memory_full_info()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+        rss += info.rss
+        pss += getattr(info, "pss", info.rss)
+    return rss / 1024**3, pss / 1024**3
+
+
 def display_memory_consumption(data_loader, BATCH_SAMPLING_NUM):
     """
     Display memory consumption
 
+    Besides system-wide memory, prints the summed RSS and PSS of the main process and its
+    DataLoader workers (see process_tree_memory), which shows whether the dataset's RAM cache
+    is duplicated per worker. Compare e.g. TrainConfig.cache_backend="dict" vs "shared_memory".
+
     :param data_loader: DataLoader object
     :param BATCH_SAMPLING_NUM: Number of batches to sample to sample at for memory consumption, e.g. 10 for every 10th batch
     """
     mem_used=[]
     mem_used.append(psutil.virtual_memory().used/1024**3)
+    print(f'{"batch":>8} - {"%":>5} - {"free":>10} - {"available":>10} - {"used":>10} - {"tree rss":>10} - {"tree pss":>10}')
     
     for i, item in enumerate(data_loader):
         if i % BATCH_SAMPLING_NUM == 0:
             mem = psutil.virtual_memory()
-            print(f'{i:8} - {mem.percent:5} - {mem.free/1024**3:10.2f} - {mem.available/1024**3:10.2f} - {mem.used/1024**3:10.2f}')
+            tree_rss, tree_pss = process_tree_memory()
+            print(f'{i:8} - {mem.percent:5} - {mem.free/1024**3:10.2f} - {mem.available/1024**3:10.2f} - {mem.used/1024**3:10.2f}'
+                  f' - {tree_rss:10.2f} - {tree_pss:10.2f}')
             mem_used.append(mem.used/1024**3)
     return mem_used
-    
\ No newline at end of file
+    
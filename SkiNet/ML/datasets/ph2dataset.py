@@ -1,6 +1,6 @@
 import logging
 from pathlib import Path
-from typing import Callable, Optional, Tuple, Union
+from typing import Callable, Iterable, Optional, Tuple, Union
 
 import numpy as np
 import torch
@@ -13,6 +13,7 @@ from torch.utils.data.dataset import Dataset
 
 
 # import AzureMachineLearningFileSystem here lazily
+from SkiNet.ML.datasets.remote_prefetch import RemoteFilePrefetcher, open_remote
 from SkiNet.ML.transformations.transform_data import TransformData
 from SkiNet.ML.utils.data_utils import filter_and_pair_valid_paths
 
@@ -93,15 +94,19 @@ class PH2Dataset(Dataset):
     def __init__(self,
                  data_root: Union[str, Path, AzureMachineLearningFileSystem],
                  transform: Optional[Union[TransformData, Callable]] = None,
-                 default_transform_visualisation: Optional[bool] = False):
+                 default_transform_visualisation: Optional[bool] = False,
+                 prefetcher: Optional[RemoteFilePrefetcher] = None):
         """
         :param data_root: if provided as a string or Path, it is a local directory that contains folders with samples of data uniquely identifiable by their ID,
             otherwise it is an Azure Machine Learning filesystem instance referencinsg a specific location on Azure data storage.
         :param transform: Transformation pipeline of type TransformData or Albumentations callable to apply to images and masks.
         :param default_transform_visualisation: If True, a default transformation for visualisation purposes is applied to images and masks
             as specified in PH2Dataset.__init__.
+        :param prefetcher: Optional prefetcher reading images and masks from the Azure filesystem ahead of time,
+            e.g. RemoteFilePrefetcher(data_root). Only used if data_root is an AzureMachineLearningFileSystem.
         """
         self.data_root = data_root
+        self.prefetcher = prefetcher
         self.transform = transform
         self.default_transform_visualisation = default_transform_visualisation
 
@@ -121,6 +126,24 @@ class PH2Dataset(Dataset):
         self.images_list, self.masks_list = get_ph2_data_paths(self.data_root, self.azure_data)
         """A tuple of two numpy arrays of dtype np.bytes_ that contains full paths to images and  masks"""
 
+    def _remote_paths(self, indices: Iterable[int]) -> list[str]:
+        return [path.decode("utf-8") for i in indices for path in (self.images_list[i], self.masks_list[i])]
+
+    def set_prefetch_order(self, indices: Iterable[int]) -> None:
+        """
+        Announce the sampler order of this epoch, so that the prefetcher reads ahead of it.
+        See SkiNet.ML.dataloaders.samplers.PrefetchOrderSampler.
+        """
+        if self.azure_data and self.prefetcher is not None:
+            self.prefetcher.set_order(self._remote_paths(indices))
+
+    def __getitems__(self, indices: list[int]) -> list[dict[str, torch.Tensor]]:
+        """
+        Return the samples of a batch; with a prefetcher all their files are requested concurrently first.
+        """
+        if self.azure_data and self.prefetcher is not None:
+            self.prefetcher.prefetch(self._remote_paths(indices))
+        return [self[i] for i in indices]
 
     def __getitem__(self, item: int) -> dict[str, torch.Tensor]:
         """
@@ -140,10 +163,10 @@ class PH2Dataset(Dataset):
             if isinstance(mask_path, (bytes, np.bytes_)):
                 mask_path = mask_path.decode("utf-8")
 
-            # read data
-            with self.data_root.open(img_path) as img:
+            # read data, from the prefetch buffer if a prefetcher is set
+            with open_remote(self.data_root, img_path, self.prefetcher) as img:
                 image = Image.open(img).copy()
-            with self.data_root.open(mask_path) as msk:
+            with open_remote(self.data_root, mask_path, self.prefetcher) as msk:
                 mask = Image.open(msk).copy()
         else:
             image = Image.open(self.images_list[item])
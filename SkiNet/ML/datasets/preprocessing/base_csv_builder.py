@@ -1,10 +1,11 @@
 import argparse
+import io
 import logging
 import os
 import tempfile
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Callable, Tuple, Union
+from typing import Any, Callable, Optional, Tuple, Union, cast
 
 import numpy as np
 import pandas as pd
@@ -12,8 +13,10 @@ from azureml.fsspec import AzureMachineLearningFileSystem
 from numpy.typing import NDArray
 
 from SkiNet.Azure.azure_setup import AzureSetup, service_principal_authentication
+from SkiNet.ML.datasets.preprocessing.listing_manifest import ListingManifest, glob_to_regex, join_relative
 from SkiNet.ML.utils.data_utils import convert_to_numpy_bytes, filter_missing_images_and_masks
-from SkiNet.Utils.csv_headers import DATAPATH_HEADER, DATATYPE_HEADER, DATATYPE_IMAGE, DATATYPE_MASK, SAMPLEID_HEADER
+from SkiNet.Utils.csv_headers import (DATAPATH_HEADER, DATATYPE_HEADER, DATATYPE_IMAGE, DATATYPE_MASK, RESIZED_DIR,
+                                      SAMPLEID_HEADER)
 
 
 class BaseCSVBuilder(ABC):
@@ -22,8 +25,26 @@ class BaseCSVBuilder(ABC):
 
     Expected to be called on local due to service principal authentication in AzureMachineLearningFileSystem,
     but the design allows for flexibility in supporting both environments if refactored.
+
+    With ``incremental`` set, the directory listings of each build are persisted in a manifest next to the CSV,
+    and the next build re-lists only directories that changed and rebuilds only the rows of the samples in them,
+    merging the result into the existing CSV (see :meth:`create_basic_metadata_incrementally`).
     """
 
+    excluded_dirs: tuple[str, ...] = (RESIZED_DIR,)
+    """Directories below the data root whose files are not samples, e.g. the pre-resized variants written by
+    ``resize_variants``, whose copies would otherwise match the image and mask patterns."""
+
+    def __init__(self, incremental: bool = False):
+        """
+        :param incremental: If True, build the CSV incrementally from the manifest of the previous build.
+        """
+        self.incremental = incremental
+        # state of the current incremental build, cleared by save_manifest()
+        self._manifest: Optional[ListingManifest] = None
+        self._existing_metadata: Optional[pd.DataFrame] = None
+        self._affected_sampleids: Optional[set[str]] = None
+
     @property
     @abstractmethod
     def data_root(self) -> Union[Path, AzureMachineLearningFileSystem]:
@@ -75,6 +96,46 @@ class BaseCSVBuilder(ABC):
         """
         pass
 
+    @property
+    def manifest_name(self) -> str:
+        """Name of the manifest of directory listings stored next to the output CSV."""
+        return f"{Path(self.output_csv_name).stem}_manifest.json"
+
+    @abstractmethod
+    def list_directory(self, directory: str) -> Tuple[dict[str, list[object]], list[str]]:
+        """
+        List a directory of the dataset for incremental builds.
+        Must be implemented in environment-specific subclasses (e.g., LocalCSVBuilder, AzureCSVBuilder).
+
+        :param directory: Directory relative to the dataset root, "" for the root.
+        :return: File name to [size, modification time or etag], and the names of the subdirectories.
+        """
+
+    @abstractmethod
+    def directory_stamp(self, directory: str) -> Optional[str]:
+        """
+        Return a value that changes whenever entries are added to or removed from a directory, or None if the
+        filesystem has none. Must be implemented in environment-specific subclasses.
+        """
+
+    @abstractmethod
+    def full_path(self, rel_path: str) -> str:
+        """
+        Full path of a file given its path relative to the dataset root, in the form returned by glob().
+        Must be implemented in environment-specific subclasses.
+        """
+
+    @abstractmethod
+    def read_file_in_data_root(self, name: str) -> Optional[bytes]:
+        """
+        Return the content of a file in the dataset root, or None if it does not exist.
+        Must be implemented in environment-specific subclasses.
+        """
+
+    @abstractmethod
+    def write_file_in_data_root(self, name: str, content: bytes) -> None:
+        """Write a file to the dataset root. Must be implemented in environment-specific subclasses."""
+
     def get_data_paths(self) -> Tuple[NDArray[np.bytes_], NDArray[np.bytes_]]:
         """
         Get paths to images and masks for a dataset in the given data root and with the specified patterns.
@@ -99,8 +160,8 @@ class BaseCSVBuilder(ABC):
             This data type is required by the Dataset class to fix the copy-on-write problem that results in an increased memory usage
             https://pytorch.org/docs/stable/data.html#single-and-multi-process-data-loading
         """
-        image_paths = list(data_root.glob(image_pattern))
-        mask_paths = list(data_root.glob(mask_pattern))
+        image_paths = [path for path in data_root.glob(image_pattern) if not self.is_excluded(str(path))]
+        mask_paths = [path for path in data_root.glob(mask_pattern) if not self.is_excluded(str(path))]
 
         image_paths, mask_paths = filter_missing_images_and_masks(image_paths, mask_paths)
 
@@ -108,6 +169,16 @@ class BaseCSVBuilder(ABC):
         # https://pytorch.org/docs/stable/data.html#single-and-multi-process-data-loading
         return convert_to_numpy_bytes(image_paths, mask_paths)
 
+    def is_excluded(self, path_str: str) -> bool:
+        """
+        Whether a file lies in one of the :attr:`excluded_dirs`.
+
+        :param path_str: Full path of the file, as returned by glob().
+        :return: True if the file is not part of the dataset.
+        """
+        relative = Path(self.datapath_func(path_str)).as_posix()
+        return any(relative == directory or relative.startswith(f"{directory}/") for directory in self.excluded_dirs)
+
     def create_dataframe_with_paths_and_types(self,
                                               image_paths: NDArray[np.bytes_],
                                               mask_paths: NDArray[np.bytes_],
@@ -125,21 +196,15 @@ class BaseCSVBuilder(ABC):
         :param datapath_func: Function that takes a path as input and returns the path relative to the dataset root.
         :return: DataFrame containing basic metadata for the dataset.
         """
-        data = []
-        for img_path, mask_path in zip(image_paths, mask_paths):
-            # Decode bytes to string if necessary
-            img_path_str = img_path.decode("utf-8") if isinstance(img_path, bytes) else str(img_path)
-            mask_path_str = mask_path.decode("utf-8") if isinstance(mask_path, bytes) else str(mask_path)
-
-            # Extract sample ID and relative paths using the provided functions
-            sample_id = sampleid_func(img_path_str)
-            img_rel_path = datapath_func(img_path_str)
-            mask_rel_path = datapath_func(mask_path_str)
-
-            # Add entries for both image and mask to the data list
-            data.append({SAMPLEID_HEADER: sample_id, DATAPATH_HEADER: img_rel_path, DATATYPE_HEADER: DATATYPE_IMAGE})
-            data.append({SAMPLEID_HEADER: sample_id, DATAPATH_HEADER: mask_rel_path, DATATYPE_HEADER: DATATYPE_MASK})
-        return pd.DataFrame(data)
+        images = _decode_paths(image_paths)
+        masks = _decode_paths(mask_paths)
+        sample_ids = images.map(sampleid_func).to_numpy(dtype=object)
+        datapaths = np.column_stack([images.map(datapath_func).to_numpy(dtype=object),
+                                     masks.map(datapath_func).to_numpy(dtype=object)])
+        # one image row followed by one mask row per sample
+        return pd.DataFrame({SAMPLEID_HEADER: np.repeat(sample_ids, 2),
+                             DATAPATH_HEADER: datapaths.reshape(-1),
+                             DATATYPE_HEADER: np.tile(np.array([DATATYPE_IMAGE, DATATYPE_MASK], dtype=object), len(images))})
 
     def create_basic_metadata(self) -> pd.DataFrame:
         """
@@ -151,9 +216,99 @@ class BaseCSVBuilder(ABC):
 
         :return: DataFrame containing the basic metadata structure
         """
+        if self.incremental:
+            return self.create_basic_metadata_incrementally()
         image_paths, mask_paths = self.get_data_paths()
         return self.create_dataframe_with_paths_and_types(image_paths, mask_paths, self.sampleid_func, self.datapath_func)
 
+    def create_basic_metadata_incrementally(self) -> pd.DataFrame:
+        """
+        Generate the basic metadata DataFrame, reusing the existing CSV for samples whose directories did not change.
+
+        The manifest of the previous build is updated by re-listing only changed directories. Samples are rebuilt
+        if any of their files, present or previously recorded, lies in a directory whose files changed; pairing
+        them considers all current files, so e.g. a new mask pairs with an image that was already present. The
+        updated manifest is kept until :meth:`save_manifest` is called after the CSV is written.
+
+        :return: DataFrame with the basic (sampleid, datapath, datatype) rows of all samples.
+        """
+        logger = logging.getLogger(__name__)
+        existing = self.read_existing_metadata()
+        manifest_bytes = self.read_file_in_data_root(self.manifest_name)
+        # a manifest without its CSV cannot be trusted, e.g. if writing the CSV failed
+        manifest = (ListingManifest.from_json(manifest_bytes.decode("utf-8"))
+                    if manifest_bytes is not None and existing is not None else ListingManifest())
+
+        changed = manifest.update(self.list_directory, self.directory_stamp, exclude=self.excluded_dirs)
+        files = pd.Series(sorted(manifest.files()), dtype=object)
+        images = files[files.str.fullmatch(glob_to_regex(self.image_pattern).pattern)]
+        masks = files[files.str.fullmatch(glob_to_regex(self.mask_pattern).pattern)]
+        image_ids = images.map(self.sampleid_func)
+        mask_ids = masks.map(self.sampleid_func)
+
+        if existing is None:
+            kept = pd.DataFrame(columns=[SAMPLEID_HEADER, DATAPATH_HEADER, DATATYPE_HEADER])
+            affected = set(image_ids) | set(mask_ids)
+        else:
+            changed_index = pd.Index(sorted(changed))
+            affected = (set(image_ids[_parent_dirs(images).isin(changed_index)])
+                        | set(mask_ids[_parent_dirs(masks).isin(changed_index)])
+                        | set(existing.loc[_parent_dirs(existing[DATAPATH_HEADER]).isin(changed_index), SAMPLEID_HEADER]))
+            kept = existing.loc[~existing[SAMPLEID_HEADER].isin(affected), [SAMPLEID_HEADER, DATAPATH_HEADER, DATATYPE_HEADER]]
+
+        # full paths in the form glob() returns them, which is what sampleid_func and datapath_func expect
+        image_paths, mask_paths = filter_missing_images_and_masks(
+            cast(list[Path], [self.full_path(p) for p in images[image_ids.isin(affected)]]),
+            cast(list[Path], [self.full_path(p) for p in masks[mask_ids.isin(affected)]]))
+        rebuilt = self.create_dataframe_with_paths_and_types(*convert_to_numpy_bytes(image_paths, mask_paths),
+                                                             self.sampleid_func, self.datapath_func)
+        logger.info(f"Incremental scan: {len(changed)} of {len(manifest.directories)} directories changed, "
+                    f"rebuilt {len(rebuilt) // 2} samples, kept {len(kept) // 2} samples from the existing CSV.")
+
+        self._manifest = manifest
+        self._existing_metadata = existing
+        self._affected_sampleids = affected
+        df = pd.concat([kept, rebuilt], ignore_index=True)
+        return df.sort_values(SAMPLEID_HEADER, kind="stable", ignore_index=True)
+
+    def read_existing_metadata(self) -> Optional[pd.DataFrame]:
+        """
+        Read the output CSV of a previous build, if any.
+
+        :return: The existing metadata, or None if the CSV does not exist.
+        """
+        content = self.read_file_in_data_root(self.output_csv_name)
+        if content is None:
+            return None
+        return pd.read_csv(io.BytesIO(content), dtype={SAMPLEID_HEADER: str, DATAPATH_HEADER: str})
+
+    def merge_into_existing_metadata(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Carry over the columns of the existing CSV that the builder does not produce (e.g. paths of pre-resized
+        variants), for samples that were not rebuilt. No-op unless the metadata was built incrementally.
+
+        :param df: Metadata DataFrame produced by the builder.
+        :return: ``df`` with the extra columns of the existing CSV, empty for rebuilt samples.
+        """
+        existing, affected = self._existing_metadata, self._affected_sampleids
+        if existing is None or affected is None:
+            return df
+        extra = [col for col in existing.columns if col not in df.columns]
+        if not extra:
+            return df
+        carried = existing.loc[~existing[SAMPLEID_HEADER].isin(affected), [DATAPATH_HEADER, *extra]]
+        return df.merge(carried, on=DATAPATH_HEADER, how="left")
+
+    def save_manifest(self) -> None:
+        """
+        Persist the manifest of an incremental build; call after the CSV was written. No-op otherwise.
+        Clears the state of the build, so that the next build starts from the files just written.
+        """
+        if self._manifest is not None:
+            self.write_file_in_data_root(self.manifest_name, self._manifest.to_json().encode("utf-8"))
+            logging.getLogger(__name__).info(f"Listing manifest '{self.manifest_name}' updated.")
+        self._manifest = self._existing_metadata = self._affected_sampleids = None
+
     def save_dataframe_to_csv(self, df: pd.DataFrame, output_csv_path: Union[str, Path]) -> None:
         """
         Save a DataFrame to a CSV file locally.
@@ -168,15 +323,31 @@ class BaseCSVBuilder(ABC):
             logging.getLogger(__name__).error(f"Failed to save CSV file at {output_csv_path}: {e}")
             raise
 
+
+def _decode_paths(paths: NDArray[np.bytes_]) -> pd.Series:
+    """Paths as a Series of str, decoding bytes arrays in one vectorised call."""
+    array: NDArray[Any] = np.asarray(paths)
+    if array.dtype.kind == "S":
+        array = np.char.decode(array, "utf-8")
+    return pd.Series(array.astype(str), dtype=object)
+
+
+def _parent_dirs(rel_paths: pd.Series) -> pd.Series:
+    """Directories of '/'-separated relative paths, "" for files in the root."""
+    return rel_paths.astype(str).str.rpartition("/")[0]
+
+
 class LocalCSVBuilder(BaseCSVBuilder):
     """
     Base class for building local CSV metadata.
     """
 
-    def __init__(self, arg: argparse.Namespace):
+    def __init__(self, arg: argparse.Namespace, incremental: bool = False):
         """
         :param arg: Command-line arguments containing the root path to data on a local file system.
+        :param incremental: If True, build the CSV incrementally from the manifest of the previous build.
         """
+        BaseCSVBuilder.__init__(self, incremental)
         if Path(arg.local_data_root).is_dir():
             self._full_path_to_local_data_root = Path(arg.local_data_root)
             """Path to the local data root directory containing folders with samples of data uniquely identifiable by their ID."""
@@ -206,6 +377,42 @@ class LocalCSVBuilder(BaseCSVBuilder):
         """
         return str(Path(path_str).relative_to(self.data_root))
 
+    def list_directory(self, directory: str) -> Tuple[dict[str, list[object]], list[str]]:
+        files: dict[str, list[object]] = {}
+        subdirs: list[str] = []
+        with os.scandir(self.data_root / directory) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    subdirs.append(entry.name)
+                elif entry.is_file():
+                    stat = entry.stat()
+                    files[entry.name] = [stat.st_size, stat.st_mtime_ns]
+        return files, sorted(subdirs)
+
+    def directory_stamp(self, directory: str) -> Optional[str]:
+        """Modification time of the directory, which changes when entries are added, removed or renamed."""
+        return str(os.stat(self.data_root / directory).st_mtime_ns)
+
+    def full_path(self, rel_path: str) -> str:
+        return str(self.data_root / rel_path)
+
+    def read_file_in_data_root(self, name: str) -> Optional[bytes]:
+        path = self.data_root / name
+        return path.read_bytes() if path.is_file() else None
+
+    def write_file_in_data_root(self, name: str, content: bytes) -> None:
+        (self.data_root / name).write_bytes(content)
+
+    def save_metadata(self, df: pd.DataFrame) -> None:
+        """
+        Save the metadata CSV to the local dataset root, merged into the existing CSV if built incrementally.
+
+        :param df: Metadata DataFrame to save.
+        """
+        self.save_dataframe_to_csv(df=self.merge_into_existing_metadata(df),
+                                   output_csv_path=str(self.data_root / self.output_csv_name))
+        self.save_manifest()
+
 
 class AzureCSVBuilder(BaseCSVBuilder):
     """
@@ -215,11 +422,13 @@ class AzureCSVBuilder(BaseCSVBuilder):
     but the design allows for flexibility in supporting both environments if refactored.
     """
 
-    def __init__(self, dataset_name: str):
+    def __init__(self, dataset_name: str, incremental: bool = False):
         """
         :param dataset_name: One of the dataset names from DatasetKey enum or a YAML file that maps to a dataset path on Azure.
             The value of the dataset name must match the key in the YAML config file under PATH_ON_DATASTORE.
+        :param incremental: If True, build the CSV incrementally from the manifest of the previous build.
         """
+        BaseCSVBuilder.__init__(self, incremental)
         service_principal_authentication()
         self.fs = AzureSetup.get_azureml_filesystem(dataset_name)
         self._data_root_on_azure = AzureSetup.get_rel_data_root_on_azure(dataset_name)
@@ -267,6 +476,56 @@ class AzureCSVBuilder(BaseCSVBuilder):
             return ""
         return path_str
 
+    def _azure_path(self, rel_path: str) -> str:
+        return join_relative(str(self.data_root_on_azure).rstrip('/'), rel_path).rstrip('/')
+
+    def list_directory(self, directory: str) -> Tuple[dict[str, list[object]], list[str]]:
+        files: dict[str, list[object]] = {}
+        subdirs: list[str] = []
+        for entry in self.fs.ls(self._azure_path(directory), detail=True):
+            name = entry["name"].rstrip('/').rsplit('/', 1)[-1]
+            if entry.get("type") == "directory":
+                subdirs.append(name)
+            else:
+                files[name] = [entry.get("size"), str(entry.get("etag") or entry.get("last_modified") or "")]
+        return files, sorted(subdirs)
+
+    def directory_stamp(self, directory: str) -> Optional[str]:
+        """
+        Flat blob containers have no directory timestamps, so every directory is re-listed (concurrently).
+        Override to return e.g. ``fs.info(path)["last_modified"]`` on storage with a hierarchical namespace.
+        """
+        return None
+
+    def full_path(self, rel_path: str) -> str:
+        return self._azure_path(rel_path)
+
+    def read_file_in_data_root(self, name: str) -> Optional[bytes]:
+        path = self._azure_path(name)
+        if not self.fs.exists(path):
+            return None
+        with self.fs.open(path) as f:
+            content: bytes = f.read()
+            return content
+
+    def write_file_in_data_root(self, name: str, content: bytes) -> None:
+        temp_path = os.path.join(tempfile.gettempdir(), name)
+        with open(temp_path, "wb") as f:
+            f.write(content)
+        try:
+            self.upload_csv_to_blob(local_csv_path=temp_path)
+        finally:
+            os.remove(temp_path)
+
+    def save_metadata(self, df: pd.DataFrame) -> None:
+        """
+        Save the metadata CSV to Azure Blob Storage, merged into the existing CSV if built incrementally.
+
+        :param df: Metadata DataFrame to save.
+        """
+        self.save_dataframe_and_upload_csv(df=self.merge_into_existing_metadata(df))
+        self.save_manifest()
+
     def upload_csv_to_blob(self, local_csv_path: str) -> None:
         """
         Upload a local CSV file to Azure Blob Storage using AzureSetup authentication.
@@ -130,9 +130,9 @@ class ISIC2017LocalCSVBuilder(ISIC2017BaseCSVBuilder, LocalCSVBuilder):
         builder.create_metadata_csv()
     """
 
-    def __init__(self, arg: argparse.Namespace) -> None:
+    def __init__(self, arg: argparse.Namespace, incremental: bool = False) -> None:
         ISIC2017BaseCSVBuilder.__init__(self)
-        LocalCSVBuilder.__init__(self, arg)
+        LocalCSVBuilder.__init__(self, arg, incremental)
 
     @property
     def image_pattern(self) -> str:
@@ -146,8 +146,7 @@ class ISIC2017LocalCSVBuilder(ISIC2017BaseCSVBuilder, LocalCSVBuilder):
         return pd.read_csv(Path(self.data_root) / csv_name)
 
     def create_metadata_csv(self) -> None:
-        self.save_dataframe_to_csv(df=self.create_merged_isic2017_metadata(),
-                                   output_csv_path=str(Path(self.data_root) / self.output_csv_name))
+        self.save_metadata(self.create_merged_isic2017_metadata())
 
 
 class ISIC2017AzureCSVBuilder(ISIC2017BaseCSVBuilder, AzureCSVBuilder):
@@ -159,9 +158,9 @@ class ISIC2017AzureCSVBuilder(ISIC2017BaseCSVBuilder, AzureCSVBuilder):
         builder.create_metadata_csv()
     """
 
-    def __init__(self) -> None:
+    def __init__(self, incremental: bool = False) -> None:
         ISIC2017BaseCSVBuilder.__init__(self)
-        AzureCSVBuilder.__init__(self, DatasetKey.ISIC2017.value)
+        AzureCSVBuilder.__init__(self, DatasetKey.ISIC2017.value, incremental)
 
     @property
     def image_pattern(self) -> str:
@@ -177,4 +176,4 @@ class ISIC2017AzureCSVBuilder(ISIC2017BaseCSVBuilder, AzureCSVBuilder):
             return pd.read_csv(f)
 
     def create_metadata_csv(self) -> None:
-        self.save_dataframe_and_upload_csv(df=self.create_merged_isic2017_metadata())
+        self.save_metadata(self.create_merged_isic2017_metadata())
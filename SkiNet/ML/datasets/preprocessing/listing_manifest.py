@@ -0,0 +1,153 @@
+"""
+Manifest of directory listings for incremental metadata CSV builds.
+
+Globbing a whole dataset tree costs one listing per directory, which takes minutes on Azure. The manifest
+stores, per directory relative to the dataset root, a change stamp of the directory and the (size, stamp) of
+its files. :meth:`ListingManifest.update` walks the tree again but re-lists only directories whose stamp
+changed or is unknown, and reports which directories' file listings differ from the previous build.
+
+Stamps are whatever the filesystem offers: the modification time of local directories, which changes when
+entries are added, removed or renamed, and the last-modified time or etag of remote directories where the
+storage has real directories (hierarchical namespace). Directories without a stamp, e.g. virtual directories
+of flat blob containers, are always re-listed; listings run concurrently on a thread pool.
+"""
+from __future__ import annotations
+
+import fnmatch
+import json
+import re
+from collections.abc import Callable, Collection, Iterable
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any
+
+MANIFEST_VERSION = 1
+
+
+@dataclass
+class DirectoryListing:
+    """
+    Listing of one directory.
+
+    :param stamp: Change stamp of the directory at the time of listing, or None if the filesystem has none.
+    :param files: File name to [size, stamp] (modification time or etag).
+    :param subdirs: Names of the subdirectories.
+    """
+    stamp: str | None
+    files: dict[str, list[Any]] = field(default_factory=dict)
+    subdirs: list[str] = field(default_factory=list)
+
+
+ListDirectoryFunc = Callable[[str], "tuple[dict[str, list[Any]], list[str]]"]
+"""Lists a directory given its path relative to the dataset root ("" for the root), returning
+file name to [size, stamp] and the names of the subdirectories."""
+
+DirectoryStampFunc = Callable[[str], "str | None"]
+"""Returns the current change stamp of a directory, or None if it has none."""
+
+
+def join_relative(directory: str, name: str) -> str:
+    """Join a relative directory and an entry name with '/', the root being ''."""
+    return f"{directory}/{name}" if directory else name
+
+
+def glob_to_regex(pattern: str) -> re.Pattern[str]:
+    """
+    Compile a glob pattern on '/'-separated relative paths.
+
+    ``**/`` matches any number of leading directories, a ``**`` elsewhere matches any characters including
+    '/' (as in fsspec globs such as ``**_Data/**.jpg``), and ``*``, ``?`` and ``[...]`` do not cross '/'
+    (as in pathlib globs such as ``ISIC-2017_*_Data/*/*.jpg``).
+
+    :param pattern: Glob pattern relative to the dataset root.
+    :return: Compiled regular expression matching whole relative paths.
+    """
+    parts = re.split(r"(\*\*/|\*\*|\*|\?)", pattern)
+    regex = []
+    for part in parts:
+        if part == "**/":
+            regex.append("(?:.*/)?")
+        elif part == "**":
+            regex.append(".*")
+        elif part == "*":
+            regex.append("[^/]*")
+        elif part == "?":
+            regex.append("[^/]")
+        elif part:
+            # fnmatch handles [...] classes; strip its anchors and let '/' be literal
+            regex.append(fnmatch.translate(part)[4:-3])
+    return re.compile("".join(regex) + r"\Z")
+
+
+class ListingManifest:
+    """
+    Directory listings of a dataset tree from the previous build, keyed by relative directory path.
+    """
+
+    def __init__(self, directories: dict[str, DirectoryListing] | None = None) -> None:
+        self.directories: dict[str, DirectoryListing] = directories if directories is not None else {}
+
+    @classmethod
+    def from_json(cls, text: str) -> "ListingManifest":
+        """
+        Parse a manifest written by :meth:`to_json`; manifests of another version are ignored.
+
+        :param text: JSON content.
+        :return: The manifest, empty if the version does not match.
+        """
+        data = json.loads(text)
+        if data.get("version") != MANIFEST_VERSION:
+            return cls()
+        return cls({path: DirectoryListing(**listing) for path, listing in data["directories"].items()})
+
+    def to_json(self) -> str:
+        return json.dumps({"version": MANIFEST_VERSION,
+                           "directories": {path: vars(listing) for path, listing in sorted(self.directories.items())}})
+
+    def update(self,
+               list_directory: ListDirectoryFunc,
+               directory_stamp: DirectoryStampFunc,
+               max_workers: int = 16,
+               exclude: Collection[str] = ()) -> set[str]:
+        """
+        Walk the tree breadth-first, re-listing only directories whose stamp changed or is unknown.
+
+        :param list_directory: Lists a directory, see :data:`ListDirectoryFunc`.
+        :param directory_stamp: Returns the current stamp of a directory, see :data:`DirectoryStampFunc`.
+        :param max_workers: Number of threads stamping and listing directories concurrently.
+        :param exclude: Relative paths of directories that are neither listed nor walked, with their subdirectories.
+        :return: Relative paths of directories that were added or removed, or whose files changed.
+        """
+        def visit(directory: str) -> tuple[DirectoryListing, bool]:
+            # stamp before listing, so that entries added meanwhile are listed again next time
+            stamp = directory_stamp(directory)
+            previous = self.directories.get(directory)
+            if stamp is not None and previous is not None and previous.stamp == stamp:
+                return previous, False
+            files, subdirs = list_directory(directory)
+            # JSON turns tuples into lists, so compare in that form
+            listing = DirectoryListing(stamp, {name: list(entry) for name, entry in files.items()}, list(subdirs))
+            return listing, previous is None or previous.files != listing.files
+
+        directories: dict[str, DirectoryListing] = {}
+        changed: set[str] = set()
+        level = [""]
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="listing") as executor:
+            while level:
+                next_level: list[str] = []
+                for directory, (listing, files_changed) in zip(level, executor.map(visit, level)):
+                    directories[directory] = listing
+                    if files_changed:
+                        changed.add(directory)
+                    next_level.extend(path for path in (join_relative(directory, name) for name in listing.subdirs)
+                                      if path not in exclude)
+                level = next_level
+        changed |= set(self.directories) - set(directories)
+        self.directories = directories
+        return changed
+
+    def files(self) -> Iterable[str]:
+        """Relative paths of all files in the manifest."""
+        for directory, listing in self.directories.items():
+            for name in listing.files:
+                yield join_relative(directory, name)
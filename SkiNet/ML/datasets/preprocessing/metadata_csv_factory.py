@@ -15,16 +15,20 @@ class MetadataFactory(ABC):
     """
 
     @abstractmethod
-    def get_local_csv_builder(self, arg: argparse.Namespace) -> LocalCSVBuilder:
+    def get_local_csv_builder(self, arg: argparse.Namespace, incremental: bool = False) -> LocalCSVBuilder:
         """
         Create a CSV builder instance for the local environment.
+
+        :param incremental: If True, the builder builds the CSV incrementally from the manifest of the previous build.
         """
         pass
 
     @abstractmethod
-    def get_azure_csv_builder(self) -> AzureCSVBuilder:
+    def get_azure_csv_builder(self, incremental: bool = False) -> AzureCSVBuilder:
         """
         Create a CSV builder instance for the Azure environment.
+
+        :param incremental: If True, the builder builds the CSV incrementally from the manifest of the previous build.
         """
         pass
 
@@ -34,17 +38,17 @@ class PH2MetadataFactory(MetadataFactory):
     Factory class for creating PH2 dataset metadata in local and Azure environments.
     """
 
-    def get_local_csv_builder(self, arg: argparse.Namespace) -> LocalCSVBuilder:
+    def get_local_csv_builder(self, arg: argparse.Namespace, incremental: bool = False) -> LocalCSVBuilder:
         """
         Create a LocalCSVBuilder instance for the PH2 dataset.
         """
-        return PH2LocalCSVBuilder(arg)
+        return PH2LocalCSVBuilder(arg, incremental)
 
-    def get_azure_csv_builder(self) -> AzureCSVBuilder:
+    def get_azure_csv_builder(self, incremental: bool = False) -> AzureCSVBuilder:
         """
         Create an AzureCSVBuilder instance for the PH2 dataset.
         """
-        return PH2AzureCSVBuilder()
+        return PH2AzureCSVBuilder(incremental)
 
 
 class ISIC2017MetadataFactory(MetadataFactory):
@@ -52,17 +56,17 @@ class ISIC2017MetadataFactory(MetadataFactory):
     Factory class for creating ISIC 2017 dataset metadata in local and Azure environments.
     """
 
-    def get_local_csv_builder(self, arg: argparse.Namespace) -> LocalCSVBuilder:
+    def get_local_csv_builder(self, arg: argparse.Namespace, incremental: bool = False) -> LocalCSVBuilder:
         """
         Create a LocalCSVBuilder instance for the ISIC 2017 dataset.
         """
-        return ISIC2017LocalCSVBuilder(arg)
+        return ISIC2017LocalCSVBuilder(arg, incremental)
 
-    def get_azure_csv_builder(self) -> AzureCSVBuilder:
+    def get_azure_csv_builder(self, incremental: bool = False) -> AzureCSVBuilder:
         """
         Create an AzureCSVBuilder instance for the ISIC 2017 dataset.
         """
-        return ISIC2017AzureCSVBuilder()
+        return ISIC2017AzureCSVBuilder(incremental)
 
 
 def get_factory(dataset_key: DatasetKey) -> MetadataFactory:
@@ -105,9 +109,9 @@ def main(args: argparse.Namespace) -> None:
 
     builder: Union[AzureCSVBuilder, LocalCSVBuilder]
     if args.azure_data:
-        builder = factory.get_azure_csv_builder()
+        builder = factory.get_azure_csv_builder(args.incremental)
     else:
-        builder = factory.get_local_csv_builder(args)
+        builder = factory.get_local_csv_builder(args, args.incremental)
     builder.create_metadata_csv()
 
 
@@ -125,6 +129,8 @@ if __name__ == "__main__":
     python metadata_csv_factory.py --dataset_key_str="PH2" --azure_data,
     ```
 
+    Add --incremental to rebuild only the samples in directories that changed since the previous run.
+
     where "PH2" is a valid dataset key from the DatasetKey Enum.
     For local data, the local_data_root should point to the directory containing the PH2 data samples.
     For data on Azure, the script will look for the data location specified in the YAML config file.
@@ -145,6 +151,11 @@ if __name__ == "__main__":
                         required=False,
                         help="The root path to data on the local file system. The path should point to a directory that contains folders"
                         " with samples of data uniquely identifiable by their ID. Only used when no --azure-data flag is set.")
+    parser.add_argument("--incremental",
+                        action='store_true',
+                        required=False,
+                        help="If set, re-list only directories that changed since the previous run (as recorded in a manifest next "
+                        "to the CSV) and merge the rebuilt rows into the existing CSV, keeping its extra columns for unchanged samples.")
     args = parser.parse_args()
 
     main(args)
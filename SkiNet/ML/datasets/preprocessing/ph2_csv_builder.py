@@ -131,12 +131,13 @@ class PH2LocalCSVBuilder(PH2BaseCSVBuilder, LocalCSVBuilder):
     builder.create_metadata_csv()
     """
 
-    def __init__(self, arg: argparse.Namespace) -> None:
+    def __init__(self, arg: argparse.Namespace, incremental: bool = False) -> None:
         """
         :param arg: Command-line arguments, containing the root path to data on a local file system.
+        :param incremental: If True, build the CSV incrementally from the manifest of the previous build.
         """
         PH2BaseCSVBuilder.__init__(self)
-        LocalCSVBuilder.__init__(self, arg)
+        LocalCSVBuilder.__init__(self, arg, incremental)
 
     @property
     def external_txt_path(self) -> str:
@@ -172,8 +173,7 @@ class PH2LocalCSVBuilder(PH2BaseCSVBuilder, LocalCSVBuilder):
         """
         Create a metadata CSV file for the dataset on a local file system.
         """
-        self.save_dataframe_to_csv(df=self.create_merged_ph2_metadata(),
-                                   output_csv_path=str(Path(self.data_root) / self.output_csv_name))
+        self.save_metadata(self.create_merged_ph2_metadata())
 
 
 class PH2AzureCSVBuilder(PH2BaseCSVBuilder, AzureCSVBuilder):
@@ -185,9 +185,9 @@ class PH2AzureCSVBuilder(PH2BaseCSVBuilder, AzureCSVBuilder):
     builder.create_metadata_csv()
     """
 
-    def __init__(self) -> None:
+    def __init__(self, incremental: bool = False) -> None:
         PH2BaseCSVBuilder.__init__(self)
-        AzureCSVBuilder.__init__(self, DatasetKey.PH2.value)
+        AzureCSVBuilder.__init__(self, DatasetKey.PH2.value, incremental)
 
     @property
     def external_txt_path(self) -> str:
@@ -221,4 +221,4 @@ class PH2AzureCSVBuilder(PH2BaseCSVBuilder, AzureCSVBuilder):
         """
         Create a metadata CSV file for the dataset on Azure
         """
-        self.save_dataframe_and_upload_csv(df=self.create_merged_ph2_metadata())
+        self.save_metadata(self.create_merged_ph2_metadata())
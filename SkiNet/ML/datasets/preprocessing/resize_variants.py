@@ -0,0 +1,209 @@
+"""
+Pre-resized variants of a dataset, recorded in its metadata CSV.
+
+Decoding a 4000x3000 dermoscopy JPEG only to crop 512x512 out of a downscaled copy wastes most of
+the data-loading time. This stage writes a copy of every image and mask whose shorter side is
+``min_side`` (aspect ratio kept, never upscaled) to ``<data_root>/resized/minside_<min_side>/``
+and records the copy's relative path in a column ``datapath_minside_<min_side>`` of the metadata CSV.
+The metadata CSV builders skip ``<data_root>/resized/``, so the copies are never recorded as samples.
+:class:`~SkiNet.ML.datasets.segmentation_dataset.SegmentationDataset` then reads the smallest variant
+that still fits the configured crop (see :func:`required_min_side` and :func:`select_resized_variant`).
+
+Images are resized with OpenCV's SIMD-accelerated ``INTER_AREA`` filter, masks with nearest-neighbour
+interpolation so they stay binary, in a process pool. Existing copies newer than their source are kept,
+so re-running after adding samples only resizes the new ones.
+
+Run with:
+    python -m SkiNet.ML.datasets.preprocessing.resize_variants --config main_config.yaml [--min-side 512 768] [--workers 8]
+
+Without ``--min-side`` the variant needed by the config's ``TRANSFORM_CONFIG.crop`` is written.
+Only local data roots are supported, as the metadata CSV is rewritten in place.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import math
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from SkiNet.ML.configs.transform_configs.crop_config import CropConfig
+from SkiNet.Utils.csv_headers import (DATAPATH_HEADER, DATATYPE_HEADER, DATATYPE_MASK, RESIZED_DATAPATH_PREFIX,
+                                      RESIZED_DIR)
+
+logger = logging.getLogger(__name__)
+
+_VARIANT_COLUMN = re.compile(rf"^{re.escape(RESIZED_DATAPATH_PREFIX)}(\d+)$")
+
+
+def variant_column(min_side: int) -> str:
+    """Name of the metadata column holding the paths of the ``min_side`` variant."""
+    return f"{RESIZED_DATAPATH_PREFIX}{min_side}"
+
+
+def available_variants(df: pd.DataFrame) -> list[int]:
+    """
+    Shorter-side lengths of the resized variants recorded in a metadata DataFrame, ascending.
+    """
+    return sorted(int(match.group(1)) for col in df.columns if (match := _VARIANT_COLUMN.match(str(col))))
+
+
+def required_min_side(crop: CropConfig) -> int | None:
+    """
+    Shorter image side needed so that cropping loses no resolution compared with the originals.
+
+    Center and random crops need at least ``max(crop.size)``. A random resized crop covering a fraction
+    ``scale[0]`` of the area has sides of about ``sqrt(scale[0])`` times the image sides, which are then
+    resized to ``crop.size``, so the image needs ``max(crop.size) / sqrt(scale[0])``.
+
+    :param crop: Crop configuration of the transform pipeline.
+    :return: The minimal shorter side, or None if no crop is applied (images are used at full size).
+    """
+    if not crop.crop_apply:
+        return None
+    side = max(crop.size)
+    if crop.crop_type == "random_resized_crop":
+        return math.ceil(side / math.sqrt(crop.scale[0]))
+    return side
+
+
+def select_resized_variant(df: pd.DataFrame, min_side: int | None) -> pd.DataFrame:
+    """
+    Point the data paths of a metadata DataFrame to the smallest variant whose shorter side is at least ``min_side``.
+
+    Variant columns are dropped in any case, so they do not end up as sample metadata. Rows without a
+    path in the chosen variant keep their original path.
+
+    :param df: Metadata DataFrame, possibly with ``datapath_minside_<n>`` columns.
+    :param min_side: Required shorter side, e.g. from :func:`required_min_side`; None keeps the originals.
+    :return: A DataFrame with the selected paths in the datapath column and without variant columns.
+    """
+    sizes = available_variants(df)
+    if not sizes:
+        return df
+    fitting = [size for size in sizes if min_side is not None and size >= min_side]
+    out = df.copy()
+    if fitting:
+        column = variant_column(fitting[0])
+        out[DATAPATH_HEADER] = out[column].where(out[column].notna(), out[DATAPATH_HEADER])
+        logger.info("Reading the pre-resized variant '%s' (shorter side %d >= %d).", column, fitting[0], min_side)
+    elif min_side is not None:
+        logger.info("No pre-resized variant has a shorter side >= %d (available: %s); reading the originals.", min_side, sizes)
+    return out.drop(columns=[variant_column(size) for size in sizes])
+
+
+def _init_resize_process() -> None:
+    # one process per core; OpenCV's own thread pool would only oversubscribe
+    cv2.setNumThreads(1)
+
+
+def resize_item(src: Path, dst: Path, min_side: int, is_mask: bool) -> int:
+    """
+    Write a copy of ``src`` whose shorter side is ``min_side``; smaller sources are copied unchanged.
+
+    :param src: Source image or mask file.
+    :param dst: Destination file; its extension selects the encoder.
+    :param min_side: Target shorter side.
+    :param is_mask: Use nearest-neighbour interpolation instead of area averaging.
+    :return: Number of bytes of the decoded source, for throughput reporting.
+    """
+    # IMREAD_UNCHANGED keeps the channel count and bit depth and, like torchvision's decode_image, ignores EXIF orientation
+    item = cv2.imread(str(src), cv2.IMREAD_UNCHANGED)
+    if item is None:
+        raise ValueError(f"Could not decode '{src}'.")
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    h, w = item.shape[:2]
+    scale = min_side / min(h, w)
+    if scale >= 1.0:
+        shutil.copy2(src, dst)
+    else:
+        size = (max(1, round(w * scale)), max(1, round(h * scale)))
+        resized = cv2.resize(item, size, interpolation=cv2.INTER_NEAREST if is_mask else cv2.INTER_AREA)
+        if not cv2.imwrite(str(dst), resized):
+            raise ValueError(f"Could not write '{dst}'.")
+    return int(item.nbytes)
+
+
+def write_resized_variant(df: pd.DataFrame,
+                          data_root: Path,
+                          min_side: int,
+                          max_workers: int | None = None) -> pd.DataFrame:
+    """
+    Resize all images and masks of a metadata DataFrame and record the variant's paths.
+
+    :param df: Metadata DataFrame with datapath and datatype columns.
+    :param data_root: Local root directory the data paths are relative to.
+    :param min_side: Shorter side of the variant.
+    :param max_workers: Number of processes; defaults to os.cpu_count().
+    :return: ``df`` with the column ``datapath_minside_<min_side>`` added or replaced.
+    """
+    out = df.copy()
+    rel_paths = [f"{RESIZED_DIR}/minside_{min_side}/{path}" for path in df[DATAPATH_HEADER]]
+    tasks = []
+    for src_rel, dst_rel, datatype in zip(df[DATAPATH_HEADER], rel_paths, df[DATATYPE_HEADER]):
+        src, dst = data_root / src_rel, data_root / dst_rel
+        if dst.exists() and dst.stat().st_mtime >= src.stat().st_mtime:
+            continue
+        tasks.append((src, dst, datatype == DATATYPE_MASK))
+
+    logger.info("Resizing %d of %d files to shorter side %d (%d up to date).",
+                len(tasks), len(df), min_side, len(df) - len(tasks))
+    start = time.perf_counter()
+    nbytes = 0
+    if tasks:
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), initializer=_init_resize_process) as executor:
+            srcs, dsts, masks = zip(*tasks)
+            for done, item_bytes in enumerate(executor.map(resize_item, srcs, dsts, [min_side] * len(tasks), masks,
+                                                           chunksize=16), start=1):
+                nbytes += item_bytes
+                if done % 500 == 0 or done == len(tasks):
+                    elapsed = time.perf_counter() - start
+                    logger.info("  %d / %d files, %.1f files/s, %.1f MB/s decoded.",
+                                done, len(tasks), done / elapsed, nbytes / 1024**2 / elapsed)
+    out[variant_column(min_side)] = np.array(rel_paths, dtype=object)
+    return out
+
+
+def main() -> None:
+    from SkiNet.ML.configs.load_config_from_yaml import load_config_from_yaml
+
+    ap = argparse.ArgumentParser(description="Write pre-resized variants of a dataset and record them in its metadata CSV.")
+    ap.add_argument("--config", type=Path, required=True, help="Path to experiment YAML config")
+    ap.add_argument("--min-side", type=int, nargs="+", default=None,
+                    help="Shorter sides of the variants (default: the one required by TRANSFORM_CONFIG.crop)")
+    ap.add_argument("--workers", type=int, default=None, help="Resizing processes (default: all cores)")
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    config = load_config_from_yaml(args.config)
+    data_config = config.dataconfig
+    if data_config.azure_data:
+        ap.error("Resized variants can only be written for local data roots")
+    min_sides = args.min_side
+    if min_sides is None:
+        required = required_min_side(config.transformconfig.crop)
+        if required is None:
+            ap.error("TRANSFORM_CONFIG.crop is disabled; provide --min-side")
+        min_sides = [required]
+
+    data_root = Path(data_config.data_root)
+    csv_path = data_root / data_config.METADATA_CSV_NAME
+    df = pd.read_csv(csv_path)
+    # variants are always resized from the originals
+    originals = df.drop(columns=[variant_column(size) for size in available_variants(df)])
+    for min_side in min_sides:
+        df[variant_column(min_side)] = write_resized_variant(originals, data_root, min_side, args.workers)[variant_column(min_side)]
+    df.to_csv(csv_path, index=False)
+    logger.info("Recorded variants %s in '%s'.", available_variants(df), csv_path)
+
+
+if __name__ == "__main__":
+    main()
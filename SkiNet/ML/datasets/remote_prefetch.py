@@ -0,0 +1,279 @@
+"""
+Read-ahead of files on remote fsspec filesystems such as ``AzureMachineLearningFileSystem``.
+
+Opening and reading one file per sample through a remote filesystem costs at least one network
+round trip per file, so a dataset reading synchronously is bound by latency rather than bandwidth.
+:class:`RemoteFilePrefetcher` keeps up to ``max_in_flight`` whole-file reads running on a thread
+pool ahead of the order in which the dataset will ask for them (the sampler order, or the indices
+of the current batch), while capping the bytes held in flight or buffered.
+
+The prefetcher is per process: forked or spawned DataLoader workers start with an empty buffer,
+their own thread pool and no announced order. With ``num_workers=0`` announce the sampler order
+(see :class:`~SkiNet.ML.dataloaders.samplers.PrefetchOrderSampler`); with workers, datasets
+prefetch all files of a batch at once in ``__getitems__``.
+"""
+from __future__ import annotations
+
+import io
+import logging
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Iterable, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_SIZE_ESTIMATE = 1024**2
+"""Bytes reserved per read before the size of any file is known."""
+
+
+@dataclass
+class PrefetchStats:
+    """
+    Counters of a :class:`RemoteFilePrefetcher`.
+
+    A read is a *hit* if the prefetched bytes were already buffered, a *late hit* if the prefetch
+    was still in flight and had to be awaited, and a *miss* if the file had not been prefetched.
+    A prefetch is *evicted* if it was dropped unread because it was no longer expected.
+    """
+    hits: int = 0
+    late_hits: int = 0
+    misses: int = 0
+    evicted: int = 0
+    bytes_read: int = 0
+    wait_s: float = 0.0
+    """Total time spent blocked in :meth:`RemoteFilePrefetcher.read`."""
+    latencies_s: deque[float] = field(default_factory=lambda: deque(maxlen=1024))
+    """Latencies of the most recent remote reads."""
+
+    @property
+    def hit_rate(self) -> float:
+        requests = self.hits + self.late_hits + self.misses
+        return (self.hits + self.late_hits) / requests if requests else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        """Flat summary suitable for logging; latency percentiles are in milliseconds."""
+        latencies = np.asarray(self.latencies_s) * 1e3
+        return {"hits": self.hits,
+                "late_hits": self.late_hits,
+                "misses": self.misses,
+                "evicted": self.evicted,
+                "hit_rate": self.hit_rate,
+                "bytes_read": self.bytes_read,
+                "wait_s": self.wait_s,
+                "latency_p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+                "latency_p95_ms": float(np.percentile(latencies, 95)) if len(latencies) else 0.0}
+
+
+class RemoteFilePrefetcher:
+    """
+    Thread-pool read-ahead of whole files from an fsspec filesystem.
+
+    Either announce the expected read order with :meth:`set_order` (each :meth:`read` then tops up
+    the reads ahead of its position), or request a set of files explicitly with :meth:`prefetch`,
+    e.g. all files of a batch. Files that are read without having been prefetched are read
+    synchronously and counted as misses.
+
+    Prefetches that are no longer expected — behind the current position of the order, or neither
+    in the order nor requested by the last :meth:`prefetch` call (e.g. files of batches skipped by
+    ``limit_*_batches``) — are evicted before new ones are submitted, so they cannot hold the caps.
+    """
+
+    def __init__(self,
+                 fs: Any,
+                 max_in_flight: int = 16,
+                 max_bytes_in_flight: int = 256 * 1024**2,
+                 lookahead: int = 64) -> None:
+        """
+        :param fs: fsspec filesystem providing ``cat_file(path)``, e.g. an ``AzureMachineLearningFileSystem``.
+        :param max_in_flight: Maximum number of concurrent remote reads.
+        :param max_bytes_in_flight: Cap on the bytes of running and buffered-but-unread prefetches. Sizes of
+            running reads are estimated by the mean size of the files read so far. At least one read is always
+            allowed, so files larger than the cap are still prefetched one at a time.
+        :param lookahead: Number of files ahead of the current position of the order that are kept prefetched.
+        """
+        if max_in_flight < 1 or lookahead < 0:
+            raise ValueError(f"max_in_flight must be positive and lookahead non-negative, got {max_in_flight} and {lookahead}.")
+        self.fs = fs
+        self.max_in_flight = max_in_flight
+        self.max_bytes_in_flight = max_bytes_in_flight
+        self.lookahead = lookahead
+        self.stats = PrefetchStats()
+        self._reset()
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._executor: ThreadPoolExecutor | None = None
+        self._pending: dict[str, Future[bytes]] = {}
+        self._reserved: dict[str, int] = {}
+        self._order: list[str] = []
+        self._positions: dict[str, int] = {}
+        self._requested: set[str] = set()
+        self._cursor = 0
+        self._size_total = 0
+        self._size_count = 0
+
+    def __getstate__(self) -> dict[str, Any]:
+        """Threads, buffered reads and the announced order stay in their process; unpickled copies start empty."""
+        state = self.__dict__.copy()
+        for key in ("_lock", "_executor", "_pending", "_reserved"):
+            state.pop(key)
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._reset()
+
+    def _check_process(self) -> None:
+        # Thread pools do not survive fork. A worker reads only some of the batches, so it does not
+        # inherit the announced order either and prefetches per batch instead (see prefetch()).
+        if os.getpid() != self._pid:
+            self._reset()
+
+    @property
+    def bytes_in_flight(self) -> int:
+        """Bytes reserved by running and buffered prefetches."""
+        return sum(self._reserved.values())
+
+    def _size_estimate(self) -> int:
+        return self._size_total // self._size_count if self._size_count else _DEFAULT_SIZE_ESTIMATE
+
+    def _fetch(self, path: str) -> bytes:
+        start = time.perf_counter()
+        data: bytes = self.fs.cat_file(path)
+        with self._lock:
+            self.stats.latencies_s.append(time.perf_counter() - start)
+            self.stats.bytes_read += len(data)
+            self._size_total += len(data)
+            self._size_count += 1
+            if path in self._reserved:
+                self._reserved[path] = len(data)
+        return data
+
+    def _is_expected(self, path: str) -> bool:
+        position = self._positions.get(path)
+        if position is not None:
+            return position >= self._cursor
+        return path in self._requested
+
+    def _evict_stale(self) -> None:
+        """Drop finished or not yet started prefetches that are no longer expected to be read."""
+        for path in [p for p in self._pending if not self._is_expected(p)]:
+            future = self._pending[path]
+            if future.done() or future.cancel():
+                del self._pending[path]
+                with self._lock:
+                    self._reserved.pop(path, None)
+                self.stats.evicted += 1
+
+    def _submit(self, path: str) -> bool:
+        """Start prefetching ``path`` unless it is already pending or a cap is reached."""
+        if path in self._pending:
+            return True
+        running = sum(not f.done() for f in self._pending.values())
+        estimate = self._size_estimate()
+        if self._pending and (running >= self.max_in_flight or self.bytes_in_flight + estimate > self.max_bytes_in_flight):
+            return False
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="remote-prefetch")
+        with self._lock:
+            self._reserved[path] = estimate
+        self._pending[path] = self._executor.submit(self._fetch, path)
+        return True
+
+    def set_order(self, paths: Sequence[str]) -> None:
+        """
+        Announce the order of upcoming reads, e.g. the files of the sampler's indices for this epoch.
+        Prefetches that are not part of the new order are dropped.
+
+        :param paths: Paths in the order they will be read; a path may appear only once.
+        """
+        self._check_process()
+        self._order = list(paths)
+        self._positions = {path: i for i, path in enumerate(self._order)}
+        self._cursor = 0
+        for path in [p for p in self._pending if p not in self._positions]:
+            self._pending.pop(path).cancel()
+            with self._lock:
+                self._reserved.pop(path, None)
+        self._top_up()
+
+    def prefetch(self, paths: Iterable[str]) -> None:
+        """
+        Start prefetching the given files, as far as the caps allow.
+
+        :param paths: Paths that will be read soon; they replace the paths of the previous call.
+        """
+        self._check_process()
+        paths = list(paths)
+        self._requested = set(paths)
+        self._evict_stale()
+        for path in paths:
+            if not self._submit(path):
+                break
+
+    def _top_up(self) -> None:
+        self._evict_stale()
+        for path in self._order[self._cursor:self._cursor + self.lookahead]:
+            if not self._submit(path):
+                break
+
+    def read(self, path: str) -> bytes:
+        """
+        Return the content of ``path``, from the prefetch buffer if available.
+
+        :param path: Path on the filesystem.
+        :return: The file content.
+        """
+        self._check_process()
+        start = time.perf_counter()
+        future = self._pending.pop(path, None)
+        if future is None:
+            self.stats.misses += 1
+            data = self._fetch(path)
+        else:
+            if future.done():
+                self.stats.hits += 1
+            else:
+                self.stats.late_hits += 1
+            data = future.result()
+            with self._lock:
+                self._reserved.pop(path, None)
+        self.stats.wait_s += time.perf_counter() - start
+
+        position = self._positions.get(path)
+        if position is not None:
+            self._cursor = max(self._cursor, position + 1)
+        self._top_up()
+        return data
+
+    def close(self) -> None:
+        """Cancel outstanding prefetches and stop the threads."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
+        self._pending.clear()
+        self._reserved.clear()
+
+
+def open_remote(fs: Any, path: str | bytes, prefetcher: RemoteFilePrefetcher | None = None) -> Any:
+    """
+    Open a file on ``fs`` for reading, through ``prefetcher`` if one is given.
+
+    :param fs: fsspec filesystem.
+    :param path: Path on the filesystem; bytes paths (as stored to avoid copy-on-write) are decoded.
+    :param prefetcher: Optional prefetcher serving the file from its buffer.
+    :return: A binary file-like object usable as a context manager.
+    """
+    if isinstance(path, bytes):
+        path = path.decode("utf-8")
+    if prefetcher is None:
+        return fs.open(path)
+    return io.BytesIO(prefetcher.read(path))
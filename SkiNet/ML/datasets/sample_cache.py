@@ -0,0 +1,441 @@
+"""
+Caches of decoded samples shared by the dataset and its DataLoader workers.
+
+A plain ``dict[str, Sample]`` holds one pydantic object and two tensors per sample. With
+``num_workers > 0`` every forked worker touches the refcounts of those objects, so the
+copy-on-write pages holding them are duplicated per worker and RSS grows with ``num_workers``
+(see https://github.com/pytorch/pytorch/issues/13246#issuecomment-905703662).
+
+:class:`PackedSampleCache` instead packs every decoded image and mask into one contiguous
+uint8 arena (shared memory or a memory-mapped file) plus a numpy offsets/shape index.
+Workers read zero-copy views into the arena, so memory stays flat regardless of the number
+of workers.
+
+:class:`LRUSampleCache` is the bounded alternative for datasets that do not fit in RAM: it is
+filled lazily on first access and evicts the least recently used samples beyond a byte budget.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import tempfile
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import Callable, Iterator, Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Literal
+
+import numpy as np
+import torch
+from torch.utils.data import get_worker_info
+
+from SkiNet.ML.datasets.sample_specs import Sample, SampleSpecs
+
+logger = logging.getLogger(__name__)
+
+CacheBackend = Literal["dict", "shared_memory", "memmap"]
+"""Storage backend of the RAM cache: a dict of Sample objects, a shared-memory arena or a memory-mapped arena."""
+
+
+def load_samples(sample_specs: Mapping[str, SampleSpecs],
+                 load_fn: Callable[[SampleSpecs], Sample],
+                 max_workers: int | None = None) -> dict[str, Sample]:
+    """
+    Load all samples concurrently with a thread pool.
+
+    :param sample_specs: Mapping of sample_id to its SampleSpecs.
+    :param load_fn: Loads one sample given its specs, e.g. ``partial(load_sample, data_root=data_root)``.
+    :param max_workers: Number of loading threads; defaults to min(os.cpu_count(), 8).
+    :return: Dictionary mapping sample_id to the loaded Sample (CHW, uint8).
+    """
+    if max_workers is None:
+        max_workers = min(os.cpu_count() or 4, 8)
+    samples: dict[str, Sample] = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(load_fn, specs): sid for sid, specs in sample_specs.items()}
+        for future in as_completed(futures):
+            samples[futures[future]] = future.result()
+    return samples
+
+
+@dataclass(frozen=True)
+class WarmupStats:
+    """Throughput of :func:`load_samples_in_processes`."""
+    samples: int
+    nbytes: int
+    seconds: float
+
+    @property
+    def mb_per_s(self) -> float:
+        return self.nbytes / 1024**2 / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def images_per_s(self) -> float:
+        return self.samples / self.seconds if self.seconds > 0 else 0.0
+
+
+_warmup_load_fns: Sequence[Callable[[SampleSpecs], Sample]] = ()
+"""Load functions of the warm-up jobs, set once per pool process by :func:`_init_warmup_process`."""
+
+
+def _init_warmup_process(load_fns: Sequence[Callable[[SampleSpecs], Sample]]) -> None:
+    global _warmup_load_fns
+    _warmup_load_fns = load_fns
+    # one decoding process per core; intra-op threads would only oversubscribe
+    torch.set_num_threads(1)
+
+
+def _load_chunk(job: int, chunk: list[SampleSpecs]) -> tuple[torch.Tensor, np.ndarray, np.ndarray]:
+    """
+    Decode a chunk of samples in a pool process and pack them into one shared-memory uint8 buffer,
+    so that a single file descriptor carries the whole chunk back to the parent.
+
+    :return: The buffer, int64 offsets [n, 2] and int64 CHW shapes [n, 2, 3] of the images and masks.
+    """
+    items: list[torch.Tensor] = []
+    for specs in chunk:
+        sample = _warmup_load_fns[job](specs)
+        for item in (sample.image, sample.mask):
+            item = item if isinstance(item, torch.Tensor) else torch.from_numpy(np.ascontiguousarray(item))
+            if item.dtype != torch.uint8 or item.ndim != 3:
+                raise TypeError(f"Sample '{specs.sample_id}' must hold CHW uint8 items, got {item.dtype} {tuple(item.shape)}.")
+            items.append(item)
+    sizes = np.array([item.numel() for item in items], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]]).reshape(-1, 2)
+    shapes = np.array([item.shape for item in items], dtype=np.int64).reshape(-1, 2, 3)
+    buffer = torch.empty(int(sizes.sum()), dtype=torch.uint8).share_memory_()
+    for start, item in zip(offsets.reshape(-1).tolist(), items):
+        buffer[start:start + item.numel()].copy_(item.reshape(-1))
+    return buffer, offsets, shapes
+
+
+def load_samples_in_processes(jobs: Sequence[tuple[Mapping[str, SampleSpecs], Callable[[SampleSpecs], Sample]]],
+                              max_workers: int | None = None,
+                              chunk_size: int = 32) -> tuple[list[dict[str, Sample]], WarmupStats]:
+    """
+    Load the samples of several datasets concurrently with one process pool.
+
+    Decoding is partly GIL-bound, so processes scale to all cores where :func:`load_samples` threads do not.
+    Each pool process decodes ``chunk_size`` samples into one shared-memory buffer; the returned samples
+    are views into these buffers, so nothing is copied back through pipes and DataLoader workers share them.
+    Progress and throughput are logged every 10% of the samples.
+
+    :param jobs: Pairs of sample specs and the load function of their dataset, e.g. one per split. Load
+        functions must be picklable if the multiprocessing start method is not fork.
+    :param max_workers: Number of processes; defaults to os.cpu_count().
+    :param chunk_size: Number of samples decoded per task.
+    :return: Per job, a dictionary mapping sample_id to its Sample in ``sample_specs`` order, and the throughput.
+    """
+    total = sum(len(sample_specs) for sample_specs, _ in jobs)
+    samples: list[dict[str, Sample]] = [{} for _ in jobs]
+    nbytes = done = 0
+    next_report = 0.1
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), initializer=_init_warmup_process,
+                             initargs=([load_fn for _, load_fn in jobs],)) as executor:
+        futures = {}
+        for job, (sample_specs, _) in enumerate(jobs):
+            job_specs = list(sample_specs.values())
+            for i in range(0, len(job_specs), chunk_size):
+                chunk = job_specs[i:i + chunk_size]
+                futures[executor.submit(_load_chunk, job, chunk)] = (job, chunk)
+        for future in as_completed(futures):
+            job, chunk = futures[future]
+            buffer, offsets, shapes = future.result()
+            for specs, (image_at, mask_at), (image_shape, mask_shape) in zip(chunk, offsets.tolist(), shapes.tolist()):
+                image = buffer[image_at:image_at + int(np.prod(image_shape))].view(image_shape)
+                mask = buffer[mask_at:mask_at + int(np.prod(mask_shape))].view(mask_shape)
+                samples[job][specs.sample_id] = Sample(image=image, mask=mask, specs=specs)
+            nbytes += buffer.numel()
+            done += len(chunk)
+            if done >= next_report * total:
+                elapsed = time.perf_counter() - start
+                logger.info("Cache warm-up: %d/%d samples, %.1f MB/s, %.1f images/s.",
+                            done, total, nbytes / 1024**2 / elapsed, done / elapsed)
+                next_report = np.floor(done / total * 10) / 10 + 0.1
+    stats = WarmupStats(samples=total, nbytes=nbytes, seconds=time.perf_counter() - start)
+    logger.info("Cache warm-up of %d samples (%.1f MB) took %.1f s: %.1f MB/s, %.1f images/s.",
+                total, nbytes / 1024**2, stats.seconds, stats.mb_per_s, stats.images_per_s)
+    ordered = [{sid: loaded[specs.sample_id] for sid, specs in sample_specs.items()}
+               for loaded, (sample_specs, _) in zip(samples, jobs)]
+    return ordered, stats
+
+
+def _unlink_if_owner(path: str, owner_pid: int) -> None:
+    """Remove the arena file, but only from the process that created it (not from forked workers)."""
+    if os.getpid() == owner_pid:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+class PackedSampleCache(Mapping[str, Sample]):
+    """
+    Read-only mapping of sample_id to Sample backed by one contiguous uint8 arena.
+
+    The arena layout is ``[image_0, mask_0, image_1, mask_1, ...]``; ``_offsets[i]`` holds the
+    start of image and mask ``i`` and ``_shapes[i]`` their CHW shapes. Both index arrays are
+    numpy arrays, i.e. single Python objects, so lookups from workers do not dirty
+    copy-on-write pages.
+
+    Returned samples hold views into the arena — transforms must not modify them in place
+    (Albumentations transforms return new arrays).
+    """
+
+    def __init__(self,
+                 arena: torch.Tensor,
+                 offsets: np.ndarray,
+                 shapes: np.ndarray,
+                 sample_specs: Mapping[str, SampleSpecs],
+                 backend: CacheBackend,
+                 arena_path: str | None = None) -> None:
+        """
+        :param arena: 1D uint8 tensor holding all images and masks back to back.
+        :param offsets: int64 array of shape [N, 2] with the image and mask offsets of each sample.
+        :param shapes: int64 array of shape [N, 2, 3] with the image and mask CHW shapes of each sample.
+        :param sample_specs: Specs of the cached samples, in the same order as ``offsets``.
+        :param backend: Either "shared_memory" or "memmap".
+        :param arena_path: Path of the memory-mapped arena file; required for the "memmap" backend.
+        """
+        if backend == "memmap" and arena_path is None:
+            raise ValueError("arena_path is required for the 'memmap' backend.")
+        self._arena = arena
+        self._offsets = offsets
+        self._shapes = shapes
+        self._sample_specs = sample_specs
+        self._index = {sid: i for i, sid in enumerate(sample_specs)}
+        self.backend = backend
+        self.arena_path = arena_path
+
+    @classmethod
+    def from_samples(cls,
+                     samples: Mapping[str, Sample],
+                     sample_specs: Mapping[str, SampleSpecs],
+                     backend: CacheBackend = "shared_memory",
+                     cache_dir: Path | None = None) -> "PackedSampleCache":
+        """
+        Pack already decoded samples into an arena.
+
+        :param samples: Mapping of sample_id to the decoded Sample (CHW, uint8).
+        :param sample_specs: Specs of the samples to pack; defines the order of the arena.
+        :param backend: "shared_memory" allocates the arena in shared memory,
+            "memmap" writes it to a file in ``cache_dir`` and maps it copy-on-write.
+        :param cache_dir: Directory for the memory-mapped arena file; defaults to the system temp dir.
+        :return: A PackedSampleCache serving the same images and masks as ``samples``.
+        """
+        n = len(sample_specs)
+        offsets = np.zeros((n, 2), dtype=np.int64)
+        shapes = np.zeros((n, 2, 3), dtype=np.int64)
+        items: list[torch.Tensor] = []
+        total = 0
+        for i, sid in enumerate(sample_specs):
+            for j, item in enumerate((samples[sid].image, samples[sid].mask)):
+                if not isinstance(item, torch.Tensor) or item.dtype != torch.uint8 or item.ndim != 3:
+                    raise TypeError(f"Sample '{sid}' must hold CHW uint8 tensors to be packed, got {type(item)}.")
+                offsets[i, j] = total
+                shapes[i, j] = item.shape
+                total += item.numel()
+                items.append(item)
+
+        arena_path: str | None = None
+        if backend == "shared_memory":
+            arena = torch.empty(total, dtype=torch.uint8).share_memory_()
+        elif backend == "memmap":
+            fd, arena_path = tempfile.mkstemp(prefix="skinet_arena_", suffix=".bin",
+                                              dir=str(cache_dir) if cache_dir is not None else None)
+            os.close(fd)
+            writable = np.memmap(arena_path, dtype=np.uint8, mode="w+", shape=(max(total, 1),))
+            arena = torch.from_numpy(writable)
+        else:
+            raise ValueError(f"Unsupported backend '{backend}' for PackedSampleCache. Supported: ['shared_memory', 'memmap']")
+
+        for start, item in zip(offsets.reshape(-1).tolist(), items):
+            arena[start:start + item.numel()].copy_(item.reshape(-1))
+
+        if arena_path is not None:
+            writable.flush()
+            del arena, writable
+            arena = cls._map_arena_file(arena_path, total)
+
+        cache = cls(arena, offsets, shapes, sample_specs, backend, arena_path)
+        if arena_path is not None:
+            weakref.finalize(cache, _unlink_if_owner, arena_path, os.getpid())
+        logger.info("Packed %d samples into a %.1f MB %s arena.", n, total / 1024**2, backend)
+        return cache
+
+    @classmethod
+    def build(cls,
+              sample_specs: Mapping[str, SampleSpecs],
+              load_fn: Callable[[SampleSpecs], Sample],
+              backend: CacheBackend = "shared_memory",
+              cache_dir: Path | None = None) -> "PackedSampleCache":
+        """
+        Load all samples and pack them into an arena.
+
+        Peak memory during the build is about twice the arena size, since decoded samples are
+        released only after they have been copied into the arena.
+
+        :param sample_specs: Mapping of sample_id to its SampleSpecs.
+        :param load_fn: Loads one sample given its specs, see :func:`load_samples`.
+        :param backend: "shared_memory" or "memmap", see :meth:`from_samples`.
+        :param cache_dir: Directory for the memory-mapped arena file.
+        :return: A PackedSampleCache holding all samples.
+        """
+        samples = load_samples(sample_specs, load_fn)
+        return cls.from_samples(samples, sample_specs, backend=backend, cache_dir=cache_dir)
+
+    @staticmethod
+    def _map_arena_file(arena_path: str, total: int) -> torch.Tensor:
+        """Map the arena file copy-on-write so that accidental writes never reach the file or other workers."""
+        return torch.from_numpy(np.memmap(arena_path, dtype=np.uint8, mode="c", shape=(max(total, 1),)))
+
+    @property
+    def nbytes(self) -> int:
+        """Number of bytes occupied by the packed images and masks."""
+        if len(self._offsets) == 0:
+            return 0
+        last_mask_offset = int(self._offsets[-1, 1])
+        return last_mask_offset + int(np.prod(self._shapes[-1, 1]))
+
+    def _view(self, row: int, item: int) -> torch.Tensor:
+        start = int(self._offsets[row, item])
+        c, h, w = (int(s) for s in self._shapes[row, item])
+        return self._arena[start:start + c * h * w].view(c, h, w)
+
+    def __getitem__(self, sample_id: str) -> Sample:
+        row = self._index[sample_id]
+        return Sample(image=self._view(row, 0), mask=self._view(row, 1), specs=self._sample_specs[sample_id])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __getstate__(self) -> dict[str, Any]:
+        """
+        Pickle the memory-mapped arena by path instead of by value (spawned workers re-map the file).
+        Shared-memory arenas are pickled by torch as handles to the same shared memory.
+        """
+        state = self.__dict__.copy()
+        if self.backend == "memmap":
+            state["_arena"] = None
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        if self.backend == "memmap":
+            assert self.arena_path is not None
+            self._arena = self._map_arena_file(self.arena_path, self.nbytes)
+
+
+def _sample_nbytes(sample: Sample) -> int:
+    return sum(item.numel() * item.element_size() if isinstance(item, torch.Tensor) else item.nbytes
+               for item in (sample.image, sample.mask))
+
+
+class LRUSampleCache:
+    """
+    Lazily filled RAM cache of decoded samples with least-recently-used eviction.
+
+    Every process (the main process and each DataLoader worker) holds its own entries, bounded by
+    ``budget_bytes``. Hits, misses and resident bytes are counted per process in a small
+    shared-memory tensor, so :meth:`stats` reports the whole cache from the main process while the
+    workers fill it. Workers should be persistent (as with ``RepeatDataLoader``), otherwise their
+    entries are lost every epoch.
+    """
+
+    _HITS, _MISSES, _RESIDENT = range(3)
+
+    def __init__(self,
+                 load_fn: Callable[[SampleSpecs], Sample],
+                 budget_bytes: int,
+                 max_processes: int = 64) -> None:
+        """
+        :param load_fn: Loads one sample given its specs on a miss, e.g. ``dataset.load_raw_sample``.
+        :param budget_bytes: Maximum bytes of images and masks held per process. Samples larger than the
+            budget are loaded but not cached.
+        :param max_processes: Number of per-process counter slots; worker ``i`` uses slot ``1 + i % max_processes``.
+        """
+        if budget_bytes < 0:
+            raise ValueError(f"budget_bytes must be non-negative, got {budget_bytes}.")
+        self.load_fn = load_fn
+        self.budget_bytes = budget_bytes
+        self.max_processes = max_processes
+        self._counters = torch.zeros((max_processes + 1, 3), dtype=torch.int64).share_memory_()
+        """Per process slot: hits, misses and resident bytes."""
+        self._reset()
+
+    def _reset(self) -> None:
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, Sample] = OrderedDict()
+        self._resident = 0
+        info = get_worker_info()
+        self._slot = 0 if info is None else 1 + info.id % self.max_processes
+        self._counters[self._slot, self._RESIDENT] = 0
+
+    def __getstate__(self) -> dict[str, Any]:
+        """Entries stay in their process; unpickled copies (spawned workers) start empty but share the counters."""
+        state = self.__dict__.copy()
+        for key in ("_lock", "_entries"):
+            state.pop(key)
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._reset()
+
+    def get(self, sample_id: str, specs: SampleSpecs) -> Sample:
+        """
+        Return the sample from the cache, loading and inserting it on a miss.
+
+        :param sample_id: Key of the sample.
+        :param specs: Specs passed to ``load_fn`` on a miss.
+        :return: The cached or freshly loaded Sample.
+        """
+        if os.getpid() != self._pid:
+            # forked worker: inherited entries and counters belong to the parent
+            self._reset()
+        with self._lock:
+            sample = self._entries.get(sample_id)
+            if sample is not None:
+                self._entries.move_to_end(sample_id)
+                self._counters[self._slot, self._HITS] += 1
+                return sample
+        sample = self.load_fn(specs)
+        nbytes = _sample_nbytes(sample)
+        with self._lock:
+            self._counters[self._slot, self._MISSES] += 1
+            if nbytes <= self.budget_bytes and sample_id not in self._entries:
+                self._entries[sample_id] = sample
+                self._resident += nbytes
+                while self._resident > self.budget_bytes:
+                    _, evicted = self._entries.popitem(last=False)
+                    self._resident -= _sample_nbytes(evicted)
+                self._counters[self._slot, self._RESIDENT] = self._resident
+        return sample
+
+    def __contains__(self, sample_id: str) -> bool:
+        return sample_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, float]:
+        """
+        Counters summed over all processes using the cache.
+
+        :return: Dictionary with hits, misses, hit_rate and resident_mb.
+        """
+        hits, misses, resident = (int(v) for v in self._counters.sum(dim=0))
+        requests = hits + misses
+        return {"hits": hits,
+                "misses": misses,
+                "hit_rate": hits / requests if requests else 0.0,
+                "resident_mb": resident / 1024**2}
@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import logging
 from pathlib import Path
-from typing import Any, Union
+from typing import TYPE_CHECKING, Any, Union
 
 import numpy as np
 import pandas as pd
@@ -12,6 +12,9 @@ from torchvision.io import decode_image
 
 from SkiNet.Utils.csv_headers import DATAPATH_HEADER, DATATYPE_HEADER, DATATYPE_IMAGE, DATATYPE_MASK, SAMPLEID_HEADER
 
+if TYPE_CHECKING:
+    from SkiNet.ML.datasets.decoded_cache import DecodedTensorCache
+
 logger = logging.getLogger(__name__)
 
 
@@ -76,17 +79,24 @@ def load_data_item(item_rel_path: str,
 
 
 def load_sample(specs: SampleSpecs,
-                data_root: Path) -> Sample:
+                data_root: Path,
+                decoded_cache: DecodedTensorCache | None = None) -> Sample:
     """
     Load a single training sample consisting of an image and a mask.
 
     :param specs: SampleSpecs object containing metadata and paths for the sample.
     :param data_root: The root directory where the data is stored, it is assumed to be a local path.
+    :param decoded_cache: Optional on-disk cache of decoded items. If given, items are memory-mapped
+        from the cache instead of being decoded, and decoded into the cache on a miss.
 
     :return: A Sample object containing the loaded image and mask tensors (CHW, uint8), along with the sample specifications.
     """
-    image = load_data_item(specs.image_path, data_root=data_root)  # torch.Tensor CHW uint8
-    mask = load_data_item(specs.mask_path, data_root=data_root)  # torch.Tensor CHW uint8
+    if decoded_cache is not None:
+        image = decoded_cache.load(specs.image_path, data_root=data_root)
+        mask = decoded_cache.load(specs.mask_path, data_root=data_root)
+    else:
+        image = load_data_item(specs.image_path, data_root=data_root)  # torch.Tensor CHW uint8
+        mask = load_data_item(specs.mask_path, data_root=data_root)  # torch.Tensor CHW uint8
 
     return Sample(image=image, mask=mask, specs=specs)  # CHW, uint8
 
@@ -102,53 +112,69 @@ def create_valid_samplespecs(df: pd.DataFrame, preserve_original_order: bool = F
     If there are multiple images or masks for a sample_id, a warning will be logged and only the first one will be used.
     If there is a metadata mismatch between the image and mask rows for a sample_id, a warning will be logged and that sample_id will be skipped.
 
+    The rows are processed in bulk: sample_ids are factorized once, the first image and mask row of every
+    sample are selected with array operations and their metadata is compared column-wise. Only samples
+    that need a warning are visited one by one.
+
     :param df: DataFrame containing columns for sample_id, data_type (image/mask), data_root, and any additional metadata.
+    :param preserve_original_order: If True, samples are returned in order of first appearance in ``df``,
+        otherwise sorted by sample_id.
     :return: Dictionary mapping sample_id to SampleSpecs objects.
     """
-    sample_specs = {}
-
-    if preserve_original_order:
-        groups = df.groupby(SAMPLEID_HEADER, sort=False)
-    else:
-        # Sort by sample_id to ensure consistent ordering
-        groups = df.sort_values(by=SAMPLEID_HEADER).groupby(SAMPLEID_HEADER)
-
-    for sample_id, group in groups:
-        # get all rows containing images for the current sample id
-        image_rows = group[group[DATATYPE_HEADER] == DATATYPE_IMAGE]
-        # get all rows containing masks for the current sample id
-        mask_rows = group[group[DATATYPE_HEADER] == DATATYPE_MASK]
-
-        if len(image_rows) != 0 and len(mask_rows) != 0:
-            if len(image_rows) > 1:
+    # codes[i] is the sample number of row i; rows without a sample_id get -1 and are ignored
+    codes, sample_ids = pd.factorize(df[SAMPLEID_HEADER], sort=not preserve_original_order)
+    n_samples = len(sample_ids)
+    data_types = df[DATATYPE_HEADER].to_numpy()
+    valid = codes >= 0
+
+    def first_rows(data_type: str) -> tuple[np.ndarray, np.ndarray]:
+        """Per sample: the number of rows of ``data_type`` and the position of the first one (-1 if none)."""
+        positions = np.flatnonzero(valid & (data_types == data_type))
+        counts = np.bincount(codes[positions], minlength=n_samples)
+        first = np.full(n_samples, -1, dtype=np.int64)
+        # assigning in reverse leaves the first position of every sample in place
+        first[codes[positions[::-1]]] = positions[::-1]
+        return counts, first
+
+    image_counts, image_rows = first_rows(DATATYPE_IMAGE)
+    mask_counts, mask_rows = first_rows(DATATYPE_MASK)
+    complete = (image_counts > 0) & (mask_counts > 0)
+
+    # extract additional metadata columns; to_numpy() upcasts like a row lookup with iloc does
+    metadata_columns = [col for col in df.columns if col not in [SAMPLEID_HEADER, DATAPATH_HEADER, DATATYPE_HEADER]]
+    metadata = df[metadata_columns].to_numpy()
+    image_meta = metadata[image_rows[complete]]
+    mask_meta = metadata[mask_rows[complete]]
+    meta_equal = ((image_meta == mask_meta) | (pd.isna(image_meta) & pd.isna(mask_meta))).all(axis=1)
+    matching = np.zeros(n_samples, dtype=bool)
+    matching[complete] = meta_equal
+
+    needs_warning = ~complete | ~matching | (image_counts > 1) | (mask_counts > 1)
+    for code in np.flatnonzero(needs_warning):
+        sample_id = sample_ids[code]
+        if complete[code]:
+            if image_counts[code] > 1:
                 logger.warning(f"Multiple images found for sample_id {sample_id}. Using the first one.")
-            if len(mask_rows) > 1:
+            if mask_counts[code] > 1:
                 logger.warning(f"Multiple masks found for sample_id {sample_id}. Using the first one.")
-
-            # nevertheless, pick the first image and mask path
-            image_path = image_rows[DATAPATH_HEADER].iloc[0]
-            mask_path = mask_rows[DATAPATH_HEADER].iloc[0]
-
-            # extract additional metadata columns
-            metadata_columns = [col for col in df.columns if col not in [
-                SAMPLEID_HEADER, DATAPATH_HEADER, DATATYPE_HEADER]]
-
-            image_meta_df = image_rows[metadata_columns].iloc[0]
-            mask_meta_df = mask_rows[metadata_columns].iloc[0]
-
-            if not image_meta_df.equals(mask_meta_df):
+            if not matching[code]:
                 logger.warning(f"Metadata mismatch for sample_id {sample_id}. Skipping sample.")
-            else:
-                # create SampleSpecs object and add to dictionary
-                # only for unique sample ids with both image and mask present and matching metadata
-                sample_specs[sample_id] = SampleSpecs(sample_id=sample_id,
-                                                      image_path=image_path,
-                                                      mask_path=mask_path,
-                                                      metadata=image_meta_df.to_dict())
         else:
-            if len(image_rows) == 0:
+            if image_counts[code] == 0:
                 logger.warning(f"No image found for sample_id {sample_id}")
-            if len(mask_rows) == 0:
+            if mask_counts[code] == 0:
                 logger.warning(f"No mask found for sample_id {sample_id}")
 
-    return sample_specs
+    # only unique sample ids with both image and mask present and matching metadata
+    selected = np.flatnonzero(matching)
+    paths = df[DATAPATH_HEADER].to_numpy()
+    if metadata_columns:
+        records = pd.DataFrame(metadata[image_rows[selected]], columns=metadata_columns).to_dict(orient="records")
+    else:
+        records = [{} for _ in selected]
+    image_paths = paths[image_rows[selected]].tolist()
+    mask_paths = paths[mask_rows[selected]].tolist()
+    return {
+        sample_id: SampleSpecs(sample_id=sample_id, image_path=image_path, mask_path=mask_path, metadata=meta)
+        for sample_id, image_path, mask_path, meta in zip(sample_ids[selected].tolist(), image_paths, mask_paths, records)
+    }
@@ -1,15 +1,20 @@
 import logging
-import os
 from abc import ABC, abstractmethod
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections.abc import Iterable, Mapping, Sequence
 from pathlib import Path
 from typing import Any
 
+import torch
 from torch.utils.data import Dataset
 import pandas as pd
 
 from SkiNet.ML.configs.experiment_config import ExperimentConfig
-from SkiNet.ML.datasets.sample_specs import Sample, create_valid_samplespecs, load_sample
+from SkiNet.ML.datasets.decoded_cache import DecodedTensorCache
+from SkiNet.ML.datasets.preprocessing.resize_variants import select_resized_variant
+from SkiNet.ML.datasets.sample_cache import (CacheBackend, LRUSampleCache, PackedSampleCache, WarmupStats, load_samples,
+                                             load_samples_in_processes)
+from SkiNet.ML.datasets.sample_specs import Sample, SampleSpecs, create_valid_samplespecs, load_sample
+from SkiNet.ML.datasets.transformed_cache import TransformedCacheDtype, TransformedSampleCache
 from SkiNet.ML.transformations.transform_adapters import SampleTransformAdapter
 from SkiNet.ML.utils.model_utils import MLWorkflowState
 
@@ -39,13 +44,41 @@ class SegmentationDataset(BaseDataset):
                  dataframe: pd.DataFrame,
                  transform: SampleTransformAdapter,
                  mode: MLWorkflowState,
-                 cache_in_ram: bool = True) -> None:
+                 cache_in_ram: bool = True,
+                 cache_backend: CacheBackend = "dict",
+                 cache_dir: Path | None = None,
+                 decoded_cache_dir: Path | None = None,
+                 precompute_transform: TransformedCacheDtype | None = None,
+                 return_specs: bool = True,
+                 cache_budget_bytes: int | None = None,
+                 min_image_side: int | None = None) -> None:
         """
         :param config: The experiment configuration containing dataset metadata and data root information.
         :param cache_in_ram: If True, all samples are loaded from disk once at startup and kept in RAM.
             Eliminates per-epoch disk I/O so workers only perform augmentation. Recommended for small datasets.
+        :param cache_backend: Storage of the RAM cache. "dict" keeps one Sample object per sample;
+            "shared_memory" and "memmap" pack all images and masks into one contiguous arena
+            so that memory stays flat with the number of DataLoader workers. Ignored if cache_in_ram is False.
+        :param cache_dir: Directory for the arena file of the "memmap" backend; defaults to the system temp dir.
+        :param decoded_cache_dir: If set, decoded images and masks are persisted to and memory-mapped from an
+            on-disk cache in this directory, so that later runs skip decoding. Applies with and without cache_in_ram.
+        :param precompute_transform: If set together with cache_in_ram, the RAM cache holds the output of the
+            transform instead of the raw samples, with images stored as "float16" or as "uint8" plus a per-channel
+            scale. Only for the deterministic VAL/TEST pipelines; random crops are drawn once and then kept fixed.
+        :param return_specs: If True, items carry their ``specs`` as a dict. If False, they carry only their
+            integer ``index``, which :meth:`resolve_specs` turns into specs when needed; this keeps per-sample
+            Python objects out of the batches (see ``collate_into_buffers``).
+        :param cache_budget_bytes: If set together with cache_in_ram, nothing is loaded at startup; samples are
+            cached on first access in an :class:`LRUSampleCache` holding at most this many bytes per process.
+            cache_backend is then ignored. Has no effect if precompute_transform is set.
+        :param min_image_side: If set and the dataframe records pre-resized variants (see
+            :mod:`~SkiNet.ML.datasets.preprocessing.resize_variants`), images and masks are read from the smallest
+            variant whose shorter side is at least this long. If None, the original files are read.
         """
-        self.dataframe = dataframe
+        if precompute_transform is not None and mode == MLWorkflowState.TRAIN:
+            raise ValueError("precompute_transform is only supported for VAL and TEST datasets, "
+                             "as training augmentations must be redrawn every epoch.")
+        self.dataframe = select_resized_variant(dataframe, min_image_side)
         """A pandas DataFrame containing metadata for the dataset. It should be provided directly
         for train, val and test modes of operation after deriving it as a respective subset of the full dataframe."""
         self.data_root = data_root
@@ -57,22 +90,49 @@ class SegmentationDataset(BaseDataset):
         """A list of sample IDs corresponding to the valid samples in the dataset, derived from the sample specifications."""
         self.transform = transform
         self.mode = mode
-
+        self.decoded_cache = DecodedTensorCache(decoded_cache_dir) if decoded_cache_dir is not None else None
+        """Optional on-disk cache of decoded images and masks shared by all runs."""
+        self.precompute_transform = precompute_transform
+        self.return_specs = return_specs
+        self.cache_budget_bytes = cache_budget_bytes
+
+        self._cache: Mapping[str, Sample] | None = None
+        self._transformed_cache: TransformedSampleCache | None = None
+        self._lru_cache: LRUSampleCache | None = None
         if cache_in_ram:
-            logger.info("Caching %d samples in RAM for %s split...", len(self.sample_ids), mode)
-            cache: dict[str, Sample] = {}
-            max_workers = min(os.cpu_count() or 4, 8)
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                futures = {
-                    executor.submit(load_sample, self.sample_specs[sid], self.data_root): sid
-                    for sid in self.sample_ids
-                }
-                for future in as_completed(futures):
-                    cache[futures[future]] = future.result()
-            self._cache: dict[str, Sample] | None = cache
-            logger.info("RAM cache ready for %s split.", mode)
+            self.build_cache(cache_backend, cache_dir)
+
+    def build_cache(self,
+                    cache_backend: CacheBackend = "dict",
+                    cache_dir: Path | None = None,
+                    samples: Mapping[str, Sample] | None = None) -> None:
+        """
+        Load all samples through :meth:`load_raw_sample` into the RAM cache, or into the cache of
+        transformed samples if ``precompute_transform`` is set. With ``cache_budget_bytes`` only an
+        empty LRU cache is created, which is filled on first access.
+
+        :param cache_backend: Storage of the RAM cache, see ``__init__``.
+        :param cache_dir: Directory for the arena file of the "memmap" backend.
+        :param samples: Already loaded raw samples of this dataset, e.g. from :func:`warm_up_caches`;
+            if given, they are used instead of :meth:`load_raw_sample`.
+        """
+        load_fn = self.load_raw_sample if samples is None else (lambda specs: samples[specs.sample_id])
+        if self.precompute_transform is not None:
+            logger.info("Precomputing the %s transform of %d samples in RAM...", self.mode, len(self.sample_ids))
+            self._transformed_cache = TransformedSampleCache.build(self.sample_specs, load_fn,
+                                                                   self.transform, dtype=self.precompute_transform)
+            return
+        if self.cache_budget_bytes is not None:
+            logger.info("Caching samples of %s split lazily in RAM, up to %.1f MB per process.",
+                        self.mode, self.cache_budget_bytes / 1024**2)
+            self._lru_cache = LRUSampleCache(self.load_raw_sample, self.cache_budget_bytes)
+            return
+        logger.info("Caching %d samples in RAM (%s) for %s split...", len(self.sample_ids), cache_backend, self.mode)
+        if cache_backend == "dict":
+            self._cache = dict(samples) if samples is not None else load_samples(self.sample_specs, load_fn)
         else:
-            self._cache = None
+            self._cache = PackedSampleCache.build(self.sample_specs, load_fn, backend=cache_backend, cache_dir=cache_dir)
+        logger.info("RAM cache ready for %s split.", self.mode)
 
     def __getitem__(self, index: int) -> dict[str, Any]:
         return self.get_sample_item(index)
@@ -80,13 +140,43 @@ class SegmentationDataset(BaseDataset):
     def __len__(self) -> int:
         return len(self.sample_ids)
 
+    def load_raw_sample(self, specs: SampleSpecs) -> Sample:
+        """
+        Load one sample from its source, bypassing the RAM cache. Subclasses reading from
+        other storage formats override this method.
+
+        :param specs: Specs of the sample to load.
+        :return: The untransformed Sample, image and mask CHW, uint8.
+        """
+        return load_sample(specs, data_root=self.data_root, decoded_cache=self.decoded_cache)
+
+    def resolve_specs(self, indices: Iterable[int] | torch.Tensor) -> list[dict[str, Any]]:
+        """
+        Resolve item indices, e.g. the ``index`` entry of a batch, to the specs dicts the items would carry
+        with ``return_specs=True``.
+
+        :param indices: Dataset indices of the items.
+        :return: List of specs dicts in the order of ``indices``.
+        """
+        if isinstance(indices, torch.Tensor):
+            indices = indices.tolist()
+        return [self.sample_specs[self.sample_ids[i]].model_dump() for i in indices]
+
+    def ram_cache_stats(self) -> dict[str, float] | None:
+        """
+        Hit rate and resident size of the lazily filled RAM cache, summed over the DataLoader workers.
+
+        :return: See :meth:`LRUSampleCache.stats`, or None if the dataset has no bounded cache.
+        """
+        return self._lru_cache.stats() if self._lru_cache is not None else None
+
     def get_raw_sample(self, index: int) -> Sample:
         """
         Load a raw sample from disk without applying any transforms.
         Useful for visualization and debugging without mutating dataset.transform.
         """
         specs_item = self.sample_specs[self.sample_ids[index]]
-        return load_sample(specs_item, data_root=self.data_root)  # image and mask should be CHW, uint8
+        return self.load_raw_sample(specs_item)  # image and mask should be CHW, uint8
 
     def get_sample_item(self, index: int) -> dict[str, Any]:
         """
@@ -95,18 +185,53 @@ class SegmentationDataset(BaseDataset):
         :return: A dictionary containing the image tensor, mask tensor, and sample specifications for the specified index.
         """
         sid = self.sample_ids[index]
-        if self._cache is not None:
-            sample = self._cache[sid]
+        if self._transformed_cache is not None:
+            transformed_sample = self._transformed_cache[sid]
         else:
-            sample = load_sample(self.sample_specs[sid], data_root=self.data_root)
-
-        transformed_sample = self.transform(sample=sample)
+            if self._cache is not None:
+                sample = self._cache[sid]
+            elif self._lru_cache is not None:
+                sample = self._lru_cache.get(sid, self.sample_specs[sid])
+            else:
+                sample = self.load_raw_sample(self.sample_specs[sid])
+            transformed_sample = self.transform(sample=sample)
 
         image_tensor = transformed_sample.image
         mask_tensor = transformed_sample.mask
 
+        if not self.return_specs:
+            return {"image": image_tensor, "mask": mask_tensor, "index": index}
         return {
             "image": image_tensor,
             "mask": mask_tensor,
-            "specs": sample.specs.model_dump(),
+            "specs": transformed_sample.specs.model_dump(),
         }
+
+
+def warm_up_caches(datasets: Sequence[SegmentationDataset],
+                   cache_backend: CacheBackend = "dict",
+                   cache_dir: Path | None = None,
+                   max_workers: int | None = None) -> WarmupStats:
+    """
+    Build the RAM caches of several datasets, e.g. all three splits, from one process pool.
+
+    The datasets should have been created with ``cache_in_ram=False``. Samples are decoded concurrently by
+    :func:`~SkiNet.ML.datasets.sample_cache.load_samples_in_processes` and then handed to
+    :meth:`SegmentationDataset.build_cache`, so the cache layout is the same as with thread-based loading.
+    Datasets with ``cache_budget_bytes`` get their empty LRU cache without any warm-up.
+
+    :param datasets: Datasets whose caches to build.
+    :param cache_backend: Storage of the RAM caches.
+    :param cache_dir: Directory for the arena files of the "memmap" backend.
+    :param max_workers: Number of decoding processes; defaults to os.cpu_count().
+    :return: Throughput of the warm-up.
+    """
+    eager = [dataset for dataset in datasets if dataset.cache_budget_bytes is None]
+    loaded, stats = load_samples_in_processes([(dataset.sample_specs, dataset.load_raw_sample) for dataset in eager],
+                                              max_workers=max_workers)
+    for dataset, samples in zip(eager, loaded):
+        dataset.build_cache(cache_backend, cache_dir, samples=samples)
+    for dataset in datasets:
+        if dataset.cache_budget_bytes is not None:
+            dataset.build_cache(cache_backend, cache_dir)
+    return stats
@@ -0,0 +1,249 @@
+"""
+Packed sharded storage of a segmentation dataset.
+
+Reading tens of thousands of small JPEG/PNG/BMP files one by one is dominated by per-file
+open/stat latency, especially on blobfuse-mounted Azure storage. The converter packs the
+still-encoded image and mask bytes of all samples into a few large tar shards
+(WebDataset layout: ``<sample_id>.image.<ext>``, ``<sample_id>.mask.<ext>``) and writes an
+``index.json`` with the byte range of every item inside its shard.
+
+:class:`ShardedSegmentationDataset` reads items with positioned reads from a handful of open
+shard files. Samples are written in the dataset's ``sample_id`` order, so a non-shuffled pass
+(validation, test, building the RAM cache) reads each shard sequentially.
+
+Convert the dataset of an experiment config with:
+    python -m SkiNet.ML.datasets.sharded_dataset --config main_config.yaml --out /path/to/shards
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import logging
+import os
+import tarfile
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+import torch
+from torchvision.io import decode_image
+
+from SkiNet.ML.datasets.sample_cache import CacheBackend
+from SkiNet.ML.datasets.sample_specs import Sample, SampleSpecs
+from SkiNet.ML.datasets.segmentation_dataset import SegmentationDataset
+from SkiNet.ML.datasets.transformed_cache import TransformedCacheDtype
+from SkiNet.ML.transformations.transform_adapters import SampleTransformAdapter
+from SkiNet.ML.utils.model_utils import MLWorkflowState
+
+logger = logging.getLogger(__name__)
+
+SHARD_FORMAT_VERSION = 1
+"""Version of the shard layout and index; indices of other versions are rejected."""
+
+INDEX_FILE_NAME = "index.json"
+
+
+def _add_member(tar: tarfile.TarFile, name: str, data: bytes) -> None:
+    info = tarfile.TarInfo(name=name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def write_shards(sample_specs: Mapping[str, SampleSpecs],
+                 data_root: Path,
+                 out_dir: Path,
+                 max_shard_bytes: int = 1024**3) -> Path:
+    """
+    Pack the encoded image and mask files of the given samples into tar shards.
+
+    Files are copied byte for byte, so decoding a sharded item gives exactly the tensor
+    :func:`~SkiNet.ML.datasets.sample_specs.load_data_item` gives for the source file.
+
+    :param sample_specs: Mapping of sample_id to its SampleSpecs; samples are written in sorted sample_id order.
+    :param data_root: Root directory where images and masks are stored.
+    :param out_dir: Output directory for the shards and the index; created if it does not exist.
+    :param max_shard_bytes: A new shard is started once the current one exceeds this size.
+    :return: Path of the written index file.
+    """
+    out_dir.mkdir(parents=True, exist_ok=True)
+    shard_names: list[str] = []
+    shard_members: list[dict[str, tuple[str, str]]] = []
+    tar: tarfile.TarFile | None = None
+
+    for sid in sorted(sample_specs):
+        specs = sample_specs[sid]
+        if tar is None or tar.offset >= max_shard_bytes:
+            if tar is not None:
+                tar.close()
+            shard_names.append(f"shard-{len(shard_names):05d}.tar")
+            shard_members.append({})
+            tar = tarfile.open(out_dir / shard_names[-1], "w", format=tarfile.USTAR_FORMAT)
+        names = []
+        for key, rel_path in (("image", specs.image_path), ("mask", specs.mask_path)):
+            full_path = data_root / rel_path
+            if not full_path.exists():
+                raise FileNotFoundError(f"Data item not found: '{full_path}'")
+            names.append(f"{sid}.{key}{Path(rel_path).suffix.lower()}")
+            _add_member(tar, names[-1], full_path.read_bytes())
+        shard_members[-1][sid] = (names[0], names[1])
+    if tar is not None:
+        tar.close()
+
+    # Byte ranges are taken from the written headers, so the index always matches the tar layout.
+    samples: dict[str, dict[str, Any]] = {}
+    for shard, (shard_name, members) in enumerate(zip(shard_names, shard_members)):
+        with tarfile.open(out_dir / shard_name, "r") as tar:
+            ranges = {m.name: [m.offset_data, m.size] for m in tar.getmembers()}
+        for sid, (image_name, mask_name) in members.items():
+            samples[sid] = {"shard": shard,
+                            "image": ranges[image_name],
+                            "mask": ranges[mask_name],
+                            "image_path": sample_specs[sid].image_path,
+                            "mask_path": sample_specs[sid].mask_path}
+
+    index_path = out_dir / INDEX_FILE_NAME
+    index = {"version": SHARD_FORMAT_VERSION, "shards": shard_names, "samples": samples}
+    index_path.write_text(json.dumps(index))
+    logger.info("Wrote %d samples into %d shard(s) in '%s'.", len(samples), len(shard_names), out_dir)
+    return index_path
+
+
+def read_index(shard_dir: Path) -> dict[str, Any]:
+    """
+    Read and validate the index of a sharded dataset.
+
+    :param shard_dir: Directory written by :func:`write_shards`.
+    :return: The parsed index.
+    """
+    index_path = shard_dir / INDEX_FILE_NAME
+    if not index_path.exists():
+        raise FileNotFoundError(f"Shard index not found: '{index_path}'")
+    index: dict[str, Any] = json.loads(index_path.read_text())
+    if index.get("version") != SHARD_FORMAT_VERSION:
+        raise ValueError(f"Shard index '{index_path}' has version {index.get('version')}, "
+                         f"expected {SHARD_FORMAT_VERSION}. Re-run the converter.")
+    return index
+
+
+class ShardedSegmentationDataset(SegmentationDataset):
+    """
+    SegmentationDataset reading encoded images and masks from packed tar shards.
+
+    The dataframe, transforms, caching and returned items are the same as for
+    :class:`~SkiNet.ML.datasets.segmentation_dataset.SegmentationDataset`; only the storage differs.
+    Item locations are kept in one numpy array, so DataLoader workers do not dirty
+    copy-on-write pages when looking them up.
+    """
+
+    def __init__(self,
+                 data_root: Path,
+                 dataframe: pd.DataFrame,
+                 transform: SampleTransformAdapter,
+                 mode: MLWorkflowState,
+                 shard_dir: Path,
+                 cache_in_ram: bool = True,
+                 cache_backend: CacheBackend = "dict",
+                 cache_dir: Path | None = None,
+                 precompute_transform: TransformedCacheDtype | None = None,
+                 return_specs: bool = True,
+                 cache_budget_bytes: int | None = None) -> None:
+        """
+        :param data_root: Root directory of the source dataset; ``shard_dir`` is resolved relative to it.
+        :param shard_dir: Directory written by :func:`write_shards` containing the dataframe's samples.
+        See :class:`~SkiNet.ML.datasets.segmentation_dataset.SegmentationDataset` for the other parameters.
+        """
+        self.shard_dir = data_root / shard_dir
+        index = read_index(self.shard_dir)
+        self._shard_paths = [str(self.shard_dir / name) for name in index["shards"]]
+        self._fds: dict[int, int] = {}
+
+        # Locations have to be known before the RAM cache is filled, so the cache is built below.
+        super().__init__(data_root, dataframe, transform, mode, cache_in_ram=False,
+                         precompute_transform=precompute_transform, return_specs=return_specs,
+                         cache_budget_bytes=cache_budget_bytes)
+
+        self._locations = np.zeros((len(self.sample_ids), 2, 3), dtype=np.int64)
+        """Per sample and item (image, mask): shard number, byte offset and size."""
+        self._rows = {sid: row for row, sid in enumerate(self.sample_ids)}
+        for row, sid in enumerate(self.sample_ids):
+            entry = index["samples"].get(sid)
+            specs = self.sample_specs[sid]
+            if entry is None:
+                raise ValueError(f"Sample '{sid}' is missing from the shards in '{self.shard_dir}'. Re-run the converter.")
+            if (entry["image_path"], entry["mask_path"]) != (specs.image_path, specs.mask_path):
+                raise ValueError(f"Sample '{sid}' in '{self.shard_dir}' was packed from different files. Re-run the converter.")
+            self._locations[row, 0] = (entry["shard"], *entry["image"])
+            self._locations[row, 1] = (entry["shard"], *entry["mask"])
+
+        if cache_in_ram:
+            self.build_cache(cache_backend, cache_dir)
+
+    def _read_item(self, shard: int, offset: int, size: int) -> torch.Tensor:
+        fd = self._fds.get(shard)
+        if fd is None:
+            # The RAM cache is filled from several threads; keep whichever descriptor was stored first.
+            opened = os.open(self._shard_paths[shard], os.O_RDONLY)
+            fd = self._fds.setdefault(shard, opened)
+            if fd != opened:
+                os.close(opened)
+        data = os.pread(fd, size, offset)
+        image: torch.Tensor = decode_image(torch.frombuffer(bytearray(data), dtype=torch.uint8))  # CHW, usually uint8
+        if image.dtype != torch.uint8:
+            image = image.to(torch.uint8)
+        return image
+
+    def load_raw_sample(self, specs: SampleSpecs) -> Sample:
+        """
+        Read and decode one sample from the shards.
+
+        :param specs: Specs of the sample to load.
+        :return: The untransformed Sample, image and mask CHW, uint8.
+        """
+        image_loc, mask_loc = self._locations[self._rows[specs.sample_id]].tolist()
+        return Sample(image=self._read_item(*image_loc), mask=self._read_item(*mask_loc), specs=specs)
+
+    def __getstate__(self) -> dict[str, Any]:
+        """File descriptors are per process; spawned workers reopen the shards lazily."""
+        state = self.__dict__.copy()
+        state["_fds"] = {}
+        return state
+
+    def __del__(self) -> None:
+        for fd in getattr(self, "_fds", {}).values():
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+def main() -> None:
+    from SkiNet.ML.configs.load_config_from_yaml import load_config_from_yaml
+    from SkiNet.ML.datasets.sample_specs import create_valid_samplespecs
+
+    logging.basicConfig(level=logging.INFO)
+    ap = argparse.ArgumentParser(description="Pack the images and masks of a configured dataset into tar shards.")
+    ap.add_argument("--config", type=Path, default=Path("main_config.yaml"),
+                    help="Path to experiment YAML config (default: main_config.yaml)")
+    ap.add_argument("--out", type=Path, default=None,
+                    help="Output directory (default: DATA_CONFIG.shard_dir below the data root)")
+    ap.add_argument("--shard-size-mb", type=int, default=1024, help="Target size of one shard in MB (default: 1024)")
+    args = ap.parse_args()
+
+    config = load_config_from_yaml(args.config)
+    data_root = config.dataconfig.data_root
+    out_dir = args.out
+    if out_dir is None:
+        if config.dataconfig.shard_dir is None:
+            ap.error("Provide --out or set DATA_CONFIG.shard_dir in the config")
+        out_dir = data_root / config.dataconfig.shard_dir
+
+    sample_specs = create_valid_samplespecs(config.dataconfig.metadata)
+    index_path = write_shards(sample_specs, data_root, out_dir, max_shard_bytes=args.shard_size_mb * 1024**2)
+    print(f"Wrote {len(sample_specs)} samples, index at '{index_path}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+RAM cache of samples that have already passed a deterministic transform pipeline.
+
+The validation and test pipelines built by
+:func:`~SkiNet.ML.transformations.transform_data.get_transform_from_config` only crop and
+normalise, so their output is the same in every epoch. :class:`TransformedSampleCache` runs
+the pipeline once per sample and keeps the result, turning later validation epochs into
+memory reads.
+
+Images are stored either as float16 or, to halve memory again, as uint8 with a per-sample,
+per-channel affine scale (``x ≈ q * scale + low``). Both are converted back to float32 when read,
+so the model sees the same dtype as with the per-epoch pipeline. Like
+:class:`~SkiNet.ML.datasets.sample_cache.PackedSampleCache`, all images and all masks are packed
+into two contiguous shared-memory tensors so DataLoader workers do not duplicate them.
+"""
+from __future__ import annotations
+
+import logging
+from collections.abc import Callable, Iterator, Mapping
+from typing import Literal
+
+import numpy as np
+import torch
+
+from SkiNet.ML.datasets.sample_cache import load_samples
+from SkiNet.ML.datasets.sample_specs import Sample, SampleSpecs
+from SkiNet.ML.transformations.transform_adapters import SampleTransformAdapter
+
+logger = logging.getLogger(__name__)
+
+TransformedCacheDtype = Literal["float16", "uint8"]
+"""Storage of the transformed images: float16, or uint8 with a per-sample, per-channel scale and offset."""
+
+
+def quantize_uint8(image: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+    """
+    Quantise a float CHW image to uint8 with one affine scale per channel.
+
+    :param image: float tensor [C, H, W].
+    :return: uint8 tensor [C, H, W] and float32 tensor [C, 2] holding (low, scale) per channel,
+        so that ``image ≈ q * scale + low`` with an error of at most ``scale / 2``.
+    """
+    flat = image.reshape(image.shape[0], -1).float()
+    low = flat.amin(dim=1)
+    scale = (flat.amax(dim=1) - low) / 255.0
+    scale = torch.where(scale > 0, scale, torch.ones_like(scale))
+    q = ((flat - low[:, None]) / scale[:, None]).round_().clamp_(0, 255).to(torch.uint8)
+    return q.view(image.shape), torch.stack([low, scale], dim=1)
+
+
+class TransformedSampleCache(Mapping[str, Sample]):
+    """
+    Read-only mapping of sample_id to the transformed Sample (float32 CHW image, uint8 CHW mask).
+
+    ``_offsets[i]`` holds the start of image and mask ``i`` in their arenas and ``_shapes[i]``
+    their CHW shapes; ``_quant[i]`` holds the per-channel (low, scale) of uint8-stored images.
+    """
+
+    def __init__(self,
+                 images: torch.Tensor,
+                 masks: torch.Tensor,
+                 offsets: np.ndarray,
+                 shapes: np.ndarray,
+                 quant: torch.Tensor | None,
+                 sample_specs: Mapping[str, SampleSpecs]) -> None:
+        """
+        :param images: 1D float16 or uint8 tensor holding all transformed images back to back.
+        :param masks: 1D uint8 tensor holding all transformed masks back to back.
+        :param offsets: int64 array [N, 2] with the image and mask offsets of each sample.
+        :param shapes: int64 array [N, 2, 3] with the image and mask CHW shapes of each sample.
+        :param quant: float32 tensor [N, C, 2] with (low, scale) per channel if images are uint8, else None.
+        :param sample_specs: Specs of the cached samples, in the same order as ``offsets``.
+        """
+        if (images.dtype == torch.uint8) != (quant is not None):
+            raise ValueError("quant must be given exactly when images are stored as uint8.")
+        self._images = images
+        self._masks = masks
+        self._offsets = offsets
+        self._shapes = shapes
+        self._quant = quant
+        self._sample_specs = sample_specs
+        self._index = {sid: i for i, sid in enumerate(sample_specs)}
+
+    @classmethod
+    def build(cls,
+              sample_specs: Mapping[str, SampleSpecs],
+              load_fn: Callable[[SampleSpecs], Sample],
+              transform: SampleTransformAdapter,
+              dtype: TransformedCacheDtype = "float16") -> "TransformedSampleCache":
+        """
+        Load all samples, transform them once and pack the results.
+
+        Samples are loaded concurrently but transformed sequentially in ``sample_specs`` order, so a
+        seeded pipeline gives the same result on every run. Random crops are drawn once and then
+        kept fixed, which makes validation metrics comparable across epochs.
+
+        :param sample_specs: Mapping of sample_id to its SampleSpecs.
+        :param load_fn: Loads one untransformed sample given its specs, see
+            :func:`~SkiNet.ML.datasets.sample_cache.load_samples`.
+        :param transform: Pipeline returning a float CHW image tensor and a uint8 CHW mask tensor.
+        :param dtype: Storage of the images, see :data:`TransformedCacheDtype`.
+        :return: A TransformedSampleCache holding all transformed samples.
+        """
+        if dtype not in ("float16", "uint8"):
+            raise ValueError(f"Unsupported dtype '{dtype}' for TransformedSampleCache. Supported: ['float16', 'uint8']")
+        raw = load_samples(sample_specs, load_fn)
+        n = len(sample_specs)
+        offsets = np.zeros((n, 2), dtype=np.int64)
+        shapes = np.zeros((n, 2, 3), dtype=np.int64)
+        images: list[torch.Tensor] = []
+        masks: list[torch.Tensor] = []
+        quant: list[torch.Tensor] = []
+        image_total = mask_total = 0
+        for i, sid in enumerate(sample_specs):
+            sample = transform(raw.pop(sid))
+            image, mask = sample.image, sample.mask
+            if not isinstance(image, torch.Tensor) or not image.is_floating_point() or image.ndim != 3:
+                raise TypeError(f"Transformed image of sample '{sid}' must be a float CHW tensor, got {type(image)}. "
+                                "Only pipelines ending with normalisation and ToTensorV2 can be precomputed.")
+            if not isinstance(mask, torch.Tensor) or mask.dtype != torch.uint8 or mask.ndim != 3:
+                raise TypeError(f"Transformed mask of sample '{sid}' must be a uint8 CHW tensor, got {type(mask)}.")
+            if dtype == "uint8":
+                image, image_quant = quantize_uint8(image)
+                quant.append(image_quant)
+            else:
+                image = image.to(torch.float16)
+            offsets[i] = (image_total, mask_total)
+            shapes[i] = (image.shape, mask.shape)
+            image_total += image.numel()
+            mask_total += mask.numel()
+            images.append(image.reshape(-1))
+            masks.append(mask.reshape(-1))
+
+        image_arena = torch.cat(images) if images else torch.empty(0, dtype=getattr(torch, dtype))
+        mask_arena = torch.cat(masks) if masks else torch.empty(0, dtype=torch.uint8)
+        quant_arena = (torch.stack(quant) if quant else torch.empty((0, 3, 2))) if dtype == "uint8" else None
+        cache = cls(image_arena.share_memory_(), mask_arena.share_memory_(), offsets, shapes,
+                    quant_arena.share_memory_() if quant_arena is not None else None, sample_specs)
+        logger.info("Precomputed %d transformed samples (%.1f MB, %s images).", n, cache.nbytes / 1024**2, dtype)
+        return cache
+
+    @property
+    def nbytes(self) -> int:
+        """Number of bytes occupied by the stored images, masks and scales."""
+        quant_bytes = self._quant.numel() * self._quant.element_size() if self._quant is not None else 0
+        return self._images.numel() * self._images.element_size() + self._masks.numel() + quant_bytes
+
+    def _view(self, arena: torch.Tensor, row: int, item: int) -> torch.Tensor:
+        start = int(self._offsets[row, item])
+        c, h, w = (int(s) for s in self._shapes[row, item])
+        return arena[start:start + c * h * w].view(c, h, w)
+
+    def __getitem__(self, sample_id: str) -> Sample:
+        row = self._index[sample_id]
+        image = self._view(self._images, row, 0).float()
+        if self._quant is not None:
+            low, scale = self._quant[row].unbind(dim=1)
+            image = image.mul_(scale[:, None, None]).add_(low[:, None, None])
+        return Sample(image=image, mask=self._view(self._masks, row, 1), specs=self._sample_specs[sample_id])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
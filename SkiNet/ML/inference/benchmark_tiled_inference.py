@@ -0,0 +1,105 @@
+"""
+CPU benchmark of :class:`~SkiNet.ML.inference.tiled_inference.TiledPredictor` against naive whole-image
+resizing (:func:`~SkiNet.ML.inference.tiled_inference.predict_resized`).
+
+Runs a randomly initialised UNet2D, built from the MODEL_CONFIG of a YAML config or from the UNet2D defaults,
+on synthetic images of dermoscopy sizes. Weights do not affect the timings. Each method runs the model as built
+("eager") and with its BatchNorms folded into the convolutions ("fused", see
+:func:`~SkiNet.ML.inference.fusion.fuse_for_inference`). Reports the best wall time over the repeats,
+throughput in megapixels per second and the number of tiles per image.
+
+Run with:
+    python -m SkiNet.ML.inference.benchmark_tiled_inference [--config main_config.yaml]
+        [--sizes 767x1022 1504x2016] [--tile-size 256] [--overlap 0.25] [--batch-size 8] [--threads 4]
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+import torch
+import torch.nn as nn
+
+from SkiNet.ML.inference.fusion import fuse_for_inference
+from SkiNet.ML.inference.tiled_inference import TiledPredictor, predict_resized
+from SkiNet.ML.model.architecture.unet2d import UNet2D
+
+DEFAULT_SIZES = ["767x1022", "1504x2016"]
+
+
+def build_model(config_path: Path | None) -> nn.Module:
+    """
+    Randomly initialised model of a YAML config, or a UNet2D with default architecture.
+
+    :param config_path: Path to a config YAML, or None.
+    :return: Model in eval mode.
+    """
+    if config_path is None:
+        return UNet2D(in_channels=3, out_channels_layer1=16, validate_forward=False).eval()
+    from SkiNet.ML.configs.load_config_from_yaml import load_config_from_yaml
+    from SkiNet.ML.model.model_factory import create_model
+    return create_model(load_config_from_yaml(config_path)).eval()
+
+
+def _best_time(predict: Callable[[], torch.Tensor], repeats: int) -> float:
+    predict()  # warm-up: allocator and oneDNN kernel selection
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predict()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def benchmark(model: nn.Module, sizes: list[tuple[int, int]], tile_size: int, overlap: float,
+              batch_size: int, repeats: int) -> pd.DataFrame:
+    """
+    Time tiled and naive resized inference on random images of each size, with the eager and the fused model.
+
+    :param model: Segmentation model.
+    :param sizes: Image (height, width) pairs.
+    :param tile_size: Tile side of the tiled predictor and input side of the resized baseline.
+    :param overlap: Tile overlap.
+    :param batch_size: Tiles per forward pass.
+    :param repeats: Timed runs per size and method; the best run is reported.
+    :return: DataFrame with columns size, method, graph, tiles, best_s, mpix_per_s.
+    """
+    results = []
+    for graph, graph_model in [("eager", model), ("fused", fuse_for_inference(model))]:
+        predictor = TiledPredictor(graph_model, tile_size=tile_size, overlap=overlap, batch_size=batch_size)
+        for height, width in sizes:
+            image = torch.randn(3, height, width)
+            rows, cols = predictor.tile_grid(height, width)
+            for method, tiles, predict in [
+                ("tiled", len(rows) * len(cols), lambda: predictor.predict(image)),
+                ("resized", 1, lambda: predict_resized(graph_model, image, tile_size)),
+            ]:
+                best = _best_time(predict, repeats)
+                results.append({"size": f"{height}x{width}", "method": method, "graph": graph, "tiles": tiles,
+                                "best_s": best, "mpix_per_s": height * width / best / 1e6})
+    return pd.DataFrame(results).sort_values(["size", "method", "graph"], kind="stable", ignore_index=True)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark tiled against resized whole-image inference on CPU.")
+    ap.add_argument("--config", type=Path, default=None, help="Config YAML whose MODEL_CONFIG is benchmarked")
+    ap.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="Image sizes as HxW (default: 767x1022 1504x2016)")
+    ap.add_argument("--tile-size", type=int, default=256, help="Tile side (default: 256)")
+    ap.add_argument("--overlap", type=float, default=0.25, help="Tile overlap fraction (default: 0.25)")
+    ap.add_argument("--batch-size", type=int, default=8, help="Tiles per forward pass (default: 8)")
+    ap.add_argument("--threads", type=int, default=None, help="torch intra-op threads (default: torch default)")
+    ap.add_argument("--repeats", type=int, default=3, help="Timed runs, best is reported (default: 3)")
+    args = ap.parse_args()
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    sizes = [(int(h), int(w)) for h, w in (size.lower().split("x") for size in args.sizes)]
+    df = benchmark(build_model(args.config), sizes, args.tile_size, args.overlap, args.batch_size, args.repeats)
+    print(df.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+
+
+if __name__ == "__main__":
+    main()
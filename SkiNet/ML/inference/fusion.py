@@ -0,0 +1,129 @@
+"""
+Inference-time simplification of UNet2D: batch-norm folding and removal of the forward-pass checks.
+
+In eval mode a BatchNorm2d is a fixed per-channel affine map, ``y = scale * x + shift``. Whenever it consumes
+the output of a convolution that feeds nothing else, the map is folded into the convolution's weights and
+bias and the BatchNorm is removed:
+
+- Conv-BN-Act of :class:`Conv2dLayer` (``classical`` and ``local_refinement`` blocks) and the transposed
+  convolution of :class:`Decoder2D`;
+- the three projections of :class:`AttentionGate`;
+- BN(conv_x(x) + conv_skip(skip)) of :class:`LocalRefinementMerge`, by scaling both convolutions and adding
+  the shift to the bias of ``conv_x``;
+- in the pre-activation ``he2``/``se`` encoders and ``he2``/``attention_gate`` merges, the BatchNorm between
+  the two convolutions, which only the first convolution feeds.
+
+BatchNorms of tensors that also feed a shortcut (the input of the pre-activation blocks and the merged sum of
+``he1``/``he2``/``attention_gate``) would change the shortcut if folded; they are kept in eval mode.
+"""
+from __future__ import annotations
+
+import copy
+import logging
+from typing import cast
+
+import torch
+import torch.nn as nn
+from torch import Tensor
+from torch.nn.utils.fusion import fuse_conv_bn_weights
+
+from SkiNet.ML.model.architecture.unet2d import UNet2D
+from SkiNet.ML.model.blocks.conv2d_layer import Conv2dLayer
+from SkiNet.ML.model.blocks.decoder2d import Decoder2D
+from SkiNet.ML.model.blocks.encoder2d_residual_blocks import He2Encoder, SEEncoder
+from SkiNet.ML.model.blocks.merge2d_residual_blocks import (AttentionGate, AttentionGateMerge, He2Merge,
+                                                            LocalRefinementMerge)
+
+logger = logging.getLogger(__name__)
+
+_FOLDS: dict[type[nn.Module], list[tuple[str, str]]] = {
+    Conv2dLayer: [("conv2d", "batchnorm2d")],
+    Decoder2D: [("deconv2d", "batchnorm2d")],
+    AttentionGate: [("W_g.0", "W_g.1"), ("W_x.0", "W_x.1"), ("psi.0", "psi.1")],
+    He2Encoder: [("conv_no_BNAct_downsample.conv2d", "batchnorm2d_out")],
+    SEEncoder: [("conv_no_BNAct_downsample.conv2d", "batchnorm2d_out")],
+    He2Merge: [("conv_no_BNAct_refine1.conv2d", "batchnorm2d_out2")],
+    AttentionGateMerge: [("conv_no_BNAct_refine1.conv2d", "batchnorm2d_out2")],
+}
+"""Per block type, (convolution, BatchNorm) submodule paths where the BatchNorm only consumes the convolution."""
+
+
+def _bn_scale_shift(bn: nn.BatchNorm2d) -> tuple[Tensor, Tensor]:
+    """Per-channel scale and shift of a BatchNorm in eval mode."""
+    assert bn.running_mean is not None and bn.running_var is not None, "BatchNorm without running statistics"
+    scale = torch.rsqrt(bn.running_var + bn.eps)
+    if bn.weight is not None:
+        scale = scale * bn.weight
+    shift = -bn.running_mean * scale
+    if bn.bias is not None:
+        shift = shift + bn.bias
+    return scale, shift
+
+
+def _fold_into_conv(conv: nn.Conv2d | nn.ConvTranspose2d, bn: nn.BatchNorm2d) -> None:
+    """Fold ``bn`` into the weights and bias of the convolution it follows, in place."""
+    assert bn.running_mean is not None and bn.running_var is not None, "BatchNorm without running statistics"
+    conv.weight, conv.bias = fuse_conv_bn_weights(conv.weight, conv.bias, bn.running_mean, bn.running_var, bn.eps,
+                                                  bn.weight, bn.bias, transpose=isinstance(conv, nn.ConvTranspose2d))
+
+
+def _fold_into_sum(convs: list[nn.Conv2d], bn: nn.BatchNorm2d) -> None:
+    """Fold ``bn`` applied to the sum of the convolutions' outputs: every convolution is scaled, the first shifted."""
+    scale, shift = _bn_scale_shift(bn)
+    for i, conv in enumerate(convs):
+        bias = conv.bias * scale if conv.bias is not None else torch.zeros_like(scale)
+        conv.weight = nn.Parameter(conv.weight * scale.reshape(-1, 1, 1, 1))
+        conv.bias = nn.Parameter(bias + shift if i == 0 else bias)
+
+
+def _optional_submodule(block: nn.Module, path: str) -> nn.Module | None:
+    """Submodule at a dotted path, or None where an optional submodule is unset."""
+    module: nn.Module | None = block
+    for name in path.split("."):
+        module = getattr(module, name, None)
+    return module
+
+
+def _remove(block: nn.Module, bn_path: str) -> None:
+    """Remove a folded BatchNorm: Conv2dLayer's optional BatchNorm becomes None, any other an identity."""
+    parent_path, _, name = bn_path.rpartition(".")
+    parent = block.get_submodule(parent_path)
+    if isinstance(parent, Conv2dLayer):
+        parent.batchnorm2d = None
+        parent.apply_bias = True
+    else:
+        setattr(parent, name, nn.Identity())
+
+
+def fuse_for_inference(model: nn.Module) -> nn.Module:
+    """
+    Copy of a model with BatchNorms folded into convolutions and the UNet2D forward-pass checks disabled.
+
+    The copy is in eval mode and its parameters do not require gradients; it computes the eval-mode output of
+    ``model`` up to floating point rounding. Modules other than the UNet2D blocks are copied unchanged.
+
+    :param model: Model, e.g. UNet2D, whose BatchNorms hold trained running statistics.
+    :return: Fused copy of the model; ``model`` itself is not modified.
+    """
+    fused = copy.deepcopy(model).eval()
+    folded = 0
+    with torch.no_grad():
+        for block in list(fused.modules()):
+            for conv_path, bn_path in _FOLDS.get(type(block), []):
+                bn = _optional_submodule(block, bn_path)
+                if not isinstance(bn, nn.BatchNorm2d):
+                    continue
+                _fold_into_conv(cast(nn.Conv2d, block.get_submodule(conv_path)), bn)
+                _remove(block, bn_path)
+                folded += 1
+            if isinstance(block, LocalRefinementMerge) and isinstance(block.batchnorm2d_out, nn.BatchNorm2d):
+                convs = [cast(Conv2dLayer, block.conv_x).conv2d, cast(Conv2dLayer, block.conv_skip).conv2d]
+                _fold_into_sum(convs, block.batchnorm2d_out)
+                _remove(block, "batchnorm2d_out")
+                folded += 1
+            if isinstance(block, UNet2D):
+                block.validate_forward = False
+                block.debug_forward = False
+    kept = sum(isinstance(module, nn.BatchNorm2d) for module in fused.modules())
+    logger.info("Folded %d BatchNorm2d layers into convolutions, kept %d in eval mode", folded, kept)
+    return fused.requires_grad_(False)
@@ -0,0 +1,141 @@
+"""
+ONNX Runtime backend for models exported by ``export_onnx.py``.
+
+:class:`OnnxRuntimeModel` wraps an inference session in an ``nn.Module`` returning logits, so the exported
+graph can be dropped into :class:`~SkiNet.ML.inference.tiled_inference.TiledPredictor`,
+:func:`~SkiNet.ML.inference.tiled_inference.predict_resized` and the ``predict`` CLI in place of the
+PyTorch backbone. :func:`tune_session_threads` picks the intra/inter-op thread counts of a session by
+timing it on a sample batch. ``onnxruntime`` is an optional dependency and is imported only when a session
+is created. Graphs exported with ``--mask-head`` output thresholded uint8 masks instead of probabilities and
+are rejected by :func:`check_probability_output`.
+"""
+from __future__ import annotations
+
+import itertools
+import os
+import time
+from collections.abc import Iterable
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+import torch
+import torch.nn as nn
+from torch import Tensor
+
+PROBABILITY_EPS = 1e-6
+"""Probabilities are clamped to [eps, 1 - eps] before converting them back to logits."""
+MASK_HEAD_OUTPUT_TYPE = "tensor(uint8)"
+"""ONNX type of the output of graphs exported with ``export_onnx.py --mask-head``."""
+
+
+def create_session(onnx_path: Path, intra_op_threads: int | None = None,
+                   inter_op_threads: int | None = None) -> Any:
+    """
+    Create a CPU inference session.
+
+    :param onnx_path: Path to the ONNX model.
+    :param intra_op_threads: Threads parallelising one operator; None lets ONNX Runtime use all cores.
+    :param inter_op_threads: Threads running independent operators concurrently. Values above 1 switch the
+        session to parallel execution mode; None for the default sequential mode.
+    :return: ``onnxruntime.InferenceSession``.
+    """
+    try:
+        import onnxruntime as ort
+    except ImportError as e:
+        raise ImportError("onnxruntime is required to run ONNX models (pip install onnxruntime)") from e
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_op_threads is not None:
+        options.intra_op_num_threads = intra_op_threads
+    if inter_op_threads is not None:
+        options.inter_op_num_threads = inter_op_threads
+        if inter_op_threads > 1:
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    return ort.InferenceSession(str(onnx_path), sess_options=options, providers=["CPUExecutionProvider"])
+
+
+def check_probability_output(session: Any, onnx_path: Path) -> None:
+    """
+    Reject graphs whose output is a thresholded uint8 mask rather than probabilities or logits.
+
+    :param session: ``onnxruntime.InferenceSession`` of the graph.
+    :param onnx_path: Path to the ONNX model, for the error message.
+    :raises ValueError: If the graph was exported with ``export_onnx.py --mask-head``.
+    """
+    output = session.get_outputs()[0]
+    if output.type == MASK_HEAD_OUTPUT_TYPE:
+        raise ValueError(f"ONNX model '{onnx_path}' outputs a uint8 mask ('{output.name}'), as exported with "
+                         f"--mask-head; export it without --mask-head to get the probabilities this needs.")
+
+
+class OnnxRuntimeModel(nn.Module):
+    """
+    ONNX Runtime session behaving like the segmentation backbone: float32 [B, C, H, W] in, logits out.
+
+    Graphs exported by ``export_onnx.py`` end in a sigmoid, so their probabilities are converted back to
+    logits; this keeps the output interchangeable with the PyTorch backbone for logit blending.
+
+    :param onnx_path: Path to the ONNX model.
+    :param intra_op_threads: See :func:`create_session`.
+    :param inter_op_threads: See :func:`create_session`.
+    :param outputs_probabilities: Whether the graph outputs probabilities (True for ``export_onnx.py``
+        graphs) rather than logits.
+    :raises ValueError: If the graph outputs a uint8 mask, see :func:`check_probability_output`.
+    """
+
+    def __init__(self,
+                 onnx_path: Path,
+                 intra_op_threads: int | None = None,
+                 inter_op_threads: int | None = None,
+                 outputs_probabilities: bool = True) -> None:
+        super().__init__()
+        self.onnx_path = Path(onnx_path)
+        self.session = create_session(self.onnx_path, intra_op_threads, inter_op_threads)
+        check_probability_output(self.session, self.onnx_path)
+        self.input_name: str = self.session.get_inputs()[0].name
+        self.output_name: str = self.session.get_outputs()[0].name
+        self.outputs_probabilities = outputs_probabilities
+
+    def forward(self, x: Tensor) -> Tensor:
+        inputs = np.ascontiguousarray(x.detach().cpu().numpy(), dtype=np.float32)
+        output = torch.from_numpy(self.session.run([self.output_name], {self.input_name: inputs})[0]).to(x.device)
+        if self.outputs_probabilities:
+            return torch.logit(output.float(), eps=PROBABILITY_EPS)
+        return output.float()
+
+
+def tune_session_threads(onnx_path: Path,
+                         sample: Tensor,
+                         intra_op_candidates: Iterable[int] | None = None,
+                         inter_op_candidates: Iterable[int] = (1, 2),
+                         repeats: int = 5) -> tuple[int, int]:
+    """
+    Pick the intra/inter-op thread counts with the lowest median latency on a sample batch.
+
+    :param onnx_path: Path to the ONNX model.
+    :param sample: Input batch [B, C, H, W] the latency is measured on.
+    :param intra_op_candidates: Intra-op thread counts to try; defaults to 1, 2, 4, ... up to the number of cores.
+    :param inter_op_candidates: Inter-op thread counts to try.
+    :param repeats: Timed runs per combination after one warm-up run.
+    :return: (intra_op_threads, inter_op_threads) of the fastest session.
+    """
+    cores = os.cpu_count() or 1
+    if intra_op_candidates is None:
+        intra_op_candidates = sorted({min(2 ** i, cores) for i in range(cores.bit_length() + 1)})
+    inputs = np.ascontiguousarray(sample.cpu().numpy(), dtype=np.float32)
+    best: tuple[float, tuple[int, int]] | None = None
+    for intra, inter in itertools.product(intra_op_candidates, inter_op_candidates):
+        session = create_session(onnx_path, intra, inter)
+        feed = {session.get_inputs()[0].name: inputs}
+        session.run(None, feed)
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            session.run(None, feed)
+            timings.append(time.perf_counter() - start)
+        latency = float(np.median(timings))
+        if best is None or latency < best[0]:
+            best = (latency, (intra, inter))
+    assert best is not None, "No thread counts to try"
+    return best[1]
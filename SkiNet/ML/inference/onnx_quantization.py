@@ -0,0 +1,304 @@
+"""
+Post-training static INT8 quantisation of an exported ONNX model, with a report against the FP32 PyTorch model.
+
+The activations of a static INT8 graph need fixed ranges, which are calibrated by running the FP32 graph on a
+random sample of the validation split from
+:func:`~SkiNet.ML.datasets.dataset_factory.create_segmentation_datasets_from_config`. Weights are quantised
+per output channel to signed INT8, activations to unsigned INT8, in the QDQ format that ONNX Runtime's
+CPU provider runs with integer kernels.
+
+The report compares the FP32 PyTorch backbone, the FP32 ONNX Runtime session and the INT8 session on
+validation images not used for calibration. For each backend it gives:
+
+- latency at batch size 1 (median over the repeats, in ms);
+- throughput at the evaluation batch size (images/s);
+- the per-image mean Dice/IoU at the checkpoint's threshold from
+  :func:`~SkiNet.Utils.analysis.test_scoring.score_at_thresholds`, and their drift from PyTorch FP32.
+
+The sessions use the intra/inter-op thread counts picked by
+:func:`~SkiNet.ML.inference.onnx_backend.tune_session_threads`.
+
+Run with:
+    python -m SkiNet.ML.inference.onnx_quantization --config config.yaml --ckpt best.ckpt --onnx skinet_unet.onnx \
+        [--out skinet_unet_int8.onnx] [--calibration-samples 64] [--eval-samples 0] [--report report.csv]
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Literal
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch import Tensor
+from torch.utils.data import DataLoader, Dataset, Subset
+
+from SkiNet.ML.dataloaders.dataloaders import collate_padded_preserving_specs, collate_preserving_specs
+from SkiNet.ML.inference.onnx_backend import (OnnxRuntimeModel, check_probability_output, create_session,
+                                              tune_session_threads)
+from SkiNet.Utils.analysis.test_scoring import score_at_thresholds
+
+logger = logging.getLogger(__name__)
+
+CalibrationMethodName = Literal["minmax", "entropy", "percentile"]
+
+
+class TensorCalibrationReader:
+    """
+    Calibration data reader feeding ONNX Runtime's calibrator one image at a time.
+
+    Implements the ``get_next`` protocol of ``onnxruntime.quantization.CalibrationDataReader``.
+
+    :param input_name: Name of the graph input.
+    :param images: Normalised images [N, C, H, W].
+    """
+
+    def __init__(self, input_name: str, images: Tensor) -> None:
+        self.input_name = input_name
+        self.images = images.float().cpu().numpy()
+        self._next = 0
+
+    def get_next(self) -> dict[str, np.ndarray] | None:
+        if self._next >= len(self.images):
+            return None
+        self._next += 1
+        return {self.input_name: self.images[self._next - 1:self._next]}
+
+    def rewind(self) -> None:
+        self._next = 0
+
+
+def sample_indices(length: int, n: int, seed: int) -> tuple[list[int], list[int]]:
+    """
+    Split dataset indices into a random calibration sample and the remaining evaluation indices.
+
+    :param length: Dataset length.
+    :param n: Calibration sample size, capped at ``length``.
+    :param seed: Seed of the sampling.
+    :return: Sorted (calibration indices, evaluation indices).
+    """
+    permutation = np.random.default_rng(seed).permutation(length)
+    return sorted(permutation[:n].tolist()), sorted(permutation[n:].tolist())
+
+
+@torch.no_grad()
+def load_split_tensors(dataset: Dataset[Any],
+                       indices: list[int],
+                       batch_augmentation: nn.Module | None = None,
+                       batch_size: int = 8) -> tuple[Tensor, Tensor]:
+    """
+    Images and masks of dataset samples after the eval transforms, as the model sees them in validation.
+
+    :param dataset: Dataset of a split, e.g. ``create_segmentation_datasets_from_config(config).val``.
+    :param indices: Sample indices to load.
+    :param batch_augmentation: The Lightning model's batch augmentation with ``augmentation_backend="batched"``,
+        which crops and normalises on the fly; None otherwise.
+    :param batch_size: Samples per loading batch.
+    :return: Float32 images [N, C, H, W] and binary float masks [N, 1, H, W].
+    """
+    collate = collate_padded_preserving_specs if batch_augmentation is not None else collate_preserving_specs
+    loader = DataLoader(Subset(dataset, indices), batch_size=batch_size, collate_fn=collate)
+    images, masks = [], []
+    for batch in loader:
+        x, m = batch["image"], batch["mask"]
+        if batch_augmentation is not None:
+            x, m = batch_augmentation(x, m, batch["image_size"], train=False)
+        images.append(x.float())
+        masks.append((m.float() >= 0.5).float())
+    return torch.cat(images), torch.cat(masks)
+
+
+def fixed_input_size(onnx_path: Path) -> tuple[int, int] | None:
+    """(height, width) of a graph input with fixed spatial axes, or None if they are dynamic."""
+    shape = create_session(onnx_path).get_inputs()[0].shape
+    return (shape[2], shape[3]) if isinstance(shape[2], int) and isinstance(shape[3], int) else None
+
+
+def resize_to(batch: Tensor, size: tuple[int, int], is_mask: bool = False) -> Tensor:
+    """Resize images [N, C, H, W] bilinearly, or masks by nearest neighbour, to a fixed (height, width)."""
+    if tuple(batch.shape[-2:]) == size:
+        return batch
+    if is_mask:
+        return F.interpolate(batch, size=size, mode="nearest")
+    return F.interpolate(batch, size=size, mode="bilinear", antialias=True, align_corners=False)
+
+
+def quantize_int8(fp32_path: Path,
+                  int8_path: Path,
+                  calibration_images: Tensor,
+                  calibrate_method: CalibrationMethodName = "minmax",
+                  per_channel: bool = True) -> Path:
+    """
+    Statically quantise an ONNX model to INT8, calibrating activation ranges on sample images.
+
+    :param fp32_path: FP32 ONNX model.
+    :param int8_path: Output path of the INT8 model.
+    :param calibration_images: Normalised images [N, C, H, W] matching the model input.
+    :param calibrate_method: Activation range estimator: "minmax", "entropy" or "percentile".
+    :param per_channel: Quantise convolution weights per output channel.
+    :return: ``int8_path``.
+    :raises ValueError: If the model outputs a uint8 mask, see
+        :func:`~SkiNet.ML.inference.onnx_backend.check_probability_output`.
+    """
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    methods = {"minmax": CalibrationMethod.MinMax, "entropy": CalibrationMethod.Entropy,
+               "percentile": CalibrationMethod.Percentile}
+    session = create_session(fp32_path)
+    check_probability_output(session, fp32_path)
+    input_name = session.get_inputs()[0].name
+    int8_path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        # shape inference and graph cleanup let the quantiser see every tensor's type
+        preprocessed = Path(tmp) / "preprocessed.onnx"
+        quant_pre_process(str(fp32_path), str(preprocessed))
+        quantize_static(str(preprocessed), str(int8_path),
+                        calibration_data_reader=TensorCalibrationReader(input_name, calibration_images),
+                        quant_format=QuantFormat.QDQ,
+                        per_channel=per_channel,
+                        activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8,
+                        calibrate_method=methods[calibrate_method])
+    logger.info("Wrote INT8 model '%s' (%.1f MB, FP32 %.1f MB).", int8_path,
+                int8_path.stat().st_size / 1024**2, fp32_path.stat().st_size / 1024**2)
+    return int8_path
+
+
+@torch.no_grad()
+def predict_probs(model: nn.Module, images: Tensor, batch_size: int) -> tuple[Tensor, float]:
+    """
+    Flattened probabilities of all images and the throughput of computing them.
+
+    :param model: Backbone returning logits.
+    :param images: Normalised images [N, C, H, W].
+    :param batch_size: Images per forward pass.
+    :return: Probabilities [N, P] and images/s.
+    """
+    probs = []
+    start = time.perf_counter()
+    for first in range(0, len(images), batch_size):
+        logits = model(images[first:first + batch_size])
+        probs.append(torch.sigmoid(logits.float()).reshape(logits.shape[0], -1))
+    seconds = time.perf_counter() - start
+    return torch.cat(probs), len(images) / seconds
+
+
+@torch.no_grad()
+def latency_ms(model: nn.Module, image: Tensor, repeats: int = 20) -> float:
+    """Median latency of one image [1, C, H, W] in milliseconds, after one warm-up run."""
+    model(image)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model(image)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000
+
+
+def compare_backends(backends: dict[str, nn.Module],
+                     images: Tensor,
+                     masks: Tensor,
+                     threshold: float,
+                     batch_size: int = 8,
+                     repeats: int = 20,
+                     n_boot: int = 1000) -> pd.DataFrame:
+    """
+    Latency, throughput and segmentation quality of several backends on the same images.
+
+    :param backends: Name to backbone returning logits; the first one is the reference of the drift columns.
+    :param images: Normalised images [N, C, H, W].
+    :param masks: Binary masks [N, 1, H, W].
+    :param threshold: Decision threshold the Dice/IoU are computed at.
+    :param batch_size: Images per forward pass for throughput and scoring.
+    :param repeats: Timed runs of the latency measurement.
+    :param n_boot: Bootstrap resamples of the Dice CI.
+    :return: One row per backend with columns backend, latency_ms, images_per_s, dice, iou, dice_lo, dice_hi,
+        dice_drift, iou_drift and max_prob_diff (largest absolute probability difference to the reference).
+    """
+    flat_masks = masks.reshape(len(masks), -1)
+    rows = []
+    reference: tuple[Tensor, pd.Series] | None = None
+    for name, model in backends.items():
+        model.eval()
+        probs, images_per_s = predict_probs(model, images, batch_size)
+        scores = score_at_thresholds(probs, flat_masks, [threshold], n_boot=n_boot).iloc[0]
+        if reference is None:
+            reference = (probs, scores)
+        rows.append({"backend": name,
+                     "latency_ms": latency_ms(model, images[:1], repeats),
+                     "images_per_s": images_per_s,
+                     "dice": scores["dice"], "iou": scores["iou"],
+                     "dice_lo": scores["dice_lo"], "dice_hi": scores["dice_hi"],
+                     "dice_drift": scores["dice"] - reference[1]["dice"],
+                     "iou_drift": scores["iou"] - reference[1]["iou"],
+                     "max_prob_diff": float((probs - reference[0]).abs().max())})
+    return pd.DataFrame(rows)
+
+
+def main() -> None:
+    from SkiNet.ML.configs.load_config_from_yaml import load_config_from_yaml
+    from SkiNet.ML.datasets.dataset_factory import create_segmentation_datasets_from_config
+    from SkiNet.ML.model.lightning_model import LightningModel
+    from SkiNet.Utils.analysis.test_scoring import load_uncompiled
+
+    ap = argparse.ArgumentParser(description="Quantise an exported ONNX model to INT8 and compare it with FP32.")
+    ap.add_argument("--config", type=Path, required=True, help="Config YAML of the checkpoint")
+    ap.add_argument("--ckpt", type=Path, required=True, help="Lightning checkpoint the ONNX model was exported from")
+    ap.add_argument("--onnx", type=Path, required=True, help="FP32 ONNX model exported by export_onnx.py")
+    ap.add_argument("--out", type=Path, default=None, help="INT8 model path (default: <onnx stem>_int8.onnx)")
+    ap.add_argument("--calibration-samples", type=int, default=64, help="Validation images to calibrate on (default: 64)")
+    ap.add_argument("--eval-samples", type=int, default=0,
+                    help="Remaining validation images to evaluate on, 0 for all (default: 0)")
+    ap.add_argument("--calibrate-method", choices=["minmax", "entropy", "percentile"], default="minmax",
+                    help="Activation range estimator (default: minmax)")
+    ap.add_argument("--batch-size", type=int, default=8, help="Images per forward pass (default: 8)")
+    ap.add_argument("--seed", type=int, default=0, help="Seed of the calibration sample (default: 0)")
+    ap.add_argument("--report", type=Path, default=None, help="Optional CSV path of the report")
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # fail before loading the checkpoint and the calibration data
+    check_probability_output(create_session(args.onnx), args.onnx)
+    config = load_config_from_yaml(args.config)
+    config.trainconfig.cache_in_ram = False  # only a sample of the split is read
+    lightning_model = load_uncompiled(config, args.ckpt)
+    assert isinstance(lightning_model, LightningModel)
+    threshold = float(lightning_model.optimal_threshold.item())
+
+    val = create_segmentation_datasets_from_config(config).val
+    calibration_indices, eval_indices = sample_indices(len(val), args.calibration_samples, args.seed)
+    if args.eval_samples:
+        eval_indices = eval_indices[:args.eval_samples]
+    augmentation = lightning_model.batch_augmentation
+    calibration_images, _ = load_split_tensors(val, calibration_indices, augmentation, args.batch_size)
+    images, masks = load_split_tensors(val, eval_indices, augmentation, args.batch_size)
+    size = fixed_input_size(args.onnx)
+    if size is not None:
+        # graphs exported with a fixed input size only accept that size
+        calibration_images, images, masks = (resize_to(calibration_images, size), resize_to(images, size),
+                                             resize_to(masks, size, is_mask=True))
+
+    int8_path = args.out if args.out is not None else args.onnx.with_name(f"{args.onnx.stem}_int8.onnx")
+    quantize_int8(args.onnx, int8_path, calibration_images, args.calibrate_method)
+
+    backends: dict[str, nn.Module] = {"pytorch_fp32": lightning_model.model}
+    for name, path in [("onnxruntime_fp32", args.onnx), ("onnxruntime_int8", int8_path)]:
+        intra, inter = tune_session_threads(path, images[:args.batch_size])
+        logger.info("%s: %d intra-op and %d inter-op threads.", name, intra, inter)
+        backends[name] = OnnxRuntimeModel(path, intra, inter)
+    report = compare_backends(backends, images, masks, threshold, args.batch_size)
+    print(f"{len(images)} validation images, threshold {threshold:.4f}")
+    print(report.to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+    if args.report is not None:
+        report.to_csv(args.report, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,453 @@
+"""
+Batch prediction of binary lesion masks for a directory or metadata CSV of images.
+
+Images are decoded, resized and normalised in a pool of processes while the model runs, at most
+``prefetch`` images ahead. The main process batches them on the model device and puts the logits on a
+bounded queue. Writer threads upsample the logits to the original resolution, threshold them and write
+each mask as soon as it is ready, so memory does not grow with the number of images:
+
+- ``png``: ``<out>/<sampleid>_segmentation.png``, values 0/255 as in the ISIC ground truth;
+- ``rle``: one row per image in ``<out>/masks_rle.csv`` (see :func:`rle_encode`), in input order;
+- ``npz``: ``<out>/<sampleid>.npz`` holding the float16 probability map and the threshold.
+
+The model is a Lightning checkpoint with its config, or an ONNX file exported by ``export_onnx.py``.
+Checkpoints are run with their BatchNorms folded into the convolutions
+(:func:`~SkiNet.ML.inference.fusion.fuse_for_inference`) unless ``--no-fuse`` is given.
+The threshold defaults to the checkpoint's ``optimal_threshold``. In ``resized`` mode (default) each image is
+resized to the training size and whole batches of images run at once; in ``tiled`` mode each image is
+predicted at full resolution by :class:`~SkiNet.ML.inference.tiled_inference.TiledPredictor`.
+
+Run with:
+    python -m SkiNet.ML.inference.predict --input <image_dir_or_csv> --ckpt best.ckpt --config config.yaml \
+        --out masks/ [--format png|rle|npz] [--mode resized|tiled] [--decode-workers 4]
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Literal, TypeVar, cast
+
+import albumentations as A
+import cv2
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torchvision.io import ImageReadMode, decode_image
+
+from SkiNet.ML.configs.transform_configs.transform_config import TransformConfig
+from SkiNet.ML.inference.tiled_inference import BlendMode, TiledPredictor
+from SkiNet.ML.utils.typing_utils import IntOrTuple2d
+from SkiNet.Utils.csv_headers import DATAPATH_HEADER, DATATYPE_HEADER, DATATYPE_IMAGE, SAMPLEID_HEADER
+
+logger = logging.getLogger(__name__)
+
+OutputFormat = Literal["png", "rle", "npz"]
+PredictMode = Literal["resized", "tiled"]
+
+IMAGE_SUFFIXES = frozenset({".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff"})
+MASK_SUFFIX = "_segmentation"
+"""Files whose stem ends with this suffix are ground-truth masks and are skipped in directory inputs."""
+RLE_CSV_NAME = "masks_rle.csv"
+
+ISIC2017_NORMALIZATION_MEAN = (0.699, 0.556, 0.5121)
+ISIC2017_NORMALIZATION_STD = (0.1576, 0.1562, 0.1706)
+"""Normalisation of the ISIC 2017 models, used for ONNX models run without a config."""
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass
+class PredictionStats:
+    """
+    Throughput of one prediction run.
+
+    :param images: Number of images whose masks were written.
+    :param seconds: Wall time from the first decode to the last write.
+    """
+    images: int
+    seconds: float
+
+    @property
+    def images_per_second(self) -> float:
+        return self.images / self.seconds if self.seconds > 0 else float("nan")
+
+
+# ----------------------------- inputs --------------------------------------- #
+def list_input_images(input_path: Path, data_root: Path | None = None) -> list[tuple[str, Path]]:
+    """
+    Images to predict, as (sample id, path) pairs.
+
+    :param input_path: Directory searched recursively for images (files ending in ``_segmentation`` are
+        skipped), or a metadata CSV with a ``datapath`` column. Rows of a CSV with a ``datatype`` column are
+        restricted to images; sample ids come from its ``sampleid`` column if present.
+    :param data_root: Directory the CSV paths are relative to; defaults to the directory of the CSV.
+    :return: Pairs sorted by sample id for directories, in CSV order for CSVs.
+    """
+    if input_path.is_dir():
+        paths = [p for p in input_path.rglob("*")
+                 if p.suffix.lower() in IMAGE_SUFFIXES and not p.stem.endswith(MASK_SUFFIX)]
+        return sorted((p.stem, p) for p in paths)
+    df = pd.read_csv(input_path)
+    if DATATYPE_HEADER in df.columns:
+        df = df[df[DATATYPE_HEADER] == DATATYPE_IMAGE]
+    root = data_root if data_root is not None else input_path.parent
+    paths = [root / p for p in df[DATAPATH_HEADER]]
+    ids = df[SAMPLEID_HEADER].astype(str) if SAMPLEID_HEADER in df.columns else [p.stem for p in paths]
+    return list(zip(ids, paths))
+
+
+_normalize: A.Normalize | None = None
+_resize_to: tuple[int, int] | None = None
+
+
+def prediction_normalization(transform_config: TransformConfig | None) -> A.Normalize:
+    """The eval-time normalisation of a config, or the ISIC 2017 statistics without one."""
+    if transform_config is None:
+        return A.Normalize(normalization="standard", mean=ISIC2017_NORMALIZATION_MEAN,
+                           std=ISIC2017_NORMALIZATION_STD, p=1.0)
+    from SkiNet.ML.transformations.transform_pipelines import get_postprocess_transforms
+    return cast(A.Normalize, get_postprocess_transforms(transform_config)[0])
+
+
+def _init_decode_process(normalize: A.Normalize, resize_to: tuple[int, int] | None) -> None:
+    global _normalize, _resize_to
+    # one image per process; nested thread pools would oversubscribe the cores
+    cv2.setNumThreads(1)
+    torch.set_num_threads(1)
+    _normalize, _resize_to = normalize, resize_to
+
+
+def decode_image_for_prediction(path: Path, normalize: A.Normalize,
+                                resize_to: tuple[int, int] | None) -> tuple[tuple[int, int], np.ndarray]:
+    """
+    Decode an RGB image as in training, optionally resize it, and normalise it.
+
+    :param path: Image file.
+    :param normalize: Normalisation transform applied to the (resized) HWC uint8 image.
+    :param resize_to: (height, width) to resize to with antialiasing, or None to keep the resolution.
+    :return: Original (height, width) and the normalised float32 CHW image.
+    """
+    image = decode_image(str(path), mode=ImageReadMode.RGB)
+    size = (int(image.shape[-2]), int(image.shape[-1]))
+    if resize_to is not None and size != resize_to:
+        image = F.interpolate(image[None].float(), size=resize_to, mode="bilinear", antialias=True,
+                              align_corners=False)[0].round().clamp(0, 255).to(torch.uint8)
+    normalized = normalize(image=image.permute(1, 2, 0).numpy())["image"]
+    return size, np.ascontiguousarray(normalized.transpose(2, 0, 1), dtype=np.float32)
+
+
+def _decode_item(item: tuple[str, Path]) -> tuple[str, tuple[int, int], np.ndarray]:
+    assert _normalize is not None
+    sampleid, path = item
+    size, image = decode_image_for_prediction(path, _normalize, _resize_to)
+    return sampleid, size, image
+
+
+def bounded_map(executor: Executor, fn: Callable[[T], R], items: Iterable[T], max_in_flight: int) -> Iterator[R]:
+    """
+    Ordered ``executor.map`` that keeps at most ``max_in_flight`` results pending, so that a slow
+    consumer bounds the memory held by finished results.
+    """
+    pending: deque[Future[R]] = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_in_flight:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# ----------------------------- outputs -------------------------------------- #
+def rle_encode(mask: np.ndarray) -> str:
+    """
+    Run-length encode a binary mask in row-major order.
+
+    :param mask: Boolean or 0/1 array [H, W].
+    :return: Space-separated ``start length`` pairs with 1-based starts; empty for an empty mask.
+    """
+    pixels = np.concatenate([[0], mask.reshape(-1).astype(np.int8), [0]])
+    edges = np.flatnonzero(pixels[1:] != pixels[:-1]) + 1
+    edges[1::2] -= edges[::2]
+    return " ".join(map(str, edges))
+
+
+def rle_decode(rle: str, shape: tuple[int, int]) -> np.ndarray:
+    """
+    Inverse of :func:`rle_encode`.
+
+    :param rle: Space-separated ``start length`` pairs with 1-based starts.
+    :param shape: Mask (height, width).
+    :return: Boolean mask of ``shape``.
+    """
+    mask = np.zeros(shape[0] * shape[1], dtype=bool)
+    values = np.array(rle.split(), dtype=np.int64)
+    for start, length in zip(values[::2], values[1::2]):
+        mask[start - 1:start - 1 + length] = True
+    return mask.reshape(shape)
+
+
+class MaskWriter:
+    """
+    Thread-safe writer of the masks of one prediction run.
+
+    :param out_dir: Output directory, created if missing.
+    :param output_format: ``png``, ``rle`` or ``npz``, see the module docstring.
+    :param threshold: Probability threshold of the foreground.
+    """
+
+    def __init__(self, out_dir: Path, output_format: OutputFormat, threshold: float) -> None:
+        if output_format not in ("png", "rle", "npz"):
+            raise ValueError(f"Unknown output format '{output_format}', expected 'png', 'rle' or 'npz'.")
+        self.out_dir = out_dir
+        self.output_format: OutputFormat = output_format
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._rle_file: Any = None
+        self._rle_writer: Any = None
+        self._rle_rows: dict[int, list[Any]] = {}
+        self._next_index = 0
+        out_dir.mkdir(parents=True, exist_ok=True)
+        if output_format == "rle":
+            self._rle_file = open(out_dir / RLE_CSV_NAME, "w", newline="")
+            self._rle_writer = csv.writer(self._rle_file)
+            self._rle_writer.writerow([SAMPLEID_HEADER, "height", "width", "rle"])
+
+    def write(self, sampleid: str, logits: torch.Tensor, size: tuple[int, int], index: int | None = None) -> None:
+        """
+        Upsample logits [1, h, w] to ``size``, threshold them and write the mask of one image.
+
+        :param index: Position of the image in the input. RLE rows are held back until all earlier images are
+            written, so the CSV is in input order whichever thread finishes first; None writes the row at once.
+        """
+        if tuple(logits.shape[-2:]) != size:
+            logits = F.interpolate(logits[None], size=size, mode="bilinear", align_corners=False)[0]
+        probs = logits[0].sigmoid().numpy()
+        if self.output_format == "npz":
+            np.savez_compressed(self.out_dir / f"{sampleid}.npz", probability=probs.astype(np.float16),
+                                threshold=np.float32(self.threshold))
+            return
+        mask = probs >= self.threshold
+        if self.output_format == "png":
+            cv2.imwrite(str(self.out_dir / f"{sampleid}{MASK_SUFFIX}.png"), mask.astype(np.uint8) * 255)
+        else:
+            row = [sampleid, size[0], size[1], rle_encode(mask)]
+            with self._lock:
+                if index is None:
+                    self._rle_writer.writerow(row)
+                    return
+                self._rle_rows[index] = row
+                while self._next_index in self._rle_rows:
+                    self._rle_writer.writerow(self._rle_rows.pop(self._next_index))
+                    self._next_index += 1
+
+    def close(self) -> None:
+        if self._rle_file is not None:
+            # rows behind an image that was never written, e.g. after an error
+            self._rle_writer.writerows(self._rle_rows.pop(index) for index in sorted(self._rle_rows))
+            self._rle_file.close()
+
+
+# ----------------------------- models --------------------------------------- #
+def load_model_for_prediction(ckpt_path: Path | None = None,
+                              config_path: Path | None = None,
+                              onnx_path: Path | None = None,
+                              fuse: bool = True,
+                              ) -> tuple[nn.Module, float | None, TransformConfig | None]:
+    """
+    Load the backbone to predict with.
+
+    :param ckpt_path: Lightning checkpoint; requires ``config_path``.
+    :param config_path: Config YAML of the checkpoint. Optional for ONNX models, where it only provides
+        the normalisation.
+    :param onnx_path: ONNX model exported by ``export_onnx.py``, used instead of a checkpoint.
+    :param fuse: Whether to fold the BatchNorms of a checkpoint's backbone into its convolutions.
+    :return: Backbone returning logits, the checkpoint's ``optimal_threshold`` (None for ONNX models)
+        and the transform config (None without a config).
+    :raises ValueError: If the ONNX model was exported with ``--mask-head``, whose uint8 masks cannot be
+        blended, upsampled or re-thresholded like probabilities.
+    """
+    from SkiNet.ML.configs.load_config_from_yaml import load_config_from_yaml
+
+    config = load_config_from_yaml(config_path) if config_path is not None else None
+    transform_config = config.transformconfig if config is not None else None
+    if onnx_path is not None:
+        from SkiNet.ML.inference.onnx_backend import OnnxRuntimeModel
+        return OnnxRuntimeModel(onnx_path), None, transform_config
+    if ckpt_path is None or config is None:
+        raise ValueError("Provide an ONNX model, or a checkpoint together with its config.")
+    from SkiNet.Utils.analysis.test_scoring import load_uncompiled
+    lightning_model = load_uncompiled(config, ckpt_path)
+    threshold = float(lightning_model.optimal_threshold.item())
+    if fuse:
+        from SkiNet.ML.inference.fusion import fuse_for_inference
+        return fuse_for_inference(lightning_model.model), threshold, transform_config
+    return lightning_model.model.eval(), threshold, transform_config
+
+
+# ----------------------------- prediction ----------------------------------- #
+def predict_images(model: nn.Module,
+                   items: list[tuple[str, Path]],
+                   writer: MaskWriter,
+                   normalize: A.Normalize,
+                   mode: PredictMode = "resized",
+                   input_size: IntOrTuple2d = 256,
+                   batch_size: int = 8,
+                   overlap: float = 0.25,
+                   blend: BlendMode = "gaussian",
+                   decode_workers: int | None = None,
+                   writer_threads: int = 2,
+                   queue_size: int = 16,
+                   prefetch: int | None = None,
+                   device: torch.device | str = "cpu") -> PredictionStats:
+    """
+    Predict and write the masks of many images, decoding, inferring and writing concurrently.
+
+    :param model: Backbone returning logits.
+    :param items: (sample id, image path) pairs, see :func:`list_input_images`.
+    :param writer: Writer of the masks.
+    :param normalize: Normalisation applied after decoding, see :func:`decode_image_for_prediction`.
+    :param mode: ``resized`` batches images resized to ``input_size``; ``tiled`` predicts each image at full
+        resolution with tiles of ``input_size``.
+    :param input_size: Model input (height, width), or one int for a square.
+    :param batch_size: Images per forward pass in ``resized`` mode, tiles per forward pass in ``tiled`` mode.
+    :param overlap: Tile overlap in ``tiled`` mode.
+    :param blend: Tile blending window in ``tiled`` mode.
+    :param decode_workers: Decoding processes; defaults to the number of cores.
+    :param writer_threads: Threads upsampling, thresholding and writing masks.
+    :param queue_size: Maximum number of predicted images waiting for a writer.
+    :param prefetch: Maximum number of images decoded ahead of the model; defaults to two batches.
+    :param device: Device running the model.
+    :return: Number of images and wall time.
+    """
+    size = (input_size, input_size) if isinstance(input_size, int) else input_size
+    device = torch.device(device)
+    model = model.eval().to(device)
+    predictor = (TiledPredictor(model, tile_size=size, overlap=overlap, batch_size=batch_size, blend=blend, device=device)
+                 if mode == "tiled" else None)
+    decode_workers = decode_workers or os.cpu_count() or 1
+    prefetch = prefetch or 2 * batch_size
+
+    pending: queue.Queue[tuple[str, torch.Tensor, tuple[int, int], int] | None] = queue.Queue(maxsize=queue_size)
+    errors: list[BaseException] = []
+
+    def write_loop() -> None:
+        while (entry := pending.get()) is not None:
+            if not errors:
+                try:
+                    writer.write(*entry)
+                except BaseException as e:  # re-raised in the main thread
+                    errors.append(e)
+
+    def put(entry: tuple[str, torch.Tensor, tuple[int, int], int]) -> None:
+        if errors:
+            raise errors[0]
+        pending.put(entry)
+
+    writers = [threading.Thread(target=write_loop, name=f"mask-writer-{i}", daemon=True) for i in range(writer_threads)]
+    for thread in writers:
+        thread.start()
+
+    start = time.perf_counter()
+    count = 0
+    try:
+        with ProcessPoolExecutor(max_workers=decode_workers, initializer=_init_decode_process,
+                                 initargs=(normalize, size if mode == "resized" else None)) as executor, \
+                torch.inference_mode():
+            batch: list[tuple[str, tuple[int, int], np.ndarray]] = []
+            for sampleid, image_size, image in bounded_map(executor, _decode_item, items, prefetch):
+                if predictor is not None:
+                    put((sampleid, predictor.predict_logits(torch.from_numpy(image)), image_size, count))
+                    count += 1
+                    continue
+                batch.append((sampleid, image_size, image))
+                if len(batch) == batch_size:
+                    count += _predict_batch(model, batch, device, put, count)
+                    batch = []
+            if batch:
+                count += _predict_batch(model, batch, device, put, count)
+    finally:
+        for _ in writers:
+            pending.put(None)
+        for thread in writers:
+            thread.join()
+        writer.close()
+    if errors:
+        raise errors[0]
+    stats = PredictionStats(images=count, seconds=time.perf_counter() - start)
+    logger.info("Predicted %d images in %.1f s (%.2f images/s).", stats.images, stats.seconds, stats.images_per_second)
+    return stats
+
+
+def _predict_batch(model: nn.Module,
+                   batch: list[tuple[str, tuple[int, int], np.ndarray]],
+                   device: torch.device,
+                   put: Callable[[tuple[str, torch.Tensor, tuple[int, int], int]], None],
+                   first_index: int) -> int:
+    images = torch.from_numpy(np.stack([image for _, _, image in batch])).to(device, non_blocking=True)
+    logits = model(images).float().cpu()
+    for index, ((sampleid, size, _), image_logits) in enumerate(zip(batch, logits), start=first_index):
+        put((sampleid, image_logits, size, index))
+    return len(batch)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Predict binary lesion masks for a directory or CSV of images.")
+    ap.add_argument("--input", type=Path, required=True, help="Directory of images or metadata CSV")
+    ap.add_argument("--data-root", type=Path, default=None, help="Root of the CSV paths (default: CSV directory)")
+    ap.add_argument("--out", type=Path, required=True, help="Output directory")
+    ap.add_argument("--ckpt", type=Path, default=None, help="Lightning checkpoint (requires --config)")
+    ap.add_argument("--config", type=Path, default=None, help="Config YAML of the checkpoint")
+    ap.add_argument("--onnx", type=Path, default=None, help="ONNX model exported by export_onnx.py, instead of --ckpt")
+    ap.add_argument("--threshold", type=float, default=None,
+                    help="Foreground threshold (default: the checkpoint's optimal_threshold, 0.5 for ONNX)")
+    ap.add_argument("--format", choices=["png", "rle", "npz"], default="png", help="Output format (default: png)")
+    ap.add_argument("--mode", choices=["resized", "tiled"], default="resized", help="Inference mode (default: resized)")
+    ap.add_argument("--input-size", type=int, default=256, help="Model input / tile side (default: 256)")
+    ap.add_argument("--batch-size", type=int, default=8, help="Images (resized) or tiles (tiled) per batch (default: 8)")
+    ap.add_argument("--overlap", type=float, default=0.25, help="Tile overlap in tiled mode (default: 0.25)")
+    ap.add_argument("--decode-workers", type=int, default=None, help="Decoding processes (default: all cores)")
+    ap.add_argument("--writer-threads", type=int, default=2, help="Mask writing threads (default: 2)")
+    ap.add_argument("--queue-size", type=int, default=16, help="Predicted images waiting for a writer (default: 16)")
+    ap.add_argument("--device", default="cpu", help="Model device (default: cpu)")
+    ap.add_argument("--no-fuse", action="store_true", help="Run a checkpoint without folding its BatchNorms")
+    args = ap.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.onnx is None and (args.ckpt is None or args.config is None):
+        ap.error("Provide --onnx, or both --ckpt and --config")
+    model, threshold, transform_config = load_model_for_prediction(args.ckpt, args.config, args.onnx, fuse=not args.no_fuse)
+    if args.threshold is not None:
+        threshold = args.threshold
+    elif threshold is None:
+        logger.warning("The ONNX model stores no threshold; using 0.5. Pass --threshold to override.")
+        threshold = 0.5
+    items = list_input_images(args.input, args.data_root)
+    logger.info("Predicting %d images with threshold %.4f.", len(items), threshold)
+    stats = predict_images(model, items, MaskWriter(args.out, args.format, threshold),
+                           normalize=prediction_normalization(transform_config),
+                           mode=args.mode,
+                           input_size=args.input_size,
+                           batch_size=args.batch_size,
+                           overlap=args.overlap,
+                           decode_workers=args.decode_workers,
+                           writer_threads=args.writer_threads,
+                           queue_size=args.queue_size,
+                           device=args.device)
+    print(f"{stats.images} images in {stats.seconds:.1f} s: {stats.images_per_second:.2f} images/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Sliding-window inference of full-resolution images with a segmentation backbone such as UNet2D.
+
+The model is trained on small crops (256x256 by default), while dermoscopy images are several megapixels.
+Instead of shrinking the whole image to the training size, :class:`TiledPredictor` cuts it into overlapping
+tiles of the training size, runs them through the model in batches and stitches the logits back together.
+Each tile's logits are weighted with a window that decays towards the tile border, where the receptive
+field is truncated, so that overlapping tiles blend smoothly.
+
+Memory stays bounded: the only full-resolution buffer is the output (one float32 map per class) and at
+most ``batch_size`` tiles are on the device at a time. The windows are separable and tiles form a regular
+grid, so the sum of weights at each pixel is the outer product of two 1-D sums and is never materialised.
+"""
+from __future__ import annotations
+
+import logging
+import math
+from typing import Literal
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from torch import Tensor
+
+from SkiNet.ML.utils.typing_utils import IntOrTuple2d
+
+logger = logging.getLogger(__name__)
+
+BlendMode = Literal["gaussian", "cosine", "constant"]
+
+
+def _pair(value: IntOrTuple2d) -> tuple[int, int]:
+    return (value, value) if isinstance(value, int) else (value[0], value[1])
+
+
+def blending_window(length: int, mode: BlendMode) -> Tensor:
+    """
+    1-D blending weights along one tile axis; the 2-D window is the outer product of the two axes.
+
+    :param length: Tile length along the axis.
+    :param mode: "gaussian" (sigma of 1/8 of the tile, as in nnU-Net), "cosine" (Hann window shifted by half
+        a pixel so that border weights stay positive) or "constant" (plain averaging).
+    :return: Positive float32 weights of shape [length] with a maximum of 1.
+    """
+    positions = torch.arange(length, dtype=torch.float64) + 0.5
+    if mode == "gaussian":
+        sigma = length / 8
+        window = torch.exp(-((positions - length / 2) ** 2) / (2 * sigma ** 2))
+    elif mode == "cosine":
+        window = 0.5 - 0.5 * torch.cos(2 * math.pi * positions / length)
+    elif mode == "constant":
+        window = torch.ones(length, dtype=torch.float64)
+    else:
+        raise ValueError(f"Unknown blend mode '{mode}', expected 'gaussian', 'cosine' or 'constant'.")
+    return (window / window.max()).float()
+
+
+def tile_starts(length: int, tile: int, overlap: float) -> list[int]:
+    """
+    Start offsets of tiles covering [0, length) with at least the requested overlap.
+
+    The tiles are spread evenly, so the first starts at 0 and the last ends at ``length``.
+
+    :param length: Image length along the axis, at least ``tile``.
+    :param tile: Tile length along the axis.
+    :param overlap: Minimum overlap of neighbouring tiles as a fraction of the tile, in [0, 1).
+    :return: Sorted start offsets.
+    """
+    if length <= tile:
+        return [0]
+    step = max(1, int(tile * (1 - overlap)))
+    n_tiles = math.ceil((length - tile) / step) + 1
+    return [round(i * (length - tile) / (n_tiles - 1)) for i in range(n_tiles)]
+
+
+def _weight_sum(length: int, starts: list[int], window: Tensor) -> Tensor:
+    """Sum of the 1-D windows of all tiles at each position along one axis."""
+    total = torch.zeros(length)
+    for start in starts:
+        total[start:start + len(window)] += window
+    return total
+
+
+class TiledPredictor:
+    """
+    Predict full-resolution probability maps by blending overlapping tiles.
+
+    :param model: Segmentation backbone mapping [B, C, h, w] to logits [B, K, h, w]. It is put in eval mode
+        and moved to ``device``.
+    :param tile_size: Tile (height, width), or one int for square tiles. Must be divisible by the model's
+        ``required_input_multiple`` if it defines one.
+    :param overlap: Minimum overlap of neighbouring tiles as a fraction of the tile size, in [0, 1).
+    :param batch_size: Number of tiles per forward pass.
+    :param blend: Blending window, see :func:`blending_window`.
+    :param device: Device running the model. Tiles are copied there batch by batch; the stitched output
+        is accumulated on the CPU.
+    """
+
+    def __init__(self,
+                 model: nn.Module,
+                 tile_size: IntOrTuple2d = 256,
+                 overlap: float = 0.25,
+                 batch_size: int = 8,
+                 blend: BlendMode = "gaussian",
+                 device: torch.device | str = "cpu") -> None:
+        self.tile_size = _pair(tile_size)
+        multiple = _pair(getattr(model, "required_input_multiple", 1))
+        if any(t % m for t, m in zip(self.tile_size, multiple)):
+            err = "Tile size %s is not divisible by the model's required input multiple %s." % (self.tile_size, multiple)
+            logger.error(err)
+            raise ValueError(err)
+        if not 0 <= overlap < 1:
+            err = "Tile overlap must be in [0, 1), got %s." % overlap
+            logger.error(err)
+            raise ValueError(err)
+        if batch_size < 1:
+            err = "Batch size must be at least 1, got %s." % batch_size
+            logger.error(err)
+            raise ValueError(err)
+        self.overlap = overlap
+        self.batch_size = batch_size
+        self.blend: BlendMode = blend
+        self.device = torch.device(device)
+        self.model = model.eval().to(self.device)
+        self._window_h = blending_window(self.tile_size[0], blend)
+        self._window_w = blending_window(self.tile_size[1], blend)
+        self._window = (self._window_h[:, None] * self._window_w[None, :]).to(self.device)
+
+    def tile_grid(self, height: int, width: int) -> tuple[list[int], list[int]]:
+        """
+        Row and column start offsets of the tiles of an image, padded to at least the tile size.
+
+        :param height: Image height.
+        :param width: Image width.
+        :return: (row starts, column starts); the tiles are their Cartesian product.
+        """
+        tile_h, tile_w = self.tile_size
+        return (tile_starts(max(height, tile_h), tile_h, self.overlap),
+                tile_starts(max(width, tile_w), tile_w, self.overlap))
+
+    @torch.inference_mode()
+    def predict_logits(self, image: Tensor) -> Tensor:
+        """
+        Blended logits of a full-resolution image.
+
+        :param image: Normalised image [C, H, W] of any size. Images smaller than a tile are padded by
+            reflection (replication if they are too small to reflect).
+        :return: Float32 logits [K, H, W] on the CPU.
+        """
+        if image.dim() != 3:
+            raise ValueError(f"Expected an image of shape [C, H, W], got {tuple(image.shape)}.")
+        height, width = image.shape[-2:]
+        tile_h, tile_w = self.tile_size
+        pad_h, pad_w = max(0, tile_h - height), max(0, tile_w - width)
+        if pad_h or pad_w:
+            mode = "reflect" if pad_h < height and pad_w < width else "replicate"
+            image = F.pad(image[None], (0, pad_w, 0, pad_h), mode=mode)[0]
+        rows, cols = self.tile_grid(height, width)
+        positions = [(y, x) for y in rows for x in cols]
+
+        output: Tensor | None = None
+        for first in range(0, len(positions), self.batch_size):
+            batch_positions = positions[first:first + self.batch_size]
+            batch = torch.stack([image[:, y:y + tile_h, x:x + tile_w] for y, x in batch_positions])
+            logits = self.model(batch.to(self.device, dtype=torch.float32, non_blocking=True)).float()
+            weighted = (logits * self._window).cpu()
+            if output is None:
+                output = torch.zeros(weighted.shape[1], *image.shape[-2:])
+            for (y, x), tile in zip(batch_positions, weighted):
+                output[:, y:y + tile_h, x:x + tile_w] += tile
+        assert output is not None
+        output.div_(_weight_sum(image.shape[-2], rows, self._window_h)[None, :, None])
+        output.div_(_weight_sum(image.shape[-1], cols, self._window_w)[None, None, :])
+        return output[:, :height, :width]
+
+    @torch.inference_mode()
+    def predict(self, image: Tensor) -> Tensor:
+        """
+        Foreground probabilities of a full-resolution image (sigmoid of :meth:`predict_logits`).
+
+        :param image: Normalised image [C, H, W] of any size.
+        :return: Float32 probabilities [K, H, W] on the CPU.
+        """
+        return self.predict_logits(image).sigmoid_()
+
+
+@torch.inference_mode()
+def predict_resized(model: nn.Module, image: Tensor, input_size: IntOrTuple2d = 256) -> Tensor:
+    """
+    Naive whole-image baseline: resize the image to the training size, predict, and upsample the logits.
+
+    :param model: Segmentation backbone in eval mode, on the device of ``image``.
+    :param image: Normalised image [C, H, W].
+    :param input_size: (height, width) the image is resized to, or one int for a square.
+    :return: Float32 probabilities [K, H, W] on the device of ``image``.
+    """
+    height, width = image.shape[-2:]
+    resized = F.interpolate(image[None].float(), size=_pair(input_size), mode="bilinear", antialias=True,
+                            align_corners=False)
+    logits = F.interpolate(model(resized).float(), size=(height, width), mode="bilinear", align_corners=False)
+    return logits[0].sigmoid_()
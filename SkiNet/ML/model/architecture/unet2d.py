@@ -148,6 +148,16 @@ class UNet2D(nn.Module):
         self._build_unet()
         self.apply(initialise_weights)
 
+    @property
+    def required_input_multiple(self) -> tuple[int, int]:
+        """
+        Input (height, width) must be divisible by the cumulative downsampling factor of the encoder,
+        stride ** (number_of_layers - 1) per spatial axis.
+        """
+        stride_h, stride_w = (self.stride, self.stride) if isinstance(self.stride, int) else self.stride
+        n = self.number_of_layers - 1
+        return stride_h ** n, stride_w ** n
+
     def _build_unet(self) -> None:
         """
         Build all layers of the UNet.
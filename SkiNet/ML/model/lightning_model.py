@@ -1,21 +1,24 @@
-from typing import cast
+from typing import Any, Literal, cast
 import lightning as L
 import torch
 import logging
 from lightning.pytorch.utilities.types import OptimizerLRScheduler
 from torchmetrics.classification import BinaryF1Score, BinaryJaccardIndex
-from torchmetrics.functional.classification import binary_f1_score
 
 from SkiNet.ML.configs.experiment_config import ExperimentConfig
 from SkiNet.ML.configs.train_configs.train_config import CosineAnnealingConfig, ReduceOnPlateauConfig
 from SkiNet.ML.model.model_factory import create_model
 from SkiNet.ML.training.build_loss import build_loss
-from SkiNet.ML.training.training_utils import find_best_threshold, mean_dice_per_image
+from SkiNet.ML.training.training_utils import ThresholdSweepCounts, dice_from_counts
+from SkiNet.ML.transformations.batch_augmentation import BatchAugmentation
 
 logger = logging.getLogger(__name__)
 
 
 class LightningModel(L.LightningModule):
+    N_SWEEP_THRESHOLDS = 51
+    """Thresholds swept from 1.0 down to 0.0 at each validation epoch end, as in find_best_threshold."""
+
     def __init__(self,
                  model: torch.nn.Module,
                  loss_fn: torch.nn.Module,
@@ -26,7 +29,11 @@ class LightningModel(L.LightningModule):
                  cosine_annealing_config: CosineAnnealingConfig,
                  scheduler_type: str = "reduce_on_plateau",
                  use_lr_scheduler: bool = True,
-                 optimal_threshold: float | None = None):
+                 optimal_threshold: float | None = None,
+                 batch_augmentation: BatchAugmentation | None = None,
+                 channels_last: bool = False,
+                 metric_sync: Literal["step", "interval", "epoch"] = "step",
+                 metric_sync_interval: int = 50):
         """
         :param model: backbone segmentation network (returns raw logits)
         :param loss_fn: loss function applied to logits and binary float masks
@@ -40,10 +47,19 @@ class LightningModel(L.LightningModule):
             the threshold sweep or any other regular value, e.g. 0.5.
             The threshold is used to obtain masks' predictions out of probabilities
             and in computation of Dice metrics.
+        :param batch_augmentation: if given, batches are cropped, augmented and normalised on the device
+            after transfer (augmentation_backend="batched"); batches must then carry "image_size".
+        :param channels_last: if True, the model and every transferred batch of images are converted to
+            torch.channels_last memory format.
+        :param metric_sync: when the per-step training loss is all-reduced across DDP ranks:
+            "step" on every step, "interval" every metric_sync_interval steps (logging the window mean),
+            "epoch" never (each rank logs its local value). Epoch metrics are synced once at epoch end.
+        :param metric_sync_interval: steps per all-reduce for metric_sync="interval"
         """
         super().__init__()
-        self.save_hyperparameters(ignore=["model", "loss_fn"])
-        self.model = model
+        self.save_hyperparameters(ignore=["model", "loss_fn", "batch_augmentation"])
+        self.channels_last = channels_last
+        self.model = model.to(memory_format=torch.channels_last) if channels_last else model
         self.loss_fn = loss_fn
         self.lr = lr
         self.optimizer_name = optimizer_name.lower()
@@ -52,6 +68,14 @@ class LightningModel(L.LightningModule):
         self.cosine_annealing_config = cosine_annealing_config
         self.scheduler_type = scheduler_type
         self.use_lr_scheduler = use_lr_scheduler
+        self.batch_augmentation = batch_augmentation
+        self.metric_sync = metric_sync
+        self.metric_sync_interval = metric_sync_interval
+        # local (sum of loss × batch size, number of samples) of the epoch and, for metric_sync="interval",
+        # of the current sync window with its number of steps
+        self._train_loss_epoch_sum: torch.Tensor | None = None
+        self._train_loss_window: torch.Tensor | None = None
+        self._train_loss_window_steps = 0
 
         # Optimal threshold - Register as a buffer so that checkpoints contain the threshold value at the best epoch
         # Float attributes are invisible to the checkpoint system
@@ -69,14 +93,32 @@ class LightningModel(L.LightningModule):
         self.test_dice = BinaryF1Score()
         self.test_iou = BinaryJaccardIndex()
 
-        # Initialise lists to keep validation and ground truth probs for finding the optimal threshold
-        self._val_probs: list[torch.Tensor] = []
-        self._val_masks: list[torch.Tensor] = []
+        # Per-threshold TP/FP/FN counts and per-image Dice sums accumulated on the device over the validation
+        # epoch for finding the optimal threshold: the sweep thresholds (high → low), then 0.5 and the fixed
+        # threshold if set. Under DDP, compute() all-reduces them, so every rank sees the whole validation set.
+        thresholds = torch.linspace(1.0, 0.0, self.N_SWEEP_THRESHOLDS)
+        extra = [0.5] if optimal_threshold is None else [0.5, optimal_threshold]
+        self.val_threshold_counts = ThresholdSweepCounts(torch.cat([thresholds, torch.tensor(extra)]))
 
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         """Run the backbone and return raw logits (pre-sigmoid)."""
         return self.model(x)  # type: ignore[no-any-return]
 
+    def on_after_batch_transfer(self, batch: Any, dataloader_idx: int) -> Any:
+        """
+        Apply the batched augmentation on the device, once the collated uint8 batch has been transferred.
+        Spatial and photometric augmentations are only applied in training mode.
+        With channels_last, the images are then converted to channels-last memory format.
+        """
+        if not isinstance(batch, dict):
+            return batch
+        if self.batch_augmentation is not None and "image_size" in batch:
+            image, mask = self.batch_augmentation(batch["image"], batch["mask"], batch["image_size"], train=self.training)
+            batch = {**batch, "image": image, "mask": mask}
+        if self.channels_last and isinstance(batch.get("image"), torch.Tensor) and batch["image"].dim() == 4:
+            batch = {**batch, "image": batch["image"].contiguous(memory_format=torch.channels_last)}
+        return batch
+
     @staticmethod
     def _get_probs_and_preds(logits: torch.Tensor,
                              threshold: torch.Tensor) -> dict[str, torch.Tensor]:
@@ -89,7 +131,8 @@ class LightningModel(L.LightningModule):
             - "probs": sigmoid outputs in [0, 1]
             - "preds": thresholded predictions as torch.long
         """
-        probs = torch.sigmoid(logits)
+        # float32 so that bf16-mixed logits do not quantise the probabilities of the threshold search
+        probs = torch.sigmoid(logits.float())
         preds = (probs >= threshold).long()
         return {"probs": probs, "preds": preds}
 
@@ -112,55 +155,58 @@ class LightningModel(L.LightningModule):
     def _compute_and_log_threshold_search_metrics_for_sigmoid(self) -> None:
         """
         Compute and log Dice metrics by sweeping over different sigmoid thresholds,
-        using probabilities from all batches saved during validation.
+        using the TP/FP/FN counts accumulated over all validation batches.
+
+        The counts are all-reduced across DDP ranks before the search, so every rank logs the same values
+        for the whole validation set; they are logged without sync_dist, as averaging them again is
+        redundant.
 
         Log the best threshold and the best Dice metrics.
 
         If self._fixed_optimal_threshold is not None, then use this value as the optimal threshold
         and to compute Dice metrics (for experiments with a fixed threshold value)
         """
-        if not self._val_probs:
+        if self.val_threshold_counts.update_count == 0:
             return
 
-        # all_probs / all_targets: [N_images, H*W] — one row per image, preserving image boundaries
-        all_probs = torch.cat(self._val_probs)
-        # threshold in case augmentations produced interpolated mask values
-        all_targets = (torch.cat(self._val_masks) >= 0.5).long()
-
-        self._val_probs.clear()
-        self._val_masks.clear()
+        counts = self.val_threshold_counts.compute()
+        self.val_threshold_counts.reset()
 
         # single-class edge case — log sentinels so all monitored keys always exist
         # this prevents KeyError in Optuna when val split contains only one class
-        if torch.unique(all_targets).numel() < 2:
+        positives = counts["positives"].item()
+        if positives == 0 or positives == counts["pixels"].item():
             logger.warning("Validation targets contain only one class — skipping threshold sweep. "
                            "Logging val_best_dice_at_threshold=0.0 and val_mean_dice_per_image=0.0 as sentinels.")
-            self.log("val_best_dice_at_threshold", 0.0, on_step=False, on_epoch=True, prog_bar=False, logger=True, sync_dist=True)
-            self.log("val_mean_dice_per_image", 0.0, on_step=False, on_epoch=True, prog_bar=False, logger=True, sync_dist=True)
+            self.log("val_best_dice_at_threshold", 0.0, on_step=False, on_epoch=True, prog_bar=False, logger=True, sync_dist=False)
+            self.log("val_mean_dice_per_image", 0.0, on_step=False, on_epoch=True, prog_bar=False, logger=True, sync_dist=False)
             return
 
-        all_probs_flat = all_probs.reshape(-1)
-        all_targets_flat = all_targets.reshape(-1)
-
-        fixed_thr_preds = (all_probs_flat >= 0.5).long()
-        fixed_thr_dice = binary_f1_score(fixed_thr_preds, all_targets_flat).item()
+        # columns: N_SWEEP_THRESHOLDS sweep thresholds, then 0.5, then the fixed threshold if set
+        n_sweep = self.N_SWEEP_THRESHOLDS
+        tp, fp, fn = counts["tp"], counts["fp"], counts["fn"]
+        # binary F1 without eps, as torchmetrics; the denominator is positive as both classes are present
+        fixed_thr_dice = dice_from_counts(tp[n_sweep], fp[n_sweep], fn[n_sweep], eps=0.0).item()
 
         if self._fixed_optimal_threshold is not None:
-            best_thr = self._fixed_optimal_threshold
-            best_preds_flat = (all_probs_flat >= best_thr).long()
-            best_dice = binary_f1_score(best_preds_flat, all_targets_flat).item()
+            best_idx = n_sweep + 1
+            best_dice = dice_from_counts(tp[best_idx], fp[best_idx], fn[best_idx], eps=0.0).item()
         else:
-            best_result = find_best_threshold(all_probs_flat, all_targets_flat)
-            best_thr, best_dice = best_result["best_threshold"], best_result["best_dice"]
+            sweep_dice = dice_from_counts(tp[:n_sweep], fp[:n_sweep], fn[:n_sweep])
+            # thresholds are ordered high→low, so argmax returns the highest of tied thresholds
+            best_idx = int(sweep_dice.argmax().item())
+            best_dice = sweep_dice[best_idx].item()
+        best_thr = self.val_threshold_counts.thresholds[best_idx].item()
+        mean_dice = counts["mean_image_dice"][best_idx].item()
 
         self.optimal_threshold.fill_(best_thr)
         self.log("val_optimal_threshold", self.optimal_threshold,
-                 on_step=False, on_epoch=True, prog_bar=True, logger=True, sync_dist=True)
-        self.log("val_best_dice_at_threshold", best_dice, on_step=False, on_epoch=True, prog_bar=True, logger=True, sync_dist=True)
+                 on_step=False, on_epoch=True, prog_bar=True, logger=True, sync_dist=False)
+        self.log("val_best_dice_at_threshold", best_dice, on_step=False, on_epoch=True, prog_bar=True, logger=True, sync_dist=False)
         self.log("val_dice_threshold_gain", best_dice - fixed_thr_dice,
-                 on_step=False, on_epoch=True, prog_bar=False, logger=True, sync_dist=True)
-        self.log("val_mean_dice_per_image", mean_dice_per_image(all_probs, all_targets, best_thr).item(),
-                 on_step=False, on_epoch=True, prog_bar=True, logger=True, sync_dist=True)
+                 on_step=False, on_epoch=True, prog_bar=False, logger=True, sync_dist=False)
+        self.log("val_mean_dice_per_image", mean_dice,
+                 on_step=False, on_epoch=True, prog_bar=True, logger=True, sync_dist=False)
 
     @staticmethod
     def _prepare_mask(mask: torch.Tensor) -> torch.Tensor:
@@ -210,7 +256,7 @@ class LightningModel(L.LightningModule):
     def _shared_eval_step(self, prefix: str, batch: dict[str, torch.Tensor], batch_idx: int) -> torch.Tensor:
         """
         This is a shared function for validation and testing.
-        Logs metrics and additionally saves validation probabilities
+        Logs metrics and additionally accumulates validation TP/FP/FN counts per threshold
         for threshold search at the end of the validation epoch.
         """
         x = batch.get("image")
@@ -231,12 +277,10 @@ class LightningModel(L.LightningModule):
 
         probs = self._compute_and_log_segmentation_metrics_from_logits_and_mask(prefix, logits, mask)
 
-        # collect probabilities (raw sigmoid outputs) and raw masks to find an optimal sigmoid threshold at the val epoch end
-        # note we collect all batches - so full validation set will be used at the end of epoch
+        # count TP/FP/FN per threshold and image to find an optimal sigmoid threshold at the val epoch end
+        # note we count all batches - so full validation set will be used at the end of epoch
         if prefix == "val":
-            self._val_probs.append(probs.detach().cpu().reshape(probs.shape[0], -1))
-            self._val_masks.append(mask.detach().cpu().reshape(mask.shape[0], -1))
-            self.log("val_threshold_used", self.optimal_threshold, on_step=False, on_epoch=True, logger=True, sync_dist=True)
+            self.val_threshold_counts.update(probs, mask)
         return loss
 
     def training_step(self, batch: dict[str, torch.Tensor], batch_idx: int) -> torch.Tensor:
@@ -265,12 +309,64 @@ class LightningModel(L.LightningModule):
             self._raise_if_non_finite("train/mask", mask, batch_idx)
             self._raise_if_non_finite("train/logits", logits, batch_idx)
             self._raise_if_non_finite("train/loss", t_loss, batch_idx)
-        self.log("train_loss", t_loss, on_step=True, on_epoch=True, prog_bar=True, logger=True, batch_size=x.shape[0], sync_dist=True)
+        self._log_train_loss(t_loss, x.shape[0])
 
         _ = self._compute_and_log_segmentation_metrics_from_logits_and_mask("train", logits, mask)
 
         return t_loss
 
+    def _log_train_loss(self, loss: torch.Tensor, batch_size: int) -> None:
+        """
+        Log the training loss per step and per epoch, all-reducing the step value according to metric_sync.
+
+        With metric_sync="step" this is a single synced log of "train_loss" (keys train_loss_step and
+        train_loss_epoch). Otherwise the loss is summed into local tensors, without a self.log call per step
+        for "interval": "train_loss_step" is either the rank's own value ("epoch") or the mean over the last
+        metric_sync_interval steps of all ranks, from one all-reduce per window ("interval"), and
+        "train_loss_epoch" is reduced once in on_train_epoch_end.
+
+        :param loss: scalar training loss of the step
+        :param batch_size: samples in the step, weighting the epoch and window means
+        """
+        if self.metric_sync == "step":
+            self.log("train_loss", loss, on_step=True, on_epoch=True, prog_bar=True, logger=True, batch_size=batch_size,
+                     sync_dist=True)
+            return
+
+        # (sum of loss × batch size, number of samples)
+        step_sum = torch.stack([loss.detach().float() * batch_size, loss.new_tensor(batch_size, dtype=torch.float32)])
+        self._train_loss_epoch_sum = step_sum if self._train_loss_epoch_sum is None else self._train_loss_epoch_sum + step_sum
+        if self.metric_sync == "epoch":
+            self.log("train_loss_step", loss, on_step=True, on_epoch=False, prog_bar=True, logger=True, sync_dist=False)
+            return
+
+        self._train_loss_window = step_sum if self._train_loss_window is None else self._train_loss_window + step_sum
+        self._train_loss_window_steps += 1
+        if self._train_loss_window_steps < self.metric_sync_interval:
+            return
+        total = self.trainer.strategy.reduce(self._train_loss_window, reduce_op="sum")
+        self._train_loss_window = None
+        self._train_loss_window_steps = 0
+        self.log("train_loss_step", total[0] / total[1], on_step=True, on_epoch=False, prog_bar=True, logger=True,
+                 sync_dist=False)
+
+    def on_train_epoch_start(self) -> None:
+        """Start every epoch with empty train-loss sums; a partial sync window of the last epoch is dropped."""
+        self._train_loss_epoch_sum = None
+        self._train_loss_window = None
+        self._train_loss_window_steps = 0
+
+    def on_train_epoch_end(self) -> None:
+        """
+        With metric_sync "interval" or "epoch", all-reduce the epoch's train-loss sums once and log the mean.
+        """
+        if self.metric_sync == "step" or self._train_loss_epoch_sum is None:
+            return
+        total = self.trainer.strategy.reduce(self._train_loss_epoch_sum, reduce_op="sum")
+        self._train_loss_epoch_sum = None
+        self.log("train_loss_epoch", total[0] / total[1], on_step=False, on_epoch=True, prog_bar=True, logger=True,
+                 sync_dist=False)
+
     def _compute_and_log_segmentation_metrics_from_logits_and_mask(
             self, prefix: str, logits: torch.Tensor, mask: torch.Tensor) -> torch.Tensor:
         """
@@ -279,7 +375,7 @@ class LightningModel(L.LightningModule):
         :param prefix: "train", "val", or "test" — prepended to every logged metric name
         :param logits: raw model outputs (pre-sigmoid)
         :param mask: binary float mask from _prepare_mask; cast to long here for metrics
-        :return: sigmoid probabilities (used upstream to accumulate val probs for threshold search)
+        :return: sigmoid probabilities (used upstream to accumulate val counts for threshold search)
         """
         target = mask.long()
         probs_and_preds = self._get_probs_and_preds(logits, self.optimal_threshold)
@@ -356,7 +452,7 @@ class LightningModel(L.LightningModule):
 
     def validation_step(self, batch: dict[str, torch.Tensor], batch_idx: int) -> torch.Tensor:
         """
-        Run one validation iteration and accumulate probabilities and masks for
+        Run one validation iteration and accumulate per-threshold TP/FP/FN counts for
         end-of-epoch threshold search.
 
         :param batch: dict with "image" and "mask" tensors
@@ -390,6 +486,8 @@ def build_lightning_model(main_config: ExperimentConfig) -> LightningModel:
         model = cast(torch.nn.Module, torch.compile(model, backend=train_cfg.torch_compile_backend))
         logger.info("torch.compile enabled — first forward pass will be slow (compilation)")
     loss_fn = build_loss(train_cfg.loss_name)
+    batch_augmentation = (BatchAugmentation(main_config.transformconfig)
+                          if main_config.transformconfig.augmentation_backend == "batched" else None)
     return LightningModel(model=model,
                           loss_fn=loss_fn,
                           lr=train_cfg.lr,
@@ -399,4 +497,8 @@ def build_lightning_model(main_config: ExperimentConfig) -> LightningModel:
                           cosine_annealing_config=train_cfg.cosine_annealing_config,
                           scheduler_type=train_cfg.scheduler_type,
                           use_lr_scheduler=train_cfg.use_lr_scheduler,
-                          optimal_threshold=train_cfg.optimal_threshold)
+                          optimal_threshold=train_cfg.optimal_threshold,
+                          batch_augmentation=batch_augmentation,
+                          channels_last=train_cfg.channels_last,
+                          metric_sync=train_cfg.metric_sync,
+                          metric_sync_interval=train_cfg.metric_sync_interval)
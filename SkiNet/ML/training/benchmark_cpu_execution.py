@@ -0,0 +1,161 @@
+"""
+CPU benchmark of the execution modes of TRAIN_CONFIG ``channels_last`` and ``cpu_bf16`` for every encoder and
+merge residual mode of UNet2D.
+
+For each (encoder, merge) pair, a randomly initialised UNet2D runs a training step (forward, BCE-Dice loss,
+backward and AdamW step) and an evaluation forward pass on a random batch in four execution modes:
+
+- ``fp32``: NCHW float32, the default;
+- ``channels_last``: model and batch in channels-last (NHWC) memory format;
+- ``bf16``: NCHW under bfloat16 CPU autocast, as Lightning's ``bf16-mixed`` precision;
+- ``channels_last_bf16``: both.
+
+Reports the best time per image over the repeats, the speed-up over ``fp32``, and how far the evaluation output
+drifts from ``fp32``: the mean absolute difference of the probabilities and the share of pixels predicted alike at
+a threshold of 0.5. bfloat16 is only faster on CPUs that execute it natively
+(:func:`~SkiNet.ML.configs.train_configs.train_config.cpu_supports_bf16`); elsewhere it is emulated.
+
+Run with:
+    python -m SkiNet.ML.training.benchmark_cpu_execution [--encoder-modes he2 se] [--merge-modes he2]
+        [--image-size 256] [--batch-size 4] [--channels 16] [--threads 4] [--repeats 3]
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import time
+from typing import Callable
+
+import pandas as pd
+import torch
+import torch.nn as nn
+
+from SkiNet.ML.configs.train_configs.train_config import cpu_supports_bf16
+from SkiNet.ML.model.architecture.unet2d import UNet2D
+from SkiNet.ML.model.blocks.encoder2d import _ENCODER_REGISTRY
+from SkiNet.ML.model.blocks.merge2d_block import _MERGE_REGISTRY
+from SkiNet.ML.training.build_loss import build_loss
+from SkiNet.Utils.experiment_keys import LossFunctionKey
+
+EXECUTION_MODES: dict[str, tuple[bool, bool]] = {
+    "fp32": (False, False),
+    "channels_last": (True, False),
+    "bf16": (False, True),
+    "channels_last_bf16": (True, True),
+}
+"""Execution mode → (channels_last, bf16 autocast)."""
+
+
+def _best_time(step: Callable[[], object], repeats: int) -> float:
+    step()  # warm-up: allocator and oneDNN kernel selection
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        step()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def benchmark_mode(model: nn.Module, images: torch.Tensor, masks: torch.Tensor, channels_last: bool, bf16: bool,
+                   repeats: int) -> tuple[float, float, torch.Tensor]:
+    """
+    Time one training step and one evaluation forward pass of a model in an execution mode.
+
+    :param model: Model in float32. It is trained in place after the evaluation, so pass a fresh copy per mode.
+    :param images: Float32 batch [B, C, H, W].
+    :param masks: Binary float32 masks [B, 1, H, W].
+    :param channels_last: Whether the model and batch use channels-last memory format.
+    :param bf16: Whether to run under bfloat16 CPU autocast.
+    :param repeats: Timed runs after one warm-up run; the best is reported.
+    :return: Best training step time (s), best evaluation time (s) and the float32 evaluation probabilities.
+    """
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+        images = images.contiguous(memory_format=torch.channels_last)
+    loss_fn = build_loss(LossFunctionKey.BCE_DICE)
+    optimizer = torch.optim.AdamW(model.parameters(), lr=1e-4)
+
+    def train_step() -> None:
+        optimizer.zero_grad(set_to_none=True)
+        with torch.autocast("cpu", dtype=torch.bfloat16, enabled=bf16):
+            loss = loss_fn(model(images), masks)
+        loss.backward()
+        optimizer.step()
+
+    def eval_step() -> torch.Tensor:
+        with torch.inference_mode(), torch.autocast("cpu", dtype=torch.bfloat16, enabled=bf16):
+            return torch.sigmoid(model(images).float())
+
+    # evaluation first, so that the probabilities of all modes come from the same weights
+    model.eval()
+    eval_s = _best_time(eval_step, repeats)
+    probs = eval_step()
+    model.train()
+    train_s = _best_time(train_step, repeats)
+    return train_s, eval_s, probs
+
+
+def benchmark(encoder_modes: list[str], merge_modes: list[str], image_size: int, batch_size: int, channels: int,
+              repeats: int) -> pd.DataFrame:
+    """
+    Benchmark every execution mode for every (encoder, merge) residual mode pair.
+
+    :param encoder_modes: Encoder residual modes of UNet2D.
+    :param merge_modes: Merge residual modes of UNet2D.
+    :param image_size: Side of the square input images.
+    :param batch_size: Images per batch.
+    :param channels: Output channels of the first encoder layer.
+    :param repeats: Timed runs per step; the best is reported.
+    :return: DataFrame with columns encoder, merge, execution, train_ms_per_image, eval_ms_per_image,
+        train_speedup, eval_speedup, mean_prob_diff and mask_agreement, the last four relative to ``fp32``.
+    """
+    generator = torch.Generator().manual_seed(0)
+    images = torch.randn(batch_size, 3, image_size, image_size, generator=generator)
+    masks = (torch.rand(batch_size, 1, image_size, image_size, generator=generator) > 0.5).float()
+    results = []
+    for encoder_mode, merge_mode in itertools.product(encoder_modes, merge_modes):
+        torch.manual_seed(0)
+        initial = UNet2D(in_channels=3, out_channels_layer1=channels, validate_forward=False,
+                         encoder_residual_mode=encoder_mode,  # type: ignore[arg-type]
+                         merge_residual_mode=merge_mode)  # type: ignore[arg-type]
+        baseline: tuple[float, float, torch.Tensor] | None = None
+        for execution, (channels_last, bf16) in EXECUTION_MODES.items():
+            model = UNet2D(in_channels=3, out_channels_layer1=channels, validate_forward=False,
+                           encoder_residual_mode=encoder_mode,  # type: ignore[arg-type]
+                           merge_residual_mode=merge_mode)  # type: ignore[arg-type]
+            model.load_state_dict(initial.state_dict())
+            train_s, eval_s, probs = benchmark_mode(model, images, masks, channels_last, bf16, repeats)
+            baseline = baseline or (train_s, eval_s, probs)
+            results.append({"encoder": encoder_mode, "merge": merge_mode, "execution": execution,
+                            "train_ms_per_image": 1e3 * train_s / batch_size,
+                            "eval_ms_per_image": 1e3 * eval_s / batch_size,
+                            "train_speedup": baseline[0] / train_s,
+                            "eval_speedup": baseline[1] / eval_s,
+                            "mean_prob_diff": float((probs - baseline[2]).abs().mean()),
+                            "mask_agreement": float(((probs >= 0.5) == (baseline[2] >= 0.5)).float().mean())})
+    return pd.DataFrame(results)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark channels-last and bfloat16 CPU execution per residual mode.")
+    ap.add_argument("--encoder-modes", nargs="+", default=list(_ENCODER_REGISTRY), choices=list(_ENCODER_REGISTRY),
+                    help="Encoder residual modes (default: all)")
+    ap.add_argument("--merge-modes", nargs="+", default=list(_MERGE_REGISTRY), choices=list(_MERGE_REGISTRY),
+                    help="Merge residual modes (default: all)")
+    ap.add_argument("--image-size", type=int, default=256, help="Square input side (default: 256)")
+    ap.add_argument("--batch-size", type=int, default=4, help="Images per batch (default: 4)")
+    ap.add_argument("--channels", type=int, default=16, help="Channels of the first encoder layer (default: 16)")
+    ap.add_argument("--threads", type=int, default=None, help="torch intra-op threads (default: torch default)")
+    ap.add_argument("--repeats", type=int, default=3, help="Timed runs, best is reported (default: 3)")
+    args = ap.parse_args()
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    print(f"Native CPU bfloat16: {cpu_supports_bf16()}, threads: {torch.get_num_threads()}")
+    df = benchmark(args.encoder_modes, args.merge_modes, args.image_size, args.batch_size, args.channels,
+                   args.repeats)
+    print(df.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+
+
+if __name__ == "__main__":
+    main()
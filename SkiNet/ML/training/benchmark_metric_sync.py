@@ -0,0 +1,156 @@
+"""
+CPU benchmark of the TRAIN_CONFIG ``metric_sync`` policies under DDP on the gloo backend.
+
+For each number of processes and each policy (``step``, ``interval``, ``epoch``), a LightningModel with a
+small convolutional backbone is trained with ``strategy="ddp_spawn"`` on random batches, without validation,
+checkpointing or loggers, so that a training step is the forward and backward pass, the DDP gradient
+all-reduce and the metric logging. The per-step time is measured on rank 0 between the start and end of
+every training batch, after a few warm-up steps.
+
+The backbone is deliberately tiny: the saving per step is the latency of one all-reduce (and, for
+``interval``, of one ``self.log`` call), which is only visible next to short steps. When processes outnumber cores, every collective also waits for the
+scheduler, which inflates the latency of each all-reduce.
+
+Run with:
+    python -m SkiNet.ML.training.benchmark_metric_sync [--processes 2 4] [--steps 200] [--interval 50]
+        [--image-size 32] [--batch-size 4] [--repeats 3]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Literal
+
+import lightning as L
+import pandas as pd
+import torch
+import torch.nn as nn
+from torch.utils.data import DataLoader, Dataset
+
+from SkiNet.ML.configs.train_configs.train_config import CosineAnnealingConfig, ReduceOnPlateauConfig
+from SkiNet.ML.model.lightning_model import LightningModel
+
+POLICIES: tuple[Literal["step", "interval", "epoch"], ...] = ("step", "interval", "epoch")
+WARMUP_STEPS = 10
+"""Steps excluded from the timings: process-group setup, allocator and kernel warm-up."""
+
+
+class _RandomSegmentationDataset(Dataset):
+    def __init__(self, n: int, image_size: int) -> None:
+        generator = torch.Generator().manual_seed(0)
+        self.images = torch.randn(n, 3, image_size, image_size, generator=generator)
+        self.masks = (torch.rand(n, 1, image_size, image_size, generator=generator) > 0.5).float()
+
+    def __len__(self) -> int:
+        return len(self.images)
+
+    def __getitem__(self, idx: int) -> dict[str, torch.Tensor]:
+        return {"image": self.images[idx], "mask": self.masks[idx]}
+
+
+class _StepTimer(L.Callback):
+    """Record the wall time of every training batch on rank 0 and write the timings to a JSON file."""
+
+    def __init__(self, output: Path) -> None:
+        self.output = output
+        self.timings: list[float] = []
+        self._start = 0.0
+
+    def on_train_batch_start(self, trainer: L.Trainer, pl_module: L.LightningModule, batch: Any, batch_idx: int) -> None:
+        self._start = time.perf_counter()
+
+    def on_train_batch_end(self, trainer: L.Trainer, pl_module: L.LightningModule, outputs: Any, batch: Any,
+                           batch_idx: int) -> None:
+        self.timings.append(time.perf_counter() - self._start)
+
+    def on_train_end(self, trainer: L.Trainer, pl_module: L.LightningModule) -> None:
+        if trainer.is_global_zero:
+            self.output.write_text(json.dumps(self.timings))
+
+
+def _backbone() -> nn.Module:
+    return nn.Sequential(nn.Conv2d(3, 8, 3, padding=1), nn.ReLU(), nn.Conv2d(8, 1, 3, padding=1))
+
+
+def time_policy(processes: int, metric_sync: Literal["step", "interval", "epoch"], steps: int, interval: int,
+                image_size: int, batch_size: int) -> list[float]:
+    """
+    Train for one epoch of ``steps`` steps per process under DDP on CPU and time every step on rank 0.
+
+    :param processes: DDP processes, each with one gloo rank.
+    :param metric_sync: Sync policy of the per-step training loss.
+    :param steps: Training steps per process.
+    :param interval: Steps per all-reduce for ``metric_sync="interval"``.
+    :param image_size: Side of the square random images.
+    :param batch_size: Images per process and step.
+    :return: Seconds per step on rank 0, warm-up steps excluded.
+    """
+    torch.manual_seed(0)
+    model = LightningModel(model=_backbone(), loss_fn=nn.BCEWithLogitsLoss(), lr=1e-3, optimizer_name="adamw",
+                           weight_decay=0.0, lr_scheduler_config=ReduceOnPlateauConfig(),
+                           cosine_annealing_config=CosineAnnealingConfig(), use_lr_scheduler=False,
+                           metric_sync=metric_sync, metric_sync_interval=interval)
+    loader = DataLoader(_RandomSegmentationDataset(processes * steps * batch_size, image_size), batch_size=batch_size)
+    with tempfile.TemporaryDirectory() as tmp:
+        output = Path(tmp) / "timings.json"
+        trainer = L.Trainer(accelerator="cpu", devices=processes, strategy="ddp_spawn", max_epochs=1,
+                            limit_val_batches=0, logger=False, enable_checkpointing=False,
+                            enable_progress_bar=False, enable_model_summary=False, log_every_n_steps=1,
+                            callbacks=[_StepTimer(output)])
+        trainer.fit(model, train_dataloaders=loader)
+        timings: list[float] = json.loads(output.read_text())
+    return timings[WARMUP_STEPS:]
+
+
+def benchmark(process_counts: list[int], steps: int, interval: int, image_size: int, batch_size: int,
+              repeats: int) -> pd.DataFrame:
+    """
+    Time every metric_sync policy for every number of DDP processes.
+
+    The policies run round-robin ``repeats`` times, so that drifts of the machine's load hit all of them
+    alike, and the step timings of the repeats are pooled.
+
+    :param process_counts: Numbers of DDP processes.
+    :param steps: Training steps per process and run.
+    :param interval: Steps per all-reduce for ``metric_sync="interval"``.
+    :param image_size: Side of the square random images.
+    :param batch_size: Images per process and step.
+    :param repeats: Runs per policy.
+    :return: DataFrame with columns processes, metric_sync, median_step_ms, mean_step_ms and saving_pct, the
+        reduction of the median step time relative to ``metric_sync="step"``.
+    """
+    results = []
+    for processes in process_counts:
+        timings: dict[str, list[float]] = {policy: [] for policy in POLICIES}
+        for _ in range(repeats):
+            for policy in POLICIES:
+                timings[policy] += time_policy(processes, policy, steps, interval, image_size, batch_size)
+        baseline = torch.tensor(timings["step"]).median().item()
+        for policy in POLICIES:
+            policy_timings = torch.tensor(timings[policy])
+            median = policy_timings.median().item()
+            results.append({"processes": processes, "metric_sync": policy, "median_step_ms": 1e3 * median,
+                            "mean_step_ms": 1e3 * policy_timings.mean().item(),
+                            "saving_pct": 100 * (baseline - median) / baseline})
+    return pd.DataFrame(results)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark the metric_sync policies under DDP on CPU (gloo).")
+    ap.add_argument("--processes", type=int, nargs="+", default=[2, 4], help="DDP process counts (default: 2 4)")
+    ap.add_argument("--steps", type=int, default=200, help="Training steps per process (default: 200)")
+    ap.add_argument("--interval", type=int, default=50, help="metric_sync_interval for 'interval' (default: 50)")
+    ap.add_argument("--image-size", type=int, default=32, help="Square image side (default: 32)")
+    ap.add_argument("--batch-size", type=int, default=4, help="Images per process and step (default: 4)")
+    ap.add_argument("--repeats", type=int, default=3, help="Round-robin runs per policy (default: 3)")
+    args = ap.parse_args()
+
+    df = benchmark(args.processes, args.steps, args.interval, args.image_size, args.batch_size, args.repeats)
+    print(df.to_string(index=False, float_format=lambda x: f"{x:.3f}"))
+
+
+if __name__ == "__main__":
+    main()
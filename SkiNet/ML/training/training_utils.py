@@ -1,4 +1,7 @@
+from typing import Any
+
 import torch
+from torchmetrics import Metric
 
 
 def mean_dice_per_image(probs: torch.Tensor, targets: torch.Tensor, threshold: float) -> torch.Tensor:
@@ -21,14 +24,88 @@ def mean_dice_per_image(probs: torch.Tensor, targets: torch.Tensor, threshold: f
     return dice.mean()
 
 
+def dice_from_counts(tp: torch.Tensor, fp: torch.Tensor, fn: torch.Tensor, eps: float = 1e-8) -> torch.Tensor:
+    """
+    Compute Dice (= binary F1) element-wise from confusion counts.
+
+    :param tp: true positive counts, any shape
+    :param fp: false positive counts, same shape as tp
+    :param fn: false negative counts, same shape as tp
+    :param eps: added to the denominator; 1e-8 as in find_best_threshold and mean_dice_per_image
+    :return: float tensor of Dice scores, same shape as tp
+    """
+    tp, fp, fn = tp.float(), fp.float(), fn.float()
+    return 2 * tp / (2 * tp + fp + fn + eps)
+
+
+def threshold_confusion_counts(probs: torch.Tensor,
+                               targets: torch.Tensor,
+                               thresholds: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Count TP/FP/FN per image for every threshold, predicting positive where ``probs >= threshold``.
+
+    Takes O(pixels · log(thresholds)) time and O(pixels + images · thresholds) memory, without a
+    [thresholds, pixels] broadcast: every probability is bucketed with ``searchsorted`` into the sorted thresholds, histograms of
+    the buckets of positive and negative pixels are taken with one ``bincount``, and their reverse cumulative
+    sums are the predicted-positive counts. Counts are exact, ties included.
+
+    :param probs: float tensor of shape [N, pixels] — sigmoid probabilities per image
+    :param targets: bool tensor of shape [N, pixels] — ground-truth binary masks
+    :param thresholds: 1D float tensor of shape [T], in any order and possibly repeated
+    :return: (tp, fp, fn), each a torch.long tensor of shape [N, T] with columns in the order of ``thresholds``
+    """
+    n_images, n_thresholds = probs.shape[0], thresholds.numel()
+    order = torch.argsort(thresholds)
+    # bucket b = number of thresholds <= prob: the pixel is predicted positive at the b lowest thresholds
+    buckets = torch.searchsorted(thresholds[order].contiguous(), probs.contiguous(), right=True)
+    image_index = torch.arange(n_images, device=probs.device).unsqueeze(1)
+    flat_index = ((image_index * 2 + targets.long()) * (n_thresholds + 1) + buckets).reshape(-1)
+    histogram = torch.bincount(flat_index, minlength=n_images * 2 * (n_thresholds + 1))
+    histogram = histogram.reshape(n_images, 2, n_thresholds + 1)
+
+    # predicted positive at the j-th lowest threshold = pixels in buckets j + 1 and above
+    above = histogram.flip(-1).cumsum(-1).flip(-1)[..., 1:][..., torch.argsort(order)]  # [N, 2, T]
+    fp, tp = above[:, 0], above[:, 1]
+    fn = histogram[:, 1].sum(-1, keepdim=True) - tp
+    return tp, fp, fn
+
+
 def find_best_threshold(probs: torch.Tensor,
                         targets: torch.Tensor,
                         n_thresholds: int = 51) -> dict[str, float]:
     """
     Find the optimal threshold that maximizes the Dice (F1) score for binary predictions.
 
-    This function evaluates multiple thresholds in a fully vectorized manner on the GPU,
-    avoiding Python loops and repeated device synchronization.
+    TP/FP/FN of all thresholds come from one histogram of the probabilities
+    (:func:`threshold_confusion_counts`), so memory stays O(N + n_thresholds) and thousands of thresholds
+    cost little more than 51. Results are identical to :func:`find_best_threshold_broadcast`.
+
+    :param probs: 1D tensor of predicted probabilities with shape [N]. Must be on the same device
+        where computation should occur (CPU or GPU).
+    :param targets: 1D tensor of ground-truth binary labels with shape [N]. Values will be converted to boolean internally.
+    :param n_thresholds: Number of evenly spaced thresholds in the range [0.0, 1.0]. Defaults to 51.
+    :return: A dict with keys ``"best_threshold"`` (float) and ``"best_dice"`` (float).
+    """
+    thresholds = torch.linspace(1.0, 0.0, n_thresholds, device=probs.device)
+    tp, fp, fn = threshold_confusion_counts(probs.reshape(1, -1), targets.bool().reshape(1, -1), thresholds)
+    dice = dice_from_counts(tp[0], fp[0], fn[0])
+
+    # Thresholds are ordered high→low, so argmax returns the first (highest) threshold
+    # in case multiple thresholds achieve the same maximum Dice coefficient.
+    best_idx = dice.argmax()
+
+    # Only two item calls, minimizing GPU-CPU synchronization overhead
+    return {"best_threshold": thresholds[best_idx].item(), "best_dice": dice[best_idx].item()}
+
+
+def find_best_threshold_broadcast(probs: torch.Tensor,
+                                  targets: torch.Tensor,
+                                  n_thresholds: int = 51) -> dict[str, float]:
+    """
+    Reference implementation of :func:`find_best_threshold` by a [n_thresholds, N] broadcast.
+
+    Materialises one boolean prediction per threshold and pixel, so memory grows as n_thresholds × N.
+    Kept to test the bucketed implementation against; use :func:`find_best_threshold` instead.
 
     :param probs: 1D tensor of predicted probabilities with shape [N]. Must be on the same device
         where computation should occur (CPU or GPU).
@@ -59,3 +136,84 @@ def find_best_threshold(probs: torch.Tensor,
 
     # Only two item calls, minimizing GPU-CPU synchronization overhead
     return {"best_threshold": thresholds[best_idx].item(), "best_dice": dice[best_idx].item()}
+
+
+class ThresholdSweepCounts(Metric):
+    """
+    Streaming per-threshold sufficient statistics of a sweep of sigmoid thresholds.
+
+    Each update adds, for every threshold, the TP/FP/FN pixel counts of a batch and the sum of its per-image
+    Dice scores, so that the threshold search at epoch end needs O(thresholds) memory instead of every
+    probability map. A pixel is predicted positive at a threshold when ``prob >= threshold``, as in
+    :func:`find_best_threshold` and :func:`mean_dice_per_image`, so the Dice scores derived from the
+    statistics equal theirs.
+
+    Every statistic is a sum, so under DDP :meth:`compute` all-reduces a few [thresholds] vectors across
+    ranks (unless ``sync_on_compute=False``) and every rank then chooses the same threshold from the
+    statistics of the whole validation set.
+
+    Counts of a batch come from :func:`threshold_confusion_counts`, without a [thresholds, pixels] broadcast.
+
+    :param thresholds: 1D sequence of thresholds, in the order the statistics are reported in; may repeat.
+    :param kwargs: forwarded to ``torchmetrics.Metric``, e.g. ``sync_on_compute``
+    :raises ValueError: if no thresholds are given
+    """
+
+    full_state_update = False
+
+    thresholds: torch.Tensor
+    tp: torch.Tensor
+    fp: torch.Tensor
+    fn: torch.Tensor
+    image_dice_sum: torch.Tensor
+    images: torch.Tensor
+    pixels: torch.Tensor
+
+    def __init__(self, thresholds: torch.Tensor | list[float], **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        thresholds = torch.as_tensor(thresholds, dtype=torch.float32).flatten()
+        if thresholds.numel() == 0:
+            raise ValueError("ThresholdSweepCounts needs at least one threshold")
+        # non-persistent: the thresholds are configuration, not checkpoint state
+        self.register_buffer("thresholds", thresholds, persistent=False)
+
+        n = thresholds.numel()
+        for name in ("tp", "fp", "fn"):
+            self.add_state(name, default=torch.zeros(n, dtype=torch.long), dist_reduce_fx="sum")
+        # float64 so that summing thousands of per-image scores does not drift from their float32 mean
+        self.add_state("image_dice_sum", default=torch.zeros(n, dtype=torch.float64), dist_reduce_fx="sum")
+        self.add_state("images", default=torch.tensor(0, dtype=torch.long), dist_reduce_fx="sum")
+        self.add_state("pixels", default=torch.tensor(0, dtype=torch.long), dist_reduce_fx="sum")
+
+    def update(self, probs: torch.Tensor, targets: torch.Tensor) -> None:
+        """
+        Add the statistics of one batch.
+
+        :param probs: sigmoid probabilities [B, ...], one image per row of the first dimension
+        :param targets: ground-truth masks of the same shape; values >= 0.5 are positive, so interpolated masks
+            are binarised the same way as in LightningModel._prepare_mask
+        """
+        n_images = probs.shape[0]
+        probs = probs.detach().reshape(n_images, -1).float()
+        positive = targets.detach().reshape(n_images, -1) >= 0.5
+        image_tp, image_fp, image_fn = threshold_confusion_counts(probs, positive, self.thresholds)
+
+        self.tp += image_tp.sum(0)
+        self.fp += image_fp.sum(0)
+        self.fn += image_fn.sum(0)
+        self.image_dice_sum += dice_from_counts(image_tp, image_fp, image_fn).sum(0, dtype=torch.float64)
+        self.images += n_images
+        self.pixels += probs.numel()
+
+    def compute(self) -> dict[str, torch.Tensor]:
+        """
+        :return: dict with the epoch's statistics, columns in the order of ``thresholds``:
+            - "tp", "fp", "fn": [T] torch.long counts over all pixels
+            - "mean_image_dice": [T] float32 mean of the per-image Dice scores, as :func:`mean_dice_per_image`
+            - "positives": scalar number of positive pixels; "pixels": scalar number of pixels
+        """
+        return {"tp": self.tp, "fp": self.fp, "fn": self.fn,
+                "mean_image_dice": (self.image_dice_sum / self.images).float(),
+                # tp + fn is the number of positive pixels at every threshold
+                "positives": self.tp[0] + self.fn[0],
+                "pixels": self.pixels}
@@ -0,0 +1,340 @@
+"""
+Batched augmentation with tensor ops, run on the training device inside the LightningModel.
+
+With ``TRANSFORM_CONFIG.augmentation_backend: "batched"`` DataLoader workers only collate the
+decoded uint8 images and masks (zero-padded to the largest sample of the batch, see
+:func:`~SkiNet.ML.dataloaders.dataloaders.collate_padded_preserving_specs`). After the batch
+has been moved to the device, :class:`BatchAugmentation` applies crop, flips/rotations, affine,
+photometric augmentation and normalisation to the whole batch at once.
+
+All geometric transforms of a sample (crop, square symmetry, affine and the resize to the crop
+size) are folded into one affine matrix per sample and applied with a single ``grid_sample``
+call. Image and mask are sampled with the same grid (bilinear for the image, nearest for the
+mask), so their geometry stays in sync.
+
+The random parameters follow the distributions of the Albumentations pipeline built by
+:func:`~SkiNet.ML.transformations.transform_data.get_transform_from_config`, but the random
+streams differ, so results are not bitwise identical to the per-sample pipeline. Validation
+and test batches get the same crop and normalisation as with Albumentations.
+"""
+from __future__ import annotations
+
+import math
+from typing import Any
+
+import torch
+import torch.nn.functional as F
+
+from SkiNet.ML.configs.transform_configs.transform_config import TransformConfig
+
+_EPS = 1e-4
+"""Added to the denominator of per-image normalisation, as in Albumentations."""
+
+# The 8 elements of the square symmetry group (identity, rotations by 90/180/270 degrees,
+# horizontal/vertical flip, transpose, anti-transpose) as 2x2 matrices in (x, y) pixel coordinates.
+_SQUARE_SYMMETRIES = torch.tensor([[[1, 0], [0, 1]], [[0, -1], [1, 0]], [[-1, 0], [0, -1]], [[0, 1], [-1, 0]],
+                                   [[-1, 0], [0, 1]], [[1, 0], [0, -1]], [[0, 1], [1, 0]], [[0, -1], [-1, 0]]],
+                                  dtype=torch.float32)
+
+# RGB <-> YIQ; a hue shift is a rotation of the chroma (I, Q) plane.
+_RGB_TO_YIQ = torch.tensor([[0.299, 0.587, 0.114], [0.596, -0.274, -0.322], [0.211, -0.523, 0.312]])
+_YIQ_TO_RGB = torch.linalg.inv(_RGB_TO_YIQ)
+_GRAY_WEIGHTS = (0.299, 0.587, 0.114)
+
+
+def _as_range(value: float | tuple[float, float]) -> tuple[float, float]:
+    """Albumentations semantics: a single number ``v`` means the range ``(-v, v)``."""
+    if isinstance(value, (int, float)):
+        return -float(value), float(value)
+    return float(value[0]), float(value[1])
+
+
+class BatchAugmentation(torch.nn.Module):
+    """
+    Crop, spatial and photometric augmentation plus normalisation of a whole batch.
+
+    Supported from :class:`~SkiNet.ML.configs.transform_configs.transform_config.TransformConfig`:
+    all crop types, square symmetry, affine, colour jitter, Gaussian blur, Gaussian noise and all
+    normalisation modes. Perspective and elastic transforms are rejected by the config validation.
+
+    The module holds no parameters and no persistent buffers, so checkpoints are unaffected.
+    """
+
+    def __init__(self, config: TransformConfig) -> None:
+        """
+        :param config: Transform configuration; ``seed_value`` seeds the augmentation random stream.
+        """
+        super().__init__()
+        self.crop = config.crop
+        self.spatial = config.spatial_augmentation
+        self.photometric = config.photometric_augmentation
+        self.normalization_mode = config.normalization_mode
+        self.seed = config.seed_value
+        self._generator: torch.Generator | None = None
+
+        mean, std = config.normalization_mean, config.normalization_std
+        if self.normalization_mode == "standard" and (mean is None or std is None):
+            raise ValueError(
+                "normalization_mode='standard' requires normalization_mean and normalization_std "
+                "to be set in TRANSFORM_CONFIG. Run compute_dataset_stats.py to obtain them."
+            )
+        self.mean: torch.Tensor
+        self.std: torch.Tensor
+        self.register_buffer("mean", torch.tensor(mean or (0.0, 0.0, 0.0)).view(1, -1, 1, 1) * 255.0, persistent=False)
+        self.register_buffer("std", torch.tensor(std or (1.0, 1.0, 1.0)).view(1, -1, 1, 1) * 255.0, persistent=False)
+
+    def __getstate__(self) -> dict[str, Any]:
+        """Generators are recreated lazily on the device of the first batch after unpickling."""
+        state = self.__dict__.copy()
+        state["_generator"] = None
+        return state
+
+    def _generator_for(self, device: torch.device) -> torch.Generator | None:
+        """Seeded generator on ``device``, or None to use the global random state if no seed is configured."""
+        if self.seed is None:
+            return None
+        if self._generator is None or self._generator.device != device:
+            self._generator = torch.Generator(device=device)
+            self._generator.manual_seed(self.seed)
+        return self._generator
+
+    def _rand(self, *shape: int, device: torch.device) -> torch.Tensor:
+        return torch.rand(shape, device=device, generator=self._generator_for(device))
+
+    def _uniform(self, low: float, high: float, *shape: int, device: torch.device) -> torch.Tensor:
+        return low + (high - low) * self._rand(*shape, device=device)
+
+    def forward(self,
+                image: torch.Tensor,
+                mask: torch.Tensor,
+                image_size: torch.Tensor,
+                train: bool) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        Augment and normalise a batch.
+
+        :param image: uint8 images [B, C, H, W], zero-padded beyond ``image_size``.
+        :param mask: uint8 masks [B, 1, H, W], padded like ``image``.
+        :param image_size: int64 tensor [B, 2] with the (height, width) of every unpadded sample.
+        :param train: If True, spatial and photometric augmentations are applied; otherwise only
+            crop and normalisation, as for the validation and test pipelines.
+        :return: float32 normalised images [B, C, h, w] and uint8 masks [B, 1, h, w],
+            where (h, w) is ``crop.size`` (or the padded size if cropping is disabled).
+        """
+        image = image.float()
+        theta, out_size = self._geometry(image_size.to(image.device), image.shape[-2:], train)
+        if theta is not None:
+            grid = F.affine_grid(theta, [image.shape[0], 1, *out_size], align_corners=False)
+            image = F.grid_sample(image, grid, mode="bilinear", padding_mode="zeros", align_corners=False)
+            mask = F.grid_sample(mask.float(), grid, mode="nearest", padding_mode="zeros",
+                                 align_corners=False).round().to(torch.uint8)
+        if train:
+            image = self._photometric(image)
+        return self._normalize(image), mask
+
+    # ----------------------------------------------------------------- geometry
+
+    def _crop_regions(self, height: torch.Tensor, width: torch.Tensor, out_h: int, out_w: int) -> torch.Tensor:
+        """Per sample crop region (x0, y0, crop width, crop height) in pixels of the unpadded image."""
+        device = height.device
+        n = height.shape[0]
+        if self.crop.crop_type == "random_resized_crop":
+            # torchvision/Albumentations algorithm: 10 attempts at a random area and log-uniform aspect ratio,
+            # falling back to the whole image
+            area = (height * width).unsqueeze(1)
+            target_area = area * self._uniform(self.crop.scale[0], self.crop.scale[1], n, 10, device=device)
+            aspect = torch.exp(self._uniform(math.log(3 / 4), math.log(4 / 3), n, 10, device=device))
+            crop_w = torch.sqrt(target_area * aspect).round()
+            crop_h = torch.sqrt(target_area / aspect).round()
+            fits = (crop_w > 0) & (crop_h > 0) & (crop_w <= width.unsqueeze(1)) & (crop_h <= height.unsqueeze(1))
+            first = fits.int().argmax(dim=1, keepdim=True)
+            found = fits.any(dim=1)
+            crop_w = torch.where(found, crop_w.gather(1, first).squeeze(1), width)
+            crop_h = torch.where(found, crop_h.gather(1, first).squeeze(1), height)
+        else:
+            # as A.RandomCrop/A.CenterCrop: a crop larger than the image is an error, not zero padding
+            too_small = (height < out_h) | (width < out_w)
+            if too_small.any():
+                i = int(too_small.int().argmax())
+                raise ValueError(f"Crop size (height, width) exceeds image dimensions (height, width): "
+                                 f"({out_h}, {out_w}) vs ({int(height[i])}, {int(width[i])})")
+            crop_w = torch.full_like(width, float(out_w))
+            crop_h = torch.full_like(height, float(out_h))
+
+        if self.crop.crop_type == "center_crop":
+            x0 = torch.floor((width - crop_w) / 2)
+            y0 = torch.floor((height - crop_h) / 2)
+        else:
+            x0 = torch.floor(self._rand(n, device=device) * (width - crop_w + 1))
+            y0 = torch.floor(self._rand(n, device=device) * (height - crop_h + 1))
+        return torch.stack([x0, y0, crop_w, crop_h], dim=1)
+
+    def _spatial_inverse(self, n: int, out_h: int, out_w: int, device: torch.device) -> torch.Tensor | None:
+        """Inverse of the random square symmetry and affine transforms, [n, 3, 3] in centred output pixels."""
+        inverse = torch.eye(3, device=device).repeat(n, 1, 1)
+        applied = False
+
+        if self.spatial.square_symmetry_apply:
+            apply = self._rand(n, device=device) < self.spatial.square_symmetry_p
+            element = torch.floor(self._rand(n, device=device) * 8).long().clamp(max=7) * apply
+            # orthogonal matrices: the inverse is the transpose
+            inverse[:, :2, :2] = _SQUARE_SYMMETRIES.to(device)[element].transpose(1, 2)
+            applied = True
+
+        if self.spatial.affine_apply:
+            apply = self._rand(n, device=device) < 0.5  # default probability of A.Affine
+            scale_x = self._uniform(*self.spatial.affine_scale, n, device=device)
+            scale_y = self._uniform(*self.spatial.affine_scale, n, device=device)
+            translate = self.spatial.affine_translate_percent
+            shift_x = self._uniform(*_as_range(translate.get("x", 0.0)), n, device=device) * out_w
+            shift_y = self._uniform(*_as_range(translate.get("y", 0.0)), n, device=device) * out_h
+            angle = torch.deg2rad(self._uniform(*_as_range(self.spatial.affine_rotate), n, device=device))
+            shear_x = torch.deg2rad(self._uniform(*_as_range(self.spatial.affine_shear.get("x", 0.0)), n, device=device))
+            shear_y = torch.deg2rad(self._uniform(*_as_range(self.spatial.affine_shear.get("y", 0.0)), n, device=device))
+
+            cos, sin = torch.cos(angle), torch.sin(angle)
+            zeros, ones = torch.zeros_like(cos), torch.ones_like(cos)
+            rotation = torch.stack([cos, -sin, zeros, sin, cos, zeros, zeros, zeros, ones], 1).view(n, 3, 3)
+            shear = torch.stack([ones, torch.tan(shear_x), zeros, torch.tan(shear_y), ones, zeros,
+                                 zeros, zeros, ones], 1).view(n, 3, 3)
+            scale = torch.diag_embed(torch.stack([scale_x, scale_y, ones], 1))
+            forward = rotation @ shear @ scale
+            forward[:, 0, 2] = shift_x
+            forward[:, 1, 2] = shift_y
+            affine_inverse = torch.where(apply.view(n, 1, 1), torch.linalg.inv(forward), torch.eye(3, device=device))
+            inverse = inverse @ affine_inverse
+            applied = True
+
+        return inverse if applied else None
+
+    def _geometry(self,
+                  image_size: torch.Tensor,
+                  padded_size: torch.Size,
+                  train: bool) -> tuple[torch.Tensor | None, tuple[int, int]]:
+        """
+        Build the ``affine_grid`` matrices mapping output to input normalised coordinates.
+
+        :return: theta [B, 2, 3] (None if the batch is passed through unchanged) and the output (height, width).
+        """
+        device = image_size.device
+        n = image_size.shape[0]
+        padded_h, padded_w = int(padded_size[0]), int(padded_size[1])
+        out_h, out_w = self.crop.size if self.crop.crop_apply else (padded_h, padded_w)
+        spatial_inverse = self._spatial_inverse(n, out_h, out_w, device=device) if train else None
+
+        if self.crop.crop_apply:
+            height, width = image_size[:, 0].float(), image_size[:, 1].float()
+            x0, y0, crop_w, crop_h = self._crop_regions(height, width, out_h, out_w).unbind(1)
+        else:
+            # without cropping the padded batch is only transformed if spatial augmentation is enabled
+            if spatial_inverse is None:
+                return None, (out_h, out_w)
+            x0 = y0 = torch.zeros(n, device=device)
+            crop_w = torch.full((n,), float(padded_w), device=device)
+            crop_h = torch.full((n,), float(padded_h), device=device)
+
+        # normalised output coordinates -> output pixels relative to the output centre
+        to_pixels = torch.diag(torch.tensor([out_w / 2, out_h / 2, 1.0], device=device)).expand(n, 3, 3)
+        # output pixels relative to the centre -> input pixels, scaling the crop region to the output size
+        zeros, ones = torch.zeros(n, device=device), torch.ones(n, device=device)
+        crop = torch.stack([crop_w / out_w, zeros, x0 + crop_w / 2,
+                            zeros, crop_h / out_h, y0 + crop_h / 2,
+                            zeros, zeros, ones], 1).view(n, 3, 3)
+        # input pixels -> normalised coordinates of the padded input
+        to_normalized = torch.tensor([[2 / padded_w, 0, -1], [0, 2 / padded_h, -1], [0, 0, 1]], device=device)
+
+        matrix = crop @ to_pixels if spatial_inverse is None else crop @ spatial_inverse @ to_pixels
+        return (to_normalized @ matrix)[:, :2, :], (out_h, out_w)
+
+    # ------------------------------------------------------------- photometric
+
+    @staticmethod
+    def _gray(x: torch.Tensor) -> torch.Tensor:
+        r, g, b = x.unbind(1)
+        return (_GRAY_WEIGHTS[0] * r + _GRAY_WEIGHTS[1] * g + _GRAY_WEIGHTS[2] * b).unsqueeze(1)
+
+    def _factor(self, limit: float, apply: torch.Tensor) -> torch.Tensor:
+        """ColorJitter factor in [max(0, 1 - limit), 1 + limit] for applied samples, 1 otherwise, shaped [B, 1, 1, 1]."""
+        factor = self._uniform(max(0.0, 1 - limit), 1 + limit, apply.shape[0], device=apply.device)
+        return torch.where(apply, factor, torch.ones_like(factor)).view(-1, 1, 1, 1)
+
+    def _color_jitter(self, x: torch.Tensor) -> torch.Tensor:
+        cfg = self.photometric
+        apply = self._rand(x.shape[0], device=x.device) < cfg.color_jitter_p
+        is_rgb = x.shape[1] == 3
+        if cfg.color_jitter_brightness > 0:
+            x = (x * self._factor(cfg.color_jitter_brightness, apply)).clamp(0, 1)
+        if cfg.color_jitter_contrast > 0:
+            mean = (self._gray(x) if is_rgb else x).mean(dim=(1, 2, 3), keepdim=True)
+            x = ((x - mean) * self._factor(cfg.color_jitter_contrast, apply) + mean).clamp(0, 1)
+        if cfg.color_jitter_saturation > 0 and is_rgb:
+            gray = self._gray(x)
+            x = ((x - gray) * self._factor(cfg.color_jitter_saturation, apply) + gray).clamp(0, 1)
+        if cfg.color_jitter_hue > 0 and is_rgb:
+            shift = self._uniform(-cfg.color_jitter_hue, cfg.color_jitter_hue, x.shape[0], device=x.device)
+            angle = 2 * math.pi * torch.where(apply, shift, torch.zeros_like(shift))
+            cos, sin = torch.cos(angle), torch.sin(angle)
+            zeros, ones = torch.zeros_like(cos), torch.ones_like(cos)
+            rotation = torch.stack([ones, zeros, zeros, zeros, cos, -sin, zeros, sin, cos], 1).view(-1, 3, 3)
+            transform = _YIQ_TO_RGB.to(x.device) @ rotation @ _RGB_TO_YIQ.to(x.device)
+            x = torch.einsum("bij,bjhw->bihw", transform, x).clamp(0, 1)
+        return x
+
+    def _gaussian_blur(self, x: torch.Tensor) -> torch.Tensor:
+        """Separable Gaussian blur with a per-sample sigma; samples not selected get a delta kernel."""
+        cfg = self.photometric
+        n, c, h, w = x.shape
+        apply = self._rand(n, device=x.device) < cfg.gaussian_blur_p
+        sigma = self._uniform(*cfg.gaussian_blur_sigma_limit, n, device=x.device).clamp(min=1e-3)
+        radius = max(1, math.ceil(3 * cfg.gaussian_blur_sigma_limit[1]))
+        offsets = torch.arange(-radius, radius + 1, device=x.device, dtype=x.dtype)
+        kernel = torch.exp(-0.5 * (offsets / sigma.unsqueeze(1)) ** 2)
+        kernel = kernel / kernel.sum(dim=1, keepdim=True)
+        delta = (offsets == 0).to(x.dtype).expand_as(kernel)
+        kernel = torch.where(apply.unsqueeze(1), kernel, delta).repeat_interleave(c, dim=0)  # [n * c, k]
+
+        flat = x.reshape(1, n * c, h, w)
+        flat = F.pad(flat, (radius, radius, 0, 0), mode="reflect" if w > radius else "replicate")
+        flat = F.conv2d(flat, kernel.view(n * c, 1, 1, -1), groups=n * c)
+        flat = F.pad(flat, (0, 0, radius, radius), mode="reflect" if h > radius else "replicate")
+        flat = F.conv2d(flat, kernel.view(n * c, 1, -1, 1), groups=n * c)
+        return flat.view(n, c, h, w)
+
+    def _gaussian_noise(self, x: torch.Tensor) -> torch.Tensor:
+        cfg = self.photometric
+        n = x.shape[0]
+        apply = self._rand(n, device=x.device) < cfg.gaussian_noise_p
+        std = self._uniform(*cfg.gaussian_noise_std_range, n, device=x.device) * apply
+        noise = torch.randn(x.shape, device=x.device, generator=self._generator_for(x.device))
+        return (x + noise * std.view(-1, 1, 1, 1)).clamp(0, 1)
+
+    def _photometric(self, image: torch.Tensor) -> torch.Tensor:
+        """Apply the configured photometric augmentations to float images in [0, 255]."""
+        cfg = self.photometric
+        if not (cfg.color_jitter_apply or cfg.gaussian_blur_apply or cfg.gaussian_noise_apply):
+            return image
+        x = image / 255.0
+        if cfg.color_jitter_apply:
+            x = self._color_jitter(x)
+        if cfg.gaussian_blur_apply:
+            x = self._gaussian_blur(x)
+        if cfg.gaussian_noise_apply:
+            x = self._gaussian_noise(x)
+        return x * 255.0
+
+    # ----------------------------------------------------------- normalisation
+
+    def _normalize(self, image: torch.Tensor) -> torch.Tensor:
+        """Normalise float images in [0, 255] like ``A.Normalize`` with the configured mode."""
+        if self.normalization_mode == "standard":
+            return (image - self.mean) / self.std
+        if self.normalization_mode == "image":
+            dims: tuple[int, ...] = (1, 2, 3)
+        elif self.normalization_mode == "image_per_channel":
+            dims = (2, 3)
+        else:  # min_max
+            low = image.amin(dim=(1, 2, 3), keepdim=True)
+            high = image.amax(dim=(1, 2, 3), keepdim=True)
+            return (image - low) / (high - low + _EPS)
+        mean = image.mean(dim=dims, keepdim=True)
+        std = image.std(dim=dims, keepdim=True, unbiased=False)
+        return (image - mean) / (std + _EPS)
@@ -8,18 +8,28 @@ For datasets without predefined splits (e.g. PH2), the random split defined by
 split_train_size / split_random_seed is used.
 
 Usage:
-    python compute_dataset_stats.py --config main_config.yaml
+    python compute_dataset_stats.py --config main_config.yaml [--workers 8] [--percentiles 1 50 99]
 
 Output is printed as YAML-ready values to paste into main_config.yaml:
     normalization_mean: [R, G, B]
     normalization_std:  [R, G, B]
 
 Stats are computed on the raw uint8 images (before any augmentation) from the
-training split only.
+training split only. The split is sharded into contiguous index ranges processed by a
+process pool; each shard counts the per-channel histogram of its uint8 pixel values,
+from which its exact (count, mean, M2) follows. Shards are merged with the parallel
+form of Welford's algorithm, and the summed histograms give percentiles in the same pass.
 """
 import argparse
 import logging
+import math
+import os
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from functools import reduce
 from pathlib import Path
+from typing import Any
 
 import numpy as np
 import torch
@@ -30,87 +40,185 @@ from SkiNet.ML.datasets.dataset_factory import create_segmentation_datasets_from
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+N_LEVELS = 256
+"""Number of uint8 pixel values, i.e. histogram bins per channel."""
 
-def compute_stats(cfg_path: Path) -> tuple[list[float], list[float]]:
+
+@dataclass
+class ChannelStats:
+    """
+    Per-channel pixel statistics in the [0, 1] scale (uint8 values divided by 255).
+
+    :attributes:
+    - count: Number of pixels per channel.
+    - mean: float64 array [C], mean per channel.
+    - m2: float64 array [C], sum of squared deviations from the mean per channel.
+    - histogram: uint64 array [C, 256] of pixel value counts.
+    """
+    count: int
+    mean: np.ndarray
+    m2: np.ndarray
+    histogram: np.ndarray
+
+    @property
+    def std(self) -> np.ndarray:
+        """Population standard deviation per channel."""
+        return np.sqrt(self.m2 / self.count)
+
+    @classmethod
+    def from_histogram(cls, histogram: np.ndarray) -> "ChannelStats":
+        """
+        Exact count, mean and M2 from a per-channel histogram of uint8 values.
+
+        Sums of values and squared values are formed as Python integers, so M2 = (n * Σx² - (Σx)²) / n
+        has no cancellation error before the final division.
+        """
+        values = np.arange(N_LEVELS, dtype=np.uint64)
+        count = int(histogram[0].sum())
+        sums = [int(v) for v in histogram @ values]
+        sums_sq = [int(v) for v in histogram @ (values * values)]
+        mean = np.array([s / count / 255.0 for s in sums])
+        m2 = np.array([(count * sq - s * s) / count / 255.0**2 for s, sq in zip(sums, sums_sq)])
+        return cls(count=count, mean=mean, m2=m2, histogram=histogram)
+
+    def merge(self, other: "ChannelStats") -> "ChannelStats":
+        """
+        Combine the statistics of two disjoint pixel sets with the parallel Welford formula.
+        """
+        n_total = self.count + other.count
+        delta = other.mean - self.mean
+        mean = (self.count * self.mean + other.count * other.mean) / n_total
+        # the second term corrects for the spread between the two groups' means
+        m2 = self.m2 + other.m2 + delta ** 2 * (self.count * other.count / n_total)
+        return ChannelStats(count=n_total, mean=mean, m2=m2, histogram=self.histogram + other.histogram)
+
+    def percentiles(self, q: Sequence[float]) -> np.ndarray:
+        """
+        Per-channel percentiles of the pixel values in the [0, 1] scale.
+
+        :param q: Percentiles in [0, 100].
+        :return: float64 array [C, len(q)]; the smallest value whose cumulative share reaches q
+            (the "inverted_cdf" method of np.percentile), which is exact for uint8 data.
+        """
+        cumulative = np.cumsum(self.histogram, axis=1)
+        targets = np.asarray(q, dtype=np.float64) / 100.0 * self.count
+        levels = [np.searchsorted(cum, np.maximum(targets, 1), side="left") for cum in cumulative]
+        return np.array(levels, dtype=np.float64) / 255.0
+
+
+def image_histogram(img: Any) -> np.ndarray:
+    """
+    Per-channel histogram of a uint8 image.
+
+    :param img: CHW or HWC (3 channels) uint8 numpy array or tensor.
+    :return: uint64 array [C, 256].
+    """
+    img_np = img.numpy() if isinstance(img, torch.Tensor) else np.asarray(img)
+    if img_np.dtype != np.uint8:
+        raise TypeError(f"Raw images must be uint8, got {img_np.dtype}.")
+    # Normalise to CHW
+    if img_np.ndim == 3 and img_np.shape[2] == 3:
+        img_np = img_np.transpose(2, 0, 1)
+    return np.stack([np.bincount(channel.ravel(), minlength=N_LEVELS) for channel in img_np]).astype(np.uint64)
+
+
+_shard_dataset: Any = None
+"""Dataset read by the pool processes, set by _init_shard_process."""
+
+
+def _init_shard_process(dataset: Any) -> None:
+    global _shard_dataset
+    _shard_dataset = dataset
+
+
+def _shard_stats(start: int, stop: int, dataset: Any = None) -> ChannelStats:
+    """
+    Statistics of the raw images ``start..stop-1`` (before any augmentation or resizing).
+    """
+    dataset = dataset if dataset is not None else _shard_dataset
+    histogram = reduce(np.add, (image_histogram(dataset.get_raw_sample(i).image) for i in range(start, stop)))
+    return ChannelStats.from_histogram(histogram)
+
+
+def compute_channel_stats(dataset: Any, num_workers: int = 1, shards_per_worker: int = 4) -> ChannelStats:
+    """
+    Per-channel statistics of all raw images of ``dataset``, sharded across processes.
+
+    :param dataset: Dataset providing ``get_raw_sample(i).image`` as uint8 CHW/HWC images.
+    :param num_workers: Number of processes; 1 computes in the calling process.
+    :param shards_per_worker: Contiguous index ranges per process, for load balancing.
+    :return: Merged ChannelStats including the summed histogram.
+    """
+    n_samples = len(dataset)
+    if n_samples == 0:
+        raise ValueError("Cannot compute statistics of an empty dataset.")
+    n_shards = max(1, min(n_samples, num_workers * shards_per_worker))
+    shard_size = math.ceil(n_samples / n_shards)
+    bounds = [(start, min(start + shard_size, n_samples)) for start in range(0, n_samples, shard_size)]
+    logger.info("Computing stats over %d training samples in %d shards...", n_samples, len(bounds))
+
+    results: list[ChannelStats] = []
+    if num_workers <= 1:
+        for start, stop in bounds:
+            results.append(_shard_stats(start, stop, dataset))
+            logger.info("  %d / %d", stop, n_samples)
+    else:
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_shard_process,
+                                 initargs=(dataset,)) as executor:
+            futures = [executor.submit(_shard_stats, start, stop) for start, stop in bounds]
+            for done, future in enumerate(as_completed(futures), start=1):
+                results.append(future.result())
+                logger.info("  shard %d / %d", done, len(bounds))
+
+    return reduce(ChannelStats.merge, results)
+
+
+def compute_stats(cfg_path: Path, num_workers: int = 1) -> tuple[list[float], list[float]]:
     """
     Produce the R/G/B mean and std of all pixel values in the training split, normalized to [0, 1].
     These are the values torchvision.transforms.Normalize expects.
 
     :param cfg_path: Path to the YAML config file containing the dataset configuration.
+    :param num_workers: Number of processes sharing the training split.
     :return: A tuple of two lists: (mean, std), where each is a list of three floats corresponding to the R, G, B channels.
     """
+    stats = _compute_train_stats(cfg_path, num_workers)
+    mean_list = [round(float(v), 4) for v in stats.mean]
+    std_list = [round(float(v), 4) for v in stats.std]
+    return mean_list, std_list
+
+
+def _compute_train_stats(cfg_path: Path, num_workers: int) -> ChannelStats:
     config = load_config_from_yaml(cfg_path)
     datasets = create_segmentation_datasets_from_config(config)
-    train_dataset = datasets.train
-
-    n_samples = len(train_dataset)
-    logger.info("Computing stats over %d training samples...", n_samples)
-
-    # Initialise single-pass pixel-weighted mean and variance (no caching).
-    # Uses the parallel/batch form of Welford's online algorithm so only one
-    # image is in memory at a time.
-    mean = np.zeros(3, dtype=np.float64)  # running mean per channel
-    M2 = np.zeros(3, dtype=np.float64)   # running sum of squared deviations from running mean
-    total_pixels = np.int64(0)
-
-    # for each training image, update the running mean and M2 using the parallel Welford merge
-    for i in range(n_samples):
-        # ge an image before any augmenation or resizing
-        sample = train_dataset.get_raw_sample(i)
-        img = sample.image
-        if isinstance(img, torch.Tensor):
-            img_np = img.numpy()
-        else:
-            img_np = np.array(img)
-
-        # scale to 0-1 range
-        img_f = img_np.astype(np.float64) / 255.0  # CHW or HWC
-
-        # Normalise to CHW
-        if img_f.ndim == 3 and img_f.shape[2] == 3:
-            img_f = img_f.transpose(2, 0, 1)
-
-        n_new = np.int64(img_f.shape[1] * img_f.shape[2])
-
-        # Per-channel stats for this image (before any augmentation or resizing).
-        img_mean = img_f.mean(axis=(1, 2))           # (3,)
-        img_var = img_f.var(axis=(1, 2))            # (3,)
-
-        # Parallel Welford merge: combine (total_pixels, mean, M2) with (n_new, img_mean, img_var*n_new)
-        n_total = total_pixels + n_new
-        delta = img_mean - mean
-        mean = (total_pixels * mean + n_new * img_mean) / n_total
-        # M2 tracks the total sum of squared deviations from the combined mean across all pixels seen so far.
-        # img_var * n_new — the internal variance of the new image, scaled by its pixel count. This is how spread out pixels are within this image.
-        # delta**2 * (total_pixels * n_new / n_total) — a correction for the fact that the two groups had different means.
-        # Even if both groups had zero internal variance, combining them would produce variance if their means differ.
-        # This term accounts for that inter-group spread.
-        M2 += img_var * n_new + delta ** 2 * (total_pixels * n_new / n_total)
-        total_pixels = n_total
-
-        if (i + 1) % 100 == 0 or (i + 1) == n_samples:
-            logger.info("  %d / %d", i + 1, n_samples)
-
-    std = np.sqrt(M2 / total_pixels)
-
-    mean_list = [round(float(v), 4) for v in mean]
-    std_list = [round(float(v), 4) for v in std]
-    return mean_list, std_list
+    return compute_channel_stats(datasets.train, num_workers=num_workers)
 
 
 def main() -> None:
     ap = argparse.ArgumentParser(description="Compute training-set channel mean and std for any configured dataset.")
     ap.add_argument("--config", type=Path, default=Path("main_config.yaml"),
                     help="Path to experiment YAML config (default: main_config.yaml)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                    help="Processes sharing the training split (default: all cores)")
+    ap.add_argument("--percentiles", type=float, nargs="*", default=None,
+                    help="Also print these per-channel percentiles (0-100) of the [0, 1] pixel values")
     args = ap.parse_args()
 
-    mean, std = compute_stats(args.config)
+    if args.percentiles:
+        stats = _compute_train_stats(args.config, args.workers)
+        mean = [round(float(v), 4) for v in stats.mean]
+        std = [round(float(v), 4) for v in stats.std]
+    else:
+        mean, std = compute_stats(args.config, num_workers=args.workers)
 
     print("\n--- Paste into your config YAML under TRANSFORM_CONFIG ---")
     print("  normalization_mode: \"standard\"")
     print(f"  normalization_mean: {mean}")
     print(f"  normalization_std:  {std}")
     print("-----------------------------------------------------------\n")
+    if args.percentiles:
+        for q, values in zip(args.percentiles, stats.percentiles(args.percentiles).T):
+            print(f"p{q:g}: {[round(float(v), 4) for v in values]}")
 
 
 if __name__ == "__main__":
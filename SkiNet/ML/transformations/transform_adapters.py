@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Protocol
 
 import albumentations as A
@@ -73,3 +73,32 @@ class AlbumentationsSampleTransform:
         return AlbumentationsSampleTransform(pipeline=vis_pipeline,
                                              visualization_pipeline=vis_pipeline,
                                              expects_tensor_output=False)
+
+
+@dataclass(frozen=True)
+class BatchedSampleTransform:
+    """
+    Pass-through transform for ``augmentation_backend="batched"``.
+
+    Samples stay CHW uint8 tensors as loaded from disk, so DataLoader workers only collate them
+    (see ``collate_padded_preserving_specs``). Cropping, augmentation and normalisation are applied
+    to whole batches on the training device by
+    :class:`~SkiNet.ML.transformations.batch_augmentation.BatchAugmentation`.
+    """
+
+    pipeline: A.Compose = field(default_factory=lambda: A.Compose([]))
+    visualization_pipeline: A.Compose | None = None
+    expects_tensor_output: bool = True
+
+    def __call__(self, sample: Sample) -> Sample:
+        """
+        :param sample: A Sample with CHW uint8 image and mask tensors.
+        :return: The same sample, unchanged.
+        """
+        for name, item in (("image", sample.image), ("mask", sample.mask)):
+            if not isinstance(item, torch.Tensor) or item.dtype != torch.uint8 or item.ndim != 3:
+                raise TypeError(f"Batched augmentation expects CHW uint8 {name} tensors, got {type(item)}.")
+        return sample
+
+    def without_postprocess(self) -> "BatchedSampleTransform":
+        return self
@@ -6,6 +6,7 @@ import albumentations as A
 from SkiNet.ML.configs.experiment_config import ExperimentConfig
 from SkiNet.ML.transformations.transform_adapters import (
     AlbumentationsSampleTransform,
+    BatchedSampleTransform,
     SampleTransformAdapter,
 )
 from SkiNet.ML.transformations.transform_pipelines import (
@@ -84,7 +85,13 @@ def get_transform_from_config(cfg: ExperimentConfig) -> TransformsContainer:
         PhotoAugmentConfig) will be used.
 
     :return: A TransformsContainer object containing the train, val, and test sample transforms constructed based on the provided configuration.
+        With ``augmentation_backend="batched"`` all three are pass-through transforms, as augmentation
+        then runs batch-wise in the LightningModel.
     """
+    if cfg.transformconfig.augmentation_backend == "batched":
+        return TransformsContainer(train=BatchedSampleTransform(),
+                                   val=BatchedSampleTransform(),
+                                   test=BatchedSampleTransform())
 
     crop_transforms = get_crop_transforms(cfg.transformconfig.crop)
     spatial_transforms = get_spatial_transforms(
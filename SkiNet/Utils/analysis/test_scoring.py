@@ -8,6 +8,12 @@ threshold(s) it is handed. Nothing here searches for a threshold.
 All Dice/IoU are **per-image mean** (ISIC-2017 official averaging): the metric is
 computed per image and then averaged over images, never pooled across pixels.
 
+Scoring goes through per-image TP/FP/FN counts ``[N, T]`` for the T thresholds, from
+which Dice, IoU and the bootstrap CIs are derived. :func:`collect_counts` fills them
+batch by batch during inference, so scoring a checkpoint keeps ``N x T`` integers
+instead of the ``[N, P]`` probabilities and masks of :func:`collect_probs`, and memory
+stays flat however many checkpoints are scored in turn.
+
 Used by both the ``EF`` notebook (single selected checkpoint, inline inference) and
 ``calibrate_threshold.py`` (the same scoring over a glob of checkpoints).
 """
@@ -19,12 +25,15 @@ import sqlite3
 from contextlib import closing
 from glob import glob
 from pathlib import Path
-from typing import Any, Iterable
+from typing import TYPE_CHECKING, Any, Iterable, Iterator
 
 import numpy as np
 import pandas as pd
 import torch
 
+if TYPE_CHECKING:
+    from SkiNet.ML.model.lightning_model import LightningModel
+
 
 # ----------------------------- metrics -------------------------------------- #
 def per_image_dice_iou(probs: torch.Tensor, masks: torch.Tensor, thr: float,
@@ -47,6 +56,39 @@ def per_image_dice_iou(probs: torch.Tensor, masks: torch.Tensor, thr: float,
     return dice.cpu().numpy(), iou.cpu().numpy()
 
 
+def per_image_counts(probs: torch.Tensor, masks: torch.Tensor, thresholds: Iterable[float]
+                     ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Per-image TP/FP/FN at every threshold, predicting foreground where ``probs >= thr``.
+
+    :param probs: Predicted foreground probabilities ``[N, P]``.
+    :param masks: Binary ground-truth masks, same shape (foreground where ``>= 0.5``).
+    :param thresholds: Decision thresholds, T of them.
+    :return: ``(tp, fp, fn)``, each a ``torch.long`` tensor ``[N, T]`` on the device
+        of ``probs``, columns in the order of ``thresholds``.
+    """
+    from SkiNet.ML.training.training_utils import threshold_confusion_counts  # lazy: heavy import
+
+    thr = torch.tensor([float(t) for t in thresholds], dtype=probs.dtype, device=probs.device)
+    return threshold_confusion_counts(probs, masks >= 0.5, thr)
+
+
+def dice_iou_from_counts(tp: torch.Tensor, fp: torch.Tensor, fn: torch.Tensor,
+                         eps: float = 1e-7) -> tuple[np.ndarray, np.ndarray]:
+    """Per-image Dice and IoU from TP/FP/FN counts, as :func:`per_image_dice_iou`.
+
+    :param tp: True-positive pixel counts, e.g. ``[N, T]`` from :func:`per_image_counts`.
+    :param fp: False-positive pixel counts, same shape.
+    :param fn: False-negative pixel counts, same shape.
+    :param eps: Smoothing constant guarding the empty-mask / empty-prediction case.
+    :return: ``(dice, iou)`` as numpy arrays of the shape of the counts.
+    """
+    inter = tp.float()
+    psum, msum = (tp + fp).float(), (tp + fn).float()
+    dice = (2 * inter + eps) / (psum + msum + eps)
+    iou = (inter + eps) / (psum + msum - inter + eps)
+    return dice.cpu().numpy(), iou.cpu().numpy()
+
+
 def bootstrap_ci(values: np.ndarray, n_boot: int, seed: int) -> tuple[float, float]:
     """Percentile bootstrap 95 % CI on the mean of ``values``.
 
@@ -84,9 +126,35 @@ def score_at_thresholds(
     :return: One row per threshold with columns ``threshold``, ``dice``, ``iou``,
         ``dice_lo``, ``dice_hi`` (Dice/IoU are per-image means).
     """
+    thresholds = list(thresholds)
+    tp, fp, fn = per_image_counts(probs, masks, thresholds)
+    return score_counts(tp, fp, fn, thresholds, n_boot=n_boot, seed=seed)
+
+
+def score_counts(
+    tp: torch.Tensor,
+    fp: torch.Tensor,
+    fn: torch.Tensor,
+    thresholds: Iterable[float],
+    *,
+    n_boot: int = 1000,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Score per-image TP/FP/FN counts, as :func:`score_at_thresholds` scores probabilities.
+
+    :param tp: True-positive counts ``[N, T]`` (e.g. from :func:`collect_counts`).
+    :param fp: False-positive counts ``[N, T]``.
+    :param fn: False-negative counts ``[N, T]``.
+    :param thresholds: The T thresholds the count columns were taken at.
+    :param n_boot: Bootstrap resamples for the CI.
+    :param seed: Bootstrap RNG seed.
+    :return: One row per threshold with columns ``threshold``, ``dice``, ``iou``,
+        ``dice_lo``, ``dice_hi`` (Dice/IoU are per-image means).
+    """
+    dice, iou = dice_iou_from_counts(tp, fp, fn)
     rows = []
-    for thr in thresholds:
-        d, i = per_image_dice_iou(probs, masks, float(thr))
+    for j, thr in enumerate(thresholds):
+        d, i = dice[:, j], iou[:, j]
         lo, hi = bootstrap_ci(d, n_boot, max(seed, 0))
         rows.append({
             "threshold": float(thr),
@@ -99,7 +167,7 @@ def score_at_thresholds(
 
 
 # ----------------------------- model / inference ----------------------------- #
-def load_uncompiled(cfg: Any, ckpt: str | Path) -> torch.nn.Module:
+def load_uncompiled(cfg: Any, ckpt: str | Path) -> LightningModel:
     """Build the model **uncompiled** and load weights from a checkpoint.
 
     Forces ``use_torch_compile = False`` (so no torch.compile / inductor / nvcc is
@@ -108,7 +176,7 @@ def load_uncompiled(cfg: Any, ckpt: str | Path) -> torch.nn.Module:
 
     :param cfg: Experiment config (mutated in place to disable compilation).
     :param ckpt: Path to the ``.ckpt`` file.
-    :return: The eval-ready :class:`torch.nn.Module` with weights loaded ``strict``.
+    :return: The eval-ready LightningModel with weights loaded ``strict``.
     """
     from SkiNet.ML.model.lightning_model import build_lightning_model  # lazy: heavy import
 
@@ -121,29 +189,95 @@ def load_uncompiled(cfg: Any, ckpt: str | Path) -> torch.nn.Module:
     return model
 
 
+def _iter_probs(model: LightningModel, loader: Any, device: torch.device
+                ) -> Iterator[tuple[torch.Tensor, torch.Tensor]]:
+    """Yield the ``[B, P]`` sigmoid probabilities and masks of every batch, on ``device``.
+
+    Batches are prepared by the model's own ``on_after_batch_transfer`` (batched
+    augmentation, channels-last), exactly as in validation and testing.
+    """
+    model.eval().to(device)
+    for batch in loader:
+        batch = {k: v.to(device) if isinstance(v, torch.Tensor) else v for k, v in batch.items()}
+        batch = model.on_after_batch_transfer(batch, 0)
+        probs = torch.sigmoid(model(batch["image"]))
+        n = probs.shape[0]
+        yield probs.reshape(n, -1), batch["mask"].reshape(n, -1)
+
+
 @torch.no_grad()
-def collect_probs(model: torch.nn.Module, loader: Any, device: torch.device
+def collect_probs(model: LightningModel, loader: Any, device: torch.device
                   ) -> tuple[torch.Tensor, torch.Tensor]:
     """Run inference once over a loader, returning per-image probabilities + masks.
 
-    :param model: Model to evaluate (set to ``eval`` and moved to ``device``).
+    :param model: LightningModel to evaluate (set to ``eval`` and moved to ``device``),
+        e.g. from :func:`load_uncompiled`; not the bare backbone.
     :param loader: Dataloader yielding ``{"image", "mask"}`` batches.
     :param device: Inference device.
     :return: ``(probs, masks)`` each ``[N, P]`` on CPU — sigmoid probabilities and
         binarised masks, flattened per image.
     """
-    model.eval().to(device)
     ps, ms = [], []
-    for batch in loader:
-        x = batch["image"].to(device)
-        m = batch["mask"].to(device)
-        probs = torch.sigmoid(model(x))
-        n = probs.shape[0]
-        ps.append(probs.reshape(n, -1).cpu())
-        ms.append((m.reshape(n, -1) >= 0.5).float().cpu())
+    for probs, m in _iter_probs(model, loader, device):
+        ps.append(probs.cpu())
+        ms.append((m >= 0.5).float().cpu())
     return torch.cat(ps), torch.cat(ms)
 
 
+@torch.no_grad()
+def collect_counts(model: LightningModel, loader: Any, device: torch.device,
+                   thresholds: Iterable[float]
+                   ) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Run inference once over a loader, keeping only per-image TP/FP/FN counts.
+
+    Streaming counterpart of :func:`collect_probs`: every batch is reduced to its
+    counts on ``device`` and its probabilities are dropped, so memory is ``[N, T]``
+    integers instead of ``[N, P]`` floats. Feed the result to :func:`score_counts`.
+
+    :param model: LightningModel to evaluate (set to ``eval`` and moved to ``device``),
+        e.g. from :func:`load_uncompiled`; not the bare backbone.
+    :param loader: Dataloader yielding ``{"image", "mask"}`` batches.
+    :param device: Inference device.
+    :param thresholds: Decision thresholds, T of them.
+    :return: ``(tp, fp, fn)``, each a ``torch.long`` tensor ``[N, T]`` on CPU.
+    """
+    thresholds = list(thresholds)
+    tps, fps, fns = [], [], []
+    for probs, m in _iter_probs(model, loader, device):
+        tp, fp, fn = per_image_counts(probs, m, thresholds)
+        tps.append(tp.cpu())
+        fps.append(fp.cpu())
+        fns.append(fn.cpu())
+    return torch.cat(tps), torch.cat(fps), torch.cat(fns)
+
+
+def score_model(
+    model: LightningModel,
+    loader: Any,
+    device: torch.device,
+    thresholds: Iterable[float],
+    *,
+    n_boot: int = 1000,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """Score a model on a loader at each threshold without retaining its probabilities.
+
+    Same result as ``score_at_thresholds(*collect_probs(model, loader, device), ...)``
+    in the memory of :func:`collect_counts`; call it per checkpoint to score many.
+
+    :param model: LightningModel to evaluate (e.g. from :func:`load_uncompiled`).
+    :param loader: Dataloader yielding ``{"image", "mask"}`` batches.
+    :param device: Inference device.
+    :param thresholds: Decision thresholds to evaluate.
+    :param n_boot: Bootstrap resamples for the CI.
+    :param seed: Bootstrap RNG seed.
+    :return: See :func:`score_counts`.
+    """
+    thresholds = list(thresholds)
+    tp, fp, fn = collect_counts(model, loader, device, thresholds)
+    return score_counts(tp, fp, fn, thresholds, n_boot=n_boot, seed=seed)
+
+
 # ----------------------------- checkpoint discovery -------------------------- #
 def build_ckpt_map(
     *dbs: Path | str,
@@ -2,6 +2,10 @@
 SAMPLEID_HEADER: str = "sampleid"
 DATAPATH_HEADER: str = "datapath"
 DATATYPE_HEADER: str = "datatype"
+# Prefix of the columns holding the paths of pre-resized variants, followed by their shorter side
+RESIZED_DATAPATH_PREFIX: str = "datapath_minside_"
+# Directory below the data root holding the pre-resized variants; never part of a dataset's own files
+RESIZED_DIR: str = "resized"
 
 # Data types for segmentation
 DATATYPE_IMAGE: str = "image"
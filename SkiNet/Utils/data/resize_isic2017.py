@@ -11,6 +11,8 @@ Example usage:
     export RESIZE_WORKERS=8
     python resize_isic2017.py
 
+To train on native-resolution data at any crop size, download the originals instead and write
+crop-sized variants with ``python -m SkiNet.ML.datasets.preprocessing.resize_variants``.
 """
 
 import os
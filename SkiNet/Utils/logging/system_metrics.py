@@ -1,4 +1,4 @@
-from typing import Any
+from typing import Any, Callable
 import logging
 import lightning as L
 import math
@@ -25,6 +25,10 @@ class SystemMetricsThreadCallback(L.Callback):
 
     Note that the native MLflow logging of system metrics is not supported by the MLFlowLogger itself.
 
+    Datasets of the train and val dataloaders that provide ``ram_cache_stats()`` (a lazily filled, bounded
+    RAM cache, see SegmentationDataset) are picked up when training and validation start; their hit rate and
+    resident size are logged as ``system/{split}_cache_hit_rate`` and ``system/{split}_cache_resident_mb``.
+
     Note: all metric snapshots flushed at a given hook point are assigned the same global_step value,
     regardless of when they were actually collected within the interval. This means that if a validation
     epoch takes 30s and `interval_sec=5`, ~6 snapshots will all be logged at the same step, and the
@@ -46,6 +50,8 @@ class SystemMetricsThreadCallback(L.Callback):
         self._thread: threading.Thread | None = None
         # bounded queue to avoid memory growth
         self._metrics_queue: queue.Queue[dict[str, float]] = queue.Queue(maxsize=max_queue_size)
+        # split name -> ram_cache_stats of its dataset; replaced, never mutated, as the thread reads it
+        self._cache_sources: dict[str, Callable[[], dict[str, float] | None]] = {}
 
     def __getstate__(self) -> dict:
         # threading.Event and queue.Queue hold _thread.lock objects that cannot be pickled
@@ -55,6 +61,7 @@ class SystemMetricsThreadCallback(L.Callback):
         state.pop("_stop_event", None)
         state.pop("_thread", None)
         state.pop("_metrics_queue", None)
+        state["_cache_sources"] = {}
         return state
 
     def __setstate__(self, state: dict) -> None:
@@ -88,8 +95,27 @@ class SystemMetricsThreadCallback(L.Callback):
             except ModuleNotFoundError:
                 # nvidia-ml-py (pynvml) not installed — skip GPU utilisation metric
                 pass
+        for split, cache_stats in self._cache_sources.items():
+            stats = cache_stats()
+            if stats is not None:
+                m[f"system/{split}_cache_hit_rate"] = stats["hit_rate"]
+                m[f"system/{split}_cache_resident_mb"] = stats["resident_mb"]
         return m
 
+    def _register_cache_sources(self, trainer: L.Trainer) -> None:
+        """
+        Collect ``ram_cache_stats`` of the datasets behind the trainer's train and val dataloaders.
+        """
+        sources = dict(self._cache_sources)
+        for split, loaders in (("train", getattr(trainer, "train_dataloader", None)),
+                               ("val", getattr(trainer, "val_dataloaders", None))):
+            loaders = loaders if isinstance(loaders, (list, tuple)) else [loaders]
+            for i, loader in enumerate(loaders):
+                cache_stats = getattr(getattr(loader, "dataset", None), "ram_cache_stats", None)
+                if callable(cache_stats):
+                    sources[split if i == 0 else f"{split}{i}"] = cache_stats
+        self._cache_sources = sources
+
     @staticmethod
     def _sanitize_metrics(metrics: dict[str, float]) -> dict[str, float]:
         """
@@ -182,6 +208,18 @@ class SystemMetricsThreadCallback(L.Callback):
         self._thread = threading.Thread(target=self._run, daemon=True)
         self._thread.start()
 
+    def on_train_start(self, trainer: L.Trainer, pl_module: L.LightningModule) -> None:
+        """
+        This is a Lightning hook called when training starts, once the train dataloader is available.
+        """
+        self._register_cache_sources(trainer)
+
+    def on_validation_start(self, trainer: L.Trainer, pl_module: L.LightningModule) -> None:
+        """
+        This is a Lightning hook called when validation starts, once the val dataloaders are available.
+        """
+        self._register_cache_sources(trainer)
+
     def on_train_batch_end(self, trainer: L.Trainer, pl_module: L.LightningModule, outputs: Any, batch: Any, batch_idx: int) -> None:
         """
         This is a Lightning hook called at the end of each training batch,
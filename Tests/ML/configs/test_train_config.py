@@ -1,4 +1,5 @@
 import os
+from unittest.mock import patch
 from typing import cast, Dict, Any, Literal
 import pytest
 from pydantic import ValidationError
@@ -33,7 +34,11 @@ def test_train_config_defaults_are_valid() -> None:
     assert cfg.devices == "auto"
     assert cfg.strategy == "auto"
     assert cfg.precision is not None  # auto-resolved from accelerator at construction time
+    assert cfg.cpu_bf16 is False
+    assert cfg.channels_last is False
     assert cfg.log_every_n_steps == 1
+    assert cfg.metric_sync == "step"
+    assert cfg.metric_sync_interval == 50
     assert cfg.check_val_every_n_epoch == 1
     assert cfg.num_sanity_val_steps == 0
     assert cfg.system_metrics_interval_sec == 5.0
@@ -296,6 +301,24 @@ def test_train_config_cache_in_ram_accepts_bool(value: bool) -> None:
     assert cfg.cache_in_ram is value
 
 
+@pytest.mark.parametrize("backend", ["dict", "shared_memory", "memmap"])
+def test_train_config_cache_backend_accepts_supported_values(backend: str) -> None:
+    """cache_backend should accept every supported backend and default to 'dict'."""
+    assert TrainConfig().cache_backend == "dict"
+    cfg = TrainConfig(cache_backend=backend)  # type: ignore[arg-type]
+    assert cfg.cache_backend == backend
+
+
+def test_train_config_cache_backend_rejects_unknown_value() -> None:
+    with pytest.raises(ValidationError, match="cache_backend"):
+        TrainConfig(cache_backend="lmdb")  # type: ignore[arg-type]
+
+
+def test_train_config_decoded_cache_dir_defaults_to_none() -> None:
+    assert TrainConfig().decoded_cache_dir is None
+    assert TrainConfig(decoded_cache_dir="/tmp/decoded").decoded_cache_dir == "/tmp/decoded"
+
+
 # ------ Test use_lr_scheduler ------
 
 
@@ -375,6 +398,21 @@ def test_explicit_precision_is_not_overridden() -> None:
     assert cfg.precision == "32-true"
 
 
+@pytest.mark.parametrize(("bf16_supported", "expected_precision"), [(True, "bf16-mixed"), (False, "32-true")])
+def test_cpu_bf16_resolves_precision_from_cpu_support(bf16_supported: bool, expected_precision: str) -> None:
+    """
+    With cpu_bf16=True on CPU, precision is 'bf16-mixed' only where the CPU has native bfloat16.
+    """
+    with patch("SkiNet.ML.configs.train_configs.train_config.cpu_supports_bf16", return_value=bf16_supported):
+        cfg = TrainConfig(accelerator="cpu", cpu_bf16=True)
+    assert cfg.precision == expected_precision
+
+
+def test_cpu_bf16_does_not_override_gpu_or_explicit_precision() -> None:
+    assert TrainConfig(accelerator="gpu", cpu_bf16=True).precision == "16-mixed"
+    assert TrainConfig(accelerator="cpu", cpu_bf16=True, precision="32-true").precision == "32-true"
+
+
 def test_precision_auto_set_from_auto_accelerator_is_not_none() -> None:
     """
     accelerator='auto' should resolve to a non-None precision on any machine
@@ -512,3 +550,10 @@ def test_train_config_cosine_annealing_config_rejects_negative_eta_min() -> None
     """eta_min must be >= 0; negative values should raise ValidationError."""
     with pytest.raises(ValidationError, match="eta_min"):
         TrainConfig(cosine_annealing_config={"eta_min": -1e-6})  # type: ignore[arg-type]
+
+
+def test_metric_sync_rejects_unknown_policy_and_empty_interval() -> None:
+    with pytest.raises(ValidationError, match="metric_sync"):
+        TrainConfig(metric_sync="batch")  # type: ignore[arg-type]
+    with pytest.raises(ValidationError, match="metric_sync_interval"):
+        TrainConfig(metric_sync="interval", metric_sync_interval=0)
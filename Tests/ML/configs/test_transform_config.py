@@ -1,3 +1,5 @@
+from typing import Any
+
 import pytest
 
 from SkiNet.ML.configs.transform_configs.augment_config import PhotoAugmentConfig, SpatialAugmentConfig
@@ -147,3 +149,14 @@ def test_transform_config_accepts_compose_overrides() -> None:
 
     assert config.seed_value == 17
     assert config.compose_kwargs == {"save_applied_params": True, "strict": True}
+
+
+@pytest.mark.parametrize("spatial_kwargs", [{"perspective_apply": True}, {"elastic_apply": True}])
+def test_transform_config_rejects_unsupported_batched_augmentations(spatial_kwargs: dict[str, Any]) -> None:
+    """
+    The batched augmentation backend has no perspective or elastic transform, so enabling them must fail early.
+    """
+    with pytest.raises(ValueError, match="augmentation_backend='batched' does not support"):
+        TransformConfig(augmentation_backend="batched", spatial_augmentation=SpatialAugmentConfig(**spatial_kwargs))
+
+    assert TransformConfig(spatial_augmentation=SpatialAugmentConfig(**spatial_kwargs)).augmentation_backend == "albumentations"
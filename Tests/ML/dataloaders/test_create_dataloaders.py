@@ -5,6 +5,7 @@ from unittest.mock import MagicMock
 
 from SkiNet.ML.configs.train_configs.train_config import TrainConfig
 from SkiNet.ML.dataloaders.create_dataloaders import create_dataloaders_from_datasets
+from SkiNet.ML.dataloaders.samplers import ChunkShuffleSampler
 from SkiNet.ML.datasets.dataset_factory import DatasetSplit
 
 
@@ -106,6 +107,29 @@ def test_create_dataloaders_train_shuffles_val_test_do_not(monkeypatch: pytest.M
     assert created[2]["shuffle"] is False  # test
 
 
+def test_create_dataloaders_chunked_shuffle_uses_chunk_sampler_for_train(monkeypatch: pytest.MonkeyPatch) -> None:
+    """shuffle_mode='chunked' replaces shuffle=True of the train loader by a ChunkShuffleSampler."""
+    datasets = _make_dataset_split()
+    cfg = _make_train_cfg(shuffle_mode="chunked", shuffle_chunk_size=16, shuffle_buffer_chunks=2, seed=7)
+    created: list[dict[str, Any]] = []
+
+    class FakeRepeatDataLoader:
+        def __init__(self, dataset: Any, **kw: Any) -> None:
+            created.append(kw)
+
+    monkeypatch.setattr(
+        "SkiNet.ML.dataloaders.create_dataloaders.RepeatDataLoader", FakeRepeatDataLoader
+    )
+
+    create_dataloaders_from_datasets(datasets, cfg)
+
+    sampler = created[0]["sampler"]
+    assert created[0]["shuffle"] is False
+    assert isinstance(sampler, ChunkShuffleSampler)
+    assert (sampler.chunk_size, sampler.buffer_chunks, sampler.seed) == (16, 2, 7)
+    assert "sampler" not in created[1] and "sampler" not in created[2]
+
+
 @pytest.mark.parametrize(("num_workers", "prefetch_factor_in", "expected_prefetch"), [
     (0, None, None),  # already None, validator keeps it None
     (0, 4, None),  # validator forces to None when num_workers=0
@@ -1,13 +1,20 @@
 """Unit tests for SkiNet.ML.dataloaders.dataloaders"""
 import random
+from typing import Any
 from unittest.mock import MagicMock, patch
 
 import numpy as np
 import pytest
 import torch
-from torch.utils.data import TensorDataset
+from torch.utils.data import DataLoader, Dataset, TensorDataset
 
-from SkiNet.ML.dataloaders.dataloaders import RepeatDataLoader, default_worker_init_fn
+from SkiNet.ML.dataloaders.dataloaders import (
+    RepeatDataLoader,
+    collate_into_buffers,
+    collate_padded_preserving_specs,
+    collate_preserving_specs,
+    default_worker_init_fn,
+)
 
 DATASET = TensorDataset(torch.arange(10))
 
@@ -72,3 +79,79 @@ def test_worker_init_seeds_rng_deterministically() -> None:
 
     assert np_state_a == np_state_b
     assert rng_state_a == rng_state_b
+
+
+def test_collate_padded_preserving_specs_pads_to_largest_sample() -> None:
+    """
+    Samples of different sizes are zero-padded to the largest height and width; the original sizes and
+    the specs are kept.
+    """
+    batch = [{"image": torch.full((3, 4, 6), 7, dtype=torch.uint8), "mask": torch.ones((1, 4, 6), dtype=torch.uint8),
+              "specs": {"sample_id": "a"}},
+             {"image": torch.full((3, 5, 2), 9, dtype=torch.uint8), "mask": torch.ones((1, 5, 2), dtype=torch.uint8),
+              "specs": {"sample_id": "b"}}]
+
+    out = collate_padded_preserving_specs(batch)
+
+    assert out["image"].shape == (2, 3, 5, 6)
+    assert out["mask"].shape == (2, 1, 5, 6)
+    assert out["image"].dtype == torch.uint8
+    assert out["image_size"].tolist() == [[4, 6], [5, 2]]
+    assert out["specs"] == [{"sample_id": "a"}, {"sample_id": "b"}]
+    assert torch.all(out["image"][0, :, :4, :6] == 7) and torch.all(out["image"][0, :, 4:] == 0)
+    assert torch.all(out["image"][1, :, :5, :2] == 9) and torch.all(out["image"][1, :, :, 2:] == 0)
+    assert int(out["mask"].sum()) == 4 * 6 + 5 * 2
+
+
+def _segmentation_items(n: int, with_specs: bool) -> list[dict[str, Any]]:
+    g = torch.Generator().manual_seed(0)
+    items: list[dict[str, Any]] = []
+    for i in range(n):
+        item: dict[str, Any] = {"image": torch.rand((3, 4, 5), generator=g),
+                                "mask": torch.randint(0, 2, (1, 4, 5), generator=g, dtype=torch.uint8)}
+        item.update({"specs": {"sample_id": f"s{i}"}} if with_specs else {"index": i})
+        items.append(item)
+    return items
+
+
+class _ItemDataset(Dataset):
+    def __init__(self, items: list[dict[str, Any]]) -> None:
+        self.items = items
+
+    def __getitem__(self, index: int) -> dict[str, Any]:
+        return self.items[index]
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+@pytest.mark.parametrize("with_specs", [True, False])
+def test_collate_into_buffers_matches_default_collate(with_specs: bool) -> None:
+    batch = _segmentation_items(3, with_specs)
+
+    fast = collate_into_buffers(batch)
+    reference = collate_preserving_specs(batch)
+
+    assert torch.equal(fast["image"], reference["image"])
+    assert torch.equal(fast["mask"], reference["mask"])
+    assert fast["mask"].dtype == torch.uint8
+    if with_specs:
+        assert fast["specs"] == reference["specs"]
+        assert "index" not in fast
+    else:
+        assert fast["index"].dtype == torch.long
+        assert fast["index"].tolist() == [0, 1, 2]
+        assert "specs" not in fast
+
+
+def test_collate_into_buffers_in_workers_allocates_shared_batches() -> None:
+    """
+    In worker processes batches are written into shared memory, so they reach the main process intact.
+    """
+    items = _segmentation_items(6, with_specs=False)
+    loader = DataLoader(_ItemDataset(items), batch_size=4, num_workers=2, collate_fn=collate_into_buffers)
+
+    batches = list(loader)
+
+    assert [b["index"].tolist() for b in batches] == [[0, 1, 2, 3], [4, 5]]
+    assert torch.equal(torch.cat([b["image"] for b in batches]), torch.stack([item["image"] for item in items]))
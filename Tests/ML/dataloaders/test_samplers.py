@@ -0,0 +1,68 @@
+"""Unit tests for SkiNet.ML.dataloaders.samplers"""
+from collections.abc import Iterable
+
+import pytest
+
+from SkiNet.ML.dataloaders.samplers import ChunkShuffleSampler, PrefetchOrderSampler
+
+
+@pytest.mark.parametrize(("n", "chunk_size", "buffer_chunks"), [(100, 8, 3), (7, 16, 4), (64, 1, 1), (0, 4, 2)])
+def test_chunk_shuffle_sampler_yields_every_index_once(n: int, chunk_size: int, buffer_chunks: int) -> None:
+    sampler = ChunkShuffleSampler(range(n), chunk_size=chunk_size, buffer_chunks=buffer_chunks)
+
+    indices = list(sampler)
+
+    assert sorted(indices) == list(range(n))
+    assert len(sampler) == n
+
+
+def test_chunk_shuffle_sampler_buffers_touch_few_chunks() -> None:
+    """
+    Every window of chunk_size * buffer_chunks consecutive yielded indices comes from at most
+    buffer_chunks chunks, i.e. reads stay within a few contiguous regions.
+    """
+    chunk_size, buffer_chunks = 10, 4
+    sampler = ChunkShuffleSampler(range(1000), chunk_size=chunk_size, buffer_chunks=buffer_chunks, seed=3)
+
+    indices = list(sampler)
+
+    window = chunk_size * buffer_chunks
+    for start in range(0, len(indices), window):
+        assert len({i // chunk_size for i in indices[start:start + window]}) == buffer_chunks
+    assert indices != sorted(indices)
+
+
+def test_chunk_shuffle_sampler_is_seeded_per_epoch() -> None:
+    sampler = ChunkShuffleSampler(range(200), chunk_size=8, buffer_chunks=2, seed=5)
+    other = ChunkShuffleSampler(range(200), chunk_size=8, buffer_chunks=2, seed=5)
+
+    first_epoch = list(sampler)
+    second_epoch = list(sampler)
+    other.set_epoch(1)
+
+    assert first_epoch != second_epoch
+    assert list(other) == second_epoch
+
+
+def test_chunk_shuffle_sampler_rejects_non_positive_sizes() -> None:
+    with pytest.raises(ValueError, match="must be positive"):
+        ChunkShuffleSampler(range(10), chunk_size=0)
+
+
+def test_prefetch_order_sampler_announces_the_epoch_order() -> None:
+    class Dataset:
+        orders: list[list[int]] = []
+
+        def set_prefetch_order(self, indices: Iterable[int]) -> None:
+            self.orders.append(list(indices))
+
+    dataset = Dataset()
+    sampler = PrefetchOrderSampler(ChunkShuffleSampler(range(50), chunk_size=4, buffer_chunks=2), dataset)
+
+    first = list(sampler)
+    sampler.set_epoch(0)
+    again = list(sampler)
+
+    assert dataset.orders == [first, again]
+    assert first == again
+    assert len(sampler) == 50
@@ -0,0 +1,43 @@
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+import pytest
+from PIL import Image
+
+from SkiNet.ML.datasets.sample_specs import SampleSpecs
+from SkiNet.Utils.csv_headers import DATAPATH_HEADER, DATATYPE_HEADER, DATATYPE_IMAGE, DATATYPE_MASK, SAMPLEID_HEADER
+
+DatasetWriter = Callable[..., tuple[dict[str, SampleSpecs], pd.DataFrame]]
+
+
+def _write_dataset(data_root: Path, sizes: list[tuple[int, int]],
+                   image_suffix: str = ".png") -> tuple[dict[str, SampleSpecs], pd.DataFrame]:
+    """
+    Write random RGB images and binary grayscale PNG masks of the given (height, width) sizes.
+
+    :param data_root: Directory the images/ and masks/ folders are written to.
+    :param sizes: (height, width) of every sample, in order; sample i is ``sample-i``.
+    :param image_suffix: Image file suffix, ``.png`` or a lossy format such as ``.jpg``.
+    :return: Specs by sample id and the matching metadata dataframe, with one image and one mask row per sample.
+    """
+    rng = np.random.default_rng(0)
+    (data_root / "images").mkdir(parents=True, exist_ok=True)
+    (data_root / "masks").mkdir(parents=True, exist_ok=True)
+    specs: dict[str, SampleSpecs] = {}
+    rows = []
+    for i, (h, w) in enumerate(sizes):
+        sid, image_rel, mask_rel = f"sample-{i}", f"images/img{i}{image_suffix}", f"masks/mask{i}.png"
+        Image.fromarray(rng.integers(0, 256, (h, w, 3), dtype=np.uint8)).save(data_root / image_rel)
+        Image.fromarray(rng.integers(0, 2, (h, w), dtype=np.uint8) * 255).save(data_root / mask_rel)
+        specs[sid] = SampleSpecs(sample_id=sid, image_path=image_rel, mask_path=mask_rel)
+        rows.append({SAMPLEID_HEADER: sid, DATATYPE_HEADER: DATATYPE_IMAGE, DATAPATH_HEADER: image_rel})
+        rows.append({SAMPLEID_HEADER: sid, DATATYPE_HEADER: DATATYPE_MASK, DATAPATH_HEADER: mask_rel})
+    return specs, pd.DataFrame(rows)
+
+
+@pytest.fixture
+def write_dataset() -> DatasetWriter:
+    """Factory writing a small on-disk dataset of random images and masks; see :func:`_write_dataset`."""
+    return _write_dataset
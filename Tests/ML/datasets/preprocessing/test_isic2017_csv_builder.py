@@ -1,5 +1,6 @@
 import argparse
 from pathlib import Path
+from typing import Optional
 
 import pandas as pd
 import pytest
@@ -56,6 +57,21 @@ class _StubISIC2017Builder(ISIC2017BaseCSVBuilder):
     def create_metadata_csv(self) -> None:
         pass
 
+    def list_directory(self, directory: str) -> tuple[dict[str, list[object]], list[str]]:
+        raise NotImplementedError
+
+    def directory_stamp(self, directory: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def full_path(self, rel_path: str) -> str:
+        raise NotImplementedError
+
+    def read_file_in_data_root(self, name: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def write_file_in_data_root(self, name: str, content: bytes) -> None:
+        raise NotImplementedError
+
 
 # -----------------------------------------------------------------------
 # sampleid_func
@@ -191,3 +207,86 @@ def test_create_merged_isic2017_metadata_csv_written(tmp_path: Path) -> None:
 def test_output_csv_name() -> None:
     builder = _StubISIC2017Builder()
     assert builder.output_csv_name == ISIC2017_CSV_NAME
+
+
+# -----------------------------------------------------------------------
+# incremental builds
+# -----------------------------------------------------------------------
+
+def _add_sample(tmp_path: Path, sample_id: str, subdir: str = "subdir") -> None:
+    for folder, name in [("ISIC-2017_Training_Data", f"{sample_id}.jpg"),
+                         ("ISIC-2017_Training_Part1_GroundTruth", f"{sample_id}_segmentation.png")]:
+        (tmp_path / folder / subdir).mkdir(exist_ok=True)
+        (tmp_path / folder / subdir / name).write_text("data")
+
+
+def _incremental_builder(tmp_path: Path) -> ISIC2017LocalCSVBuilder:
+    return ISIC2017LocalCSVBuilder(argparse.Namespace(local_data_root=str(tmp_path)), incremental=True)
+
+
+def test_incremental_build_matches_full_build(tmp_path: Path) -> None:
+    _make_isic2017_dirs(tmp_path)
+    _add_sample(tmp_path, "ISIC_0000002")
+    _make_gt_csvs(tmp_path, [{"image_id": "ISIC_0000001", ISIC2017_MELANOMA_HEADER: 1, ISIC2017_SEBORRHEIC_KERATOSIS_HEADER: 0}])
+
+    full = ISIC2017LocalCSVBuilder(argparse.Namespace(local_data_root=str(tmp_path))).create_merged_isic2017_metadata()
+    _incremental_builder(tmp_path).create_metadata_csv()
+
+    written = pd.read_csv(tmp_path / ISIC2017_CSV_NAME)
+    pd.testing.assert_frame_equal(written, full, check_dtype=False)
+    assert (tmp_path / "isic2017_metadata_manifest.json").is_file()
+
+
+def test_incremental_build_relists_only_changed_directories_and_keeps_extra_columns(tmp_path: Path) -> None:
+    _make_isic2017_dirs(tmp_path)
+    _make_gt_csvs(tmp_path, [{"image_id": "ISIC_0000001", ISIC2017_MELANOMA_HEADER: 1, ISIC2017_SEBORRHEIC_KERATOSIS_HEADER: 0}])
+    _incremental_builder(tmp_path).create_metadata_csv()
+    csv_path = tmp_path / ISIC2017_CSV_NAME
+    pd.read_csv(csv_path).assign(extra=lambda df: "kept/" + df[DATAPATH_HEADER]).to_csv(csv_path, index=False)
+
+    # a new subdirectory changes its parents' listings, but not the directories of sample 1
+    _add_sample(tmp_path, "ISIC_0000002", subdir="subdir2")
+    builder = _incremental_builder(tmp_path)
+    listed: list[str] = []
+    list_directory = builder.list_directory
+
+    def spy(directory: str) -> tuple[dict[str, list[object]], list[str]]:
+        listed.append(directory)
+        return list_directory(directory)
+
+    builder.list_directory = spy  # type: ignore[method-assign]
+    builder.create_metadata_csv()
+
+    assert sorted(listed) == ["", "ISIC-2017_Training_Data", "ISIC-2017_Training_Data/subdir2",
+                              "ISIC-2017_Training_Part1_GroundTruth", "ISIC-2017_Training_Part1_GroundTruth/subdir2"]
+    df = pd.read_csv(csv_path)
+    assert set(df[SAMPLEID_HEADER]) == {"ISIC_0000001", "ISIC_0000002"}
+    assert df.loc[df[SAMPLEID_HEADER] == "ISIC_0000001", "extra"].str.startswith("kept/").all()
+    assert df.loc[df[SAMPLEID_HEADER] == "ISIC_0000002", "extra"].isna().all()
+    assert (df.loc[df[SAMPLEID_HEADER] == "ISIC_0000001", ISIC2017_MELANOMA_HEADER] == 1).all()
+
+
+def test_incremental_build_drops_samples_whose_files_were_removed(tmp_path: Path) -> None:
+    _, mask = _make_isic2017_dirs(tmp_path)
+    _add_sample(tmp_path, "ISIC_0000002")
+    _make_gt_csvs(tmp_path, [{"image_id": "ISIC_0000001", ISIC2017_MELANOMA_HEADER: 0, ISIC2017_SEBORRHEIC_KERATOSIS_HEADER: 0}])
+    _incremental_builder(tmp_path).create_metadata_csv()
+
+    mask.unlink()
+    _incremental_builder(tmp_path).create_metadata_csv()
+
+    assert set(pd.read_csv(tmp_path / ISIC2017_CSV_NAME)[SAMPLEID_HEADER]) == {"ISIC_0000002"}
+
+
+def test_incremental_builder_can_be_reused(tmp_path: Path) -> None:
+    _make_isic2017_dirs(tmp_path)
+    _make_gt_csvs(tmp_path, [{"image_id": "ISIC_0000001", ISIC2017_MELANOMA_HEADER: 0, ISIC2017_SEBORRHEIC_KERATOSIS_HEADER: 0}])
+    builder = _incremental_builder(tmp_path)
+    builder.create_metadata_csv()
+    # the state of a build does not outlive it
+    assert builder._manifest is None and builder._existing_metadata is None and builder._affected_sampleids is None
+
+    _add_sample(tmp_path, "ISIC_0000002")
+    builder.create_metadata_csv()
+
+    assert set(pd.read_csv(tmp_path / ISIC2017_CSV_NAME)[SAMPLEID_HEADER]) == {"ISIC_0000001", "ISIC_0000002"}
@@ -0,0 +1,82 @@
+import pytest
+
+from SkiNet.ML.datasets.preprocessing.listing_manifest import DirectoryListing, ListingManifest, glob_to_regex
+
+
+@pytest.mark.parametrize("pattern, path, expected", [
+    ("**/*_Dermoscopic_Image/*.png", "IMD002/IMD002_Dermoscopic_Image/IMD002.png", True),
+    ("**/*_Dermoscopic_Image/*.png", "IMD002/IMD002_lesion/IMD002_lesion.png", False),
+    ("ISIC-2017_*_Data/*/*.jpg", "ISIC-2017_Training_Data/sub/ISIC_0000000.jpg", True),
+    ("ISIC-2017_*_Data/*/*.jpg", "ISIC-2017_Training_Data/ISIC_0000000.jpg", False),
+    ("**_Data/**.jpg", "ISIC-2017_Training_Data/ISIC_0000000.jpg", True),
+    ("**_Part1_GroundTruth/**_segmentation.png", "ISIC-2017_Test_v2_Part1_GroundTruth/ISIC_0000000_segmentation.png", True),
+    ("**/*.jpg", "a.jpg", True),
+])
+def test_glob_to_regex(pattern: str, path: str, expected: bool) -> None:
+    assert bool(glob_to_regex(pattern).match(path)) is expected
+
+
+class _FakeTree:
+    """In-memory tree whose directory stamps are set explicitly; records the listed directories."""
+
+    def __init__(self) -> None:
+        self.dirs: dict[str, tuple[dict[str, list[object]], list[str]]] = {
+            "": ({}, ["a", "b"]),
+            "a": ({"1.jpg": [10, 1]}, []),
+            "b": ({"2.jpg": [20, 1]}, []),
+        }
+        self.stamps: dict[str, str | None] = {"": "0", "a": "0", "b": None}
+        self.listed: list[str] = []
+
+    def list_directory(self, directory: str) -> tuple[dict[str, list[object]], list[str]]:
+        self.listed.append(directory)
+        return self.dirs[directory]
+
+    def directory_stamp(self, directory: str) -> str | None:
+        return self.stamps[directory]
+
+
+def test_update_relists_only_directories_with_changed_or_missing_stamps() -> None:
+    tree = _FakeTree()
+    manifest = ListingManifest()
+    assert manifest.update(tree.list_directory, tree.directory_stamp) == {"", "a", "b"}
+    assert sorted(manifest.files()) == ["a/1.jpg", "b/2.jpg"]
+
+    tree.listed.clear()
+    assert manifest.update(tree.list_directory, tree.directory_stamp) == set()
+    assert tree.listed == ["b"]  # no stamp, listed again but unchanged
+
+    tree.dirs["a"] = ({"1.jpg": [10, 1], "3.jpg": [30, 2]}, [])
+    tree.stamps["a"] = "1"
+    tree.listed.clear()
+    assert manifest.update(tree.list_directory, tree.directory_stamp) == {"a"}
+    assert sorted(tree.listed) == ["a", "b"]
+
+
+def test_update_reports_removed_directories() -> None:
+    tree = _FakeTree()
+    manifest = ListingManifest()
+    manifest.update(tree.list_directory, tree.directory_stamp)
+
+    tree.dirs[""] = ({}, ["a"])
+    tree.stamps[""] = "1"
+    assert manifest.update(tree.list_directory, tree.directory_stamp) == {"b"}
+    assert "b" not in manifest.directories
+
+
+def test_update_skips_excluded_directories() -> None:
+    tree = _FakeTree()
+    manifest = ListingManifest()
+    manifest.update(tree.list_directory, tree.directory_stamp)
+
+    tree.listed.clear()
+    assert manifest.update(tree.list_directory, tree.directory_stamp, exclude=("b",)) == {"b"}
+    assert "b" not in tree.listed and "b" not in manifest.directories
+    assert sorted(manifest.files()) == ["a/1.jpg"]
+
+
+def test_json_round_trip_and_version_mismatch() -> None:
+    manifest = ListingManifest({"a": DirectoryListing("5", {"1.jpg": [10, 1]}, [])})
+    restored = ListingManifest.from_json(manifest.to_json())
+    assert restored.directories == manifest.directories
+    assert ListingManifest.from_json('{"version": 0, "directories": {}}').directories == {}
@@ -24,13 +24,13 @@ pytestmark = pytest.mark.skipif(
 @pytest.fixture
 def local_arg_ph2(tmp_path: pytest.TempPathFactory) -> argparse.Namespace:
     """Simulate argparse.Namespace for local"""
-    return argparse.Namespace(local_data_root=str(tmp_path), dataset_key_str="PH2", azure_data=False)
+    return argparse.Namespace(local_data_root=str(tmp_path), dataset_key_str="PH2", azure_data=False, incremental=False)
 
 
 @pytest.fixture
 def azure_arg_ph2() -> argparse.Namespace:
     """Simulate argparse.Namespace for Azure"""
-    return argparse.Namespace(local_data_root=None, dataset_key_str="PH2", azure_data=True)
+    return argparse.Namespace(local_data_root=None, dataset_key_str="PH2", azure_data=True, incremental=False)
 
 
 @pytest.mark.parametrize("factory_cls, builder_cls, arg_fixture", [
@@ -71,10 +71,10 @@ def test_main_local(monkeypatch: pytest.MonkeyPatch, local_arg_ph2: argparse.Nam
 
     # Patch the factory to return a dummy builder that does nothing when create_metadata_csv is called
     class DummyFactory:
-        def get_local_csv_builder(self, arg: argparse.Namespace) -> Any:
+        def get_local_csv_builder(self, arg: argparse.Namespace, incremental: bool = False) -> Any:
             return DummyBuilder()
 
-        def get_azure_csv_builder(self) -> Any:
+        def get_azure_csv_builder(self, incremental: bool = False) -> Any:
             return DummyBuilder()
 
     monkeypatch.setattr("SkiNet.ML.datasets.preprocessing.metadata_csv_factory.get_factory",
@@ -91,10 +91,10 @@ def test_main_azure(monkeypatch: pytest.MonkeyPatch, azure_arg_ph2: argparse.Nam
 
     # Patch the factory to return a dummy builder that does nothing when create_metadata_csv is called
     class DummyFactory:
-        def get_local_csv_builder(self, arg: argparse.Namespace) -> Any:
+        def get_local_csv_builder(self, arg: argparse.Namespace, incremental: bool = False) -> Any:
             return DummyBuilder()
 
-        def get_azure_csv_builder(self) -> Any:
+        def get_azure_csv_builder(self, incremental: bool = False) -> Any:
             return DummyBuilder()
 
     monkeypatch.setattr("SkiNet.ML.datasets.preprocessing.metadata_csv_factory.get_factory",
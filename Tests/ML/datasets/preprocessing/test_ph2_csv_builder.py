@@ -1,18 +1,24 @@
 import argparse
 from pathlib import Path
+from typing import Optional
 
+import cv2
+import numpy as np
 import pandas as pd
 import pytest
 
 from SkiNet.ML.datasets.preprocessing.ph2_csv_builder import PH2BaseCSVBuilder, PH2LocalCSVBuilder
+from SkiNet.ML.datasets.preprocessing.resize_variants import write_resized_variant
+from SkiNet.ML.utils.data_utils import filter_missing_images_and_masks
 from SkiNet.Utils.csv_headers import (DATAPATH_HEADER, DATATYPE_HEADER, PH2_COLORS_HEADER, PH2_COLORS_LIST_HEADER,
-                                      PH2_NAME_HEADER, SAMPLEID_HEADER)
-from SkiNet.Utils.project_paths import PH2_TXT_NAME
+                                      PH2_NAME_HEADER, RESIZED_DIR, SAMPLEID_HEADER)
+from SkiNet.Utils.project_paths import PH2_CSV_NAME, PH2_TXT_NAME
 
 # -------------- fixtures and dummy class ----------------
 
 class TestLocalPH2Base(PH2BaseCSVBuilder):
     def __init__(self) -> None:
+        super().__init__()
         self._local_data_root = "/dummy/local/root"
 
     @property
@@ -50,6 +56,21 @@ class TestLocalPH2Base(PH2BaseCSVBuilder):
     def sampleid_func(self, path: str) -> str:
         return super().sampleid_func(path)
 
+    def list_directory(self, directory: str) -> tuple[dict[str, list[object]], list[str]]:
+        raise NotImplementedError
+
+    def directory_stamp(self, directory: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def full_path(self, rel_path: str) -> str:
+        raise NotImplementedError
+
+    def read_file_in_data_root(self, name: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def write_file_in_data_root(self, name: str, content: bytes) -> None:
+        raise NotImplementedError
+
 
 @pytest.fixture
 def tmp_ph2_txt(tmp_path: Path) -> Path:
@@ -201,3 +222,40 @@ def test_merge_ph2_data_missing_or_empty_colors() -> None:
     assert PH2_COLORS_LIST_HEADER in merged.columns
     assert merged.loc[merged[SAMPLEID_HEADER] == "sample1", PH2_COLORS_LIST_HEADER].iloc[0] == []
     assert merged.loc[merged[SAMPLEID_HEADER] == "sample2", PH2_COLORS_LIST_HEADER].iloc[0] == []
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_rebuilt_csv_ignores_resized_variants(tmp_path: Path, tmp_ph2_txt: Path, incremental: bool,
+                                              monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Copies written by resize_variants below <data_root>/resized/ match the PH2 patterns, but must not be
+    recorded as samples when the CSV is rebuilt.
+    """
+    for sample, size in [("IMD002", (40, 60)), ("IMD003", (50, 50))]:
+        for folder, name in [(f"{sample}_Dermoscopic_Image", f"{sample}.png"), (f"{sample}_lesion", f"{sample}_lesion.png")]:
+            (tmp_path / sample / folder).mkdir(parents=True)
+            cv2.imwrite(str(tmp_path / sample / folder / name), np.zeros(size, dtype=np.uint8))
+
+    def build() -> pd.DataFrame:
+        PH2LocalCSVBuilder(argparse.Namespace(local_data_root=str(tmp_path)), incremental).create_metadata_csv()
+        return pd.read_csv(tmp_path / PH2_CSV_NAME)
+
+    original = build()
+    write_resized_variant(original, tmp_path, min_side=20, max_workers=1)
+    assert (tmp_path / RESIZED_DIR / "minside_20" / "IMD002" / "IMD002_Dermoscopic_Image" / "IMD002.png").is_file()
+    # pairing keeps one image per sample number, so also check that no copy is even considered
+    considered: list[str] = []
+
+    def pair(images: list[Path], masks: list[Path]) -> tuple[list[Path], list[Path]]:
+        considered.extend(str(path) for path in images + masks)
+        return filter_missing_images_and_masks(images, masks)
+
+    monkeypatch.setattr("SkiNet.ML.datasets.preprocessing.base_csv_builder.filter_missing_images_and_masks", pair)
+    rebuilt = build()
+
+    # an incremental rebuild re-pairs only samples in changed directories, here none
+    assert len(considered) == (0 if incremental else 4)
+    assert not any(f"/{RESIZED_DIR}/" in path for path in considered)
+    pd.testing.assert_frame_equal(rebuilt, original)
+    assert len(rebuilt) == 4
+    assert not rebuilt[DATAPATH_HEADER].str.startswith(f"{RESIZED_DIR}/").any()
@@ -0,0 +1,83 @@
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pandas as pd
+import pytest
+
+from SkiNet.ML.configs.transform_configs.crop_config import CropConfig
+from SkiNet.ML.datasets.preprocessing.resize_variants import (available_variants, required_min_side, resize_item,
+                                                              select_resized_variant, variant_column,
+                                                              write_resized_variant)
+from SkiNet.Utils.csv_headers import DATAPATH_HEADER, DATATYPE_HEADER, SAMPLEID_HEADER
+
+
+@pytest.fixture
+def data_root(tmp_path: Path) -> Path:
+    """Two samples of 300x400 and 100x120 pixels with binary masks."""
+    rng = np.random.default_rng(0)
+    for sample, (h, w) in [("s1", (300, 400)), ("s2", (100, 120))]:
+        (tmp_path / sample).mkdir()
+        cv2.imwrite(str(tmp_path / sample / "image.png"), rng.integers(0, 256, (h, w, 3), dtype=np.uint8))
+        cv2.imwrite(str(tmp_path / sample / "mask.png"), (rng.random((h, w)) > 0.5).astype(np.uint8) * 255)
+    return tmp_path
+
+
+@pytest.fixture
+def metadata() -> pd.DataFrame:
+    return pd.DataFrame({SAMPLEID_HEADER: ["s1", "s1", "s2", "s2"],
+                         DATAPATH_HEADER: ["s1/image.png", "s1/mask.png", "s2/image.png", "s2/mask.png"],
+                         DATATYPE_HEADER: ["image", "mask", "image", "mask"]})
+
+
+@pytest.mark.parametrize("crop, expected", [
+    (CropConfig(crop_apply=False), None),
+    (CropConfig(crop_type="center_crop", size=(256, 384)), 384),
+    (CropConfig(crop_type="random_resized_crop", size=(512, 512), scale=(0.25, 1.0)), 1024),
+])
+def test_required_min_side(crop: CropConfig, expected: int | None) -> None:
+    assert required_min_side(crop) == expected
+
+
+def test_resize_item_keeps_aspect_ratio_and_binary_masks(data_root: Path, tmp_path: Path) -> None:
+    resize_item(data_root / "s1" / "image.png", tmp_path / "out" / "image.png", 150, is_mask=False)
+    resize_item(data_root / "s1" / "mask.png", tmp_path / "out" / "mask.png", 150, is_mask=True)
+
+    image = cv2.imread(str(tmp_path / "out" / "image.png"), cv2.IMREAD_UNCHANGED)
+    mask = cv2.imread(str(tmp_path / "out" / "mask.png"), cv2.IMREAD_UNCHANGED)
+    assert image is not None and mask is not None
+    assert image.shape == (150, 200, 3)
+    assert mask.shape == (150, 200)
+    assert set(np.unique(mask)) <= {0, 255}
+
+
+def test_write_resized_variant_never_upscales_and_records_paths(data_root: Path, metadata: pd.DataFrame) -> None:
+    df = write_resized_variant(metadata, data_root, min_side=150, max_workers=2)
+
+    assert available_variants(df) == [150]
+    for path in df[variant_column(150)]:
+        assert (data_root / path).is_file()
+    small = cv2.imread(str(data_root / df[variant_column(150)][2]), cv2.IMREAD_UNCHANGED)
+    assert small is not None
+    assert small.shape[:2] == (100, 120)
+
+
+def test_write_resized_variant_skips_up_to_date_files(data_root: Path, metadata: pd.DataFrame,
+                                                      caplog: pytest.LogCaptureFixture) -> None:
+    write_resized_variant(metadata, data_root, min_side=150, max_workers=1)
+    with caplog.at_level("INFO"):
+        write_resized_variant(metadata, data_root, min_side=150, max_workers=1)
+    assert "Resizing 0 of 4 files" in caplog.text
+
+
+def test_select_resized_variant_picks_smallest_fitting_variant(metadata: pd.DataFrame) -> None:
+    df = metadata.assign(**{variant_column(256): [f"r256/{p}" for p in metadata[DATAPATH_HEADER]],
+                            variant_column(512): [f"r512/{p}" for p in metadata[DATAPATH_HEADER]]})
+    df.loc[3, variant_column(512)] = np.nan
+
+    selected = select_resized_variant(df, 300)
+
+    assert list(selected.columns) == list(metadata.columns)
+    assert list(selected[DATAPATH_HEADER]) == ["r512/s1/image.png", "r512/s1/mask.png", "r512/s2/image.png", "s2/mask.png"]
+    assert list(select_resized_variant(df, 1024)[DATAPATH_HEADER]) == list(metadata[DATAPATH_HEADER])
+    assert list(select_resized_variant(df, None)[DATAPATH_HEADER]) == list(metadata[DATAPATH_HEADER])
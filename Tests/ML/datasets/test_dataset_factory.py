@@ -15,6 +15,7 @@ from SkiNet.Utils.data.split_data import DataFrameSplits, SplitConfig
 from SkiNet.Utils.experiment_keys import ExperimentType
 from SkiNet.ML.utils.model_utils import MLWorkflowState
 from SkiNet.ML.configs.experiment_config import ExperimentConfig
+from SkiNet.ML.configs.transform_configs.crop_config import CropConfig
 
 
 class DummyDatasetConfig:
@@ -28,11 +29,15 @@ class DummyDatasetConfig:
         split_config: SplitConfig,
         data_root: Path,
         predefined_split_column: str | None = None,
+        shard_dir: str | None = None,
+        use_resized_variants: bool = False,
     ) -> None:
         self.metadata = metadata
         self.split_config = split_config
         self.data_root = data_root
         self.predefined_split_column = predefined_split_column
+        self.shard_dir = shard_dir
+        self.use_resized_variants = use_resized_variants
 
     def get_split_config(self) -> SplitConfig:
         # In a real implementation, this involves more complex logic to determine the split config,
@@ -68,7 +73,11 @@ def _make_config(
                 data_root=data_root,
                 predefined_split_column=predefined_split_column,
             ),
-            trainconfig=SimpleNamespace(cache_in_ram=cache_in_ram),
+            trainconfig=SimpleNamespace(cache_in_ram=cache_in_ram, cache_backend="dict", cache_dir=None,
+                                        decoded_cache_dir=None, precompute_eval_transforms=None,
+                                        fast_collate=False, cache_budget_mb=None, num_workers=0,
+                                        cache_warmup="threads", cache_warmup_workers=None),
+            transformconfig=SimpleNamespace(augmentation_backend="albumentations"),
         ),
     )
 
@@ -137,7 +146,8 @@ def test_segmentation_dataset_factory_creates_expected_split(monkeypatch: pytest
         so assertions can verify the factory wired everything correctly.
         """
 
-        def __init__(self, data_root: object, dataframe: pd.DataFrame, transform: object, mode: object, cache_in_ram: bool = True) -> None:
+        def __init__(self, data_root: object, dataframe: pd.DataFrame, transform: object, mode: object, cache_in_ram: bool = True,
+                     **kwargs: object) -> None:
             created_datasets.append({
                 "data_root": data_root,
                 "dataframe": dataframe,
@@ -201,7 +211,8 @@ def test_segmentation_dataset_factory_forwards_cache_in_ram(monkeypatch: pytest.
     received_cache_flags: list[bool] = []
 
     class FakeSegmentationDataset:
-        def __init__(self, data_root: object, dataframe: pd.DataFrame, transform: object, mode: object, cache_in_ram: bool = True) -> None:
+        def __init__(self, data_root: object, dataframe: pd.DataFrame, transform: object, mode: object, cache_in_ram: bool = True,
+                     **kwargs: object) -> None:
             received_cache_flags.append(cache_in_ram)
 
     monkeypatch.setattr("SkiNet.ML.datasets.dataset_factory.SegmentationDataset", FakeSegmentationDataset)
@@ -211,6 +222,128 @@ def test_segmentation_dataset_factory_forwards_cache_in_ram(monkeypatch: pytest.
     assert received_cache_flags == [cache_in_ram, cache_in_ram, cache_in_ram]
 
 
+def _run_factory(monkeypatch: pytest.MonkeyPatch, config: ExperimentConfig,
+                 dataset_class: str = "SegmentationDataset") -> list[dict[str, Any]]:
+    """
+    Run SegmentationDatasetFactory.create_datasets on empty splits, with the dataset class replaced by a fake.
+
+    :param dataset_class: Name of the dataset class in dataset_factory that the fake replaces.
+    :return: Per created dataset, in train/val/test order, its mode and keyword arguments.
+    """
+    fake_splits = DataFrameSplits(train=pd.DataFrame(), val=pd.DataFrame(), test=pd.DataFrame())
+    monkeypatch.setattr("SkiNet.ML.datasets.dataset_factory.split_segmentation_metadata",
+                        lambda df, split_config: fake_splits)
+    monkeypatch.setattr("SkiNet.ML.datasets.dataset_factory.get_transform_from_config",
+                        lambda cfg: SimpleNamespace(train=None, val=None, test=None))
+
+    received: list[dict[str, Any]] = []
+
+    class FakeDataset:
+        def __init__(self, data_root: object, dataframe: pd.DataFrame, transform: object, mode: object,
+                     **kwargs: object) -> None:
+            received.append({"mode": mode, **kwargs})
+
+    monkeypatch.setattr(f"SkiNet.ML.datasets.dataset_factory.{dataset_class}", FakeDataset)
+    SegmentationDatasetFactory().create_datasets(config)
+    return received
+
+
+@pytest.mark.parametrize(("cache_backend", "cache_dir", "expected_dir"),
+                         [("dict", None, None), ("memmap", "some/cache", Path("some/cache"))])
+def test_segmentation_dataset_factory_forwards_cache_backend(monkeypatch: pytest.MonkeyPatch,
+                                                             cache_backend: str,
+                                                             cache_dir: str | None,
+                                                             expected_dir: Path | None) -> None:
+    """
+    Verify that cache_backend and cache_dir are read from config.trainconfig and forwarded
+    to every SegmentationDataset constructor call, with cache_dir converted to a Path.
+    """
+    config = _make_config(cache_in_ram=True)
+    trainconfig = cast(Any, config.trainconfig)
+    trainconfig.cache_backend = cache_backend
+    trainconfig.cache_dir = cache_dir
+
+    received = _run_factory(monkeypatch, config)
+
+    assert [(kwargs["cache_backend"], kwargs["cache_dir"]) for kwargs in received] == [(cache_backend, expected_dir)] * 3
+
+
+def test_segmentation_dataset_factory_precomputes_only_eval_transforms(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    precompute_eval_transforms is forwarded to the VAL and TEST datasets only; training augmentations stay per epoch.
+    """
+    config = _make_config(cache_in_ram=True)
+    cast(Any, config.trainconfig).precompute_eval_transforms = "uint8"
+
+    received = _run_factory(monkeypatch, config)
+
+    assert [(kwargs["mode"], kwargs["precompute_transform"]) for kwargs in received] == \
+        [(MLWorkflowState.TRAIN, None), (MLWorkflowState.VAL, "uint8"), (MLWorkflowState.TEST, "uint8")]
+
+
+def test_segmentation_dataset_factory_warms_up_all_splits_in_processes(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    With cache_warmup='processes' the datasets are created without a cache and warmed up together afterwards.
+    """
+    config = _make_config(cache_in_ram=True)
+    cast(Any, config.trainconfig).cache_warmup = "processes"
+    cast(Any, config.trainconfig).cache_warmup_workers = 3
+    warmed_up: list[tuple[int, object, object]] = []
+    monkeypatch.setattr("SkiNet.ML.datasets.dataset_factory.warm_up_caches",
+                        lambda datasets, cache_backend, cache_dir, max_workers: warmed_up.append(
+                            (len(datasets), cache_backend, max_workers)))
+
+    received = _run_factory(monkeypatch, config)
+
+    assert [kwargs["cache_in_ram"] for kwargs in received] == [False] * 3
+    assert warmed_up == [(3, "dict", 3)]
+
+
+def test_segmentation_dataset_factory_divides_cache_budget_among_workers(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    cache_budget_mb bounds the RAM of a split; each DataLoader worker holds its own LRU cache.
+    """
+    config = _make_config(cache_in_ram=True)
+    cast(Any, config.trainconfig).cache_budget_mb = 100.0
+    cast(Any, config.trainconfig).num_workers = 4
+
+    received = _run_factory(monkeypatch, config)
+
+    assert [kwargs["cache_budget_bytes"] for kwargs in received] == [25 * 1024**2] * 3
+
+
+def test_segmentation_dataset_factory_forwards_min_image_side_from_crop(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    With use_resized_variants, every split reads the variant required by the configured crop.
+    """
+    config = _make_config()
+    cast(Any, config.dataconfig).use_resized_variants = True
+    cast(Any, config.transformconfig).crop = CropConfig(crop_type="random_crop", size=(384, 512))
+
+    received = _run_factory(monkeypatch, config)
+
+    assert [kwargs["min_image_side"] for kwargs in received] == [512] * 3
+
+
+def test_segmentation_dataset_factory_creates_sharded_datasets_when_shard_dir_set(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    With shard_dir set in the data config, every split should be a ShardedSegmentationDataset
+    receiving shard_dir as a Path.
+    """
+    config = _make_config()
+    cast(Any, config.dataconfig).shard_dir = "shards"
+
+    def fail_segmentation_dataset(*args: object, **kwargs: object) -> None:
+        raise AssertionError("SegmentationDataset must not be created when shard_dir is set")
+
+    monkeypatch.setattr("SkiNet.ML.datasets.dataset_factory.SegmentationDataset", fail_segmentation_dataset)
+
+    received = _run_factory(monkeypatch, config, dataset_class="ShardedSegmentationDataset")
+
+    assert [(kwargs["mode"], kwargs["shard_dir"]) for kwargs in received] == \
+        [(MLWorkflowState.TRAIN, Path("shards")), (MLWorkflowState.VAL, Path("shards")), (MLWorkflowState.TEST, Path("shards"))]
+
+
 def test_create_segmentation_datasets_from_config_delegates_to_factory(
     monkeypatch: pytest.MonkeyPatch,
 ) -> None:
@@ -299,7 +432,10 @@ def test_factory_uses_predefined_column_instead_of_random_split(monkeypatch: pyt
                 data_root=data_root,
                 predefined_split_column="predefined_split",
             ),
-            trainconfig=SimpleNamespace(cache_in_ram=False),
+            trainconfig=SimpleNamespace(cache_in_ram=False, cache_backend="dict", cache_dir=None,
+                                        decoded_cache_dir=None, precompute_eval_transforms=None,
+                                        fast_collate=False, cache_budget_mb=None, num_workers=0,
+                                        cache_warmup="threads", cache_warmup_workers=None),
         ),
     )
 
@@ -317,7 +453,8 @@ def test_factory_uses_predefined_column_instead_of_random_split(monkeypatch: pyt
     created: list[dict[str, object]] = []
 
     class FakeSegmentationDataset:
-        def __init__(self, data_root: object, dataframe: pd.DataFrame, transform: object, mode: object, cache_in_ram: bool = False) -> None:
+        def __init__(self, data_root: object, dataframe: pd.DataFrame, transform: object, mode: object, cache_in_ram: bool = False,
+                     **kwargs: object) -> None:
             created.append({"mode": mode, "sampleids": list(dataframe["sampleid"])})
 
     monkeypatch.setattr("SkiNet.ML.datasets.dataset_factory.SegmentationDataset", FakeSegmentationDataset)
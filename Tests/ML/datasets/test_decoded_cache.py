@@ -0,0 +1,123 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from SkiNet.ML.datasets import decoded_cache as decoded_cache_module
+from SkiNet.ML.datasets.decoded_cache import CACHE_VERSION, DecodedTensorCache
+from SkiNet.ML.datasets.sample_specs import SampleSpecs, load_data_item, load_sample
+
+
+def _write_png(path: Path, array: np.ndarray) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.fromarray(array).save(path)
+
+
+def _fail_decode(*args: object, **kwargs: object) -> torch.Tensor:
+    raise AssertionError("load_data_item must not be called on a cache hit")
+
+
+@pytest.fixture
+def data_root(tmp_path: Path) -> Path:
+    root = tmp_path / "data"
+    rng = np.random.default_rng(0)
+    _write_png(root / "images/img.png", rng.integers(0, 256, (7, 9, 3), dtype=np.uint8))
+    _write_png(root / "masks/mask.png", rng.integers(0, 2, (7, 9), dtype=np.uint8) * 255)
+    return root
+
+
+def test_decoded_cache_miss_decodes_and_stores_versioned_entry(tmp_path: Path, data_root: Path) -> None:
+    """
+    On a miss the item is decoded exactly as load_data_item does and written below the versioned directory.
+    """
+    cache = DecodedTensorCache(tmp_path / "cache")
+
+    image = cache.load("images/img.png", data_root)
+
+    assert torch.equal(image, load_data_item("images/img.png", data_root))
+    entry = cache.entry_path("images/img.png", data_root)
+    assert entry.exists()
+    assert entry.is_relative_to(tmp_path / "cache" / f"v{CACHE_VERSION}")
+
+
+def test_decoded_cache_hit_memory_maps_without_decoding(tmp_path: Path, data_root: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    A second load should be served from the memory-mapped entry without calling the decoder,
+    and the returned tensor should be writable without touching the cache file.
+    """
+    cache = DecodedTensorCache(tmp_path / "cache")
+    expected = cache.load("images/img.png", data_root).clone()
+    monkeypatch.setattr(decoded_cache_module, "load_data_item", _fail_decode)
+
+    cached = cache.load("images/img.png", data_root)
+    cached.zero_()
+
+    assert cached.dtype == torch.uint8
+    assert cached.shape == (3, 7, 9)
+    assert torch.equal(cache.load("images/img.png", data_root), expected)
+
+
+def test_decoded_cache_invalidates_entry_when_source_changes(tmp_path: Path, data_root: Path) -> None:
+    """
+    Rewriting a source file changes its size/mtime, so the next load decodes the new content
+    and the stale entry is removed.
+    """
+    cache = DecodedTensorCache(tmp_path / "cache")
+    cache.load("images/img.png", data_root)
+    stale_entry = cache.entry_path("images/img.png", data_root)
+
+    new_array = np.full((4, 5, 3), 17, dtype=np.uint8)
+    _write_png(data_root / "images/img.png", new_array)
+    os.utime(data_root / "images/img.png", ns=(1, 1))
+
+    reloaded = cache.load("images/img.png", data_root)
+
+    assert reloaded.shape == (3, 4, 5)
+    assert torch.all(reloaded == 17)
+    assert not stale_entry.exists()
+    assert cache.entry_path("images/img.png", data_root).exists()
+
+
+def test_decoded_cache_recovers_from_corrupt_entry(tmp_path: Path, data_root: Path) -> None:
+    cache = DecodedTensorCache(tmp_path / "cache")
+    cache.load("images/img.png", data_root)
+    cache.entry_path("images/img.png", data_root).write_bytes(b"not a npy file")
+
+    reloaded = cache.load("images/img.png", data_root)
+
+    assert torch.equal(reloaded, load_data_item("images/img.png", data_root))
+
+
+def test_decoded_cache_missing_source_raises(tmp_path: Path, data_root: Path) -> None:
+    cache = DecodedTensorCache(tmp_path / "cache")
+
+    with pytest.raises(FileNotFoundError, match="Data item not found"):
+        cache.load("images/missing.png", data_root)
+
+
+def test_decoded_cache_warm_decodes_only_missing_items(tmp_path: Path, data_root: Path) -> None:
+    """
+    warm() should decode every image and mask once; a second warm() finds everything cached.
+    """
+    cache = DecodedTensorCache(tmp_path / "cache")
+    specs = {"sample-1": SampleSpecs(sample_id="sample-1", image_path="images/img.png", mask_path="masks/mask.png")}
+
+    assert cache.warm(specs, data_root, max_workers=2) == 2
+    assert cache.warm(specs, data_root, max_workers=2) == 0
+
+
+def test_load_sample_with_decoded_cache_matches_plain_decoding(tmp_path: Path, data_root: Path) -> None:
+    specs = SampleSpecs(sample_id="sample-1", image_path="images/img.png", mask_path="masks/mask.png")
+    cache = DecodedTensorCache(tmp_path / "cache")
+
+    plain = load_sample(specs, data_root)
+    cache.warm({"sample-1": specs}, data_root)
+    cached = load_sample(specs, data_root, decoded_cache=cache)
+
+    assert isinstance(cached.image, torch.Tensor) and isinstance(plain.image, torch.Tensor)
+    assert isinstance(cached.mask, torch.Tensor) and isinstance(plain.mask, torch.Tensor)
+    assert torch.equal(cached.image, plain.image)
+    assert torch.equal(cached.mask, plain.mask)
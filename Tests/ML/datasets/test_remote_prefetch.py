@@ -0,0 +1,169 @@
+import pickle
+import threading
+import time
+from concurrent.futures import wait
+from typing import Any
+
+import pytest
+from fsspec.implementations.memory import MemoryFileSystem
+
+from SkiNet.ML.datasets.remote_prefetch import RemoteFilePrefetcher, open_remote
+
+
+class SlowMemoryFileSystem(MemoryFileSystem):
+    """In-memory filesystem adding a fixed latency per read and recording the peak of concurrent reads."""
+
+    def __init__(self, latency_s: float = 0.02, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.latency_s = latency_s
+        self.running = 0
+        self.peak_running = 0
+        self.reads: list[str] = []
+        self._counter_lock = threading.Lock()
+
+    def cat_file(self, path: str, start: int | None = None, end: int | None = None, **kwargs: Any) -> bytes:
+        with self._counter_lock:
+            self.running += 1
+            self.peak_running = max(self.peak_running, self.running)
+            self.reads.append(path)
+        time.sleep(self.latency_s)
+        try:
+            data: bytes = super().cat_file(path, start=start, end=end, **kwargs)
+            return data
+        finally:
+            with self._counter_lock:
+                self.running -= 1
+
+
+@pytest.fixture
+def fs() -> SlowMemoryFileSystem:
+    fs = SlowMemoryFileSystem(skip_instance_cache=True)
+    fs.store.clear()
+    for i in range(20):
+        fs.pipe_file(f"/data/{i}.bin", bytes([i]) * 1000)
+    return fs
+
+
+def _paths(n: int) -> list[str]:
+    return [f"/data/{i}.bin" for i in range(n)]
+
+
+def test_read_without_prefetch_is_a_miss(fs: SlowMemoryFileSystem) -> None:
+    prefetcher = RemoteFilePrefetcher(fs)
+
+    assert prefetcher.read("/data/3.bin") == bytes([3]) * 1000
+    assert prefetcher.stats.misses == 1
+    assert prefetcher.stats.hit_rate == 0.0
+
+
+def test_prefetched_batch_is_read_concurrently(fs: SlowMemoryFileSystem) -> None:
+    prefetcher = RemoteFilePrefetcher(fs, max_in_flight=8)
+
+    prefetcher.prefetch(_paths(8))
+    data = [prefetcher.read(path) for path in _paths(8)]
+
+    assert data == [bytes([i]) * 1000 for i in range(8)]
+    assert prefetcher.stats.misses == 0
+    assert prefetcher.stats.hit_rate == 1.0
+    assert fs.peak_running > 1
+    assert prefetcher.bytes_in_flight == 0
+    prefetcher.close()
+
+
+def test_order_keeps_lookahead_in_flight(fs: SlowMemoryFileSystem) -> None:
+    prefetcher = RemoteFilePrefetcher(fs, max_in_flight=4, lookahead=3)
+    order = _paths(20)[::-1]
+
+    prefetcher.set_order(order)
+    assert set(prefetcher._pending) == set(order[:3])
+    data = [prefetcher.read(path) for path in order]
+
+    assert data == [bytes([int(p.split("/")[-1].split(".")[0])]) * 1000 for p in order]
+    assert prefetcher.stats.misses == 0
+    assert sorted(fs.reads) == sorted(order)
+    prefetcher.close()
+
+
+def test_byte_cap_limits_prefetches(fs: SlowMemoryFileSystem) -> None:
+    prefetcher = RemoteFilePrefetcher(fs, max_in_flight=16, max_bytes_in_flight=2500, lookahead=20)
+    prefetcher.read("/data/0.bin")  # learns the file size
+
+    prefetcher.set_order(_paths(20)[1:])
+
+    assert len(prefetcher._pending) == 2
+    assert prefetcher.bytes_in_flight <= 2500
+    for path in _paths(20)[1:]:
+        prefetcher.read(path)
+        assert prefetcher.bytes_in_flight <= 2500
+    assert prefetcher.stats.misses == 1
+    prefetcher.close()
+
+
+def test_unread_batch_prefetches_are_evicted_by_the_next_batch(fs: SlowMemoryFileSystem) -> None:
+    """
+    Files of a batch that are prefetched but never read must not hold the byte cap for later batches.
+    """
+    prefetcher = RemoteFilePrefetcher(fs, max_in_flight=16, max_bytes_in_flight=2500)
+    prefetcher.read("/data/0.bin")  # learns the file size
+
+    for i in range(1, 19, 2):
+        batch = [f"/data/{i}.bin", f"/data/{i + 1}.bin"]
+        prefetcher.prefetch(batch)
+        wait(list(prefetcher._pending.values()))
+        prefetcher.read(batch[0])  # the second file of every batch is skipped
+
+    assert prefetcher.stats.misses == 1
+    assert prefetcher.stats.evicted == 8
+    assert set(prefetcher._pending) == {"/data/18.bin"}
+    assert prefetcher.bytes_in_flight == 1000
+    prefetcher.close()
+
+
+def test_prefetches_skipped_in_the_order_are_evicted(fs: SlowMemoryFileSystem) -> None:
+    prefetcher = RemoteFilePrefetcher(fs, max_in_flight=4, lookahead=3)
+    order = _paths(10)
+    prefetcher.set_order(order)
+    prefetcher.read(order[0])
+    wait(list(prefetcher._pending.values()))
+
+    prefetcher.read(order[5])  # order[1:5] are skipped
+
+    assert prefetcher.stats.evicted == 3
+    assert set(prefetcher._pending) == set(order[6:9])
+    assert prefetcher.read(order[6]) == bytes([6]) * 1000
+    assert prefetcher.stats.misses == 1
+    prefetcher.close()
+
+
+def test_new_order_drops_stale_prefetches(fs: SlowMemoryFileSystem) -> None:
+    prefetcher = RemoteFilePrefetcher(fs, lookahead=4)
+    prefetcher.set_order(_paths(4))
+
+    prefetcher.set_order(_paths(8)[4:])
+
+    assert set(prefetcher._pending) == set(_paths(8)[4:])
+    prefetcher.close()
+
+
+def test_unpickled_prefetcher_starts_empty(fs: SlowMemoryFileSystem) -> None:
+    prefetcher = RemoteFilePrefetcher(fs, lookahead=4)
+    prefetcher.set_order(_paths(4))
+
+    copy = pickle.loads(pickle.dumps(prefetcher))
+
+    assert copy._pending == {} and copy._order == [] and copy._executor is None
+    assert copy.read("/data/1.bin") == bytes([1]) * 1000
+    prefetcher.close()
+    copy.close()
+
+
+def test_open_remote_reads_through_prefetcher(fs: SlowMemoryFileSystem) -> None:
+    prefetcher = RemoteFilePrefetcher(fs)
+    prefetcher.prefetch(["/data/5.bin"])
+
+    with open_remote(fs, b"/data/5.bin", prefetcher) as f:
+        assert f.read() == bytes([5]) * 1000
+    with open_remote(fs, "/data/6.bin") as f:
+        assert f.read() == bytes([6]) * 1000
+    assert prefetcher.stats.misses == 0
+    prefetcher.close()
@@ -0,0 +1,233 @@
+import pickle
+from functools import partial
+from pathlib import Path
+from typing import Callable
+
+import albumentations as A
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+from SkiNet.ML.datasets.sample_cache import LRUSampleCache, PackedSampleCache, load_samples, load_samples_in_processes
+from SkiNet.ML.datasets.sample_specs import Sample, SampleSpecs, load_sample
+from SkiNet.ML.datasets.segmentation_dataset import SegmentationDataset, warm_up_caches
+from SkiNet.ML.utils.model_utils import MLWorkflowState
+from SkiNet.Utils.csv_headers import DATAPATH_HEADER, DATATYPE_HEADER, DATATYPE_IMAGE, DATATYPE_MASK, SAMPLEID_HEADER
+
+DatasetWriter = Callable[..., tuple[dict[str, SampleSpecs], pd.DataFrame]]
+
+
+class IdentityTransform:
+    pipeline = A.Compose([])
+    visualization_pipeline = None
+    expects_tensor_output = True
+
+    def __call__(self, sample: Sample) -> Sample:
+        return sample
+
+
+def _tensor(x: torch.Tensor | np.ndarray) -> torch.Tensor:
+    assert isinstance(x, torch.Tensor)
+    return x
+
+
+@pytest.mark.parametrize("backend", ["shared_memory", "memmap"])
+def test_packed_sample_cache_serves_same_data_as_disk(tmp_path: Path, backend: str, write_dataset: DatasetWriter) -> None:
+    """
+    Every cached sample should equal the sample decoded from disk, for samples of different sizes.
+    """
+    specs, _ = write_dataset(tmp_path, [(8, 6), (5, 9), (7, 7)])
+
+    cache = PackedSampleCache.build(specs, partial(load_sample, data_root=tmp_path), backend=backend, cache_dir=tmp_path)  # type: ignore[arg-type]
+
+    assert list(cache) == list(specs)
+    assert len(cache) == 3
+    expected_nbytes = sum(4 * h * w for h, w in [(8, 6), (5, 9), (7, 7)])
+    assert cache.nbytes == expected_nbytes
+    for sid, spec in specs.items():
+        expected = load_sample(spec, tmp_path)
+        cached = cache[sid]
+        assert torch.equal(_tensor(cached.image), _tensor(expected.image))
+        assert torch.equal(_tensor(cached.mask), _tensor(expected.mask))
+        assert cached.specs == spec
+
+
+def test_packed_sample_cache_returns_views_into_one_arena(tmp_path: Path, write_dataset: DatasetWriter) -> None:
+    """
+    Cached tensors must be views sharing the storage of the single shared-memory arena, not copies.
+    """
+    specs, _ = write_dataset(tmp_path, [(4, 4), (3, 5)])
+    cache = PackedSampleCache.build(specs, partial(load_sample, data_root=tmp_path), backend="shared_memory")
+
+    first, second = cache["sample-0"], cache["sample-1"]
+
+    storage_ptr = _tensor(first.image).untyped_storage().data_ptr()
+    assert _tensor(first.mask).untyped_storage().data_ptr() == storage_ptr
+    assert _tensor(second.image).untyped_storage().data_ptr() == storage_ptr
+    assert _tensor(first.image).is_shared()
+
+
+def test_packed_sample_cache_memmap_pickles_by_path(tmp_path: Path, write_dataset: DatasetWriter) -> None:
+    """
+    A memmap-backed cache should pickle without its arena (so spawned workers don't receive a copy)
+    and re-map the same file when unpickled.
+    """
+    specs, _ = write_dataset(tmp_path, [(16, 16)])
+    cache = PackedSampleCache.build(specs, partial(load_sample, data_root=tmp_path), backend="memmap", cache_dir=tmp_path)
+
+    payload = pickle.dumps(cache)
+    restored = pickle.loads(payload)
+
+    assert len(payload) < cache.nbytes
+    assert restored.arena_path == cache.arena_path
+    assert torch.equal(_tensor(restored["sample-0"].image), _tensor(cache["sample-0"].image))
+
+
+def test_packed_sample_cache_memmap_file_removed_with_cache(tmp_path: Path, write_dataset: DatasetWriter) -> None:
+    """
+    The arena file is owned by the cache and removed once the cache is garbage collected.
+    """
+    specs, _ = write_dataset(tmp_path, [(4, 4)])
+    cache = PackedSampleCache.build(specs, partial(load_sample, data_root=tmp_path), backend="memmap", cache_dir=tmp_path)
+    arena_path = Path(str(cache.arena_path))
+    assert arena_path.exists()
+
+    del cache
+
+    assert not arena_path.exists()
+
+
+def test_packed_sample_cache_rejects_unknown_backend(tmp_path: Path, write_dataset: DatasetWriter) -> None:
+    specs, _ = write_dataset(tmp_path, [(4, 4)])
+    samples = load_samples(specs, partial(load_sample, data_root=tmp_path))
+
+    with pytest.raises(ValueError, match="Unsupported backend"):
+        PackedSampleCache.from_samples(samples, specs, backend="dict")
+
+
+@pytest.mark.parametrize("cache_backend", ["dict", "shared_memory", "memmap"])
+def test_segmentation_dataset_cache_backends_serve_identical_items_across_workers(tmp_path: Path, cache_backend: str, write_dataset: DatasetWriter) -> None:
+    """
+    A DataLoader with worker processes should read the same batches from every cache backend.
+    """
+    specs, _ = write_dataset(tmp_path, [(8, 8)] * 4)
+    rows = []
+    for sid, spec in specs.items():
+        rows.append({SAMPLEID_HEADER: sid, DATATYPE_HEADER: DATATYPE_IMAGE, DATAPATH_HEADER: spec.image_path})
+        rows.append({SAMPLEID_HEADER: sid, DATATYPE_HEADER: DATATYPE_MASK, DATAPATH_HEADER: spec.mask_path})
+    df = pd.DataFrame(rows)
+
+    dataset = SegmentationDataset(data_root=tmp_path, dataframe=df, transform=IdentityTransform(),
+                                  mode=MLWorkflowState.TRAIN, cache_in_ram=True,
+                                  cache_backend=cache_backend, cache_dir=tmp_path)  # type: ignore[arg-type]
+    loader = DataLoader(dataset, batch_size=2, num_workers=2, collate_fn=lambda b: b)
+
+    items = [item for batch in loader for item in batch]
+
+    assert [item["specs"]["sample_id"] for item in items] == list(specs)
+    for item, spec in zip(items, specs.values()):
+        expected = load_sample(spec, tmp_path)
+        assert torch.equal(item["image"], _tensor(expected.image))
+        assert torch.equal(item["mask"], _tensor(expected.mask))
+
+
+def test_lru_sample_cache_evicts_least_recently_used(tmp_path: Path, write_dataset: DatasetWriter) -> None:
+    specs, _ = write_dataset(tmp_path, [(8, 8)] * 4)
+    sample_bytes = 8 * 8 * 4
+    loads: list[str] = []
+
+    def load_fn(spec: SampleSpecs) -> Sample:
+        loads.append(spec.sample_id)
+        return load_sample(spec, tmp_path)
+
+    cache = LRUSampleCache(load_fn, budget_bytes=2 * sample_bytes)
+    for sid in ["sample-0", "sample-1", "sample-0", "sample-2", "sample-0", "sample-1"]:
+        cache.get(sid, specs[sid])
+
+    # sample-1 was least recently used when sample-2 arrived
+    assert loads == ["sample-0", "sample-1", "sample-2", "sample-1"]
+    assert "sample-0" in cache and "sample-1" in cache and "sample-2" not in cache
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 4)
+    assert stats["hit_rate"] == pytest.approx(2 / 6)
+    assert stats["resident_mb"] == pytest.approx(2 * sample_bytes / 1024**2)
+
+
+def test_lru_sample_cache_does_not_cache_samples_above_budget(tmp_path: Path, write_dataset: DatasetWriter) -> None:
+    specs, _ = write_dataset(tmp_path, [(8, 8)])
+    cache = LRUSampleCache(partial(load_sample, data_root=tmp_path), budget_bytes=10)
+
+    cache.get("sample-0", specs["sample-0"])
+
+    assert len(cache) == 0
+    assert cache.stats()["resident_mb"] == 0.0
+
+
+def test_segmentation_dataset_lru_cache_counts_worker_hits(tmp_path: Path, write_dataset: DatasetWriter) -> None:
+    """
+    With a budget the cache starts empty, fills in the persistent workers and reports their counters to the main process.
+    """
+    specs, _ = write_dataset(tmp_path, [(8, 8)] * 4)
+    rows = []
+    for sid, spec in specs.items():
+        rows.append({SAMPLEID_HEADER: sid, DATATYPE_HEADER: DATATYPE_IMAGE, DATAPATH_HEADER: spec.image_path})
+        rows.append({SAMPLEID_HEADER: sid, DATATYPE_HEADER: DATATYPE_MASK, DATAPATH_HEADER: spec.mask_path})
+    dataset = SegmentationDataset(data_root=tmp_path, dataframe=pd.DataFrame(rows), transform=IdentityTransform(),
+                                  mode=MLWorkflowState.TRAIN, cache_in_ram=True, cache_budget_bytes=1024**2)
+    loader = DataLoader(dataset, batch_size=2, num_workers=2, persistent_workers=True, collate_fn=lambda b: b)
+
+    assert dataset.ram_cache_stats() == {"hits": 0, "misses": 0, "hit_rate": 0.0, "resident_mb": 0.0}
+    for _ in range(3):
+        items = [item for batch in loader for item in batch]
+
+    assert [item["specs"]["sample_id"] for item in items] == list(specs)
+    stats = dataset.ram_cache_stats()
+    assert stats is not None
+    assert (stats["hits"], stats["misses"]) == (8, 4)
+    assert stats["resident_mb"] == pytest.approx(4 * 8 * 8 * 4 / 1024**2)
+
+
+def test_load_samples_in_processes_matches_disk(tmp_path: Path, write_dataset: DatasetWriter) -> None:
+    specs, _ = write_dataset(tmp_path, [(8, 8), (5, 7), (9, 4)])
+    other = {"other": specs.pop("sample-2")}
+
+    loaded, stats = load_samples_in_processes([(specs, partial(load_sample, data_root=tmp_path)),
+                                               (other, partial(load_sample, data_root=tmp_path))],
+                                              max_workers=2, chunk_size=1)
+
+    assert [list(samples) for samples in loaded] == [list(specs), ["other"]]
+    for samples, job_specs in zip(loaded, (specs, other)):
+        for sid, spec in job_specs.items():
+            expected = load_sample(spec, tmp_path)
+            assert torch.equal(_tensor(samples[sid].image), _tensor(expected.image))
+            assert torch.equal(_tensor(samples[sid].mask), _tensor(expected.mask))
+            assert _tensor(samples[sid].image).is_shared()
+    assert stats.samples == 3
+    assert stats.nbytes == (8 * 8 + 5 * 7 + 9 * 4) * 4
+    assert stats.mb_per_s > 0 and stats.images_per_s > 0
+
+
+@pytest.mark.parametrize("cache_backend", ["dict", "shared_memory"])
+def test_warm_up_caches_serves_same_items_as_thread_cache(tmp_path: Path, cache_backend: str, write_dataset: DatasetWriter) -> None:
+    specs, _ = write_dataset(tmp_path, [(8, 8)] * 4)
+    rows = []
+    for sid, spec in specs.items():
+        rows.append({SAMPLEID_HEADER: sid, DATATYPE_HEADER: DATATYPE_IMAGE, DATAPATH_HEADER: spec.image_path})
+        rows.append({SAMPLEID_HEADER: sid, DATATYPE_HEADER: DATATYPE_MASK, DATAPATH_HEADER: spec.mask_path})
+    df = pd.DataFrame(rows)
+    datasets = [SegmentationDataset(data_root=tmp_path, dataframe=part, transform=IdentityTransform(),
+                                    mode=MLWorkflowState.TRAIN, cache_in_ram=False)
+                for part in (df.iloc[:4], df.iloc[4:])]
+
+    stats = warm_up_caches(datasets, cache_backend, max_workers=2)  # type: ignore[arg-type]
+
+    assert stats.samples == 4
+    for dataset in datasets:
+        reference = SegmentationDataset(data_root=tmp_path, dataframe=dataset.dataframe, transform=IdentityTransform(),
+                                        mode=MLWorkflowState.TRAIN, cache_in_ram=True)
+        assert dataset._cache is not None and len(dataset._cache) == 2
+        for i in range(len(dataset)):
+            assert torch.equal(dataset[i]["image"], reference[i]["image"])
+            assert torch.equal(dataset[i]["mask"], reference[i]["mask"])
@@ -230,3 +230,59 @@ def test_create_valid_samplespecs_uses_first_image_and_mask_when_duplicates(capl
     assert specs.mask_path == "masks/mask1.png"
     assert "Multiple images found for sample_id sample-1" in caplog.text
     assert "Multiple masks found for sample_id sample-1" in caplog.text
+
+
+def test_create_valid_samplespecs_orders_by_sample_id_or_first_appearance() -> None:
+    df = pd.DataFrame([r("sample-2", DATATYPE_IMAGE, "images/img2.png", "A"),
+                       r("sample-1", DATATYPE_MASK, "masks/mask1.png", "A"),
+                       r("sample-2", DATATYPE_MASK, "masks/mask2.png", "A"),
+                       r("sample-1", DATATYPE_IMAGE, "images/img1.png", "A")])
+
+    assert list(create_valid_samplespecs(df)) == ["sample-1", "sample-2"]
+    assert list(create_valid_samplespecs(df, preserve_original_order=True)) == ["sample-2", "sample-1"]
+
+
+def test_create_valid_samplespecs_treats_missing_metadata_as_equal() -> None:
+    """
+    NaN metadata in both the image and the mask row is not a mismatch; metadata values keep
+    the types a row lookup gives (ints are upcast to float next to a float column).
+    """
+    df = pd.DataFrame([{SAMPLEID_HEADER: "sample-1", DATATYPE_HEADER: DATATYPE_IMAGE, DATAPATH_HEADER: "img.png",
+                        "age": np.nan, "count": 3},
+                       {SAMPLEID_HEADER: "sample-1", DATATYPE_HEADER: DATATYPE_MASK, DATAPATH_HEADER: "mask.png",
+                        "age": np.nan, "count": 3}])
+
+    specs = create_valid_samplespecs(df)["sample-1"]
+
+    assert np.isnan(specs.metadata["age"])
+    assert specs.metadata["count"] == 3.0
+    assert isinstance(specs.metadata["count"], float)
+
+
+def test_create_valid_samplespecs_without_metadata_columns() -> None:
+    df = pd.DataFrame([{SAMPLEID_HEADER: "sample-1", DATATYPE_HEADER: DATATYPE_IMAGE, DATAPATH_HEADER: "img.png"},
+                       {SAMPLEID_HEADER: "sample-1", DATATYPE_HEADER: DATATYPE_MASK, DATAPATH_HEADER: "mask.png"}])
+
+    assert create_valid_samplespecs(df)["sample-1"].metadata == {}
+
+
+def test_create_valid_samplespecs_logs_warnings_per_sample_in_order(caplog: pytest.LogCaptureFixture) -> None:
+    """
+    Warnings are emitted sample by sample in sample_id order, as with per-group processing.
+    """
+    df = pd.DataFrame([r("sample-3", DATATYPE_IMAGE, "images/img3.png", "A"),
+                       r("sample-1", DATATYPE_MASK, "masks/mask1.png", "A"),
+                       r("sample-2", DATATYPE_IMAGE, "images/img2.png", "A"),
+                       r("sample-2", DATATYPE_IMAGE, "images/img2b.png", "A"),
+                       r("sample-2", DATATYPE_MASK, "masks/mask2.png", "B"),
+                       r("sample-4", DATATYPE_IMAGE, "images/img4.png", "A"),
+                       r("sample-4", DATATYPE_MASK, "masks/mask4.png", "A")])
+
+    with caplog.at_level("WARNING"):
+        result = create_valid_samplespecs(df)
+
+    assert list(result) == ["sample-4"]
+    assert caplog.messages == ["No image found for sample_id sample-1",
+                               "Multiple images found for sample_id sample-2. Using the first one.",
+                               "Metadata mismatch for sample_id sample-2. Skipping sample.",
+                               "No mask found for sample_id sample-3"]
@@ -449,3 +449,28 @@ def test_segmentation_dataset_no_cache_is_none(tmp_path: Path) -> None:
     )
 
     assert dataset._cache is None
+
+
+def test_segmentation_dataset_without_specs_returns_index_resolvable_to_specs(tmp_path: Path) -> None:
+    """
+    With return_specs=False items carry their index instead of the specs dict; resolve_specs
+    recovers exactly the specs the item would have carried.
+    """
+    image_rel_path, mask_rel_path = _write_png_sample_files(tmp_path)
+    df = pd.DataFrame(
+        [
+            {SAMPLEID_HEADER: "sample-1", DATATYPE_HEADER: DATATYPE_IMAGE, DATAPATH_HEADER: image_rel_path, "site": "A"},
+            {SAMPLEID_HEADER: "sample-1", DATATYPE_HEADER: DATATYPE_MASK, DATAPATH_HEADER: mask_rel_path, "site": "A"},
+        ]
+    )
+    with_specs = SegmentationDataset(data_root=tmp_path, dataframe=df, transform=IdentityTransform(),
+                                     mode=MLWorkflowState.VAL, cache_in_ram=False)
+    without_specs = SegmentationDataset(data_root=tmp_path, dataframe=df, transform=IdentityTransform(),
+                                        mode=MLWorkflowState.VAL, cache_in_ram=False, return_specs=False)
+
+    item = without_specs[0]
+
+    assert set(item) == {"image", "mask", "index"}
+    assert item["index"] == 0
+    assert torch.equal(item["image"], with_specs[0]["image"])
+    assert without_specs.resolve_specs(torch.tensor([0])) == [with_specs[0]["specs"]]
@@ -0,0 +1,114 @@
+import json
+import pickle
+from pathlib import Path
+from typing import Callable
+
+import albumentations as A
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+from SkiNet.ML.datasets.sample_specs import Sample, SampleSpecs, create_valid_samplespecs, load_sample
+from SkiNet.ML.datasets.sharded_dataset import INDEX_FILE_NAME, ShardedSegmentationDataset, read_index, write_shards
+from SkiNet.ML.utils.model_utils import MLWorkflowState
+
+DatasetWriter = Callable[..., tuple[dict[str, SampleSpecs], pd.DataFrame]]
+
+
+class IdentityTransform:
+    pipeline = A.Compose([])
+    visualization_pipeline = None
+    expects_tensor_output = True
+
+    def __call__(self, sample: Sample) -> Sample:
+        return sample
+
+
+def _tensor(x: torch.Tensor | np.ndarray) -> torch.Tensor:
+    assert isinstance(x, torch.Tensor)
+    return x
+
+
+def _sizes(n: int) -> list[tuple[int, int]]:
+    return [(6 + i, 9 - i % 3) for i in range(n)]
+
+
+def _make_dataset(data_root: Path, df: pd.DataFrame, **kwargs: object) -> ShardedSegmentationDataset:
+    return ShardedSegmentationDataset(data_root, df, IdentityTransform(), MLWorkflowState.VAL,
+                                      shard_dir=Path("shards"), **kwargs)  # type: ignore[arg-type]
+
+
+def test_write_shards_splits_by_size_and_indexes_every_sample(tmp_path: Path, write_dataset: DatasetWriter) -> None:
+    _, df = write_dataset(tmp_path, _sizes(5), image_suffix=".jpg")
+    specs = create_valid_samplespecs(df)
+
+    index_path = write_shards(specs, tmp_path, tmp_path / "shards", max_shard_bytes=1)
+
+    index = read_index(tmp_path / "shards")
+    assert index_path == tmp_path / "shards" / INDEX_FILE_NAME
+    assert len(index["shards"]) == 5
+    assert set(index["samples"]) == set(specs)
+    assert [index["samples"][sid]["shard"] for sid in sorted(specs)] == list(range(5))
+
+
+@pytest.mark.parametrize("cache_in_ram", [True, False])
+def test_sharded_dataset_serves_same_samples_as_files(tmp_path: Path, cache_in_ram: bool, write_dataset: DatasetWriter) -> None:
+    """
+    Items read from shards must equal items decoded from the original files, in the same order.
+    """
+    _, df = write_dataset(tmp_path, _sizes(4), image_suffix=".jpg")
+    write_shards(create_valid_samplespecs(df), tmp_path, tmp_path / "shards", max_shard_bytes=300)
+
+    dataset = _make_dataset(tmp_path, df, cache_in_ram=cache_in_ram)
+
+    assert len(dataset) == 4
+    for i, sid in enumerate(dataset.sample_ids):
+        expected = load_sample(dataset.sample_specs[sid], tmp_path)
+        item = dataset[i]
+        assert item["specs"]["sample_id"] == sid
+        assert torch.equal(item["image"], _tensor(expected.image))
+        assert torch.equal(item["mask"], _tensor(expected.mask))
+
+
+def test_sharded_dataset_reads_in_dataloader_workers(tmp_path: Path, write_dataset: DatasetWriter) -> None:
+    _, df = write_dataset(tmp_path, _sizes(4), image_suffix=".jpg")
+    write_shards(create_valid_samplespecs(df), tmp_path, tmp_path / "shards")
+    dataset = _make_dataset(tmp_path, df, cache_in_ram=False)
+    dataset.get_raw_sample(0)  # opens a shard in the main process
+
+    restored = pickle.loads(pickle.dumps(dataset))
+    loader = DataLoader(dataset, batch_size=2, num_workers=2, collate_fn=lambda b: b)
+    items = [item for batch in loader for item in batch]
+
+    assert restored._fds == {}
+    assert [item["specs"]["sample_id"] for item in items] == dataset.sample_ids
+    assert torch.equal(_tensor(restored.get_raw_sample(3).image), items[3]["image"])
+
+
+def test_sharded_dataset_rejects_samples_missing_from_shards(tmp_path: Path, write_dataset: DatasetWriter) -> None:
+    _, df = write_dataset(tmp_path, _sizes(3), image_suffix=".jpg")
+    specs = create_valid_samplespecs(df)
+    write_shards({"sample-0": specs["sample-0"]}, tmp_path, tmp_path / "shards")
+
+    with pytest.raises(ValueError, match="missing from the shards"):
+        _make_dataset(tmp_path, df, cache_in_ram=False)
+
+
+def test_sharded_dataset_rejects_shards_packed_from_other_files(tmp_path: Path, write_dataset: DatasetWriter) -> None:
+    _, df = write_dataset(tmp_path, _sizes(2), image_suffix=".jpg")
+    specs = create_valid_samplespecs(df)
+    swapped = {"sample-0": SampleSpecs(sample_id="sample-0", image_path="images/img1.jpg", mask_path="masks/mask1.png"),
+               "sample-1": specs["sample-1"]}
+    write_shards(swapped, tmp_path, tmp_path / "shards")
+
+    with pytest.raises(ValueError, match="packed from different files"):
+        _make_dataset(tmp_path, df, cache_in_ram=False)
+
+
+def test_read_index_rejects_other_versions(tmp_path: Path) -> None:
+    (tmp_path / INDEX_FILE_NAME).write_text(json.dumps({"version": 0, "shards": [], "samples": {}}))
+
+    with pytest.raises(ValueError, match="Re-run the converter"):
+        read_index(tmp_path)
@@ -0,0 +1,94 @@
+from pathlib import Path
+from typing import Callable
+
+import albumentations as A
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+from SkiNet.ML.datasets.sample_specs import SampleSpecs, load_sample
+from SkiNet.ML.datasets.segmentation_dataset import SegmentationDataset
+from SkiNet.ML.datasets.transformed_cache import TransformedSampleCache, quantize_uint8
+from SkiNet.ML.transformations.transform_adapters import AlbumentationsSampleTransform
+from SkiNet.ML.utils.model_utils import MLWorkflowState
+
+DatasetWriter = Callable[..., tuple[dict[str, SampleSpecs], pd.DataFrame]]
+
+
+def _eval_transform() -> AlbumentationsSampleTransform:
+    return AlbumentationsSampleTransform(pipeline=A.Compose([A.CenterCrop(height=8, width=8),
+                                                             A.Normalize(normalization="image_per_channel"),
+                                                             A.ToTensorV2(transpose_mask=True)]))
+
+
+def _sizes(n: int) -> list[tuple[int, int]]:
+    return [(12, 10 + i) for i in range(n)]
+
+
+def _tensor(x: torch.Tensor | np.ndarray) -> torch.Tensor:
+    assert isinstance(x, torch.Tensor)
+    return x
+
+
+def test_quantize_uint8_error_is_bounded_by_half_a_step() -> None:
+    image = torch.randn(3, 16, 16) * torch.tensor([1.0, 5.0, 0.1])[:, None, None]
+
+    q, quant = quantize_uint8(image)
+    restored = q.float() * quant[:, 1, None, None] + quant[:, 0, None, None]
+
+    assert q.dtype == torch.uint8
+    assert torch.all((restored - image).abs() <= quant[:, 1, None, None] / 2 + 1e-6)
+
+
+@pytest.mark.parametrize(("dtype", "atol"), [("float16", 1e-2), ("uint8", 0.05)])
+def test_transformed_sample_cache_matches_transform(tmp_path: Path, dtype: str, atol: float, write_dataset: DatasetWriter) -> None:
+    """
+    Cached samples should equal the per-epoch transform output up to the storage precision, as float32 images.
+    """
+    specs, _ = write_dataset(tmp_path, _sizes(3))
+    transform = _eval_transform()
+
+    cache = TransformedSampleCache.build(specs, lambda s: load_sample(s, tmp_path), transform, dtype=dtype)  # type: ignore[arg-type]
+
+    assert list(cache) == list(specs)
+    for sid, spec in specs.items():
+        expected = transform(load_sample(spec, tmp_path))
+        cached = cache[sid]
+        assert _tensor(cached.image).dtype == torch.float32
+        torch.testing.assert_close(_tensor(cached.image), _tensor(expected.image), atol=atol, rtol=0)
+        assert torch.equal(_tensor(cached.mask), _tensor(expected.mask))
+        assert cached.specs == spec
+
+
+def test_transformed_sample_cache_rejects_untransformed_images(tmp_path: Path, write_dataset: DatasetWriter) -> None:
+    specs, _ = write_dataset(tmp_path, _sizes(1))
+    identity = AlbumentationsSampleTransform(pipeline=A.Compose([A.ToTensorV2(transpose_mask=True)]))
+
+    with pytest.raises(TypeError, match="float CHW tensor"):
+        TransformedSampleCache.build(specs, lambda s: load_sample(s, tmp_path), identity)
+
+
+def test_segmentation_dataset_precompute_transform_serves_items_across_workers(tmp_path: Path, write_dataset: DatasetWriter) -> None:
+    _, df = write_dataset(tmp_path, _sizes(4))
+    transform = _eval_transform()
+    reference = SegmentationDataset(tmp_path, df, transform, MLWorkflowState.VAL, cache_in_ram=False)
+    dataset = SegmentationDataset(tmp_path, df, transform, MLWorkflowState.VAL, cache_in_ram=True,
+                                  precompute_transform="float16")
+    loader = DataLoader(dataset, batch_size=2, num_workers=2, collate_fn=lambda b: b)
+
+    items = [item for batch in loader for item in batch]
+
+    assert len(items) == len(reference)
+    for item, expected in zip(items, (reference[i] for i in range(len(reference)))):
+        assert item["specs"] == expected["specs"]
+        torch.testing.assert_close(item["image"], expected["image"], atol=1e-2, rtol=0)
+        assert torch.equal(item["mask"], expected["mask"])
+
+
+def test_segmentation_dataset_precompute_transform_rejected_for_train(tmp_path: Path, write_dataset: DatasetWriter) -> None:
+    _, df = write_dataset(tmp_path, _sizes(1))
+
+    with pytest.raises(ValueError, match="only supported for VAL and TEST"):
+        SegmentationDataset(tmp_path, df, _eval_transform(), MLWorkflowState.TRAIN, precompute_transform="uint8")
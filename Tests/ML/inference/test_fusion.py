@@ -0,0 +1,58 @@
+import itertools
+
+import pytest
+import torch
+import torch.nn as nn
+
+from SkiNet.ML.inference.fusion import fuse_for_inference
+from SkiNet.ML.model.architecture.unet2d import UNet2D
+
+torch.manual_seed(0)
+
+ENCODER_MODES = ["classical", "local_refinement", "he2", "se"]
+MERGE_MODES = ["classical", "local_refinement", "he1", "he2", "attention_gate"]
+
+
+def _trained_like(model: nn.Module) -> nn.Module:
+    """Give every BatchNorm non-trivial statistics and affine parameters, as after training."""
+    generator = torch.Generator().manual_seed(1)
+    for module in model.modules():
+        if isinstance(module, nn.BatchNorm2d):
+            n = module.num_features
+            assert module.running_mean is not None and module.running_var is not None
+            module.running_mean.copy_(torch.randn(n, generator=generator) * 0.5)
+            module.running_var.copy_(torch.rand(n, generator=generator) + 0.5)
+            module.weight.data.copy_(torch.rand(n, generator=generator) + 0.5)
+            module.bias.data.copy_(torch.randn(n, generator=generator) * 0.2)
+    return model.eval()
+
+
+@pytest.mark.parametrize("encoder_mode, merge_mode", list(itertools.product(ENCODER_MODES, MERGE_MODES)))
+def test_fused_model_matches_eval_model(encoder_mode: str, merge_mode: str) -> None:
+    model = _trained_like(UNet2D(in_channels=3, out_channels_layer1=8, number_of_layers=3, se_reduction=2,
+                                 encoder_residual_mode=encoder_mode,  # type: ignore[arg-type]
+                                 merge_residual_mode=merge_mode))  # type: ignore[arg-type]
+    fused = fuse_for_inference(model)
+    x = torch.randn(2, 3, 32, 48)
+
+    with torch.no_grad():
+        expected = model(x)
+        actual = fused(x)
+
+    assert torch.allclose(actual, expected, atol=1e-4, rtol=1e-4)
+    n_bn = sum(isinstance(module, nn.BatchNorm2d) for module in model.modules())
+    assert sum(isinstance(module, nn.BatchNorm2d) for module in fused.modules()) < n_bn
+
+
+def test_fusion_folds_post_activation_blocks_completely_and_leaves_the_original_untouched() -> None:
+    model = _trained_like(UNet2D(in_channels=3, out_channels_layer1=4, number_of_layers=3, debug_forward=True,
+                                 encoder_residual_mode="classical", merge_residual_mode="local_refinement"))
+    state = {k: v.clone() for k, v in model.state_dict().items()}
+
+    fused = fuse_for_inference(model)
+
+    assert not any(isinstance(module, nn.BatchNorm2d) for module in fused.modules())
+    assert isinstance(fused, UNet2D) and not fused.validate_forward and not fused.debug_forward
+    assert not fused.training and not any(p.requires_grad for p in fused.parameters())
+    assert model.validate_forward and model.debug_forward
+    assert all(torch.equal(v, state[k]) for k, v in model.state_dict().items())
@@ -0,0 +1,87 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+import torch
+import torch.nn as nn
+
+from SkiNet.ML.inference.onnx_quantization import (TensorCalibrationReader, compare_backends, load_split_tensors,
+                                                   quantize_int8, resize_to, sample_indices)
+from SkiNet.ML.model.architecture.unet2d import UNet2D
+
+torch.manual_seed(0)
+
+
+def test_sample_indices_split_is_disjoint_and_complete() -> None:
+    calibration, evaluation = sample_indices(20, 6, seed=1)
+    assert len(calibration) == 6
+    assert sorted(calibration + evaluation) == list(range(20))
+    assert sample_indices(20, 6, seed=1) == (calibration, evaluation)
+
+
+def test_calibration_reader_feeds_single_images_and_rewinds() -> None:
+    reader = TensorCalibrationReader("image", torch.randn(3, 3, 8, 8))
+    fed = [reader.get_next() for _ in range(4)]
+    assert [item["image"].shape for item in fed[:3] if item is not None] == [(1, 3, 8, 8)] * 3
+    assert fed[3] is None
+    reader.rewind()
+    assert reader.get_next() is not None
+
+
+def test_load_split_tensors_binarises_masks() -> None:
+    dataset = [{"image": torch.randn(3, 8, 8), "mask": torch.full((1, 8, 8), 255 * (i % 2), dtype=torch.uint8) / 255,
+                "specs": {"sampleid": str(i)}} for i in range(5)]
+
+    images, masks = load_split_tensors(dataset, [1, 2, 4], batch_size=2)  # type: ignore[arg-type]
+
+    assert images.shape == (3, 3, 8, 8)
+    assert masks[:, 0, 0, 0].tolist() == [1.0, 0.0, 0.0]
+
+
+def test_resize_to_keeps_masks_binary() -> None:
+    masks = (torch.rand(2, 1, 10, 12) > 0.5).float()
+    resized = resize_to(masks, (16, 16), is_mask=True)
+    assert resized.shape == (2, 1, 16, 16)
+    assert set(resized.unique().tolist()) <= {0.0, 1.0}
+
+
+def test_quantize_int8_rejects_mask_head_graphs(tmp_path: Path) -> None:
+    pytest.importorskip("onnxruntime")
+
+    class MaskHead(nn.Module):
+        def forward(self, x: torch.Tensor) -> torch.Tensor:
+            return (x[:, :1] >= 0).to(torch.uint8) * 255
+
+    onnx_path = tmp_path / "mask.onnx"
+    torch.onnx.export(MaskHead(), (torch.zeros(1, 3, 8, 8),), str(onnx_path), input_names=["image"],
+                      output_names=["mask"], dynamo=False)
+
+    with pytest.raises(ValueError, match="--mask-head"):
+        quantize_int8(onnx_path, tmp_path / "int8.onnx", torch.randn(2, 3, 8, 8))
+    assert not (tmp_path / "int8.onnx").exists()
+
+
+def test_int8_model_is_smaller_and_reported_against_pytorch(tmp_path: Path) -> None:
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnx")
+    from SkiNet.ML.inference.onnx_backend import OnnxRuntimeModel
+
+    model = UNet2D(in_channels=3, out_channels_layer1=8, number_of_layers=3, validate_forward=False).eval()
+    fp32_path = tmp_path / "model.onnx"
+    torch.onnx.export(nn.Sequential(model, nn.Sigmoid()), (torch.zeros(1, 3, 32, 32),), str(fp32_path),
+                      input_names=["image"], output_names=["mask_prob"],
+                      dynamic_axes={"image": {0: "batch"}, "mask_prob": {0: "batch"}}, dynamo=False)
+    images = torch.randn(6, 3, 32, 32)
+    masks = (torch.rand(6, 1, 32, 32) > 0.5).float()
+
+    int8_path = quantize_int8(fp32_path, tmp_path / "model_int8.onnx", images[:4])
+    report = compare_backends({"pytorch_fp32": model,
+                               "onnxruntime_fp32": OnnxRuntimeModel(fp32_path, 1, 1),
+                               "onnxruntime_int8": OnnxRuntimeModel(int8_path, 1, 1)},
+                              images, masks, threshold=0.5, batch_size=4, repeats=2, n_boot=10)
+
+    assert int8_path.stat().st_size < fp32_path.stat().st_size
+    assert list(report["backend"]) == ["pytorch_fp32", "onnxruntime_fp32", "onnxruntime_int8"]
+    assert report.loc[0, "dice_drift"] == 0
+    assert report.loc[1, "max_prob_diff"] < 1e-4
+    assert np.isfinite(report[["latency_ms", "images_per_s", "dice", "iou"]].to_numpy()).all()
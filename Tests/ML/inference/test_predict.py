@@ -0,0 +1,161 @@
+import csv
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pandas as pd
+import pytest
+import torch
+import torch.nn as nn
+
+from SkiNet.ML.inference.predict import (MaskWriter, bounded_map, list_input_images, load_model_for_prediction,
+                                         prediction_normalization, predict_images, rle_decode, rle_encode)
+from SkiNet.ML.model.architecture.unet2d import UNet2D
+from SkiNet.Utils.csv_headers import DATAPATH_HEADER, DATATYPE_HEADER, SAMPLEID_HEADER
+
+SIZES = {"ISIC_0000000": (40, 60), "ISIC_0000001": (33, 33), "ISIC_0000002": (64, 48)}
+
+
+@pytest.fixture
+def image_dir(tmp_path: Path) -> Path:
+    """Three RGB images of different sizes and one ground-truth mask."""
+    rng = np.random.default_rng(0)
+    root = tmp_path / "images"
+    (root / "nested").mkdir(parents=True)
+    for i, (sampleid, (h, w)) in enumerate(SIZES.items()):
+        directory = root / "nested" if i == 2 else root
+        cv2.imwrite(str(directory / f"{sampleid}.png"), rng.integers(0, 256, (h, w, 3), dtype=np.uint8))
+    cv2.imwrite(str(root / "ISIC_0000000_segmentation.png"), np.zeros((40, 60), dtype=np.uint8))
+    return root
+
+
+@pytest.fixture
+def model() -> nn.Module:
+    return UNet2D(in_channels=3, out_channels_layer1=4, number_of_layers=3, validate_forward=False)
+
+
+@pytest.mark.parametrize("mask", [np.zeros((3, 4), dtype=bool),
+                                  np.ones((3, 4), dtype=bool),
+                                  np.random.default_rng(0).random((17, 23)) > 0.5])
+def test_rle_round_trip(mask: np.ndarray) -> None:
+    assert np.array_equal(rle_decode(rle_encode(mask), mask.shape), mask)
+
+
+def test_rle_encode_uses_one_based_starts_and_lengths() -> None:
+    assert rle_encode(np.array([[0, 1, 1], [1, 0, 0]])) == "2 3"
+    assert rle_encode(np.zeros((2, 2))) == ""
+
+
+def test_list_input_images_from_directory_skips_masks(image_dir: Path) -> None:
+    items = list_input_images(image_dir)
+    assert [sampleid for sampleid, _ in items] == list(SIZES)
+    assert items[2][1] == image_dir / "nested" / "ISIC_0000002.png"
+
+
+def test_list_input_images_from_csv_keeps_image_rows(image_dir: Path, tmp_path: Path) -> None:
+    csv_path = tmp_path / "metadata.csv"
+    pd.DataFrame({SAMPLEID_HEADER: ["a", "a"],
+                  DATAPATH_HEADER: ["ISIC_0000001.png", "ISIC_0000000_segmentation.png"],
+                  DATATYPE_HEADER: ["image", "mask"]}).to_csv(csv_path, index=False)
+
+    assert list_input_images(csv_path, data_root=image_dir) == [("a", image_dir / "ISIC_0000001.png")]
+
+
+def test_bounded_map_keeps_order() -> None:
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        assert list(bounded_map(executor, lambda x: x * x, range(10), max_in_flight=2)) == [x * x for x in range(10)]
+
+
+@pytest.mark.parametrize("mode", ["resized", "tiled"])
+def test_predict_images_writes_png_masks_at_original_size(image_dir: Path, tmp_path: Path, model: nn.Module,
+                                                          mode: str) -> None:
+    out = tmp_path / "out"
+    # threshold 0 turns every pixel into foreground, whatever the random weights
+    stats = predict_images(model, list_input_images(image_dir), MaskWriter(out, "png", threshold=0.0),
+                           normalize=prediction_normalization(None), mode=mode,  # type: ignore[arg-type]
+                           input_size=32, batch_size=2, decode_workers=1, queue_size=1)
+
+    assert stats.images == 3
+    for sampleid, size in SIZES.items():
+        mask = cv2.imread(str(out / f"{sampleid}_segmentation.png"), cv2.IMREAD_UNCHANGED)
+        assert mask is not None
+        assert mask.shape == size
+        assert (mask == 255).all()
+
+
+def test_predict_images_writes_rle_and_npz(image_dir: Path, tmp_path: Path, model: nn.Module) -> None:
+    items = list_input_images(image_dir)
+    predict_images(model, items, MaskWriter(tmp_path / "rle", "rle", threshold=1.1),
+                   normalize=prediction_normalization(None), input_size=32, decode_workers=1)
+    predict_images(model, items, MaskWriter(tmp_path / "npz", "npz", threshold=0.3),
+                   normalize=prediction_normalization(None), input_size=32, decode_workers=1)
+
+    with open(tmp_path / "rle" / "masks_rle.csv") as f:
+        rows = list(csv.DictReader(f))
+    assert [(row[SAMPLEID_HEADER], int(row["height"]), int(row["width"]), row["rle"]) for row in rows] == \
+        [(sampleid, *SIZES[sampleid], "") for sampleid, _ in items]
+    npz = np.load(tmp_path / "npz" / "ISIC_0000001.npz")
+    assert npz["probability"].shape == SIZES["ISIC_0000001"]
+    assert npz["probability"].dtype == np.float16
+    assert npz["threshold"] == pytest.approx(0.3)
+
+
+def test_mask_writer_writes_rle_rows_in_input_order(tmp_path: Path) -> None:
+    writer = MaskWriter(tmp_path, "rle", threshold=0.5)
+    for index in (2, 0, 3, 1):
+        writer.write(f"sample{index}", torch.full((1, 2, 2), float(index) - 1.5), (2, 2), index=index)
+    writer.close()
+
+    with open(tmp_path / "masks_rle.csv") as f:
+        rows = list(csv.DictReader(f))
+    assert [(row[SAMPLEID_HEADER], row["rle"]) for row in rows] == \
+        [("sample0", ""), ("sample1", ""), ("sample2", "1 4"), ("sample3", "1 4")]
+
+
+def test_predict_images_writes_identical_rle_csvs(image_dir: Path, tmp_path: Path, model: nn.Module) -> None:
+    items = list_input_images(image_dir)
+    for run in ("a", "b"):
+        predict_images(model, items, MaskWriter(tmp_path / run, "rle", threshold=0.5), batch_size=1,
+                       normalize=prediction_normalization(None), input_size=32, decode_workers=1, writer_threads=3)
+    assert (tmp_path / "a" / "masks_rle.csv").read_bytes() == (tmp_path / "b" / "masks_rle.csv").read_bytes()
+
+
+def test_predict_images_reraises_writer_errors(image_dir: Path, tmp_path: Path, model: nn.Module) -> None:
+    class FailingWriter(MaskWriter):
+        def write(self, sampleid: str, logits: torch.Tensor, size: tuple[int, int], index: int | None = None) -> None:
+            raise OSError("disk full")
+
+    with pytest.raises(OSError, match="disk full"):
+        predict_images(model, list_input_images(image_dir), FailingWriter(tmp_path / "out", "png", 0.5),
+                       normalize=prediction_normalization(None), input_size=32, decode_workers=1)
+
+
+def test_onnx_model_returns_logits(tmp_path: Path) -> None:
+    pytest.importorskip("onnxruntime")
+    from SkiNet.ML.inference.onnx_backend import OnnxRuntimeModel
+
+    backbone = nn.Conv2d(3, 1, kernel_size=1)
+    onnx_path = tmp_path / "model.onnx"
+    torch.onnx.export(nn.Sequential(backbone, nn.Sigmoid()), (torch.zeros(1, 3, 8, 8),), str(onnx_path),
+                      input_names=["image"], output_names=["mask_prob"], dynamo=False)
+
+    x = torch.randn(1, 3, 8, 8)
+    with torch.no_grad():
+        expected = backbone(x).clamp(-10, 10)
+    assert torch.allclose(OnnxRuntimeModel(onnx_path)(x).clamp(-10, 10), expected, atol=1e-3)
+
+
+def test_onnx_mask_head_graphs_are_rejected(tmp_path: Path) -> None:
+    pytest.importorskip("onnxruntime")
+
+    class MaskHead(nn.Module):
+        def forward(self, x: torch.Tensor) -> torch.Tensor:
+            return (x[:, :1] >= 0).to(torch.uint8) * 255
+
+    onnx_path = tmp_path / "mask.onnx"
+    torch.onnx.export(MaskHead(), (torch.zeros(1, 3, 8, 8),), str(onnx_path), input_names=["image"],
+                      output_names=["mask"], dynamo=False)
+
+    with pytest.raises(ValueError, match="--mask-head"):
+        load_model_for_prediction(onnx_path=onnx_path)
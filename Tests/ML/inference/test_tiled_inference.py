@@ -0,0 +1,83 @@
+import pytest
+import torch
+import torch.nn as nn
+
+from SkiNet.ML.inference.tiled_inference import (TiledPredictor, blending_window, predict_resized,
+                                                 tile_starts)
+from SkiNet.ML.model.architecture.unet2d import UNet2D
+
+torch.manual_seed(0)
+
+
+@pytest.mark.parametrize("mode", ["gaussian", "cosine", "constant"])
+def test_blending_window_is_positive_symmetric_and_peaks_at_one(mode: str) -> None:
+    window = blending_window(32, mode)  # type: ignore[arg-type]
+    assert window.shape == (32,)
+    assert (window > 0).all()
+    assert window.max() == pytest.approx(1.0)
+    assert torch.allclose(window, window.flip(0))
+
+
+def test_blending_window_rejects_unknown_mode() -> None:
+    with pytest.raises(ValueError, match="Unknown blend mode"):
+        blending_window(8, "linear")  # type: ignore[arg-type]
+
+
+@pytest.mark.parametrize("length, tile, overlap", [(256, 256, 0.25), (1000, 256, 0.25), (767, 256, 0.5), (300, 64, 0.0)])
+def test_tile_starts_cover_the_axis_with_requested_overlap(length: int, tile: int, overlap: float) -> None:
+    starts = tile_starts(length, tile, overlap)
+    assert starts[0] == 0
+    assert starts[-1] + tile == length
+    for previous, start in zip(starts, starts[1:]):
+        assert tile - (start - previous) >= int(tile * overlap)
+
+
+def test_pointwise_model_gives_exact_whole_image_logits() -> None:
+    """Blended logits of a 1x1 convolution equal the whole-image logits, whatever the weights."""
+    model = nn.Conv2d(3, 2, kernel_size=1)
+    image = torch.randn(3, 70, 90)
+    predictor = TiledPredictor(model, tile_size=(32, 48), overlap=0.5, batch_size=3, blend="cosine")
+
+    with torch.no_grad():
+        expected = model(image[None])[0]
+    assert torch.allclose(predictor.predict_logits(image), expected, atol=1e-5)
+
+
+def test_image_smaller_than_tile_is_padded_and_cropped_back() -> None:
+    model = nn.Conv2d(3, 1, kernel_size=1)
+    image = torch.randn(3, 10, 40)
+
+    probs = TiledPredictor(model, tile_size=32).predict(image)
+
+    with torch.no_grad():
+        expected = model(image[None])[0].sigmoid()
+    assert probs.shape == (1, 10, 40)
+    assert torch.allclose(probs, expected, atol=1e-5)
+
+
+def test_unet2d_tiled_prediction_has_full_resolution() -> None:
+    model = UNet2D(in_channels=3, out_channels_layer1=4, number_of_layers=3, validate_forward=False)
+    predictor = TiledPredictor(model, tile_size=32, overlap=0.25, batch_size=4)
+
+    probs = predictor.predict(torch.randn(3, 50, 75))
+
+    assert probs.shape == (1, 50, 75)
+    assert probs.min() >= 0 and probs.max() <= 1
+
+
+def test_tile_size_must_match_required_input_multiple() -> None:
+    model = UNet2D(in_channels=3, out_channels_layer1=4, number_of_layers=3)
+    with pytest.raises(ValueError, match="not divisible"):
+        TiledPredictor(model, tile_size=30)
+
+
+def test_overlap_out_of_range_raises() -> None:
+    with pytest.raises(ValueError, match="overlap"):
+        TiledPredictor(nn.Identity(), tile_size=32, overlap=1.0)
+
+
+def test_predict_resized_returns_probabilities_at_input_resolution() -> None:
+    model = UNet2D(in_channels=3, out_channels_layer1=4, number_of_layers=3).eval()
+    probs = predict_resized(model, torch.randn(3, 50, 75), input_size=32)
+    assert probs.shape == (1, 50, 75)
+    assert probs.min() >= 0 and probs.max() <= 1
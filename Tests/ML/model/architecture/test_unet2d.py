@@ -129,6 +129,13 @@ def test_unet_layers_n4_forward() -> None:
     assert len(model.decoders) == 3
     assert len(model.mergeblocks) == 3
 
+
+@pytest.mark.parametrize("stride, number_of_layers, expected", [(2, 5, (16, 16)), ((2, 1), 4, (8, 1))])
+def test_unet2d_required_input_multiple(stride: int | tuple[int, int], number_of_layers: int,
+                                        expected: tuple[int, int]) -> None:
+    model = UNet2D(in_channels=3, out_channels_layer1=2, stride=stride, number_of_layers=number_of_layers)
+    assert model.required_input_multiple == expected
+
 # --------------------------------------------------
 # UNet forward shape tests
 # --------------------------------------------------
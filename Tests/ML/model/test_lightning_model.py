@@ -1,11 +1,21 @@
-from unittest.mock import patch
+import json
+from pathlib import Path
+from typing import cast
+from unittest.mock import MagicMock, PropertyMock, patch
 
 import pytest
 import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
 import torch.nn as nn
+from torchmetrics.functional.classification import binary_f1_score
 
 from SkiNet.ML.configs.train_configs.train_config import CosineAnnealingConfig, ReduceOnPlateauConfig
+from SkiNet.ML.configs.transform_configs.crop_config import CropConfig
+from SkiNet.ML.configs.transform_configs.transform_config import TransformConfig
 from SkiNet.ML.model.lightning_model import LightningModel
+from SkiNet.ML.training.training_utils import find_best_threshold, mean_dice_per_image
+from SkiNet.ML.transformations.batch_augmentation import BatchAugmentation
 
 
 # ---------------------------------------------------------------------------
@@ -162,6 +172,15 @@ def test_get_probs_and_preds_preds_are_long() -> None:
     assert result["preds"].dtype == torch.long
 
 
+def test_get_probs_and_preds_returns_float32_probs_for_bf16_logits() -> None:
+    """Checks that bf16-mixed logits give float32 probabilities, so the threshold search
+    is not limited to the ~0.004 resolution of bfloat16 near 1."""
+    logits = torch.tensor([4.0, 5.0]).to(torch.bfloat16)
+    result = LightningModel._get_probs_and_preds(logits, torch.tensor(0.5))
+    assert result["probs"].dtype == torch.float32
+    assert result["probs"][0] != result["probs"][1]
+
+
 # ---------------------------------------------------------------------------
 # _raise_if_non_finite
 # ---------------------------------------------------------------------------
@@ -205,9 +224,9 @@ def test_raise_if_non_finite_error_contains_tensor_name(lm: LightningModel) -> N
 # ---------------------------------------------------------------------------
 
 def test_threshold_search_returns_early_on_empty_probs(lm: LightningModel) -> None:
-    """Checks that the method exits immediately when no validation probabilities have
-    been collected (empty _val_probs). Without this guard the method would call
-    self.log, which raises without an attached trainer."""
+    """Checks that the method exits immediately when no validation counts have
+    been accumulated (no update of val_threshold_counts). Without this guard the method
+    would call self.log, which raises without an attached trainer."""
     lm._compute_and_log_threshold_search_metrics_for_sigmoid()
 
 
@@ -216,23 +235,21 @@ def test_threshold_search_logs_sentinel_on_single_class(lm: LightningModel) -> N
     the method logs val_best_dice_at_threshold=0.0 and val_mean_dice_per_image=0.0 as
     sentinels. Both keys must exist so Optuna never hits a KeyError regardless of which
     one is the active monitor."""
-    lm._val_probs = [torch.ones(1, 10)]
-    lm._val_masks = [torch.ones(1, 10)]
+    lm.val_threshold_counts.update(torch.ones(1, 10), torch.ones(1, 10))
     with patch.object(lm, "log") as mock_log:
         lm._compute_and_log_threshold_search_metrics_for_sigmoid()
     logged_keys = {call.args[0] for call in mock_log.call_args_list}
     assert logged_keys == {"val_best_dice_at_threshold", "val_mean_dice_per_image"}
 
 
-def test_threshold_search_clears_lists_on_single_class(lm: LightningModel) -> None:
-    """Checks that _val_probs and _val_masks are cleared even in the single-class
-    early-return branch, preventing stale data from bleeding into the next epoch."""
-    lm._val_probs = [torch.ones(1, 10)]
-    lm._val_masks = [torch.ones(1, 10)]
+def test_threshold_search_resets_counts_on_single_class(lm: LightningModel) -> None:
+    """Checks that val_threshold_counts is reset even in the single-class
+    early-return branch, preventing stale counts from bleeding into the next epoch."""
+    lm.val_threshold_counts.update(torch.ones(1, 10), torch.ones(1, 10))
     with patch.object(lm, "log"):
         lm._compute_and_log_threshold_search_metrics_for_sigmoid()
-    assert lm._val_probs == []
-    assert lm._val_masks == []
+    assert lm.val_threshold_counts.update_count == 0
+    assert lm.val_threshold_counts.images.item() == 0
 
 
 def test_threshold_search_updates_optimal_threshold(lm: LightningModel) -> None:
@@ -243,24 +260,22 @@ def test_threshold_search_updates_optimal_threshold(lm: LightningModel) -> None:
     to 0.8 in linspace(1.0, 0.0, 51). pytest.approx handles float32 rounding."""
     probs = torch.tensor([[0.1, 0.2, 0.8, 0.9]])
     masks = torch.tensor([[0.0, 0.0, 1.0, 1.0]])
-    lm._val_probs = [probs]
-    lm._val_masks = [masks]
+    lm.val_threshold_counts.update(probs, masks)
     with patch.object(lm, "log"), \
             patch.object(lm.val_dice, "compute", return_value=torch.tensor(0.5)):
         lm._compute_and_log_threshold_search_metrics_for_sigmoid()
     assert lm.optimal_threshold.item() == pytest.approx(0.8, abs=0.02)
 
 
-def test_threshold_search_clears_lists_after_update(lm: LightningModel) -> None:
-    """Checks that _val_probs and _val_masks are cleared after a successful threshold
-    sweep so that the next validation epoch starts from an empty accumulation buffer."""
-    lm._val_probs = [torch.tensor([[0.1, 0.9]])]
-    lm._val_masks = [torch.tensor([[0.0, 1.0]])]
+def test_threshold_search_resets_counts_after_update(lm: LightningModel) -> None:
+    """Checks that val_threshold_counts is reset after a successful threshold
+    sweep so that the next validation epoch starts from zero counts."""
+    lm.val_threshold_counts.update(torch.tensor([[0.1, 0.9]]), torch.tensor([[0.0, 1.0]]))
     with patch.object(lm, "log"), \
             patch.object(lm.val_dice, "compute", return_value=torch.tensor(0.5)):
         lm._compute_and_log_threshold_search_metrics_for_sigmoid()
-    assert lm._val_probs == []
-    assert lm._val_masks == []
+    assert lm.val_threshold_counts.update_count == 0
+    assert lm.val_threshold_counts.images.item() == 0
 
 
 def test_threshold_search_logs_dice_threshold_gain(lm: LightningModel) -> None:
@@ -274,8 +289,7 @@ def test_threshold_search_logs_dice_threshold_gain(lm: LightningModel) -> None:
     # Case 1: fixed threshold already perfect → gain == 0
     probs = torch.tensor([[0.1, 0.2, 0.8, 0.9]])
     masks = torch.tensor([[0.0, 0.0, 1.0, 1.0]])
-    lm._val_probs = [probs]
-    lm._val_masks = [masks]
+    lm.val_threshold_counts.update(probs, masks)
     logged: dict[str, float] = {}
     with patch.object(lm, "log", side_effect=lambda key, val, **_: logged.update({key: float(val)})):
         lm._compute_and_log_threshold_search_metrics_for_sigmoid()
@@ -284,8 +298,7 @@ def test_threshold_search_logs_dice_threshold_gain(lm: LightningModel) -> None:
 
     # Case 2: positive prob (0.6) straddles 0.5 → fixed threshold classifies it as
     # positive when the true label is 0, so fixed-thr Dice < best Dice → gain > 0
-    lm._val_probs = [torch.tensor([[0.1, 0.6, 0.9]])]
-    lm._val_masks = [torch.tensor([[0.0, 0.0, 1.0]])]
+    lm.val_threshold_counts.update(torch.tensor([[0.1, 0.6, 0.9]]), torch.tensor([[0.0, 0.0, 1.0]]))
     logged2: dict[str, float] = {}
     with patch.object(lm, "log", side_effect=lambda key, val, **_: logged2.update({key: float(val)})):
         lm._compute_and_log_threshold_search_metrics_for_sigmoid()
@@ -309,10 +322,204 @@ def test_threshold_search_logs_mean_dice_per_image(lm: LightningModel) -> None:
 
     # image B is all-background so the two-class check would fire; add a positive image
     # with a clear positive label to keep both classes present overall
-    lm._val_probs = [probs]
-    lm._val_masks = [masks]
+    lm.val_threshold_counts.update(probs, masks)
     logged: dict[str, float] = {}
     with patch.object(lm, "log", side_effect=lambda key, val, **_: logged.update({key: float(val)})):
         lm._compute_and_log_threshold_search_metrics_for_sigmoid()
     assert "val_mean_dice_per_image" in logged
     assert 0.0 <= logged["val_mean_dice_per_image"] <= 1.0
+
+
+def _threshold_search_model(optimal_threshold: float | None = None) -> LightningModel:
+    return LightningModel(model=nn.Identity(), loss_fn=nn.BCEWithLogitsLoss(), lr=1e-3, optimizer_name="adam",
+                          weight_decay=0.0, lr_scheduler_config=ReduceOnPlateauConfig(),
+                          cosine_annealing_config=CosineAnnealingConfig(), optimal_threshold=optimal_threshold)
+
+
+def _validation_batches() -> list[tuple[torch.Tensor, torch.Tensor]]:
+    generator = torch.Generator().manual_seed(3)
+    return [(torch.rand(n, 1, 6, 5, generator=generator), (torch.rand(n, 1, 6, 5, generator=generator) > 0.6).float())
+            for n in (3, 1, 4, 2)]
+
+
+def _threshold_search_logs(lm: LightningModel, batches: list[tuple[torch.Tensor, torch.Tensor]]) -> dict[str, float]:
+    for probs, masks in batches:
+        lm.val_threshold_counts.update(probs, masks)
+    logged: dict[str, float] = {}
+    with patch.object(lm, "log", side_effect=lambda key, val, **_: logged.update({key: float(val)})):
+        lm._compute_and_log_threshold_search_metrics_for_sigmoid()
+    return logged
+
+
+@pytest.mark.parametrize("optimal_threshold", [None, 0.37])
+def test_threshold_search_matches_search_on_all_probabilities(optimal_threshold: float | None) -> None:
+    """Checks that the metrics derived from the streamed counts equal those of the former
+    implementation, which concatenated the probabilities of all batches and ran
+    find_best_threshold and mean_dice_per_image on them."""
+    batches = _validation_batches()
+    logged = _threshold_search_logs(_threshold_search_model(optimal_threshold), batches)
+
+    all_probs = torch.cat([probs.reshape(probs.shape[0], -1) for probs, _ in batches])
+    all_targets = torch.cat([masks.reshape(masks.shape[0], -1) for _, masks in batches]).long()
+    if optimal_threshold is None:
+        expected = find_best_threshold(all_probs.reshape(-1), all_targets.reshape(-1))
+    else:
+        expected = {"best_threshold": optimal_threshold,
+                    "best_dice": binary_f1_score((all_probs >= optimal_threshold).long(), all_targets).item()}
+    assert logged["val_optimal_threshold"] == pytest.approx(expected["best_threshold"])
+    assert logged["val_best_dice_at_threshold"] == pytest.approx(expected["best_dice"], abs=1e-6)
+    assert logged["val_mean_dice_per_image"] == pytest.approx(
+        mean_dice_per_image(all_probs, all_targets, expected["best_threshold"]).item(), abs=1e-6)
+    fixed_dice = binary_f1_score((all_probs >= 0.5).long(), all_targets).item()
+    assert logged["val_dice_threshold_gain"] == pytest.approx(expected["best_dice"] - fixed_dice, abs=1e-6)
+
+
+def _ddp_threshold_search_worker(rank: int, world_size: int, tmp_dir: str) -> None:
+    dist.init_process_group("gloo", init_method=f"file://{tmp_dir}/init", rank=rank, world_size=world_size)
+    try:
+        logged = _threshold_search_logs(_threshold_search_model(), _validation_batches()[rank::world_size])
+        Path(tmp_dir, f"rank{rank}.json").write_text(json.dumps(logged))
+    finally:
+        dist.destroy_process_group()
+
+
+@pytest.mark.slow
+@pytest.mark.skipif(not dist.is_available(), reason="torch.distributed not available")
+def test_threshold_search_under_ddp_uses_the_whole_validation_set(tmp_path: Path) -> None:
+    """Checks that with the validation batches sharded over two gloo ranks, both ranks
+    all-reduce the counts and log exactly what a single process logs for all batches,
+    instead of per-shard values averaged by sync_dist."""
+    mp.spawn(_ddp_threshold_search_worker, args=(2, str(tmp_path)), nprocs=2, join=True)
+
+    expected = _threshold_search_logs(_threshold_search_model(), _validation_batches())
+    for rank in range(2):
+        logged = json.loads((tmp_path / f"rank{rank}.json").read_text())
+        assert logged == pytest.approx(expected, abs=1e-6)
+
+
+# ---------------------------------------------------------------------------
+# _log_train_loss
+# ---------------------------------------------------------------------------
+
+def _train_loss_logs(metric_sync: str, losses: list[float], reduced: list[torch.Tensor]) -> list[tuple[str, float, dict]]:
+    """Log the given step losses (batch size 2) over one epoch and return the (key, value, kwargs) of every
+    self.log call; the sums all-reduced by the strategy are appended to ``reduced``."""
+    lm = _threshold_search_model()
+    lm.metric_sync = metric_sync  # type: ignore[assignment]
+    lm.metric_sync_interval = 2
+
+    def reduce(tensor: torch.Tensor, reduce_op: str) -> torch.Tensor:
+        reduced.append(tensor.clone())
+        return tensor
+
+    trainer = MagicMock()
+    trainer.strategy.reduce.side_effect = reduce
+    logs: list[tuple[str, float, dict]] = []
+    with patch.object(LightningModel, "trainer", new_callable=PropertyMock, return_value=trainer), \
+            patch.object(lm, "log", side_effect=lambda key, val, **kwargs: logs.append((key, float(val), kwargs))):
+        lm.on_train_epoch_start()
+        for loss in losses:
+            lm._log_train_loss(torch.tensor(loss), batch_size=2)
+        lm.on_train_epoch_end()
+    return logs
+
+
+def test_train_loss_synced_every_step_by_default() -> None:
+    reduced: list[torch.Tensor] = []
+    logs = _train_loss_logs("step", [0.4, 0.2], reduced)
+    assert [(key, kwargs["on_step"], kwargs["on_epoch"], kwargs["sync_dist"]) for key, _, kwargs in logs] == \
+        [("train_loss", True, True, True)] * 2
+    assert reduced == []
+
+
+def test_train_loss_with_epoch_sync_logs_local_steps_and_reduces_once_per_epoch() -> None:
+    reduced: list[torch.Tensor] = []
+    logs = _train_loss_logs("epoch", [0.4, 0.2], reduced)
+    assert [(key, value, kwargs["sync_dist"]) for key, value, kwargs in logs] == [
+        ("train_loss_step", pytest.approx(0.4), False), ("train_loss_step", pytest.approx(0.2), False),
+        ("train_loss_epoch", pytest.approx(0.3), False)]
+    assert [window.tolist() for window in reduced] == [[pytest.approx(1.2), 4.0]]
+
+
+def test_train_loss_with_interval_sync_reduces_one_window_per_interval() -> None:
+    """Checks that the per-step loss is all-reduced once per window of metric_sync_interval
+    steps, as (sum of loss × batch size, samples), and logged as the window mean, with no
+    self.log call on the other steps; the epoch mean is reduced once at epoch end."""
+    reduced: list[torch.Tensor] = []
+    logs = _train_loss_logs("interval", [0.4, 0.2, 0.6, 0.8, 1.0], reduced)
+    assert [(key, value) for key, value, _ in logs] == [
+        ("train_loss_step", pytest.approx(0.3)), ("train_loss_step", pytest.approx(0.7)),
+        ("train_loss_epoch", pytest.approx(0.6))]
+    assert [window.tolist() for window in reduced] == [[pytest.approx(1.2), 4.0], [pytest.approx(2.8), 4.0],
+                                                       [pytest.approx(6.0), 10.0]]
+
+
+def test_validation_step_does_not_log_threshold_used(lm: LightningModel) -> None:
+    batch = {"image": torch.randn(2, 1, 4, 4), "mask": (torch.rand(2, 1, 4, 4) > 0.5).float()}
+    with patch.object(lm, "log") as mock_log:
+        lm.validation_step(batch, 0)
+    assert "val_threshold_used" not in {call.args[0] for call in mock_log.call_args_list}
+    assert lm.val_threshold_counts.update_count == 1
+
+
+# ---------------------------------------------------------------------------
+# on_after_batch_transfer
+# ---------------------------------------------------------------------------
+
+def test_on_after_batch_transfer_without_batch_augmentation_returns_batch(lm: LightningModel) -> None:
+    batch = {"image": torch.zeros(1, 3, 4, 4), "mask": torch.zeros(1, 1, 4, 4)}
+    assert lm.on_after_batch_transfer(batch, 0) is batch
+
+
+@pytest.mark.parametrize("training", [True, False])
+def test_on_after_batch_transfer_applies_batch_augmentation(training: bool) -> None:
+    """Checks that padded uint8 batches are cropped and normalised on the device, keeping the other keys."""
+    config = TransformConfig(augmentation_backend="batched", crop=CropConfig(crop_type="random_crop", size=(8, 8)))
+    model = LightningModel(
+        model=nn.Identity(),
+        loss_fn=nn.BCEWithLogitsLoss(),
+        lr=1e-3,
+        optimizer_name="adam",
+        weight_decay=0.0,
+        lr_scheduler_config=ReduceOnPlateauConfig(),
+        cosine_annealing_config=CosineAnnealingConfig(),
+        batch_augmentation=BatchAugmentation(config),
+    )
+    model.train(training)
+    batch = {"image": torch.randint(0, 256, (2, 3, 12, 16), dtype=torch.uint8),
+             "mask": torch.ones((2, 1, 12, 16), dtype=torch.uint8),
+             "image_size": torch.tensor([[12, 16], [10, 9]]),
+             "specs": ["a", "b"]}
+
+    out = model.on_after_batch_transfer(batch, 0)
+
+    assert out["image"].shape == (2, 3, 8, 8)
+    assert out["image"].dtype == torch.float32
+    assert out["mask"].shape == (2, 1, 8, 8)
+    assert torch.all(out["mask"] == 1)
+    assert out["specs"] == ["a", "b"]
+    assert "batch_augmentation" not in model.hparams
+
+
+def test_channels_last_converts_model_and_transferred_images() -> None:
+    """Checks that channels_last=True converts the backbone weights and the images of every
+    transferred batch to channels-last memory format, leaving the masks as they are."""
+    model = LightningModel(
+        model=nn.Conv2d(3, 1, kernel_size=3, padding=1),
+        loss_fn=nn.BCEWithLogitsLoss(),
+        lr=1e-3,
+        optimizer_name="adam",
+        weight_decay=0.0,
+        lr_scheduler_config=ReduceOnPlateauConfig(),
+        cosine_annealing_config=CosineAnnealingConfig(),
+        channels_last=True,
+    )
+    batch = {"image": torch.randn(2, 3, 8, 8), "mask": torch.zeros(2, 1, 8, 8)}
+
+    out = model.on_after_batch_transfer(batch, 0)
+
+    assert cast(nn.Conv2d, model.model).weight.is_contiguous(memory_format=torch.channels_last)
+    assert out["image"].is_contiguous(memory_format=torch.channels_last)
+    assert not out["image"].is_contiguous()
+    assert out["mask"] is batch["mask"]
+    assert torch.equal(out["image"], batch["image"])
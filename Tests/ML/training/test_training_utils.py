@@ -1,7 +1,9 @@
 import pytest
 import torch
 
-from SkiNet.ML.training.training_utils import find_best_threshold
+from SkiNet.ML.training.training_utils import (ThresholdSweepCounts, dice_from_counts, find_best_threshold,
+                                               find_best_threshold_broadcast, mean_dice_per_image,
+                                               threshold_confusion_counts)
 
 
 # ---------------------------------------------------------------------------
@@ -241,6 +243,34 @@ def test_coarser_grid_still_finds_good_threshold(
     assert result_coarse["best_dice"] <= result_fine["best_dice"] + 1e-6
 
 
+# ---------------------------------------------------------------------------
+# Bucketed implementation against the broadcast reference
+# ---------------------------------------------------------------------------
+
+@pytest.mark.parametrize("n_thresholds", [1, 2, 11, 51, 1001])
+def test_matches_broadcast_reference(n_thresholds: int) -> None:
+    generator = torch.Generator().manual_seed(n_thresholds)
+    # quantised probabilities land exactly on grid thresholds, exercising the >= ties
+    probs = torch.randint(0, 101, (5000,), generator=generator) / 100
+    targets = (torch.rand(5000, generator=generator) < probs).float()
+    assert find_best_threshold(probs, targets, n_thresholds) == find_best_threshold_broadcast(probs, targets, n_thresholds)
+
+
+def test_confusion_counts_match_broadcast_per_image() -> None:
+    generator = torch.Generator().manual_seed(0)
+    probs = torch.rand(3, 40, generator=generator)
+    targets = torch.rand(3, 40, generator=generator) > 0.5
+    thresholds = torch.tensor([0.5, 0.9, 0.1, 0.5, 0.0, 1.0])
+    probs[0, :4] = torch.tensor([0.0, 0.1, 0.5, 1.0])
+
+    tp, fp, fn = threshold_confusion_counts(probs, targets, thresholds)
+
+    preds = probs.unsqueeze(1) >= thresholds.reshape(1, -1, 1)  # [N, T, P]
+    assert torch.equal(tp, (preds & targets.unsqueeze(1)).sum(-1))
+    assert torch.equal(fp, (preds & ~targets.unsqueeze(1)).sum(-1))
+    assert torch.equal(fn, (~preds & targets.unsqueeze(1)).sum(-1))
+
+
 # ---------------------------------------------------------------------------
 # Device test
 # ---------------------------------------------------------------------------
@@ -260,3 +290,54 @@ def test_works_on_cuda(perfect_separation: tuple[torch.Tensor, torch.Tensor]) ->
     probs, targets = perfect_separation
     result = find_best_threshold(probs.cuda(), targets.cuda())
     assert result["best_dice"] == pytest.approx(1.0)
+
+
+# ---------------------------------------------------------------------------
+# ThresholdSweepCounts
+# ---------------------------------------------------------------------------
+
+def test_sweep_counts_match_broadcast_counts_and_mean_dice_per_image() -> None:
+    generator = torch.Generator().manual_seed(0)
+    # unsorted and repeated thresholds; probabilities exactly on thresholds count as positive
+    thresholds = torch.tensor([0.5, 1.0, 0.0, 0.25, 0.5, 0.75])
+    batches = [(torch.rand(n, 1, 4, 4, generator=generator), (torch.rand(n, 1, 4, 4, generator=generator) > 0.5).float())
+               for n in (2, 3)]
+    batches[0][0][0, 0, 0, :] = torch.tensor([0.0, 0.25, 0.5, 1.0])
+    metric = ThresholdSweepCounts(thresholds)
+    for probs, masks in batches:
+        metric.update(probs, masks)
+    counts = metric.compute()
+
+    probs = torch.cat([p.reshape(p.shape[0], -1) for p, _ in batches])
+    targets = torch.cat([m.reshape(m.shape[0], -1) for _, m in batches]).bool()
+    preds = probs.unsqueeze(0) >= thresholds.reshape(-1, 1, 1)  # [T, N, P]
+    assert torch.equal(counts["tp"], (preds & targets).sum((1, 2)))
+    assert torch.equal(counts["fp"], (preds & ~targets).sum((1, 2)))
+    assert torch.equal(counts["fn"], (~preds & targets).sum((1, 2)))
+    expected = torch.stack([mean_dice_per_image(probs, targets, float(t)) for t in thresholds])
+    assert torch.allclose(counts["mean_image_dice"], expected, atol=1e-6)
+    assert counts["positives"].item() == targets.sum().item()
+    assert counts["pixels"].item() == probs.numel()
+
+
+def test_sweep_counts_reproduce_find_best_threshold(random_probs_targets: tuple[torch.Tensor, torch.Tensor]) -> None:
+    probs, targets = random_probs_targets
+    thresholds = torch.linspace(1.0, 0.0, 51)
+    metric = ThresholdSweepCounts(thresholds)
+    metric.update(probs.reshape(4, 50), targets.reshape(4, 50))
+    counts = metric.compute()
+
+    dice = dice_from_counts(counts["tp"], counts["fp"], counts["fn"])
+    expected = find_best_threshold(probs, targets)
+    assert thresholds[dice.argmax()].item() == expected["best_threshold"]
+    assert dice.max().item() == expected["best_dice"]
+
+
+def test_sweep_counts_reset_and_reject_empty_thresholds() -> None:
+    metric = ThresholdSweepCounts([0.5])
+    metric.update(torch.tensor([[0.2, 0.7]]), torch.tensor([[0.0, 1.0]]))
+    metric.reset()
+    assert metric.update_count == 0
+    assert metric.tp.tolist() == [0]
+    with pytest.raises(ValueError, match="at least one threshold"):
+        ThresholdSweepCounts([])
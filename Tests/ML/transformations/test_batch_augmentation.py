@@ -0,0 +1,135 @@
+import albumentations as A
+import numpy as np
+import pytest
+import torch
+
+from SkiNet.ML.configs.transform_configs.augment_config import PhotoAugmentConfig, SpatialAugmentConfig
+from SkiNet.ML.configs.transform_configs.crop_config import CropConfig
+from SkiNet.ML.configs.transform_configs.transform_config import TransformConfig
+from SkiNet.ML.transformations.batch_augmentation import BatchAugmentation
+
+
+def _batch(sizes: list[tuple[int, int]], seed: int = 0) -> tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """
+    Zero-padded uint8 batch whose masks are derived from the image, so that geometric sync can be checked.
+    """
+    g = torch.Generator().manual_seed(seed)
+    max_h, max_w = max(h for h, _ in sizes), max(w for _, w in sizes)
+    image = torch.zeros((len(sizes), 3, max_h, max_w), dtype=torch.uint8)
+    for i, (h, w) in enumerate(sizes):
+        image[i, :, :h, :w] = torch.randint(0, 256, (3, h, w), generator=g, dtype=torch.uint8)
+    mask = (image[:, :1] > 127).to(torch.uint8)
+    return image, mask, torch.tensor(sizes, dtype=torch.long)
+
+
+def _config(**kwargs: object) -> TransformConfig:
+    return TransformConfig(augmentation_backend="batched", **kwargs)  # type: ignore[arg-type]
+
+
+@pytest.mark.parametrize("crop_type", ["center_crop", "random_crop", "random_resized_crop"])
+def test_batch_augmentation_outputs_crop_size_for_mixed_sample_sizes(crop_type: str) -> None:
+    aug = BatchAugmentation(_config(crop=CropConfig(crop_type=crop_type, size=(16, 24)), seed_value=1))  # type: ignore[arg-type]
+    image, mask, sizes = _batch([(40, 30), (20, 50)])
+
+    for train in (True, False):
+        out_image, out_mask = aug(image, mask, sizes, train=train)
+
+        assert out_image.shape == (2, 3, 16, 24)
+        assert out_image.dtype == torch.float32
+        assert out_mask.shape == (2, 1, 16, 24)
+        assert out_mask.dtype == torch.uint8
+
+
+@pytest.mark.parametrize("crop_type", ["center_crop", "random_crop"])
+def test_batch_augmentation_rejects_crops_larger_than_the_image_like_albumentations(crop_type: str) -> None:
+    """
+    Both backends must refuse a fixed-size crop larger than a sample instead of zero-padding it.
+    """
+    config = CropConfig(crop_type=crop_type, size=(16, 24))  # type: ignore[arg-type]
+    aug = BatchAugmentation(_config(crop=config))
+    image, mask, sizes = _batch([(40, 30), (20, 20)])
+    albumentations_crop = A.CenterCrop(16, 24) if crop_type == "center_crop" else A.RandomCrop(16, 24)
+
+    for train in (True, False):
+        with pytest.raises(ValueError, match=r"Crop size \(height, width\) exceeds image dimensions .* vs \(20, 20\)"):
+            aug(image, mask, sizes, train=train)
+    with pytest.raises(Exception, match=r"Crop size \(height, width\) exceeds image dimensions"):
+        A.Compose([albumentations_crop])(image=np.zeros((20, 20, 3), dtype=np.uint8))
+
+
+def test_batch_augmentation_center_crop_matches_albumentations() -> None:
+    """
+    Validation batches should get exactly the crop and normalisation of the Albumentations pipeline.
+    """
+    aug = BatchAugmentation(_config(crop=CropConfig(crop_type="center_crop", size=(8, 8))))
+    image, mask, sizes = _batch([(12, 10)])
+
+    out_image, out_mask = aug(image, mask, sizes, train=False)
+
+    reference = A.Compose([A.CenterCrop(height=8, width=8), A.Normalize(normalization="image_per_channel")])
+    expected = reference(image=image[0].permute(1, 2, 0).numpy(), mask=mask[0, 0].numpy())
+    np.testing.assert_allclose(out_image[0].permute(1, 2, 0).numpy(), expected["image"], atol=1e-4)
+    assert np.array_equal(out_mask[0, 0].numpy(), expected["mask"])
+
+
+def test_batch_augmentation_standard_normalization_matches_albumentations() -> None:
+    mean, std = (0.5, 0.4, 0.3), (0.2, 0.25, 0.3)
+    aug = BatchAugmentation(_config(crop=CropConfig(crop_apply=False), normalization_mode="standard",
+                                    normalization_mean=mean, normalization_std=std))
+    image, mask, sizes = _batch([(6, 6)])
+
+    out_image, _ = aug(image, mask, sizes, train=False)
+
+    expected = A.Normalize(mean=mean, std=std, normalization="standard")(image=image[0].permute(1, 2, 0).numpy())["image"]
+    np.testing.assert_allclose(out_image[0].permute(1, 2, 0).numpy(), expected, atol=1e-4)
+
+
+def test_batch_augmentation_standard_normalization_requires_stats() -> None:
+    with pytest.raises(ValueError, match="normalization_mean"):
+        BatchAugmentation(_config(normalization_mode="standard"))
+
+
+def test_batch_augmentation_keeps_image_and_mask_geometry_in_sync() -> None:
+    """
+    With flips, rotations and affine warps, the nearest-sampled mask must still match the warped image.
+    """
+    spatial = SpatialAugmentConfig(square_symmetry_apply=True, square_symmetry_p=1.0,
+                                   affine_apply=True, affine_rotate=(-30, 30))
+    aug = BatchAugmentation(_config(crop=CropConfig(crop_type="random_resized_crop", size=(32, 32)),
+                                    spatial_augmentation=spatial, normalization_mode="min_max", seed_value=3))
+    image = torch.zeros((8, 3, 32, 32), dtype=torch.uint8)
+    image[:, :, 8:24, 4:20] = 255
+    mask = (image[:, :1] == 255).to(torch.uint8)
+    sizes = torch.tensor([[32, 32]] * 8)
+
+    out_image, out_mask = aug(image, mask, sizes, train=True)
+
+    # bilinear values are only ~1 / ~0 away from the square's edges, where the nearest-sampled mask must agree
+    bright = out_image[:, 0] > 0.99
+    dark = out_image[:, 0] < 0.01
+    assert torch.all(out_mask[:, 0][bright] == 1)
+    assert torch.all(out_mask[:, 0][dark] == 0)
+
+
+def test_batch_augmentation_is_reproducible_with_seed() -> None:
+    photometric = PhotoAugmentConfig(color_jitter_apply=True, color_jitter_p=1.0,
+                                     gaussian_noise_apply=True, gaussian_noise_p=1.0)
+    config = _config(crop=CropConfig(size=(16, 16)), photometric_augmentation=photometric, seed_value=7)
+    image, mask, sizes = _batch([(24, 24), (20, 28)])
+
+    first = BatchAugmentation(config)(image, mask, sizes, train=True)
+    second = BatchAugmentation(config)(image, mask, sizes, train=True)
+
+    assert torch.equal(first[0], second[0])
+    assert torch.equal(first[1], second[1])
+
+
+def test_batch_augmentation_photometric_only_applied_in_training() -> None:
+    photometric = PhotoAugmentConfig(color_jitter_apply=True, color_jitter_p=1.0)
+    aug = BatchAugmentation(_config(crop=CropConfig(crop_apply=False), photometric_augmentation=photometric,
+                                    seed_value=0))
+    plain = BatchAugmentation(_config(crop=CropConfig(crop_apply=False)))
+    image, mask, sizes = _batch([(8, 8)])
+
+    assert torch.equal(aug(image, mask, sizes, train=False)[0], plain(image, mask, sizes, train=False)[0])
+    assert not torch.equal(aug(image, mask, sizes, train=True)[0], plain(image, mask, sizes, train=True)[0])
@@ -6,7 +6,7 @@ import numpy as np
 import pytest
 import torch
 
-from SkiNet.ML.transformations.compute_dataset_stats import compute_stats, main
+from SkiNet.ML.transformations.compute_dataset_stats import compute_channel_stats, compute_stats, image_histogram, main
 
 
 def _make_dataset(images: list) -> MagicMock:
@@ -168,3 +168,49 @@ def test_main_prints_yaml_ready_output(tmp_path: Path, capsys: pytest.CaptureFix
     captured = capsys.readouterr().out
     assert f"normalization_mean: {fixed_mean}" in captured
     assert f"normalization_std:  {fixed_std}" in captured
+
+
+def _reference_stats(images: list[np.ndarray]) -> tuple[np.ndarray, np.ndarray]:
+    """Float64 mean and std over all pixels, as computed by the previous per-image Welford loop."""
+    pixels = np.concatenate([img.reshape(3, -1).astype(np.float64) / 255.0 for img in images], axis=1)
+    return pixels.mean(axis=1), pixels.std(axis=1)
+
+
+@pytest.mark.parametrize("num_workers", [1, 3])
+def test_sharded_stats_match_reference(num_workers: int) -> None:
+    """Sharded histogram statistics merged with Welford must match the float64 reference to 1e-4."""
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, (3, int(h), int(w)), dtype=np.uint8)
+              for h, w in rng.integers(4, 40, size=(11, 2))]
+    images[3][1] = 250  # skewed channel
+    mean_ref, std_ref = _reference_stats(images)
+
+    stats = compute_channel_stats(_make_dataset(images), num_workers=num_workers, shards_per_worker=2)
+
+    assert stats.count == sum(img.shape[1] * img.shape[2] for img in images)
+    np.testing.assert_allclose(stats.mean, mean_ref, atol=1e-10)
+    np.testing.assert_allclose(stats.std, std_ref, atol=1e-10)
+
+
+def test_percentiles_match_numpy() -> None:
+    rng = np.random.default_rng(1)
+    images = [rng.integers(0, 256, (3, 7, 9), dtype=np.uint8) for _ in range(4)]
+    pixels = np.concatenate([img.reshape(3, -1) for img in images], axis=1)
+    q = [0, 1, 50, 99, 100]
+
+    stats = compute_channel_stats(_make_dataset(images))
+
+    expected = np.percentile(pixels, q, axis=1, method="inverted_cdf").T / 255.0
+    np.testing.assert_allclose(stats.percentiles(q), expected)
+    assert stats.histogram.shape == (3, 256) and int(stats.histogram.sum()) == pixels.size
+
+
+def test_hwc_images_are_accepted_and_non_uint8_rejected() -> None:
+    hwc = np.zeros((4, 5, 3), dtype=np.uint8)
+    hwc[..., 2] = 255
+
+    stats = compute_channel_stats(_make_dataset([hwc]))
+
+    assert stats.mean.tolist() == [0.0, 0.0, 1.0]
+    with pytest.raises(TypeError, match="uint8"):
+        image_histogram(np.zeros((3, 2, 2), dtype=np.float32))
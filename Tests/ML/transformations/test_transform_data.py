@@ -4,7 +4,7 @@ import torch
 
 from SkiNet.ML.configs.config_creator import PH2_UNet_ConfigCreator
 from SkiNet.ML.datasets.sample_specs import Sample, SampleSpecs
-from SkiNet.ML.transformations.transform_adapters import AlbumentationsSampleTransform
+from SkiNet.ML.transformations.transform_adapters import AlbumentationsSampleTransform, BatchedSampleTransform
 from SkiNet.ML.transformations.transform_data import _build_transform, get_transform_from_config
 
 
@@ -114,3 +114,18 @@ def test_get_transform_from_config_returns_callable_sample_transforms(split_name
     assert transformed.image.shape == (3, 32, 48)
     assert transformed.mask.shape == (1, 32, 48)
     assert transformed.specs == sample.specs
+
+
+def test_get_transform_from_config_passes_samples_through_for_batched_backend() -> None:
+    """
+    With the batched backend workers only decode; all splits return the uint8 sample unchanged.
+    """
+    cfg = PH2_UNet_ConfigCreator().create_config(transformconfig_kwargs={"augmentation_backend": "batched"})
+    sample = _make_sample(20, 30)
+
+    transforms = get_transform_from_config(cfg)
+
+    for transform in (transforms.train, transforms.val, transforms.test):
+        assert isinstance(transform, BatchedSampleTransform)
+        assert transform(sample) is sample
+        assert transform.without_postprocess() is transform
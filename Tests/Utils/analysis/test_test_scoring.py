@@ -10,11 +10,22 @@ import numpy as np
 import pytest
 import torch
 
+from SkiNet.ML.configs.train_configs.train_config import CosineAnnealingConfig, ReduceOnPlateauConfig
+from SkiNet.ML.configs.transform_configs.crop_config import CropConfig
+from SkiNet.ML.configs.transform_configs.transform_config import TransformConfig
+from SkiNet.ML.model.lightning_model import LightningModel
+from SkiNet.ML.transformations.batch_augmentation import BatchAugmentation
 from SkiNet.Utils.analysis.test_scoring import (
     bootstrap_ci,
     build_ckpt_map,
+    collect_counts,
+    collect_probs,
+    dice_iou_from_counts,
+    per_image_counts,
     per_image_dice_iou,
     score_at_thresholds,
+    score_counts,
+    score_model,
 )
 
 # Two images, 4 pixels each. At thr=0.5: image 0 is a perfect match (Dice 1),
@@ -53,6 +64,33 @@ class TestPerImageDiceIou:
         assert dice.mean() == pytest.approx(0.5, abs=1e-4)
 
 
+# ---------------------------------------------------------------------------
+# per_image_counts / dice_iou_from_counts
+# ---------------------------------------------------------------------------
+
+class TestPerImageCounts:
+    def test_counts_at_half(self) -> None:
+        tp, fp, fn = per_image_counts(_PROBS, _MASKS, [0.5])
+        assert tp[:, 0].tolist() == [2, 0]
+        assert fp[:, 0].tolist() == [0, 1]
+        assert fn[:, 0].tolist() == [0, 0]
+        assert tp.dtype == torch.long
+
+    def test_dice_iou_match_per_image_dice_iou(self) -> None:
+        # Probabilities on a 0.05 grid put pixels exactly on the thresholds (ties).
+        generator = torch.Generator().manual_seed(0)
+        probs = torch.randint(0, 21, (6, 50), generator=generator) / 20
+        masks = (torch.rand(6, 50, generator=generator) > 0.6).float()
+        masks[0] = 0.0
+        thresholds = [0.95, 0.0, 0.5, 0.35, 1.0, 0.5]
+        dice, iou = dice_iou_from_counts(*per_image_counts(probs, masks, thresholds))
+        assert dice.shape == (6, len(thresholds))
+        for j, thr in enumerate(thresholds):
+            expected_dice, expected_iou = per_image_dice_iou(probs, masks, thr)
+            np.testing.assert_array_equal(dice[:, j], expected_dice)
+            np.testing.assert_array_equal(iou[:, j], expected_iou)
+
+
 # ---------------------------------------------------------------------------
 # bootstrap_ci
 # ---------------------------------------------------------------------------
@@ -95,6 +133,71 @@ class TestScoreAtThresholds:
         assert r["dice_lo"] <= r["dice"] <= r["dice_hi"]
 
 
+# ---------------------------------------------------------------------------
+# score_counts / collect_counts / score_model
+# ---------------------------------------------------------------------------
+
+class _Logits(torch.nn.Module):
+    """Returns the first image channel as logits, so the probabilities are sigmoid(image)."""
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return x[:, :1]
+
+
+def _model(batch_augmentation: BatchAugmentation | None = None) -> LightningModel:
+    return LightningModel(model=_Logits(), loss_fn=torch.nn.BCEWithLogitsLoss(), lr=1e-3, optimizer_name="adamw",
+                          weight_decay=0.0, lr_scheduler_config=ReduceOnPlateauConfig(),
+                          cosine_annealing_config=CosineAnnealingConfig(), batch_augmentation=batch_augmentation)
+
+
+def _loader() -> list[dict[str, torch.Tensor]]:
+    generator = torch.Generator().manual_seed(1)
+    return [{"image": torch.randn(b, 1, 4, 5, generator=generator),
+             "mask": (torch.rand(b, 1, 4, 5, generator=generator) > 0.5).float()} for b in (3, 2, 4)]
+
+
+class TestStreamingScoring:
+    def test_score_counts_matches_per_threshold_scoring(self) -> None:
+        thresholds = [0.5, 0.95, 0.1]
+        out = score_counts(*per_image_counts(_PROBS, _MASKS, thresholds), thresholds, n_boot=100, seed=3)
+        for j, thr in enumerate(thresholds):
+            d, i = per_image_dice_iou(_PROBS, _MASKS, thr)
+            assert out.loc[j, "threshold"] == thr
+            assert out.loc[j, "dice"] == pytest.approx(d.mean())
+            assert out.loc[j, "iou"] == pytest.approx(i.mean())
+            assert (out.loc[j, "dice_lo"], out.loc[j, "dice_hi"]) == bootstrap_ci(d, 100, 3)
+
+    def test_collect_counts_matches_counts_of_collected_probs(self) -> None:
+        thresholds = [0.3, 0.5, 0.7]
+        tp, fp, fn = collect_counts(_model(), _loader(), torch.device("cpu"), thresholds)
+        probs, masks = collect_probs(_model(), _loader(), torch.device("cpu"))
+        expected = per_image_counts(probs, masks, thresholds)
+        assert tp.shape == (9, 3)
+        for actual, reference in zip((tp, fp, fn), expected):
+            assert torch.equal(actual, reference)
+
+    def test_score_model_matches_score_at_thresholds(self) -> None:
+        thresholds = [0.4, 0.5]
+        out = score_model(_model(), _loader(), torch.device("cpu"), thresholds, n_boot=50, seed=0)
+        probs, masks = collect_probs(_model(), _loader(), torch.device("cpu"))
+        assert out.equals(score_at_thresholds(probs, masks, thresholds, n_boot=50, seed=0))
+
+    def test_batches_are_prepared_by_the_model(self) -> None:
+        # augmentation_backend="batched": padded uint8 batches are center-cropped and normalised by the model
+        config = TransformConfig(augmentation_backend="batched", normalization_mode="image_per_channel",
+                                 crop=CropConfig(crop_type="center_crop", size=(4, 6)))
+        generator = torch.Generator().manual_seed(2)
+        image = torch.randint(0, 256, (2, 3, 10, 12), generator=generator, dtype=torch.uint8)
+        mask = (image[:, :1] > 127).to(torch.uint8)
+        batch = {"image": image, "mask": mask, "image_size": torch.tensor([[10, 12], [8, 9]])}
+
+        probs, masks = collect_probs(_model(BatchAugmentation(config)), [batch], torch.device("cpu"))
+
+        assert probs.shape == masks.shape == (2, 24)
+        # per-image normalisation centres the logits, so about half of the probabilities are above 0.5
+        assert 0.2 < (probs >= 0.5).float().mean() < 0.8
+
+
 # ---------------------------------------------------------------------------
 # build_ckpt_map
 # ---------------------------------------------------------------------------
@@ -525,3 +525,30 @@ def test_run_drops_oldest_when_queue_is_full() -> None:
     assert callback._metrics_queue.qsize() <= 2
     # and must be non-empty (thread did collect something)
     assert not callback._metrics_queue.empty()
+
+
+def test_collect_reports_ram_cache_stats_of_dataloader_datasets() -> None:
+    """
+    Datasets exposing ram_cache_stats() are discovered from the trainer's dataloaders on train/val start.
+    """
+    class _Dataset:
+        def ram_cache_stats(self) -> dict[str, float]:
+            return {"hits": 3, "misses": 1, "hit_rate": 0.75, "resident_mb": 12.5}
+
+    class _NoCacheDataset:
+        def ram_cache_stats(self) -> None:
+            return None
+
+    callback = SystemMetricsThreadCallback()
+    trainer = _TrainerStub(loggers=[])
+    cast(Any, trainer).train_dataloader = type("Loader", (), {"dataset": _Dataset()})()
+    cast(Any, trainer).val_dataloaders = None
+    callback.on_train_start(_as_trainer(trainer), _as_module())
+    cast(Any, trainer).val_dataloaders = [type("Loader", (), {"dataset": _NoCacheDataset()})()]
+    callback.on_validation_start(_as_trainer(trainer), _as_module())
+
+    metrics = callback._collect()
+
+    assert metrics["system/train_cache_hit_rate"] == 0.75
+    assert metrics["system/train_cache_resident_mb"] == 12.5
+    assert not any(key.startswith("system/val_cache") for key in metrics)
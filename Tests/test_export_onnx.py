@@ -2,18 +2,27 @@
 Unit tests for export_onnx.py.
 
 All tests are offline — no real checkpoint, no ONNX runtime required.
-They cover the three pure-logic units:
+They cover the pure-logic units:
   - _UNetWithSigmoid  (sigmoid wrapper)
+  - _UNetWithMask     (fused sigmoid + threshold + uint8 head)
+  - _validation_sizes (stride-multiple validation sizes)
   - _unwrap_compiled  (torch.compile unwrapping)
   - _resolve_run      (MLflow run folder discovery)
+and, if onnxruntime is installed, _validate_onnx on a BatchNorm-folded graph with dynamic spatial axes and
+on a graph that drifts from its reference.
 """
 
+import copy
+
 import pytest
 import torch
 import torch.nn as nn
 from pathlib import Path
 
-from export_onnx import _UNetWithSigmoid, _unwrap_compiled, _resolve_run
+from export_onnx import (_UNetWithMask, _UNetWithSigmoid, _unwrap_compiled, _resolve_run, _validate_onnx,
+                         _validation_sizes)
+from SkiNet.ML.inference.fusion import fuse_for_inference
+from SkiNet.ML.model.architecture.unet2d import UNet2D
 
 
 # ---------------------------------------------------------------------------
@@ -80,6 +89,72 @@ def test_unet_with_sigmoid_stores_backbone() -> None:
     assert model.backbone is backbone
 
 
+# ---------------------------------------------------------------------------
+# _UNetWithMask / _validation_sizes / _validate_onnx
+# ---------------------------------------------------------------------------
+
+def test_unet_with_mask_thresholds_probabilities_into_uint8() -> None:
+    backbone = nn.Identity()
+    model = _UNetWithMask(backbone, threshold=0.5)
+    x = torch.tensor([-3.0, -0.01, 0.0, 2.0]).reshape(1, 1, 2, 2)
+    out = model(x)
+    assert out.dtype == torch.uint8
+    assert out.flatten().tolist() == [0, 0, 255, 255]
+
+
+def test_unet_with_mask_stores_threshold_as_buffer() -> None:
+    model = _UNetWithMask(nn.Identity(), threshold=0.3)
+    assert "threshold" in dict(model.named_buffers())
+    assert model.threshold.item() == pytest.approx(0.3)
+
+
+def test_validation_sizes_round_up_to_stride_multiples() -> None:
+    assert _validation_sizes([(256, 256), (250, 500), (255, 499)], (16, 16)) == [(256, 256), (256, 512)]
+
+
+@pytest.mark.parametrize("mask_head", [False, True])
+def test_validate_onnx_at_several_sizes_of_a_dynamic_graph(tmp_path: Path, mask_head: bool) -> None:
+    pytest.importorskip("onnxruntime")
+    backbone = UNet2D(in_channels=3, out_channels_layer1=4, number_of_layers=3).eval()
+    reference_model = (_UNetWithMask(backbone, 0.5) if mask_head else _UNetWithSigmoid(backbone)).eval()
+    export_model = (_UNetWithMask(fuse_for_inference(backbone), 0.5) if mask_head
+                    else _UNetWithSigmoid(fuse_for_inference(backbone))).eval()
+    output_name = "mask" if mask_head else "mask_prob"
+    axes = {0: "batch", 2: "height", 3: "width"}
+    out_path = tmp_path / "model.onnx"
+    torch.onnx.export(export_model, (torch.zeros(1, 3, 32, 32),), str(out_path), input_names=["image"],
+                      output_names=[output_name], dynamic_axes={"image": axes, output_name: axes}, dynamo=False)
+
+    sizes = _validation_sizes([(32, 32), (42, 62)], backbone.required_input_multiple)
+    differences = _validate_onnx(out_path, reference_model, output_name, sizes)
+
+    assert list(differences) == [(32, 32), (44, 64)]
+    assert all(difference < 1e-3 for difference in differences.values())
+
+
+@pytest.mark.parametrize("mask_head", [False, True])
+def test_validate_onnx_rejects_a_drifting_graph(tmp_path: Path, mask_head: bool) -> None:
+    pytest.importorskip("onnxruntime")
+    torch.manual_seed(0)
+    backbone = UNet2D(in_channels=3, out_channels_layer1=4, number_of_layers=3).eval()
+    drifted = copy.deepcopy(backbone)
+    with torch.no_grad():
+        for parameter in drifted.parameters():
+            parameter.add_(0.05 * torch.randn_like(parameter))
+
+    def wrap(model: nn.Module) -> nn.Module:
+        return (_UNetWithMask(model, 0.5) if mask_head else _UNetWithSigmoid(model)).eval()
+
+    output_name = "mask" if mask_head else "mask_prob"
+    out_path = tmp_path / "model.onnx"
+    torch.onnx.export(wrap(drifted), (torch.zeros(1, 3, 32, 32),), str(out_path), input_names=["image"],
+                      output_names=[output_name], dynamo=False)
+
+    with pytest.raises(ValueError, match="drifts from PyTorch"):
+        _validate_onnx(out_path, wrap(backbone), output_name, [(32, 32)])
+    assert _validate_onnx(out_path, wrap(drifted), output_name, [(32, 32)])[(32, 32)] <= 1e-4
+
+
 # ---------------------------------------------------------------------------
 # _unwrap_compiled
 # ---------------------------------------------------------------------------
@@ -9,9 +9,15 @@ Usage:
     # Or supply paths explicitly:
     python export_onnx.py --ckpt path/to/epoch.ckpt --config path/to/config.yaml --out ios_onnx.onnx --opset 17
 
+    # Any input size that is a multiple of the UNet's total stride, with a uint8 mask output:
+    python export_onnx.py --run <run_dir> --dynamic-spatial --mask-head --validate-sizes 256x256 512x768
+
+BatchNorms are folded into the convolutions before export; --no-fuse exports the backbone as trained.
+
 """
 
 from SkiNet.ML.model.lightning_model import build_lightning_model
+from SkiNet.ML.inference.fusion import fuse_for_inference
 from SkiNet.ML.configs.load_config_from_yaml import load_config_from_yaml
 from pathlib import Path
 import torch.nn as nn
@@ -25,6 +31,12 @@ os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", "/tmp/torchinductor_cache")
 
 
 INPUT_SIZE = 256
+DEFAULT_VALIDATION_SIZES = [(256, 256), (384, 512), (768, 1024)]
+"""Input sizes a dynamic-spatial export is validated at, rounded up to multiples of the total stride."""
+PROBABILITY_ATOL = 1e-4
+"""Largest absolute probability difference between the ONNX graph and PyTorch that passes validation."""
+MAX_MASK_MISMATCH = 1e-3
+"""Largest fraction of differing pixels between a --mask-head graph and PyTorch that passes validation."""
 
 
 class _UNetWithSigmoid(nn.Module):
@@ -38,12 +50,98 @@ class _UNetWithSigmoid(nn.Module):
         return torch.sigmoid(self.backbone(x))
 
 
+class _UNetWithMask(nn.Module):
+    """Wraps the UNet backbone so the ONNX graph outputs uint8 masks (0/255) at the stored threshold."""
+
+    def __init__(self, backbone: nn.Module, threshold: float) -> None:
+        super().__init__()
+        self.backbone = backbone
+        self.threshold: torch.Tensor
+        self.register_buffer("threshold", torch.tensor(threshold, dtype=torch.float32))
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        mask = torch.sigmoid(self.backbone(x)) >= self.threshold
+        return mask.to(torch.uint8) * 255
+
+
+def _validation_sizes(sizes: list[tuple[int, int]], multiple: tuple[int, int]) -> list[tuple[int, int]]:
+    """Round each (height, width) up to the nearest multiple of the total stride, dropping duplicates."""
+    rounded = [(-(-h // multiple[0]) * multiple[0], -(-w // multiple[1]) * multiple[1]) for h, w in sizes]
+    return list(dict.fromkeys(rounded))
+
+
+def _validate_onnx(out_path: Path, reference_model: nn.Module, output_name: str,
+                   sizes: list[tuple[int, int]], atol: float = PROBABILITY_ATOL,
+                   max_mask_mismatch: float = MAX_MASK_MISMATCH) -> dict[tuple[int, int], float]:
+    """
+    Run the exported graph with onnxruntime at each input size and compare it with the PyTorch reference model.
+
+    :param atol: Largest absolute difference of probability outputs that passes.
+    :param max_mask_mismatch: Largest fraction of differing pixels of uint8 mask outputs that passes.
+    :return: Per size, the largest absolute difference of probability outputs, or the fraction of differing
+        pixels of mask outputs.
+    :raises AssertionError: If an output shape does not match the input size.
+    :raises ValueError: If the difference at any size exceeds its tolerance.
+    """
+    import onnxruntime as ort
+    import numpy as np
+
+    sess = ort.InferenceSession(str(out_path), providers=["CPUExecutionProvider"])
+    input_name = sess.get_inputs()[0].name
+    generator = torch.Generator().manual_seed(0)
+    differences = {}
+    is_mask = False
+    for height, width in sizes:
+        x = torch.randn(1, 3, height, width, generator=generator)
+        output = sess.run([output_name], {input_name: x.numpy()})[0]
+        assert output.shape == (1, 1, height, width), f"Unexpected output shape at {height}x{width}: {output.shape}"
+        with torch.no_grad():
+            expected = reference_model(x).numpy()
+        is_mask = output.dtype == np.uint8
+        if is_mask:
+            differences[(height, width)] = float(np.mean(output != expected))
+        else:
+            differences[(height, width)] = float(np.abs(output - expected).max())
+    tolerance, metric = (max_mask_mismatch, "differing pixels") if is_mask else (atol, "max |Δprob|")
+    failed = {size: difference for size, difference in differences.items() if difference > tolerance}
+    if failed:
+        details = ", ".join(f"{h}x{w}: {difference:.2e}" for (h, w), difference in failed.items())
+        raise ValueError(f"ONNX graph drifts from PyTorch beyond the tolerance of {tolerance:.0e} {metric} ({details})")
+    return differences
+
+
 def _unwrap_compiled(model: nn.Module) -> nn.Module:
     """Strip torch.compile wrapper if present (training used use_torch_compile=True)."""
     return getattr(model, "_orig_mod", model)
 
 
-def export(ckpt_path: Path, out_path: Path, config_path: Path, opset: int = 17) -> None:
+def export(ckpt_path: Path,
+           out_path: Path,
+           config_path: Path,
+           opset: int = 17,
+           dynamic_spatial: bool = False,
+           mask_head: bool = False,
+           validation_sizes: list[tuple[int, int]] | None = None,
+           fuse: bool = True,
+           atol: float = PROBABILITY_ATOL,
+           max_mask_mismatch: float = MAX_MASK_MISMATCH) -> None:
+    """
+    Export a checkpoint to ONNX.
+
+    :param dynamic_spatial: If True, height and width are dynamic axes besides the batch, and the graph is
+        validated at ``validation_sizes`` (multiples of the UNet's total stride). Otherwise the input is
+        fixed at INPUT_SIZE x INPUT_SIZE.
+    :param mask_head: If True, the graph fuses sigmoid, the checkpoint's optimal threshold and a uint8
+        cast, and outputs masks (0/255) named "mask" instead of float32 probabilities "mask_prob".
+    :param validation_sizes: (height, width) sizes of the dynamic-spatial validation, rounded up to
+        multiples of the total stride; defaults to DEFAULT_VALIDATION_SIZES.
+    :param fuse: If True, BatchNorms are folded into the convolutions of the exported graph
+        (see :func:`~SkiNet.ML.inference.fusion.fuse_for_inference`). The graph is still validated against
+        the unfused model.
+    :param atol: Largest max |Δprob| between the graph and PyTorch that passes validation.
+    :param max_mask_mismatch: Largest fraction of differing pixels that passes validation with ``mask_head``.
+    :raises ValueError: If onnxruntime is installed and the graph drifts beyond these tolerances.
+    """
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
     print(f"Loading config from {config_path} …")
@@ -67,10 +165,17 @@ def export(ckpt_path: Path, out_path: Path, config_path: Path, opset: int = 17)
     print("  → Hard-code this value as SEGMENTATION_THRESHOLD in your iOS app's ml/modelRunner.ts")
 
     backbone = _unwrap_compiled(lightning_model.model)
-    export_model = _UNetWithSigmoid(backbone)
-    export_model.eval()
+
+    def wrap(model: nn.Module) -> nn.Module:
+        return (_UNetWithMask(model, threshold) if mask_head else _UNetWithSigmoid(model)).eval()
+
+    reference_model = wrap(backbone)
+    export_model = wrap(fuse_for_inference(backbone)) if fuse else reference_model
+    output_name = "mask" if mask_head else "mask_prob"
+    multiple = getattr(backbone, "required_input_multiple", (1, 1))
 
     dummy = torch.zeros(1, 3, INPUT_SIZE, INPUT_SIZE)
+    axes = {0: "batch", 2: "height", 3: "width"} if dynamic_spatial else {0: "batch"}
 
     print(f"Exporting to ONNX (opset {opset}) → {out_path} …")
     torch.onnx.export(
@@ -79,8 +184,8 @@ def export(ckpt_path: Path, out_path: Path, config_path: Path, opset: int = 17)
         str(out_path),
         opset_version=opset,
         input_names=["image"],
-        output_names=["mask_prob"],
-        dynamic_axes={"image": {0: "batch"}, "mask_prob": {0: "batch"}},
+        output_names=[output_name],
+        dynamic_axes={"image": axes, output_name: axes},
         do_constant_folding=True,
     )
     print("Export complete.")
@@ -103,16 +208,14 @@ def export(ckpt_path: Path, out_path: Path, config_path: Path, opset: int = 17)
     except ImportError:
         print("onnx not installed — skipping weight merge (pip install onnx to enable)")
 
-    # Quick validation with onnxruntime if available
+    # Validation with onnxruntime if available, at every size a dynamic graph is meant for
+    sizes = (_validation_sizes(validation_sizes or DEFAULT_VALIDATION_SIZES, multiple) if dynamic_spatial
+             else [(INPUT_SIZE, INPUT_SIZE)])
     try:
-        import onnxruntime as ort
-        import numpy as np
-
-        sess = ort.InferenceSession(str(out_path), providers=["CPUExecutionProvider"])
-        dummy_np = np.zeros((1, 3, INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
-        output = sess.run(["mask_prob"], {"image": dummy_np})[0]
-        assert output.shape == (1, 1, INPUT_SIZE, INPUT_SIZE), f"Unexpected output shape: {output.shape}"
-        print(f"ONNXRuntime validation passed — output shape: {output.shape}")
+        differences = _validate_onnx(out_path, reference_model, output_name, sizes, atol, max_mask_mismatch)
+        metric = "differing pixels" if mask_head else "max |Δprob|"
+        for (height, width), difference in differences.items():
+            print(f"ONNXRuntime validation passed at {height}x{width} — {metric} vs PyTorch: {difference:.2e}")
     except ImportError:
         print("onnxruntime not installed — skipping validation (pip install onnxruntime to enable)")
 
@@ -121,10 +224,16 @@ def export(ckpt_path: Path, out_path: Path, config_path: Path, opset: int = 17)
     size_str = f"{size_mb:.1f} MB" if size_mb >= 1 else f"{size_bytes / 1024:.0f} KB"
     print(f"\nModel size: {size_str}")
     print("\nPreprocessing constants for your iOS app:")
-    print(f"  INPUT_SIZE  = {INPUT_SIZE}")
+    if dynamic_spatial:
+        print(f"  INPUT_SIZE  = any multiple of {multiple[0]}x{multiple[1]} (dynamic height/width)")
+    else:
+        print(f"  INPUT_SIZE  = {INPUT_SIZE}")
     print("  NORM_MEAN   = [0.699, 0.556, 0.5121]")
     print("  NORM_STD    = [0.1576, 0.1562, 0.1706]")
-    print(f"  THRESHOLD   = {threshold:.4f}")
+    if mask_head:
+        print(f"  THRESHOLD   = {threshold:.4f} (fused into the graph; output 'mask' is uint8 0/255)")
+    else:
+        print(f"  THRESHOLD   = {threshold:.4f}")
 
 
 def _resolve_run(run_dir: Path) -> tuple[Path, Path]:
@@ -152,6 +261,18 @@ if __name__ == "__main__":
     parser.add_argument("--config", type=Path, default=None)
     parser.add_argument("--out", type=Path, default=Path("skinet_unet.onnx"))
     parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--dynamic-spatial", action="store_true",
+                        help="Make height and width dynamic; inputs must be multiples of the UNet's total stride")
+    parser.add_argument("--mask-head", action="store_true",
+                        help="Fuse sigmoid, the optimal threshold and a uint8 cast; output 'mask' (0/255)")
+    parser.add_argument("--no-fuse", action="store_true",
+                        help="Export the backbone without folding its BatchNorms into the convolutions")
+    parser.add_argument("--validate-sizes", nargs="+", default=None,
+                        help="HxW sizes a --dynamic-spatial export is validated at (default: 256x256 384x512 768x1024)")
+    parser.add_argument("--atol", type=float, default=PROBABILITY_ATOL,
+                        help="Largest max |Δprob| between the ONNX graph and PyTorch that passes validation")
+    parser.add_argument("--max-mask-mismatch", type=float, default=MAX_MASK_MISMATCH,
+                        help="Largest fraction of differing pixels that passes validation with --mask-head")
     args = parser.parse_args()
 
     if args.run is not None:
@@ -163,4 +284,7 @@ if __name__ == "__main__":
             parser.error("Provide --run <run_dir> or both --ckpt and --config")
         ckpt, cfg = args.ckpt, args.config
 
-    export(ckpt, args.out, cfg, args.opset)
+    sizes = ([(int(h), int(w)) for h, w in (size.lower().split("x") for size in args.validate_sizes)]
+             if args.validate_sizes is not None else None)
+    export(ckpt, args.out, cfg, args.opset, dynamic_spatial=args.dynamic_spatial, mask_head=args.mask_head,
+           validation_sizes=sizes, fuse=not args.no_fuse, atol=args.atol, max_mask_mismatch=args.max_mask_mismatch)